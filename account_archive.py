@@ -0,0 +1,247 @@
+import json
+import zlib
+from datetime import datetime
+
+from common import BatchWriter, iter_documents
+
+# Upper bounds on what an uploaded archive may decompress to
+MAX_ARCHIVE_BYTES = 256 * 1024 * 1024
+MAX_ARCHIVE_RECORDS = 1000000
+DECOMPRESS_BLOCK_SIZE = 64 * 1024
+
+# ID lists that point at other collections, per collection
+REFERENCE_FIELDS = {
+    'users': {
+        'favorited_meals': 'Meal',
+        'meals': 'Meal',
+        'favorited_workouts': 'Workout',
+        'workouts': 'Workout',
+    },
+    'Calendar': {'days': 'Day'},
+    'Day': {'meals': 'Meal', 'workouts': 'Workout'},
+    'Workout': {'exercises': 'Exercise'},
+}
+
+
+def _json_default(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError(f"Cannot serialize {type(value).__name__}")
+
+
+def _record(collection, doc_id, data):
+    return (json.dumps({'collection': collection, 'id': doc_id, 'data': data}, default=_json_default) + '\n').encode('utf-8')
+
+
+def _referenced_ids(data, collection, target):
+    for field, field_target in REFERENCE_FIELDS.get(collection, {}).items():
+        if field_target == target:
+            for doc_id in data.get(field) or []:
+                if isinstance(doc_id, str) and doc_id:
+                    yield doc_id
+
+
+def iter_export_records(db, user_doc):
+    """Yield one JSONL record per document owned by or referenced from the user's account."""
+    user_data = user_doc.to_dict()
+    yield _record('users', user_doc.id, user_data)
+
+    # dicts keep first-seen order and double as de-duplicating sets of IDs
+    day_ids = {}
+    for calendar in db.collection('Calendar').where('belongs_to', '==', user_doc.id).get():
+        calendar_data = calendar.to_dict()
+        yield _record('Calendar', calendar.id, calendar_data)
+        day_ids.update(dict.fromkeys(_referenced_ids(calendar_data, 'Calendar', 'Day')))
+
+    meal_ids = dict.fromkeys(_referenced_ids(user_data, 'users', 'Meal'))
+    workout_ids = dict.fromkeys(_referenced_ids(user_data, 'users', 'Workout'))
+    for day_id, day_data in iter_documents(db, 'Day', list(day_ids)):
+        yield _record('Day', day_id, day_data)
+        meal_ids.update(dict.fromkeys(_referenced_ids(day_data, 'Day', 'Meal')))
+        workout_ids.update(dict.fromkeys(_referenced_ids(day_data, 'Day', 'Workout')))
+
+    for meal_id, meal_data in iter_documents(db, 'Meal', list(meal_ids)):
+        yield _record('Meal', meal_id, meal_data)
+
+    exercise_ids = {}
+    for workout_id, workout_data in iter_documents(db, 'Workout', list(workout_ids)):
+        yield _record('Workout', workout_id, workout_data)
+        exercise_ids.update(dict.fromkeys(_referenced_ids(workout_data, 'Workout', 'Exercise')))
+
+    for exercise_id, exercise_data in iter_documents(db, 'Exercise', list(exercise_ids)):
+        yield _record('Exercise', exercise_id, exercise_data)
+
+
+def export_account(db, user_doc):
+    """Stream the account as a gzip-compressed JSONL archive."""
+    compressor = zlib.compressobj(wbits=31)  # 16 + 15: gzip container
+    pending = []
+    pending_size = 0
+    for record in iter_export_records(db, user_doc):
+        pending.append(record)
+        pending_size += len(record)
+        if pending_size >= 64 * 1024:
+            compressed = compressor.compress(b''.join(pending))
+            pending, pending_size = [], 0
+            if compressed:
+                yield compressed
+    yield compressor.compress(b''.join(pending)) + compressor.flush()
+
+
+def iter_archive_records(chunks, max_bytes=MAX_ARCHIVE_BYTES, max_records=MAX_ARCHIVE_RECORDS):
+    """
+    Decompress a gzip JSONL archive given as an iterable of byte chunks. Raises
+    ValueError once the archive inflates past max_bytes or holds more than
+    max_records records, without inflating more than a block beyond the limit.
+    """
+    decompressor = zlib.decompressobj(wbits=47)  # 32 + 15: detect gzip or zlib header
+    buffer = b''
+    size = records = 0
+
+    def inflate(data):
+        nonlocal size
+        output = []
+        while data:
+            block = decompressor.decompress(data, DECOMPRESS_BLOCK_SIZE)
+            data = decompressor.unconsumed_tail
+            size += len(block)
+            if size > max_bytes:
+                raise ValueError(f"Archive decompresses to more than {max_bytes} bytes")
+            output.append(block)
+        return b''.join(output)
+
+    def parse(lines):
+        nonlocal records
+        for line in lines:
+            if line.strip():
+                records += 1
+                if records > max_records:
+                    raise ValueError(f"Archive holds more than {max_records} records")
+                yield json.loads(line)
+
+    try:
+        for chunk in chunks:
+            buffer += inflate(chunk)
+            *lines, buffer = buffer.split(b'\n')
+            yield from parse(lines)
+        tail = decompressor.flush()
+        size += len(tail)
+        if size > max_bytes:
+            raise ValueError(f"Archive decompresses to more than {max_bytes} bytes")
+        buffer += tail
+    except zlib.error as e:
+        raise ValueError(f"Archive is not valid gzip data: {e}")
+    yield from parse([buffer])
+
+
+def import_account(db, user_doc, records, array_union):
+    """
+    Write archive records into the given account.
+
+    Every imported Meal, Workout and Exercise gets a fresh document ID so an
+    archive can be loaded next to existing data; references between imported
+    documents are rewritten through the ID map as records stream in. The
+    archive's profile and calendar are merged into the target user's. Days are
+    merged by date, so the account keeps one Day per date: an archive day for a
+    date the calendar already has adds its meals and workouts to that Day, and
+    archive days are buffered until the end to merge duplicates among them.
+    Merged days drop their totals, which readers then sum from the meals until
+    reconcile_day_totals() stores them again; their IDs are returned in
+    'merged_days' so cached copies can be invalidated, and the weights written to
+    Days are returned in 'weights' as {date: weight} for the weight series.
+
+    The whole archive is read and checked before the first write, so an archive
+    that turns out to be invalid or over the size limits changes nothing; the
+    limits on iter_archive_records() bound what is held until then.
+    """
+    id_map = {}
+
+    def new_id(collection, old_id):
+        key = (collection, old_id)
+        if key not in id_map:
+            id_map[key] = db.collection(collection).document().id
+        return id_map[key]
+
+    def remap(collection, data):
+        for field, target in REFERENCE_FIELDS.get(collection, {}).items():
+            if isinstance(data.get(field), list):
+                data[field] = [new_id(target, doc_id) for doc_id in data[field] if isinstance(doc_id, str)]
+        return data
+
+    calendar_docs = db.collection('Calendar').where('belongs_to', '==', user_doc.id).limit(1).get()
+    calendar_ref = calendar_docs[0].reference if calendar_docs else None
+    calendar_data = {}
+    existing_days = {}
+    if calendar_docs:
+        existing_ids = [day_id for day_id in calendar_docs[0].to_dict().get('days', []) if isinstance(day_id, str)]
+        for day_id, day in iter_documents(db, 'Day', existing_ids, field_paths=['date', 'weight']):
+            if day.get('date'):
+                existing_days.setdefault(day['date'], (day_id, day))
+    archive_days = {}
+
+    counts = {}
+    # (method, doc_ref, data) in the order they are committed
+    writes = []
+    for record in records:
+        if not isinstance(record, dict) or not isinstance(record.get('data', {}), dict):
+            raise ValueError("Archive records must be JSON objects")
+        collection, data = record.get('collection'), record.get('data') or {}
+        if collection not in ('users', 'Calendar', 'Day', 'Meal', 'Workout', 'Exercise') or not record.get('id'):
+            raise ValueError(f"Invalid archive record: {record.get('collection')}/{record.get('id')}")
+        data = remap(collection, data)
+
+        if collection == 'users':
+            profile_update = {key: value for key, value in data.items() if key not in ('email', 'id') and key not in REFERENCE_FIELDS['users']}
+            for field in REFERENCE_FIELDS['users']:
+                if data.get(field):
+                    profile_update[field] = array_union(data[field])
+            writes.append(('update', user_doc.reference, profile_update))
+        elif collection == 'Calendar':
+            # Days join the calendar once they are merged below
+            calendar_data = {key: value for key, value in data.items() if key != 'days'}
+        elif collection == 'Day':
+            date = data.get('date') or f"undated:{record['id']}"
+            if date in archive_days:
+                merged = archive_days[date]
+                for field in ('meals', 'workouts'):
+                    merged[field] = list(dict.fromkeys(merged.get(field, []) + data.get(field, [])))
+                merged['totals'] = None
+                if merged.get('weight') is None:
+                    merged['weight'] = data.get('weight')
+            else:
+                archive_days[date] = data
+        else:
+            writes.append(('set', db.collection(collection).document(new_id(collection, record['id'])), data))
+        counts[collection] = counts.get(collection, 0) + 1
+
+    new_day_ids, merged_day_ids, weights = [], [], {}
+    for date, data in archive_days.items():
+        if date in existing_days:
+            day_id, existing = existing_days[date]
+            update = {field: array_union(data[field]) for field in ('meals', 'workouts') if data.get(field)}
+            if 'meals' in update:
+                update['totals'] = None
+            if existing.get('weight') is None and data.get('weight') is not None:
+                update['weight'] = weights[date] = data['weight']
+            writes.append(('update', db.collection('Day').document(day_id), update))
+            merged_day_ids.append(day_id)
+        else:
+            day_ref = db.collection('Day').document()
+            writes.append(('set', day_ref, data))
+            new_day_ids.append(day_ref.id)
+            if data.get('weight') is not None and data.get('date'):
+                weights[date] = data['weight']
+    if calendar_ref is None:
+        writes.append(('set', db.collection('Calendar').document(), {**calendar_data, 'belongs_to': user_doc.id, 'days': new_day_ids}))
+    elif new_day_ids:
+        writes.append(('update', calendar_ref, {'days': array_union(new_day_ids)}))
+
+    writer = BatchWriter(db)
+    try:
+        for method, doc_ref, data in writes:
+            getattr(writer, method)(doc_ref, data)
+    finally:
+        writer.close()
+
+    return {'documents': counts, 'committed_writes': writer.committed_ops, 'merged_days': merged_day_ids,
+            'weights': weights}
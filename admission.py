@@ -0,0 +1,153 @@
+"""
+Admission control for routes that call the model.
+
+Each request takes a token from its user's bucket and one from a global bucket.
+An empty user bucket is refused at once. When only the global bucket is empty,
+the request waits in a bounded queue that is served round-robin across users, so
+one user's burst cannot hold back everyone else; a full queue or a wait longer
+than max_wait is refused. Refusals carry the seconds until a retry can succeed.
+"""
+import math
+import threading
+import time
+from collections import OrderedDict, deque
+
+
+class RateLimited(Exception):
+    def __init__(self, reason, retry_after):
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after = retry_after
+
+    @property
+    def retry_after_header(self):
+        return str(max(1, math.ceil(self.retry_after)))
+
+
+class TokenBucket:
+    """rate tokens per second up to capacity. Not locked; AdmissionController holds the lock."""
+
+    def __init__(self, rate, capacity, clock=time.monotonic):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = float(capacity)
+        self._clock = clock
+        self._updated = clock()
+
+    def refill(self):
+        now = self._clock()
+        self.tokens = min(self.capacity, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+        return self.tokens
+
+    def take(self):
+        if self.refill() >= 1:
+            self.tokens -= 1
+            return True
+        return False
+
+    def wait_time(self, tokens=1):
+        """Seconds until the bucket holds the given number of tokens."""
+        missing = tokens - self.refill()
+        return max(missing, 0.0) / self.rate if self.rate > 0 else math.inf
+
+    @property
+    def full(self):
+        return self.refill() >= self.capacity
+
+
+class AdmissionController:
+    def __init__(self, user_rate=1 / 6, user_burst=5, global_rate=2.0, global_burst=20,
+                 max_queue=50, max_wait=10.0, max_users=10000, clock=time.monotonic):
+        # Retry times are tokens over rate, so a bucket that never refills has none to give
+        if user_rate <= 0 or global_rate <= 0:
+            raise ValueError("user_rate and global_rate must be positive")
+        self.user_rate = user_rate
+        self.user_burst = user_burst
+        self.max_queue = max_queue
+        self.max_wait = max_wait
+        self.max_users = max_users
+        self._clock = clock
+        self._global = TokenBucket(global_rate, global_burst, clock)
+        self._users = OrderedDict()
+        # user key -> deque of waiting events; the OrderedDict order is the round-robin order
+        self._queues = OrderedDict()
+        self._queued = 0
+        self._lock = threading.Lock()
+        self._counts = {'admitted': 0, 'queued': 0, 'rejected_user': 0, 'rejected_queue_full': 0, 'timed_out': 0}
+
+    def _user_bucket(self, user):
+        bucket = self._users.get(user)
+        if bucket is None:
+            if len(self._users) >= self.max_users:
+                # Full buckets carry no state worth keeping
+                for other in [other for other, existing in self._users.items() if existing.full]:
+                    del self._users[other]
+                while len(self._users) >= self.max_users:
+                    self._users.popitem(last=False)
+            bucket = self._users[user] = TokenBucket(self.user_rate, self.user_burst, self._clock)
+        self._users.move_to_end(user)
+        return bucket
+
+    def _dispatch(self):
+        # Hand global tokens to the head of each user's queue in turn
+        while self._queues and self._global.take():
+            user, waiters = next(iter(self._queues.items()))
+            waiters.popleft().set()
+            self._queued -= 1
+            del self._queues[user]
+            if waiters:
+                self._queues[user] = waiters
+
+    def acquire(self, user):
+        """Return once the request may proceed; raise RateLimited otherwise."""
+        with self._lock:
+            bucket = self._user_bucket(user)
+            if not bucket.take():
+                self._counts['rejected_user'] += 1
+                raise RateLimited('user rate limit exceeded', bucket.wait_time())
+            self._dispatch()
+            if not self._queues and self._global.take():
+                self._counts['admitted'] += 1
+                return
+            if self._queued >= self.max_queue:
+                bucket.tokens = min(bucket.capacity, bucket.tokens + 1)
+                self._counts['rejected_queue_full'] += 1
+                raise RateLimited('server busy', self._queued / self._global.rate)
+            granted = threading.Event()
+            self._queues.setdefault(user, deque()).append(granted)
+            self._queued += 1
+            self._counts['queued'] += 1
+
+        deadline = self._clock() + self.max_wait
+        while True:
+            with self._lock:
+                self._dispatch()
+                if granted.is_set():
+                    self._counts['admitted'] += 1
+                    return
+                remaining = deadline - self._clock()
+                if remaining <= 0:
+                    waiters = self._queues.get(user)
+                    waiters.remove(granted)
+                    if not waiters:
+                        del self._queues[user]
+                    self._queued -= 1
+                    bucket.tokens = min(bucket.capacity, bucket.tokens + 1)
+                    self._counts['timed_out'] += 1
+                    raise RateLimited('server busy', self._queued / self._global.rate)
+                pause = min(remaining, max(self._global.wait_time(), 0.001))
+            granted.wait(pause)
+
+    def stats(self):
+        with self._lock:
+            return {
+                **self._counts,
+                'queue_depth': self._queued,
+                'max_queue': self.max_queue,
+                'users_waiting': len(self._queues),
+                'global_tokens_available': round(self._global.refill(), 2),
+                'global_capacity': self._global.capacity,
+                'global_rate_per_second': self._global.rate,
+                'users_tracked': len(self._users),
+            }
@@ -0,0 +1,219 @@
+import math
+
+import numpy as np
+
+from common import iter_documents, number
+from streaks import within_target
+
+MACRO_CALORIES = {'carbs': 4.0, 'proteins': 4.0, 'fats': 9.0}
+
+
+class History:
+    """
+    A user's logged history as one row per calendar date, held in parallel NumPy arrays.
+
+    Nutrition and burned calories are daily sums; weight is NaN on days it was not logged.
+    """
+
+    COLUMNS = ('calories', 'carbs', 'fats', 'proteins', 'burned', 'weight')
+
+    def __init__(self, dates, **columns):
+        self.dates = dates
+        for name in self.COLUMNS:
+            setattr(self, name, columns[name])
+
+    def __len__(self):
+        return len(self.dates)
+
+    @classmethod
+    def from_rows(cls, meal_rows, burned_rows, weight_rows):
+        """
+        Build a History from flat rows:
+        meal_rows (date, calories, carbs, fats, proteins), burned_rows (date, calories)
+        and weight_rows (date, weight). Dates are 'YYYY-MM-DD' strings.
+        """
+        meal_dates = np.array([row[0] for row in meal_rows], dtype='datetime64[D]')
+        burned_dates = np.array([row[0] for row in burned_rows], dtype='datetime64[D]')
+        weight_dates = np.array([row[0] for row in weight_rows], dtype='datetime64[D]')
+
+        dates, inverse = np.unique(np.concatenate([meal_dates, burned_dates, weight_dates]), return_inverse=True)
+        meal_index = inverse[:len(meal_dates)]
+        burned_index = inverse[len(meal_dates):len(meal_dates) + len(burned_dates)]
+        weight_index = inverse[len(meal_dates) + len(burned_dates):]
+
+        meal_values = np.array([row[1:] for row in meal_rows], dtype=float).reshape(-1, 4)
+        columns = {
+            name: np.bincount(meal_index, weights=meal_values[:, column], minlength=len(dates))
+            for column, name in enumerate(('calories', 'carbs', 'fats', 'proteins'))
+        }
+        columns['burned'] = np.bincount(
+            burned_index, weights=np.array([row[1] for row in burned_rows], dtype=float), minlength=len(dates)
+        )
+        weight = np.full(len(dates), np.nan)
+        # If a date was weighed more than once, the last row wins
+        weight[weight_index] = np.array([row[1] for row in weight_rows], dtype=float)
+        columns['weight'] = weight
+        return cls(dates, **columns)
+
+    def between(self, start=None, end=None):
+        mask = np.ones(len(self.dates), dtype=bool)
+        if start:
+            mask &= self.dates >= np.datetime64(start, 'D')
+        if end:
+            mask &= self.dates <= np.datetime64(end, 'D')
+        return History(self.dates[mask], **{name: getattr(self, name)[mask] for name in self.COLUMNS})
+
+
+def load_history(db, user_id):
+    """
+    Read a user's Day, Meal, Workout and Exercise documents with batched reads into a History.
+    Days that carry nutrition totals are used as they are; only older days fetch their meals.
+    """
+    day_ids = []
+    for calendar in db.collection('Calendar').where('belongs_to', '==', user_id).get():
+        day_ids.extend(calendar.to_dict().get('days', []))
+    day_ids = [day_id for day_id in dict.fromkeys(day_ids) if isinstance(day_id, str)]
+
+    day_meals, day_workouts, weight_rows, total_rows = [], [], [], []
+    for _, day in iter_documents(db, 'Day', day_ids, field_paths=['date', 'meals', 'workouts', 'weight', 'totals']):
+        if not day.get('date'):
+            continue
+        if isinstance(day.get('totals'), dict):
+            total_rows.append((day['date'], *(number(day['totals'].get(field)) for field in ('calories', 'carbs', 'fats', 'proteins'))))
+        else:
+            day_meals.extend((day['date'], meal_id) for meal_id in day.get('meals', []))
+        day_workouts.extend((day['date'], workout_id) for workout_id in day.get('workouts', []))
+        if day.get('weight') is not None:
+            weight_rows.append((day['date'], number(day['weight'])))
+
+    meals = dict(iter_documents(db, 'Meal', list(dict.fromkeys(meal_id for _, meal_id in day_meals)),
+                                field_paths=['calories', 'carbs', 'fats', 'proteins']))
+    workouts = dict(iter_documents(db, 'Workout', list(dict.fromkeys(workout_id for _, workout_id in day_workouts)),
+                                   field_paths=['exercises']))
+    exercise_ids = list(dict.fromkeys(
+        exercise_id for workout in workouts.values() for exercise_id in workout.get('exercises', [])
+        if isinstance(exercise_id, str)
+    ))
+    burned_by_exercise = {
+        exercise_id: number(exercise.get('avg_calories_burned'))
+        for exercise_id, exercise in iter_documents(db, 'Exercise', exercise_ids, field_paths=['avg_calories_burned'])
+    }
+
+    meal_rows = total_rows + [
+        (date, *(number(meals[meal_id].get(field)) for field in ('calories', 'carbs', 'fats', 'proteins')))
+        for date, meal_id in day_meals if meal_id in meals
+    ]
+    burned_rows = [
+        (date, sum(burned_by_exercise.get(exercise_id, 0.0) for exercise_id in workouts[workout_id].get('exercises', [])
+                   if isinstance(exercise_id, str)))
+        for date, workout_id in day_workouts if workout_id in workouts
+    ]
+    return History.from_rows(meal_rows, burned_rows, weight_rows)
+
+
+def rolling_mean(dates, values, window):
+    """
+    Mean over the trailing `window` calendar days ending at each row, counting
+    only rows that have a value (NaN is treated as not logged).
+    """
+    if len(values) == 0:
+        return np.array([], dtype=float)
+    day_numbers = dates.astype('int64')
+    present = ~np.isnan(values)
+    value_sums = np.concatenate([[0.0], np.cumsum(np.where(present, values, 0.0))])
+    counts = np.concatenate([[0], np.cumsum(present)])
+    # First row inside each row's window; rows are sorted by date
+    starts = np.searchsorted(day_numbers, day_numbers - window + 1, side='left')
+    ends = np.arange(1, len(values) + 1)
+    window_counts = counts[ends] - counts[starts]
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return np.where(window_counts > 0, (value_sums[ends] - value_sums[starts]) / window_counts, np.nan)
+
+
+def ewma(values, alpha):
+    """
+    Exponentially weighted moving average y[t] = (1 - alpha) * y[t-1] + alpha * x[t], y[0] = x[0],
+    evaluated in closed form over blocks small enough that the decay factors stay finite.
+    """
+    values = np.asarray(values, dtype=float)
+    result = np.empty_like(values)
+    if len(values) == 0:
+        return result
+    decay = 1.0 - alpha
+    if decay <= 0.0:
+        return values.copy()
+    block = max(1, int(600 / -math.log(decay)))
+    state = values[0]
+    for start in range(0, len(values), block):
+        chunk = values[start:start + block]
+        powers = decay ** np.arange(1, len(chunk) + 1)
+        # y[k] = decay^(k+1) * state + alpha * sum_{i<=k} decay^(k-i) * x[i]
+        result[start:start + len(chunk)] = powers * state + alpha * powers * np.cumsum(chunk / powers)
+        state = result[start + len(chunk) - 1]
+    return result
+
+
+def weight_trend(history, alpha=0.1):
+    """EWMA of weight over the days it was logged; NaN elsewhere."""
+    trend = np.full(len(history), np.nan)
+    weighed = ~np.isnan(history.weight)
+    if weighed.any():
+        trend[weighed] = ewma(history.weight[weighed], alpha)
+    return trend
+
+
+def macro_ratios(history):
+    """Share of macro calories from carbs, proteins and fats per day."""
+    energy = {name: getattr(history, name) * factor for name, factor in MACRO_CALORIES.items()}
+    total = energy['carbs'] + energy['proteins'] + energy['fats']
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return {name: np.where(total > 0, value / total, np.nan) for name, value in energy.items()}
+
+
+def calorie_balance(history, target):
+    """Intake minus target, and intake minus burned minus target, per day."""
+    target = number(target)
+    return {
+        'intake_vs_target': history.calories - target,
+        'net_vs_target': history.calories - history.burned - target,
+    }
+
+
+def _series(values):
+    values = np.asarray(values, dtype=float)
+    series = np.round(values, 2).astype(object)
+    series[np.isnan(values)] = None
+    return series.tolist()
+
+
+def summarize(history, avg_cal_intake, window=7, alpha=0.1):
+    """Everything the analytics endpoint returns, as JSON-ready lists."""
+    ratios = macro_ratios(history)
+    balance = calorie_balance(history, avg_cal_intake)
+    trend = weight_trend(history, alpha)
+    logged = history.calories > 0
+
+    with np.errstate(invalid='ignore'):
+        summary = {
+            'days_logged': int(logged.sum()),
+            'average_calories': round(float(history.calories[logged].mean()), 2) if logged.any() else None,
+            'average_burned': round(float(history.burned.mean()), 2) if len(history) else None,
+            'days_within_target': int((logged & within_target(history.calories, avg_cal_intake)).sum()),
+            'latest_weight_trend': _series(trend[~np.isnan(trend)][-1:])[0] if (~np.isnan(trend)).any() else None,
+        }
+
+    return {
+        'dates': [str(date) for date in history.dates],
+        'calories': _series(history.calories),
+        'carbs': _series(history.carbs),
+        'fats': _series(history.fats),
+        'proteins': _series(history.proteins),
+        'burned': _series(history.burned),
+        'weight': _series(history.weight),
+        'rolling_calories': _series(rolling_mean(history.dates, np.where(logged, history.calories, np.nan), window)),
+        'rolling_burned': _series(rolling_mean(history.dates, history.burned, window)),
+        'weight_trend': _series(trend),
+        'macro_ratios': {name: _series(values) for name, values in ratios.items()},
+        'calorie_balance': {name: _series(values) for name, values in balance.items()},
+        'summary': summary,
+    }
@@ -1,4 +1,4 @@
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, Response, stream_with_context
 from flask_cors import CORS
 import firebase_admin
 from firebase_admin import credentials, firestore
@@ -6,12 +6,38 @@ from firebase_admin import credentials, firestore
 import os
 import google.generativeai as genai
 from dotenv import load_dotenv
+import hashlib
 import json
 import re
+import time
+from functools import wraps
 
-from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
 import pytz
 
+from doc_cache import DocumentCache
+from shared_cache import SharedCache
+from single_flight import SingleFlight
+from storage import FirestoreStorage
+from day_totals import NUTRIENTS, add_meal_to_day, edit_meal_on_days, remove_meal_from_days, sum_totals
+from streaks import record_activity, streak_summary
+from weight_series import add_weights, day_offset, record_weight, weight_history, weight_on
+from account_archive import export_account, import_account, iter_archive_records
+from analytics import load_history, summarize
+from exercise_energy import body_weight_kg, estimate_workout
+from nutrition import reconcile_meal
+from recommender import LiveIndex, Recommender
+from meal_reuse import MealReuseIndex, ReuseStats
+from pregeneration import PregenerationPool
+from incremental_json import ObjectStreamParser
+from model_output import OutputStats, parse_output
+from admission import AdmissionController, RateLimited
+from model_client import ModelClient, ModelUnavailable
+from fallback import FallbackLibrary, FallbackStats
+from idempotency import IdempotencyStore, KeyConflict, StillRunning, replayable
+from batch import BatchError, parse_batch, run_batch
+
 app = Flask(__name__)
 CORS(app)  # enable CORS for javascript 
 
@@ -50,9 +76,123 @@ def get_current_date():
 
 db = firestore.client()
 
+# Identical Firestore reads that are in flight at the same time share one round-trip
+reads = SingleFlight()
+
+# SHARED_CACHE_PATH names a SQLite file that all workers on the host share as a
+# second cache tier; their invalidations reach each other within SHARED_CACHE_SYNC_INTERVAL
+shared_cache = None
+if os.getenv('SHARED_CACHE_PATH'):
+    shared_cache = SharedCache(
+        os.getenv('SHARED_CACHE_PATH'),
+        max_entries=int(os.getenv('SHARED_CACHE_MAX_ENTRIES', 50000)),
+    )
+
+# Read-through cache for documents fetched by path. Writes made by this process
+# invalidate entries; DOC_CACHE_WATCH lists collections to keep coherent with
+# on_snapshot listeners for writes made elsewhere.
+doc_cache = DocumentCache(
+    db,
+    max_entries=int(os.getenv('DOC_CACHE_MAX_ENTRIES', 5000)),
+    max_age=float(os.getenv('DOC_CACHE_MAX_AGE', 300)),
+    collections=('users', 'Meal', 'Workout', 'Exercise'),
+    flights=reads,
+    shared=shared_cache,
+    sync_interval=float(os.getenv('SHARED_CACHE_SYNC_INTERVAL', 0)),
+)
+for watched_collection in filter(None, os.getenv('DOC_CACHE_WATCH', '').split(',')):
+    doc_cache.watch(watched_collection.strip())
+
+# Records behind the read views
+storage = FirestoreStorage(db, firestore.ArrayUnion, doc_cache=doc_cache, flights=reads)
+
+# In-memory ranking indexes for /get_n_not_favorited_*; rebuilt in the background
+# after RECOMMENDER_MAX_AGE seconds to pick up writes made by other workers
+recommender = Recommender(db, max_age=float(os.getenv('RECOMMENDER_MAX_AGE', 600)))
+
+# generate_meal answers from stored meals that already fit a request when it can;
+# MEAL_REUSE=0 always calls the model
+MEAL_REUSE_ENABLED = os.getenv('MEAL_REUSE', '1') != '0'
+meal_reuse = LiveIndex(db, lambda client: MealReuseIndex().load(client),
+                       max_age=float(os.getenv('RECOMMENDER_MAX_AGE', 600)), name='meal reuse index')
+meal_reuse_stats = ReuseStats()
+
+def index_meal(meal_id, meal_data):
+    recommender.upsert_meal(meal_id, meal_data)
+    meal_reuse.apply('upsert', meal_id, meal_data)
+
+def copy_meal(meal_id, meal_data):
+    # A reused meal is stored again for the requester, so editing or deleting it never
+    # reaches the Days of the users who already had the original
+    copy = {**meal_data, 'copied_from': meal_data.get('copied_from') or meal_id}
+    copy_id = db.collection('Meal').add(copy)[1].id
+    index_meal(copy_id, copy)
+    return copy_id, copy
+
+def unindex_meal(meal_id):
+    recommender.remove_meal(meal_id)
+    meal_reuse.apply('remove', meal_id)
+
+# Deleted documents are recorded here so /sync can tell clients to drop them.
+# Tokens older than the retention window get a full resync instead of a delta.
+TOMBSTONE_RETENTION_DAYS = int(os.getenv('TOMBSTONE_RETENTION_DAYS', 90))
+
+def write_tombstone(doc_ref, user_ids):
+    # One tombstone per user whose /sync has to drop the document; belongs_to scopes it to them
+    deleted_at = datetime.now(pytz.UTC)
+    batch, ops = db.batch(), 0
+    for user_id in dict.fromkeys(user_id for user_id in user_ids if user_id):
+        batch.set(db.collection('Tombstone').document(f"{doc_ref.parent.id}_{doc_ref.id}_{user_id}"), {
+            'collection': doc_ref.parent.id,
+            'doc_id': doc_ref.id,
+            'belongs_to': user_id,
+            'deleted_at': firestore.SERVER_TIMESTAMP,
+            'expire_at': deleted_at + timedelta(days=TOMBSTONE_RETENTION_DAYS),
+        })
+        ops += 1
+        if ops >= 500:
+            batch.commit()
+            batch, ops = db.batch(), 0
+    if ops:
+        batch.commit()
+
+def item_owners(field, item_id, day_refs, user_docs=()):
+    # IDs of the users who list a meal or workout (field 'meals' or 'workouts') or have it
+    # on a Day of their calendar; Day documents carry no owner, so calendars are asked
+    owners = [user_doc.id for user_doc in user_docs]
+    for list_field in (field, f'favorited_{field}'):
+        owners += [user_doc.id for user_doc in
+                   db.collection('users').where(list_field, 'array_contains', item_id).select([]).get()]
+    for day_ref in day_refs:
+        owners += [calendar.get('belongs_to') for calendar in
+                   db.collection('Calendar').where('days', 'array_contains', day_ref.id).select(['belongs_to']).get()]
+    return list(dict.fromkeys(owner for owner in owners if owner))
+
+def encode_sync_token(timestamp):
+    # Microseconds since the epoch; truncating nanoseconds can only resend a change, never skip one
+    return str(int(timestamp.timestamp()) * 1000000 + timestamp.microsecond)
+
+def decode_sync_token(token):
+    micros = int(token)
+    if micros < 0:
+        raise ValueError("Sync token must not be negative")
+    return datetime.fromtimestamp(micros // 1000000, pytz.UTC).replace(microsecond=micros % 1000000)
+
+def find_users_by_email(email, projection=None):
+    query = db.collection('users').where('email', '==', email).limit(1)
+    if projection:
+        query = query.select(projection)
+    return list(reads.do(('users', 'email', email, tuple(projection or ())), query.get))
+
+def find_calendars(user_id, projection=None):
+    query = db.collection('Calendar').where('belongs_to', '==', user_id)
+    if projection:
+        query = query.select(projection)
+    return list(reads.do(('Calendar', 'belongs_to', user_id, tuple(projection or ())), query.get))
+
 def get_user_doc_id_by_email(email):
     try:
-        user_query = db.collection('users').where('email', '==', email).get()
+        user_query = find_users_by_email(email)
 
         if not user_query:
             return None 
@@ -63,11 +203,177 @@ def get_user_doc_id_by_email(email):
         print(f"Error fetching user document ID: {str(e)}")
         return None
 
+def get_user_doc_by_email(email):
+    user_docs = find_users_by_email(email)
+    if not user_docs:
+        return None
+    return user_docs[0]
+
+def find_workout_owner(workout_id):
+    # A user-created or favorited workout is listed on its owner's user document
+    for field in ('workouts', 'favorited_workouts'):
+        user_docs = db.collection('users').where(field, 'array_contains', workout_id).limit(1).get()
+        if user_docs:
+            return user_docs[0]
+    return None
+
+def get_docs_by_ids(collection, doc_ids, field_paths=None):
+    # Fetch many documents in one batched get_all round-trip (cache misses only), keyed by ID
+    unique_ids = [doc_id for doc_id in dict.fromkeys(doc_ids) if isinstance(doc_id, str) and doc_id]
+    if not unique_ids:
+        return {}
+    doc_refs = [db.collection(collection).document(doc_id) for doc_id in unique_ids]
+    return {doc.id: doc for doc in doc_cache.get_all(doc_refs, field_paths=field_paths) if doc.exists}
+
+def days_with_meal(meal_id):
+    return [day_doc.reference for day_doc in db.collection('Day').where('meals', 'array_contains', meal_id).get()]
+
+def add_meal_to_today(meal_id):
+    # Today's Day gets the meal and its share of the day's totals in one transaction
+    current_date, day_name = get_current_date()
+    day_docs = db.collection('Day').where('date', '==', current_date).limit(1).get()
+    day_ref = day_docs[0].reference if day_docs else db.collection('Day').document()
+    add_meal_to_day(db, firestore.transactional, day_ref, meal_id, new_day={'date': current_date, 'day': day_name})
+    return current_date, day_ref
+
+def record_streak(user_doc, date, day_ref=None, logged=True):
+    # O(1) update of the user's streak counters; day_ref supplies the day's calorie total after a meal change.
+    # Future dates (scheduled plans, a weigh-in entered ahead) are not logging and would freeze the streak
+    if date > get_current_date()[0]:
+        return
+    calories = None
+    if day_ref is not None:
+        day = day_ref.get(field_paths=['totals'])
+        calories = ((day.to_dict() or {}).get('totals') or {}).get('calories', 0) if day.exists else 0
+    record_activity(db, firestore.transactional, user_doc.id, date, calories,
+                    (user_doc.to_dict() or {}).get('avg_cal_intake'), logged)
+
+def refresh_open_day(user_doc, day_refs):
+    # A meal change moves the calories of the user's open streak day if it is among day_refs; earlier days are final
+    counters = db.collection('Streak').document(user_doc.id).get()
+    open_date = counters.to_dict().get('last_logged') if counters.exists else None
+    own_days = {day_id for calendar in find_calendars(user_doc.id, ['days']) for day_id in calendar.to_dict().get('days', [])}
+    day_refs = [day_ref for day_ref in day_refs if day_ref.id in own_days]
+    if not open_date or not day_refs:
+        return
+    for day in db.get_all(day_refs, field_paths=['date']):
+        if day.exists and day.get('date') == open_date:
+            record_streak(user_doc, open_date, day.reference, logged=False)
+
+def workout_calories(exercises):
+    # Total avg_calories_burned of inline exercise dicts, or None when none carry a number
+    calories = [exercise.get('avg_calories_burned') for exercise in exercises if isinstance(exercise, dict)]
+    calories = [value for value in calories if isinstance(value, (int, float)) and not isinstance(value, bool)]
+    return sum(calories) if calories else None
+
+FIELD_NAME_PATTERN = re.compile(r'^[A-Za-z_][A-Za-z0-9_]*(\.[A-Za-z_][A-Za-z0-9_]*)*$')
+
+def parse_fields(raw_fields):
+    # Accepts "name,calories,exercises.name" or a list; None means whole documents
+    if not raw_fields:
+        return None
+    if isinstance(raw_fields, str):
+        raw_fields = raw_fields.split(',')
+    fields = [field.strip() for field in raw_fields if isinstance(field, str) and field.strip()]
+    for field in fields:
+        if not FIELD_NAME_PATTERN.match(field):
+            raise ValueError(f"Invalid field name: {field}")
+    return fields or None
+
+def projection_for(fields, required=()):
+    # Top-level Firestore field paths needed to hydrate the requested fields.
+    # 'id' is the document ID, not a stored field, so it is never projected.
+    if fields is None:
+        return None
+    projection = {field.split('.')[0] for field in fields} | set(required)
+    projection.discard('id')
+    # An empty mask is not a valid projection, fall back to whole documents
+    return sorted(projection) or None
+
+def nested_fields(fields, head):
+    # Sub-field paths requested under head, or None when the whole value is wanted
+    if fields is None or head in fields:
+        return None
+    return [field[len(head) + 1:] for field in fields if field.startswith(head + '.')]
+
+def prune_fields(data, fields):
+    # Keep only the requested field paths, descending into maps and lists of maps
+    if fields is None or not isinstance(data, dict):
+        return data
+    nested = {}
+    for field in fields:
+        head, _, rest = field.partition('.')
+        nested.setdefault(head, []).append(rest)
+
+    pruned = {}
+    for head, rests in nested.items():
+        if head not in data:
+            continue
+        value = data[head]
+        # A bare field name keeps the whole value even if sub-paths were also requested
+        if all(rests):
+            if isinstance(value, dict):
+                value = prune_fields(value, rests)
+            elif isinstance(value, list):
+                value = [prune_fields(item, rests) for item in value]
+        pruned[head] = value
+    return pruned
+
+# Responses to requests sent with an Idempotency-Key, replayed to retries of the same request
+idempotency_store = IdempotencyStore(
+    ttl=float(os.getenv('IDEMPOTENCY_TTL', 24 * 3600)),
+    max_wait=float(os.getenv('IDEMPOTENCY_MAX_WAIT', 60)),
+)
+
+def idempotent(route):
+    @wraps(route)
+    def wrapper(*args, **kwargs):
+        key = request.headers.get('Idempotency-Key')
+        if not key:
+            return route(*args, **kwargs)
+        body = request.get_json(silent=True) or {}
+        # Keys are scoped to the route and user so clients cannot collide with each other
+        scoped_key = f"{request.path}|{body.get('email', '') if isinstance(body, dict) else ''}|{key}"
+        fingerprint = hashlib.sha256(request.get_data()).hexdigest()
+
+        def execute():
+            response = app.make_response(route(*args, **kwargs))
+            # Streams cannot be replayed, and errors (including 429s) should be retried for real
+            return response, replayable(response.status_code, response.is_streamed)
+
+        try:
+            response, replayed = idempotency_store.run(scoped_key, fingerprint, execute)
+        except KeyConflict as e:
+            return jsonify({"error": str(e)}), 422
+        except StillRunning as e:
+            return jsonify({"error": str(e)}), 409, {'Retry-After': '1'}
+        if not replayed:
+            return response
+        return Response(response.get_data(), status=response.status_code,
+                        content_type=response.content_type, headers={'Idempotent-Replayed': 'true'})
+    return wrapper
+
+@app.route('/idempotency_stats', methods=['GET'])
+def idempotency_stats():
+    return jsonify(idempotency_store.stats()), 200
+
 # route to health check
 @app.route('/health', methods=['GET'])
 def health_check():
     return "App is running!", 200
 
+@app.route('/cache_stats', methods=['GET'])
+def cache_stats():
+    return jsonify(doc_cache.stats()), 200
+
+@app.route('/read_coalescing_stats', methods=['GET'])
+def read_coalescing_stats():
+    return jsonify(reads.stats()), 200
+
+@app.route('/meal_reuse_stats', methods=['GET'])
+def reuse_stats():
+    return jsonify(meal_reuse_stats.stats()), 200
+
 # route to add a new user to DB
 @app.route('/add_user', methods=['POST'])
 def add_user():
@@ -89,6 +395,7 @@ def add_user():
             'favorited_meals': [],
             'favorited_workouts': [],
         })
+        reads.forget('users')
 
         return jsonify({"message": "User added successfully"}), 201
 
@@ -104,13 +411,17 @@ def get_profile():
         return jsonify({"error": "Email parameter is required"}), 400
 
     try:
-        profile_ref = db.collection('users').where('email', '==', email)
-        docs = profile_ref.get()
+        fields = parse_fields(request.args.get('fields'))
+    except ValueError as ve:
+        return jsonify({"error": str(ve)}), 400
+
+    try:
+        docs = find_users_by_email(email, projection_for(fields))
 
         if not docs:
             return jsonify({"message": "Profile not found"}), 404
 
-        profile_data = docs[0].to_dict()
+        profile_data = prune_fields(docs[0].to_dict(), fields)
         profile_data['id'] = docs[0].id
         return jsonify(profile_data), 200
 
@@ -124,14 +435,16 @@ def save_profile():
         return jsonify({"error": "Email is required"}), 400
 
     try:
-        profile_ref = db.collection('users').where('email', '==', data['email'])
-        docs = profile_ref.get()
+        docs = find_users_by_email(data['email'])
 
         if docs:
             profile_id = docs[0].id
-            db.collection('users').document(profile_id).update(data)
+            profile_doc_ref = db.collection('users').document(profile_id)
+            profile_doc_ref.update(data)
+            doc_cache.invalidate(profile_doc_ref)
         else:
             db.collection('users').add(data)
+            reads.forget('users')
 
         return jsonify({"message": "Profile saved successfully"}), 200
 
@@ -144,41 +457,22 @@ def get_historical_data():
     if 'email' not in data:
         return jsonify({"error": "Email is required"}), 400
 
+    try:
+        fields = parse_fields(data.get('fields') or request.args.get('fields'))
+    except ValueError as ve:
+        return jsonify({"error": str(ve)}), 400
+
     try:
         res = []
-        profile_ref = db.collection('users').where('email', '==', data['email'])
-        profile_docs = profile_ref.get()
-        if len(profile_docs) < 1:
+        profile = storage.find_user(data['email'], ['email'])
+        if profile is None:
             raise Exception('no profile associated with user')
-        user_id = profile_docs[0].id
-        calendar_ref = db.collection('Calendar').where('belongs_to', '==', user_id)
-        if calendar_ref:
-            calendar_docs = calendar_ref.get()
-            for calendar in calendar_docs:
-                day_ids = calendar.to_dict()["days"]
-                for day_id in day_ids:
-                    day_ref = db.collection('Day').document(day_id)
-                    day_values = day_ref.get().to_dict()
-                    if "meals" in day_values:
-                        for meal_id in day_values['meals']:
-                            meal_ref = db.collection('Meal').document(meal_id)
-                            meal_doc = meal_ref.get()
-                            if  meal_doc.exists:
-                                meal_values = meal_doc.to_dict()
-                                meal_values["date"] = day_values['date']
-                                meal_values['eventType'] = "Meal"
-                                res.append(meal_values)
-                                
-                    if "workouts" in day_values:
-                        for workout_id in day_values['workouts']:
-                            workout_ref = db.collection('Workout').document(workout_id)
-                            workout_doc = workout_ref.get()
-                            if  workout_doc.exists:
-                                workout_values = workout_doc.to_dict()
-                                workout_values["date"] = day_values['date']
-                                workout_values['eventType'] = "Workout"
-                                res.append(workout_values)
-                            
+        for date, event_type, values in storage.historical_data(profile['id'], projection_for(fields)):
+            values = prune_fields(values, fields)
+            values["date"] = date
+            values['eventType'] = event_type
+            res.append(values)
+
         return jsonify(res), 200
 
     except Exception as e:
@@ -194,8 +488,7 @@ def remove_favorite_meal():
         return jsonify({"error": "Email and Meal ID are required"}), 400
     
     try:
-        user_query = db.collection('users').where('email', '==', email).limit(1)
-        user_docs = user_query.get()
+        user_docs = find_users_by_email(email)
         
         if not user_docs:
             return jsonify({"error": "User not found"}), 404
@@ -204,21 +497,20 @@ def remove_favorite_meal():
         user_ref.update({
             'favorited_meals': firestore.ArrayRemove([meal_id])
         })
-        
-        day_query = db.collection('Day').where('meals', 'array_contains', meal_id)
-        day_docs = day_query.get()
-        for day_doc in day_docs:
-            day_doc.reference.update({
-                'meals': firestore.ArrayRemove([meal_id])
-            })
+        doc_cache.invalidate(user_ref)
         
         meal_ref = db.collection('Meal').document(meal_id)
-        meal_doc = meal_ref.get()
+        meal_doc = doc_cache.get(meal_ref)
+        day_refs = days_with_meal(meal_id)
+        remove_meal_from_days(db, firestore.transactional, day_refs, meal_id, delete_meal=meal_doc.exists)
+        refresh_open_day(user_docs[0], day_refs)
 
         if not meal_doc.exists:
             return jsonify({"error": "Meal not found"}), 404
 
-        meal_ref.delete()
+        doc_cache.invalidate(meal_ref)
+        write_tombstone(meal_ref, item_owners('meals', meal_id, day_refs, user_docs))
+        unindex_meal(meal_id)
 
         return jsonify({"message": "Meal removed from favorites, associated Day entries updated, and meal deleted successfully"}), 200
     
@@ -235,23 +527,28 @@ def delete_meal():
 
     try:
         meal_ref = db.collection('Meal').document(meal_id)
-        meal_doc = meal_ref.get()
+        meal_doc = doc_cache.get(meal_ref)
 
         if not meal_doc.exists:
             return jsonify({"error": "Meal not found"}), 404
 
-        meal_ref.delete()
-
         email = data.get('email')
-        if email:
-            user_query = db.collection('users').where('email', '==', email).limit(1)
-            user_docs = user_query.get()
-
-            if user_docs:
-                user_ref = user_docs[0].reference
-                user_ref.update({
-                    'favorited_meals': firestore.ArrayRemove([meal_id])
-                })
+        user_docs = find_users_by_email(email) if email else []
+
+        day_refs = days_with_meal(meal_id)
+        remove_meal_from_days(db, firestore.transactional, day_refs, meal_id, delete_meal=True)
+        if user_docs:
+            refresh_open_day(user_docs[0], day_refs)
+        doc_cache.invalidate(meal_ref)
+        write_tombstone(meal_ref, item_owners('meals', meal_id, day_refs, user_docs))
+        unindex_meal(meal_id)
+
+        if user_docs:
+            user_ref = user_docs[0].reference
+            user_ref.update({
+                'favorited_meals': firestore.ArrayRemove([meal_id])
+            })
+            doc_cache.invalidate(user_ref)
 
         return jsonify({"message": "Meal deleted successfully"}), 200
 
@@ -268,23 +565,28 @@ def delete_workout():
 
     try:
         workout_ref = db.collection('Workout').document(workout_id)
-        workout_doc = workout_ref.get()
+        workout_doc = doc_cache.get(workout_ref)
 
         if not workout_doc.exists:
             return jsonify({"error": "Workout not found"}), 404
 
-        workout_ref.delete()
-
         email = data.get('email')
-        if email:
-            user_query = db.collection('users').where('email', '==', email).limit(1)
-            user_docs = user_query.get()
+        user_docs = find_users_by_email(email) if email else []
+        day_refs = [day_doc.reference for day_doc in
+                    db.collection('Day').where('workouts', 'array_contains', workout_id).select([]).get()]
+        owners = item_owners('workouts', workout_id, day_refs, user_docs)
 
-            if user_docs:
-                user_ref = user_docs[0].reference
-                user_ref.update({
-                    'favorited_workouts': firestore.ArrayRemove([workout_id])
-                })
+        workout_ref.delete()
+        doc_cache.invalidate(workout_ref)
+        write_tombstone(workout_ref, owners)
+        recommender.remove_workout(workout_id)
+
+        if user_docs:
+            user_ref = user_docs[0].reference
+            user_ref.update({
+                'favorited_workouts': firestore.ArrayRemove([workout_id])
+            })
+            doc_cache.invalidate(user_ref)
 
         return jsonify({"message": "Workout deleted successfully"}), 200
 
@@ -301,8 +603,7 @@ def remove_favorite_workout():
         if not email or not workout_id:
             return jsonify({"error": "Email and Workout ID are required"}), 400
 
-        user_query = db.collection('users').where('email', '==', email).limit(1)
-        user_docs = user_query.get()
+        user_docs = find_users_by_email(email)
 
         if not user_docs:
             return jsonify({"error": "User not found"}), 404
@@ -311,6 +612,7 @@ def remove_favorite_workout():
         user_ref.update({
             'favorited_workouts': firestore.ArrayRemove([workout_id])
         })
+        doc_cache.invalidate(user_ref)
 
         day_query = db.collection('Day').where('workouts', 'array_contains', workout_id)
         day_docs = day_query.get()
@@ -320,19 +622,25 @@ def remove_favorite_workout():
             })
 
         workout_ref = db.collection('Workout').document(workout_id)
-        workout_doc = workout_ref.get()
+        workout_doc = doc_cache.get(workout_ref)
 
         if not workout_doc.exists:
             return jsonify({"error": "Workout not found"}), 404
 
         workout_data = workout_doc.to_dict()
         exercise_ids = workout_data.get('exercises', [])
+        owners = item_owners('workouts', workout_id, [day_doc.reference for day_doc in day_docs], user_docs)
 
         for exercise_id in exercise_ids:
             exercise_ref = db.collection('Exercise').document(exercise_id)
             exercise_ref.delete()
+            doc_cache.invalidate(exercise_ref)
+            write_tombstone(exercise_ref, owners)
 
         workout_ref.delete()
+        doc_cache.invalidate(workout_ref)
+        write_tombstone(workout_ref, owners)
+        recommender.remove_workout(workout_id)
 
         return jsonify({"message": "Workout, associated exercises, and Day entries updated successfully"}), 200
 
@@ -340,13 +648,15 @@ def remove_favorite_workout():
         return jsonify({"error": str(e)}), 500
 
 @app.route('/create_favorite_meal', methods=['POST'])
+@idempotent
 def create_favorite_meal():
     data = request.json
     if 'email' not in data:
         return jsonify({"error": "Email is required"}), 400
 
     try:
-        meal_ref = db.collection('Meal').add({
+        # Client-supplied numbers are checked against the ingredients before they are stored
+        meal_data, _ = reconcile_meal({
             'name': data.get('name'),
             'calories': data.get('calories'),
             'carbs': data.get('carbs'),
@@ -355,11 +665,12 @@ def create_favorite_meal():
             'proteins': data.get('proteins'),
             'type': data.get('type')
         })
+        meal_ref = db.collection('Meal').add(meal_data)
         meal_id = meal_ref[1].id
+        index_meal(meal_id, meal_data)
 
         users_ref = db.collection('users')
-        user_query = users_ref.where('email', '==', data['email']).limit(1)
-        user_docs = user_query.get()
+        user_docs = find_users_by_email(data['email'])
 
         if not user_docs:
             return jsonify({"error": "User with specified email not found"}), 404
@@ -369,24 +680,10 @@ def create_favorite_meal():
         user_ref.update({
             'favorited_meals': firestore.ArrayUnion([meal_id])
         })
+        doc_cache.invalidate(user_ref)
 
-        current_date, day_name = get_current_date()
-
-        day_query = db.collection('Day').where('date', '==', current_date).limit(1)
-        day_docs = day_query.get()
-
-        if day_docs:
-            day_ref = day_docs[0].reference
-            day_ref.update({
-                'meals': firestore.ArrayUnion([meal_id])
-            })
-        else:
-            db.collection('Day').add({
-                'date': current_date,
-                'day': day_name,
-                'meals': [meal_id],
-                'workouts': []
-            })
+        current_date, day_ref = add_meal_to_today(meal_id)
+        record_streak(user_doc, current_date, day_ref)
 
         return jsonify({"message": "Meal created and added to favorites", "meal_id": meal_id}), 200
 
@@ -403,8 +700,7 @@ def add_meal_to_favorites():
         return jsonify({"error": "Meal ID and email are required"}), 400
 
     try:
-        user_query = db.collection('users').where('email', '==', email).limit(1)
-        user_docs = user_query.get()
+        user_docs = find_users_by_email(email)
 
         if not user_docs:
             return jsonify({"error": "User not found"}), 404
@@ -414,24 +710,10 @@ def add_meal_to_favorites():
         user_ref.update({
             'favorited_meals': firestore.ArrayUnion([meal_id])
         })
+        doc_cache.invalidate(user_ref)
 
-        current_date, day_name = get_current_date()
-
-        day_query = db.collection('Day').where('date', '==', current_date).limit(1)
-        day_docs = day_query.get()
-
-        if day_docs:
-            day_ref = day_docs[0].reference
-            day_ref.update({
-                'meals': firestore.ArrayUnion([meal_id])
-            })
-        else:
-            db.collection('Day').add({
-                'date': current_date,
-                'day': day_name,
-                'meals': [meal_id],
-                'workouts': []
-            })
+        current_date, day_ref = add_meal_to_today(meal_id)
+        record_streak(user_docs[0], current_date, day_ref)
 
         return jsonify({
             "message": "Meal added to favorites and associated with today's entry",
@@ -451,8 +733,7 @@ def add_workout_to_favorites():
         return jsonify({"error": "Workout ID and email are required"}), 400
 
     try:
-        user_query = db.collection('users').where('email', '==', email).limit(1)
-        user_docs = user_query.get()
+        user_docs = find_users_by_email(email)
 
         if not user_docs:
             return jsonify({"error": "User not found"}), 404
@@ -462,6 +743,7 @@ def add_workout_to_favorites():
         user_ref.update({
             'favorited_workouts': firestore.ArrayUnion([workout_id])
         })
+        doc_cache.invalidate(user_ref)
 
         current_date, day_name = get_current_date()
 
@@ -480,6 +762,7 @@ def add_workout_to_favorites():
                 'meals': [],
                 'workouts': [workout_id]
             })
+        record_streak(user_docs[0], current_date)
 
         return jsonify({
             "message": "Workout added to favorites and associated with today's entry",
@@ -499,8 +782,7 @@ def check_favorite():
         return jsonify({"error": "Meal ID and email are required"}), 400
 
     try:
-        user_query = db.collection('users').where('email', '==', email).limit(1)
-        user_docs = user_query.get()
+        user_docs = find_users_by_email(email)
 
         if not user_docs:
             return jsonify({"error": "User not found"}), 404
@@ -525,8 +807,7 @@ def check_favorite_workout():
         return jsonify({"error": "Workout ID and email are required"}), 400
 
     try:
-        user_query = db.collection('users').where('email', '==', email).limit(1)
-        user_docs = user_query.get()
+        user_docs = find_users_by_email(email)
 
         if not user_docs:
             return jsonify({"error": "User not found"}), 404
@@ -541,6 +822,36 @@ def check_favorite_workout():
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
+@app.route('/check_favorites', methods=['POST'])
+def check_favorites():
+    data = request.json
+    email = data.get('email')
+    meal_ids = data.get('meal_ids', [])
+    workout_ids = data.get('workout_ids', [])
+
+    if not email:
+        return jsonify({"error": "Email is required"}), 400
+    if not isinstance(meal_ids, list) or not isinstance(workout_ids, list):
+        return jsonify({"error": "meal_ids and workout_ids must be lists"}), 400
+
+    try:
+        # One user read answers every card on the page
+        user_doc = get_user_doc_by_email(email)
+        if not user_doc:
+            return jsonify({"error": "User not found"}), 404
+
+        user_data = user_doc.to_dict()
+        favorited_meals = set(user_data.get('favorited_meals') or [])
+        favorited_workouts = set(user_data.get('favorited_workouts') or [])
+
+        return jsonify({
+            "meals": {meal_id: meal_id in favorited_meals for meal_id in meal_ids if isinstance(meal_id, str)},
+            "workouts": {workout_id: workout_id in favorited_workouts for workout_id in workout_ids if isinstance(workout_id, str)}
+        }), 200
+
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
 @app.route('/create_favorite_workout', methods=['POST'])
 def create_favorite_workout():
     data = request.json
@@ -548,29 +859,33 @@ def create_favorite_workout():
         return jsonify({"error": "Email is required"}), 400
 
     try:
-        user_query = db.collection('users').where('email', '==', data['email']).limit(1)
-        user_docs = user_query.get()
+        user_docs = find_users_by_email(data['email'])
         if not user_docs:
             return jsonify({"error": "User with specified email not found"}), 404
 
         user_ref = user_docs[0].reference
 
+        exercises = estimate_workout(data.get('exercises', []), body_weight_kg(user_docs[0].to_dict()), data.get('total_minutes'))
+
         exercise_ids = []
-        for exercise in data.get('exercises', []):
+        for exercise in exercises:
             exercise_ref = db.collection('Exercise').add(exercise)
             exercise_ids.append(exercise_ref[1].id)
 
-        workout_ref = db.collection('Workout').add({
+        workout_data = {
             'name': data.get('name', ''),
             'exercises': exercise_ids, 
             'body_part_focus': data.get('body_part_focus', ''),
             'total_minutes': data.get('total_minutes'),
-        })
+        }
+        workout_ref = db.collection('Workout').add(workout_data)
         workout_id = workout_ref[1].id
+        recommender.upsert_workout(workout_id, workout_data, workout_calories(exercises))
 
         user_ref.update({
             'favorited_workouts': firestore.ArrayUnion([workout_id])
         })
+        doc_cache.invalidate(user_ref)
 
         current_date, day_name = get_current_date()
         day_query = db.collection('Day').where('date', '==', current_date).limit(1)
@@ -588,6 +903,7 @@ def create_favorite_workout():
                 'meals': [],
                 'workouts': [workout_id]
             })
+        record_streak(user_docs[0], current_date)
 
         return jsonify({"message": "Workout created successfully", "workout_id": workout_id}), 200
 
@@ -601,8 +917,12 @@ def get_user_meals():
         return jsonify({"error": "Email parameter is required"}), 400
 
     try:
-        user_query = db.collection('users').where('email', '==', email).limit(1)
-        user_docs = user_query.get()
+        fields = parse_fields(request.args.get('fields'))
+    except ValueError as ve:
+        return jsonify({"error": str(ve)}), 400
+
+    try:
+        user_docs = find_users_by_email(email, ['meals'])
 
         if not user_docs:
             return jsonify({"error": "User not found"}), 404
@@ -613,13 +933,13 @@ def get_user_meals():
         if not meal_ids:
             return jsonify({"message": "No meals found for this user"}), 404
 
+        meal_docs = get_docs_by_ids('Meal', meal_ids, field_paths=projection_for(fields))
         meal_list = []
         for meal_id in meal_ids:
-            meal_ref = db.collection('Meal').document(meal_id)
-            meal_doc = meal_ref.get()
+            meal_doc = meal_docs.get(meal_id)
 
-            if meal_doc.exists:
-                meal_data = meal_doc.to_dict()
+            if meal_doc:
+                meal_data = prune_fields(meal_doc.to_dict(), fields)
                 meal_data['id'] = meal_id
                 meal_list.append(meal_data)
             else:
@@ -640,8 +960,7 @@ def get_user_workouts():
         return jsonify({"error": "Email parameter is required"}), 400
 
     try:
-        user_query = db.collection('users').where('email', '==', email).limit(1)
-        user_docs = user_query.get()
+        user_docs = find_users_by_email(email)
 
         if not user_docs:
             return jsonify({"error": "User not found"}), 404
@@ -655,7 +974,7 @@ def get_user_workouts():
         workout_list = []
         for workout_id in workout_ids:
             workout_ref = db.collection('Workout').document(workout_id)
-            workout_doc = workout_ref.get()
+            workout_doc = doc_cache.get(workout_ref)
 
             if workout_doc.exists:
                 workout_data = workout_doc.to_dict()
@@ -672,26 +991,15 @@ def get_user_workouts():
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
-@app.route('/generate_meal', methods=['POST'])
-def generate_meal():
-    user_input = request.json
-    if not user_input:
-        return jsonify({"error": "Request body is required"}), 400
-    
-    email = user_input.get('email')  # Email sent by the client
-    if not email :
-        return jsonify({"error": "Email is required"}), 400
-
-    try:
-        model = genai.GenerativeModel('gemini-pro')
-
-        prompt = f"""
+def meal_prompt(criteria, goal=None):
+    goal_line = f"\n        - Fitness goal: {goal}" if goal else ""
+    return f"""
         Create a meal recommendation based on the following criteria:
-        - Type of meal: {user_input.get('type', 'any')}
-        - Dietary preference: {user_input.get('diet', 'any')}
-        - Calorie range: {user_input.get('calories', 'any')} calories
-        - Ingredients to include: {', '.join(user_input.get('ingredients', []))}
-        - Time available: {user_input.get('time', 'any')} minutes
+        - Type of meal: {criteria.get('type', 'any')}
+        - Dietary preference: {criteria.get('diet', 'any')}
+        - Calorie range: {criteria.get('calories', 'any')} calories
+        - Ingredients to include: {', '.join(criteria.get('ingredients', []))}
+        - Time available: {criteria.get('time', 'any')} minutes{goal_line}
 
         Respond with ONLY a JSON object that fits this schema, with no additional text:
         {{
@@ -701,84 +1009,18 @@ def generate_meal():
             "fats": int,
             "proteins": int,
             "ingredients": [str],
-            "type": "{user_input.get('type', 'meal')}"
+            "type": "{criteria.get('type', 'meal')}"
         }}
+        List each ingredient with its quantity, for example "150 g chicken breast" or "1 cup cooked rice".
         """
 
-        response = model.generate_content(prompt)
-
-        try:
-            cleaned_response = re.sub(r"^```json|```$", "", response.text.strip(), flags=re.MULTILINE)
-            meal_data = json.loads(cleaned_response)
-        except json.JSONDecodeError:
-            return jsonify({"error": "Failed to parse model's response to JSON. Try again to generate a new response."}), 500
-
-        user_id = get_user_doc_id_by_email(email)
-        if not user_id:
-            return jsonify({"error": "User not found"}), 404
-        calendar_ref = db.collection('Calendar').where('belongs_to', '==', user_id)
-        #Assume user has one calendar
-        calendar_doc = calendar_ref.get()
-        if (not len(calendar_doc) or not calendar_doc[0].exists):
-            return jsonify({"error": "No calendars exist for user"}), 400
-        calendar_doc = calendar_doc[0]
-
-        # store generated meal in Firestore
-        meal_ref = db.collection('Meal').add(meal_data)
-        meal_id = meal_ref[1].id
-        
-        # For each date specified, add the workout to a Day document
-        for dateObj in user_input.get('dates', []):  # Provide a default empty list to avoid errors
-            day_ids = calendar_doc.to_dict()["days"]
-            match = False
-            for day_id in day_ids:
-                day_ref = db.collection('Day').document(day_id)
-                day_values = day_ref.get().to_dict()
-                if dateObj.get('date') == day_values['date']:
-                    #Update
-                    day_ref.update({'meals': firestore.ArrayUnion([str(meal_id)])})
-                    match = True 
-            if not match:
-                # Create when record does not exist
-                doc_to_add = {
-                    'date': dateObj['date'],
-                    'day': dateObj['day'],
-                    'meals': [],
-                    'workouts': [str(meal_id)]
-                }
-                new_day_ref = db.collection('Day').add(doc_to_add)
-                new_day_id = new_day_ref[1].id
-                calendar_doc.reference.update({'days': firestore.ArrayUnion([str(new_day_id)])})
-
-        return jsonify({
-            "message": "Meal generated successfully",
-            "meal_id": meal_id,
-            "meal_data": meal_data
-        }), 201
-
-    except Exception as e:
-        return jsonify({"error": str(e)}), 500
-
-@app.route('/generate_workout', methods=['POST'])
-def generate_workout():
-    user_input = request.json
-    if not user_input:
-        return jsonify({"error": "Request body is required"}), 400
-    
-    email = user_input.get('email')
-    if not email:
-        return jsonify({"error": "Email is required"}), 400
-
-    try:
-        model = genai.GenerativeModel('gemini-pro')
-
-        body_parts = user_input.get('body_parts', '')
-
-        prompt = f"""
+def workout_prompt(criteria, goal=None):
+    goal_line = f"\n        - Fitness goal: {goal}" if goal else ""
+    return f"""
         Create a workout recommendation based on the following criteria:
-        - Total time available: {user_input.get('total_minutes', 'any')} minutes
-        - Focus on body parts: {body_parts}
-        - Desired calories to burn: {user_input.get('avg_calories_burned', 'any')} calories
+        - Total time available: {criteria.get('total_minutes', 'any')} minutes
+        - Focus on body parts: {criteria.get('body_parts', '')}
+        - Desired calories to burn: {criteria.get('avg_calories_burned', 'any')} calories{goal_line}
 
         Be creative and engaging when naming the workout and exercises. The workout and exercise names should be a short phrase at most 2-3 words. Include around 3-4 exercises max, and the description for each exercise should be 1-2 sentences.
 
@@ -789,7 +1031,6 @@ def generate_workout():
             "exercises": [
                 {{
                     "name": str,
-                    "avg_calories_burned": int,
                     "body_parts": str,
                     "description": str,
                     "reps": int,
@@ -800,68 +1041,392 @@ def generate_workout():
         }}
         """
 
-        response = model.generate_content(prompt)
-
+model_output_stats = OutputStats()
+
+# Model tiers, most capable first; see model_client.py for routing, hedging and circuit breaking
+model_client = ModelClient(
+    genai.GenerativeModel,
+    tiers=[tier.strip() for tier in os.getenv('MODEL_TIERS', 'gemini-pro').split(',') if tier.strip()],
+    timeout=float(os.getenv('MODEL_TIMEOUT', 30)),
+)
+# Seconds a user-facing generation may wait for the model
+GENERATION_LATENCY_BUDGET = float(os.getenv('GENERATION_LATENCY_BUDGET', 20))
+
+@app.route('/model_stats', methods=['GET'])
+def model_stats():
+    return jsonify(model_client.stats()), 200
+
+def repair_model_output(prompt):
+    return model_client.generate(prompt, budget=GENERATION_LATENCY_BUDGET).text
+
+def parse_generation(kind, text):
+    # Tolerant parsing and schema defaults first; one short repair call only for unusable output
+    return parse_output(kind, text, repair=repair_model_output, stats=model_output_stats)
+
+def wants_stream(user_input):
+    return bool(user_input.get('stream')) or 'text/event-stream' in request.headers.get('Accept', '')
+
+def sse_event(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+def stream_response(events):
+    return Response(
+        stream_with_context(events),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+def stream_generation(kind, prompt, data, finish, fallback, record=None):
+    """
+    Server-sent events for a generation request: a 'field' event for each completed
+    top-level field, an 'item' event for each completed array element (exercise or
+    ingredient), then 'done' with what finish(data) stored, or 'error'.
+    A pooled candidate (data is not None) goes straight to 'done'. When no model tier
+    is available, the stream breaks off, or it runs past GENERATION_LATENCY_BUDGET,
+    'done' carries fallback() instead and replaces anything streamed before it.
+    """
+    try:
+        if data is None:
+            chunks = []
+            try:
+                response = model_client.stream(prompt, budget=GENERATION_LATENCY_BUDGET)
+                parser = ObjectStreamParser()
+                started = time.monotonic()
+                for chunk in response:
+                    if time.monotonic() - started > GENERATION_LATENCY_BUDGET:
+                        response.close()
+                        raise ModelUnavailable(f"No complete {kind} within {GENERATION_LATENCY_BUDGET:g} seconds")
+                    chunks.append(chunk.text)
+                    if parser is None:
+                        continue
+                    try:
+                        events = parser.feed(chunk.text)
+                    except ValueError:
+                        # Malformed output is still collected for the tolerant parse below
+                        parser, events = None, []
+                    for event in events:
+                        if event[0] == 'item':
+                            yield sse_event('item', {'key': event[1], 'index': event[2], 'value': event[3]})
+                        else:
+                            yield sse_event('field', {'key': event[1], 'value': event[2]})
+            except Exception as e:
+                print(f"Serving a fallback {kind}: {e}")
+                data = fallback()
+            else:
+                if record:
+                    record(time.monotonic() - started)
+                data = parse_generation(kind, ''.join(chunks))
+        yield sse_event('done', finish(data))
+    except Exception as e:
+        yield sse_event('error', {'error': str(e)})
+
+# Stored favorites for degraded mode; built in the background so the first fallback never waits on a scan
+fallback_library = LiveIndex(
+    db, lambda client: FallbackLibrary().load(client),
+    max_age=float(os.getenv('FALLBACK_LIBRARY_MAX_AGE', 3600)), name='fallback library'
+)
+fallback_library.get(wait=False)
+fallback_stats = FallbackStats()
+
+@app.route('/fallback_stats', methods=['GET'])
+def get_fallback_stats():
+    return jsonify(fallback_stats.stats()), 200
+
+def fallback_meal(user_input):
+    library = fallback_library.get(wait=False) or FallbackLibrary()
+    return fallback_stats.timed('meal', lambda: library.meal(user_input))
+
+def fallback_workout(user_input, user_data):
+    library = fallback_library.get(wait=False) or FallbackLibrary()
+    return fallback_stats.timed('workout', lambda: library.workout(user_input, body_weight_kg(user_data)))
+
+def pregenerate(kind, criteria, user_data):
+    # Runs on the pool's worker thread; the routes finish pooled output the same way as fresh output
+    if kind == 'meal':
+        # Background work neither hedges nor holds to the interactive budget
+        response = model_client.generate(meal_prompt(criteria, user_data.get('goal')), hedge=False)
+        data = parse_generation('meal', response.text)
+        data, _ = reconcile_meal(data)
+        if str(criteria.get('diet') or 'any').lower() != 'any':
+            data['diet'] = criteria['diet']
+        return data
+    response = model_client.generate(workout_prompt(criteria, user_data.get('goal')), hedge=False)
+    data = parse_generation('workout', response.text)
+    # Estimated calories let requests for a calorie target be matched against the candidate
+    data['exercises'] = estimate_workout(data.get('exercises', []), body_weight_kg(user_data), data.get('total_minutes'))
+    return data
+
+# Candidates generated ahead of time for the request shapes each user asks for;
+# PREGENERATION_BUDGET_PER_HOUR caps the model calls the worker may make. The worker
+# calls the model in the background, so it is opt-in (PREGENERATION=1) per deployment
+PREGENERATION_ENABLED = os.getenv('PREGENERATION', '0') == '1'
+pregeneration_pool = PregenerationPool(
+    pregenerate,
+    ttl=float(os.getenv('PREGENERATION_TTL', 6 * 3600)),
+    budget_per_hour=int(os.getenv('PREGENERATION_BUDGET_PER_HOUR', 30)),
+)
+if PREGENERATION_ENABLED:
+    pregeneration_pool.start()
+
+@app.route('/model_output_stats', methods=['GET'])
+def get_model_output_stats():
+    return jsonify(model_output_stats.stats()), 200
+
+@app.route('/pregeneration_stats', methods=['GET'])
+def pregeneration_stats():
+    return jsonify(pregeneration_pool.stats()), 200
+
+# Token buckets per user and overall for the model-backed routes; see admission.py
+admission = AdmissionController(
+    user_rate=float(os.getenv('GENERATION_USER_PER_MINUTE', 10)) / 60,
+    user_burst=int(os.getenv('GENERATION_USER_BURST', 5)),
+    global_rate=float(os.getenv('GENERATION_GLOBAL_PER_MINUTE', 120)) / 60,
+    global_burst=int(os.getenv('GENERATION_GLOBAL_BURST', 20)),
+    max_queue=int(os.getenv('GENERATION_MAX_QUEUE', 50)),
+    max_wait=float(os.getenv('GENERATION_MAX_WAIT', 10)),
+)
+
+def admitted(route):
+    @wraps(route)
+    def wrapper(*args, **kwargs):
+        body = request.get_json(silent=True) or {}
         try:
-            cleaned_response = re.sub(r"^```json|```$", "", response.text.strip(), flags=re.MULTILINE)
-            workout_data = json.loads(cleaned_response)
-        except json.JSONDecodeError:
-            return jsonify({"error": "Failed to parse model's response to JSON. Try again to generate a new response."}), 500
-
-        body_parts_list = [exercise.get('body_parts', '') for exercise in workout_data.get('exercises', [])]
-        body_part_focus = ', '.join(sorted(set(', '.join(body_parts_list).split(', '))))
+            admission.acquire(body.get('email') or request.remote_addr)
+        except RateLimited as e:
+            response = jsonify({"error": f"Too many generation requests: {e.reason}", "retry_after": e.retry_after_header})
+            return response, 429, {'Retry-After': e.retry_after_header}
+        return route(*args, **kwargs)
+    return wrapper
 
-        exercise_ids = []
-        for exercise in workout_data.get('exercises', []):
-            exercise_ref = db.collection('Exercise').add(exercise)
-            exercise_ids.append(exercise_ref[1].id)
+@app.route('/admission_stats', methods=['GET'])
+def admission_stats():
+    return jsonify(admission.stats()), 200
 
-        workout_data['exercises'] = exercise_ids
-        workout_data['body_part_focus'] = body_part_focus
-        workout_ref = db.collection('Workout').add(workout_data)
-        workout_id = workout_ref[1].id
+@app.route('/generate_meal', methods=['POST'])
+@idempotent
+@admitted
+def generate_meal():
+    user_input = request.json
+    if not user_input:
+        return jsonify({"error": "Request body is required"}), 400
+    
+    email = user_input.get('email')  # Email sent by the client
+    if not email :
+        return jsonify({"error": "Email is required"}), 400
 
-        user_id = get_user_doc_id_by_email(email)
-        if not user_id:
+    try:
+        # Look the user and calendar up first so a reused meal needs no model call at all
+        user_doc = get_user_doc_by_email(email)
+        if not user_doc:
             return jsonify({"error": "User not found"}), 404
-        calendar_ref = db.collection('Calendar').where('belongs_to', '==', user_id)
         #Assume user has one calendar
-        calendar_doc = calendar_ref.get()
+        calendar_doc = find_calendars(user_doc.id)
         if (not len(calendar_doc) or not calendar_doc[0].exists):
             return jsonify({"error": "No calendars exist for user"}), 400
         calendar_doc = calendar_doc[0]
-        # For each date specified, add the workout to a Day document
-        for dateObj in user_input.get('dates', []):
-            day_ids = calendar_doc.to_dict()["days"]
-            match = False
-            for day_id in day_ids:
-                day_ref = db.collection('Day').document(day_id)
-                day_values = day_ref.get().to_dict()
-                if dateObj.get('date') == day_values['date']:
-                    #Update
-                    day_ref.update({'workouts': firestore.ArrayUnion([str(workout_id)])})
-                    match = True 
-            if not match:
-                # Create when record does not exist
-                doc_to_add = {
-                    'date': dateObj['date'],
-                    'day': dateObj['day'],
-                    'meals': [],
-                    'workouts': [str(workout_id)]
-                }
+
+        # Serve a copy of a stored meal that already fits the request, unless the client asks
+        # for a fresh one; while the index is still loading every request goes to the model
+        reuse_index = meal_reuse.get(wait=False) if MEAL_REUSE_ENABLED and not user_input.get('fresh') else None
+        if reuse_index is not None:
+            user_data = user_doc.to_dict()
+            reused_id = reuse_index.find_reusable(
+                user_input, exclude=[*user_data.get('favorited_meals', []), *user_data.get('meals', [])]
+            )
+            reused_doc = get_docs_by_ids('Meal', [reused_id]).get(reused_id) if reused_id else None
+            if reused_doc:
+                meal_id, meal_data = copy_meal(reused_id, reused_doc.to_dict())
+                schedule_on_days(calendar_doc, 'meals', meal_id, user_input.get('dates', []), user_doc)
+                meal_reuse_stats.record_reuse()
+                return jsonify({
+                    "message": "Meal generated successfully",
+                    "meal_id": meal_id,
+                    "meal_data": meal_data,
+                    "reused": True
+                }), 201
+            if reused_id:
+                meal_reuse.apply('remove', reused_id)
+
+        # A candidate pre-generated in the background for this user and profile needs no wait
+        user_data = user_doc.to_dict()
+        meal_data = pregeneration_pool.take(user_doc.id, 'meal', user_data, user_input) if PREGENERATION_ENABLED else None
+        if wants_stream(user_input):
+            return stream_response(stream_generation(
+                'meal', meal_prompt(user_input, user_data.get('goal')), meal_data,
+                lambda data: save_generated_meal(user_input, user_doc, calendar_doc, data),
+                lambda: fallback_meal(user_input),
+                record=meal_reuse_stats.record_generation,
+            ))
+        if meal_data is None:
+            started = time.monotonic()
+            try:
+                response = model_client.generate(meal_prompt(user_input, user_data.get('goal')), budget=GENERATION_LATENCY_BUDGET)
+            except ModelUnavailable as e:
+                print(f"Serving a fallback meal: {e}")
+                return jsonify(save_generated_meal(user_input, user_doc, calendar_doc, fallback_meal(user_input))), 201
+            meal_reuse_stats.record_generation(time.monotonic() - started)
+
+            try:
+                meal_data = parse_generation('meal', response.text)
+            except ValueError:
+                return jsonify({"error": "Failed to parse model's response to JSON. Try again to generate a new response."}), 500
+
+        return jsonify(save_generated_meal(user_input, user_doc, calendar_doc, meal_data)), 201
+
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+def save_generated_meal(user_input, user_doc, calendar_doc, meal_data):
+    fallback = bool(meal_data.get('fallback'))
+    # The model's numbers are checked against the local nutrient table instead of trusted
+    meal_data, _ = reconcile_meal(meal_data)
+    # Record the requested diet so later requests with the same diet can reuse this meal
+    if str(user_input.get('diet') or 'any').lower() != 'any':
+        meal_data['diet'] = user_input['diet']
+
+    # A near-copy of a stored meal is stored as a copy of that meal, keeping its checked numbers
+    reuse_index = meal_reuse.get(wait=False) if MEAL_REUSE_ENABLED else None
+    duplicate_id = reuse_index.find_duplicate(meal_data) if reuse_index is not None else None
+    if duplicate_id:
+        meal_reuse_stats.record_duplicate()
+    duplicate_doc = get_docs_by_ids('Meal', [duplicate_id]).get(duplicate_id) if duplicate_id else None
+    if duplicate_doc:
+        meal_id, meal_data = copy_meal(duplicate_id, duplicate_doc.to_dict())
+    else:
+        # store generated meal in Firestore
+        meal_ref = db.collection('Meal').add(meal_data)
+        meal_id = meal_ref[1].id
+        index_meal(meal_id, meal_data)
+
+    schedule_on_days(calendar_doc, 'meals', meal_id, user_input.get('dates', []), user_doc)
+
+    return {
+        "message": "Meal generated successfully",
+        "meal_id": meal_id,
+        "meal_data": meal_data,
+        "fallback": fallback
+    }
+
+def schedule_on_days(calendar_doc, field, item_id, dates, user_doc=None):
+    # For each date specified, add the item to the matching Day document or create one;
+    # an item put on today also counts toward user_doc's logging streak
+    day_ids = calendar_doc.to_dict().get("days", [])
+    days = get_docs_by_ids('Day', day_ids)
+    today, _ = get_current_date()
+    for dateObj in dates:
+        match = False
+        for day_id in day_ids:
+            if day_id in days and dateObj.get('date') == days[day_id].to_dict().get('date'):
+                if field == 'meals':
+                    add_meal_to_day(db, firestore.transactional, db.collection('Day').document(day_id), str(item_id))
+                else:
+                    db.collection('Day').document(day_id).update({field: firestore.ArrayUnion([str(item_id)])})
+                match = True
+                new_day_id = day_id
+        if not match:
+            # Create when record does not exist
+            doc_to_add = {
+                'date': dateObj['date'],
+                'day': dateObj['day'],
+                'meals': [],
+                'workouts': []
+            }
+            if field == 'meals':
+                new_day_id = db.collection('Day').document().id
+                add_meal_to_day(db, firestore.transactional, db.collection('Day').document(new_day_id), str(item_id),
+                                new_day=doc_to_add)
+            else:
+                doc_to_add[field] = [str(item_id)]
                 new_day_ref = db.collection('Day').add(doc_to_add)
                 new_day_id = new_day_ref[1].id
-                calendar_doc.reference.update({'days': firestore.ArrayUnion([str(new_day_id)])})
+            calendar_doc.reference.update({'days': firestore.ArrayUnion([str(new_day_id)])})
+            reads.forget('Calendar')
+        if user_doc is not None and dateObj.get('date') == today:
+            record_streak(user_doc, today, db.collection('Day').document(new_day_id) if field == 'meals' else None)
 
-        return jsonify({
-            "message": "Workout generated successfully",
-            "workout_id": workout_id,
-            "workout_data": workout_data
-        }), 201
+@app.route('/generate_workout', methods=['POST'])
+@idempotent
+@admitted
+def generate_workout():
+    user_input = request.json
+    if not user_input:
+        return jsonify({"error": "Request body is required"}), 400
+    
+    email = user_input.get('email')
+    if not email:
+        return jsonify({"error": "Email is required"}), 400
+
+    try:
+        # Look the user up first: their weight drives the calorie estimates, and an
+        # unknown user should not cost a model call
+        user_doc = get_user_doc_by_email(email)
+        if not user_doc:
+            return jsonify({"error": "User not found"}), 404
+
+        #Assume user has one calendar
+        calendar_doc = find_calendars(user_doc.id)
+        if (not len(calendar_doc) or not calendar_doc[0].exists):
+            return jsonify({"error": "No calendars exist for user"}), 400
+        calendar_doc = calendar_doc[0]
+
+        user_data = user_doc.to_dict()
+        workout_data = (pregeneration_pool.take(user_doc.id, 'workout', user_data, user_input)
+                        if PREGENERATION_ENABLED else None)
+        if wants_stream(user_input):
+            return stream_response(stream_generation(
+                'workout', workout_prompt(user_input, user_data.get('goal')), workout_data,
+                lambda data: save_generated_workout(user_input, user_doc, calendar_doc, data),
+                lambda: fallback_workout(user_input, user_data),
+            ))
+        if workout_data is None:
+            try:
+                response = model_client.generate(workout_prompt(user_input, user_data.get('goal')), budget=GENERATION_LATENCY_BUDGET)
+            except ModelUnavailable as e:
+                print(f"Serving a fallback workout: {e}")
+                workout_data = fallback_workout(user_input, user_data)
+                return jsonify(save_generated_workout(user_input, user_doc, calendar_doc, workout_data)), 201
+
+            try:
+                workout_data = parse_generation('workout', response.text)
+            except ValueError:
+                return jsonify({"error": "Failed to parse model's response to JSON. Try again to generate a new response."}), 500
+
+        return jsonify(save_generated_workout(user_input, user_doc, calendar_doc, workout_data)), 201
 
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
+def save_generated_workout(user_input, user_doc, calendar_doc, workout_data):
+    user_data = user_doc.to_dict()
+    # Calories come from the local MET table, not from the model
+    workout_data['exercises'] = estimate_workout(
+        workout_data.get('exercises', []), body_weight_kg(user_data), workout_data.get('total_minutes')
+    )
+
+    body_parts_list = [exercise.get('body_parts', '') for exercise in workout_data.get('exercises', [])]
+    body_part_focus = ', '.join(sorted(set(', '.join(body_parts_list).split(', '))))
+
+    exercise_ids = []
+    for exercise in workout_data.get('exercises', []):
+        exercise_ref = db.collection('Exercise').add(exercise)
+        exercise_ids.append(exercise_ref[1].id)
+
+    calories = workout_calories(workout_data.get('exercises', []))
+    workout_data['exercises'] = exercise_ids
+    workout_data['body_part_focus'] = body_part_focus
+    workout_ref = db.collection('Workout').add(workout_data)
+    workout_id = workout_ref[1].id
+    recommender.upsert_workout(workout_id, workout_data, calories)
+
+    schedule_on_days(calendar_doc, 'workouts', workout_id, user_input.get('dates', []), user_doc)
+
+    return {
+        "message": "Workout generated successfully",
+        "workout_id": workout_id,
+        "workout_data": workout_data,
+        "fallback": bool(workout_data.get('fallback'))
+    }
+
 @app.route('/get_n_not_favorited_meals', methods=['GET'])
 def get_n_not_favorited_meals():
     try:
@@ -873,8 +1438,7 @@ def get_n_not_favorited_meals():
             return jsonify({"error": "Email is required"}), 400
 
         # Fetch the user's data to get the favorited meals
-        user_query = db.collection('users').where('email', '==', user_email).limit(1)
-        user_docs = user_query.get()
+        user_docs = find_users_by_email(user_email)
 
         if not user_docs:
             return jsonify({"error": "User not found"}), 404
@@ -882,18 +1446,13 @@ def get_n_not_favorited_meals():
         user_data = user_docs[0].to_dict()
         favorited_meals = set(user_data.get('favorited_meals', []))  # Get the list of favorited meals
 
-        # Fetch meals from the 'Meal' collection
-        meals_query = db.collection('Meal').get()
-        meal_list = []
-
-        # Add only non-favorited meals to the response
-        for meal in meals_query:
-            if meal.id not in favorited_meals:
-                meal_list.append({**meal.to_dict(), 'id': meal.id})
-
-            # Stop when we've collected the desired number of meals
-            if len(meal_list) >= num_meals:
-                break
+        # Rank every non-favorited meal for this user, then read only the winners
+        meal_ids = recommender.recommend_meals(user_data, num_meals, exclude=favorited_meals)
+        meal_docs = get_docs_by_ids('Meal', meal_ids)
+        for meal_id in meal_ids:
+            if meal_id not in meal_docs:
+                unindex_meal(meal_id)
+        meal_list = [{**meal_docs[meal_id].to_dict(), 'id': meal_id} for meal_id in meal_ids if meal_id in meal_docs]
 
         return jsonify(meal_list), 200
 
@@ -913,35 +1472,30 @@ def get_n_not_favorited_workouts():
         if not user_email:
             return jsonify({"error": "Email is required"}), 400
 
-        user_query = db.collection('users').where('email', '==', user_email).limit(1)
-        user_docs = user_query.get()
+        user_docs = find_users_by_email(user_email)
         if not user_docs:
             return jsonify({"error": "User not found"}), 404
 
         user_data = user_docs[0].to_dict()
         favorited_workouts = set(user_data.get('favorited_workouts', []))
 
-        workouts_query = db.collection('Workout').get()
-        workout_list = []
-
-        for workout in workouts_query:
-            if workout.id not in favorited_workouts:
-                workout_data = {**workout.to_dict(), 'id': workout.id}
-
-                exercise_details = []
-                for exercise_id in workout_data.get("exercises", []):
-                    if not isinstance(exercise_id, str):
-                        continue
-                    exercise_ref = db.collection('Exercise').document(exercise_id)
-                    exercise_doc = exercise_ref.get()
-                    if exercise_doc.exists:
-                        exercise_details.append(exercise_doc.to_dict())
-
-                workout_data["exercises"] = exercise_details
-                workout_list.append(workout_data)
-
-                if len(workout_list) >= num_workouts:
-                    break
+        workout_ids = recommender.recommend_workouts(user_data, num_workouts, exclude=favorited_workouts)
+        workout_docs = get_docs_by_ids('Workout', workout_ids)
+        for workout_id in workout_ids:
+            if workout_id not in workout_docs:
+                recommender.remove_workout(workout_id)
+        workout_list = [{**workout_docs[workout_id].to_dict(), 'id': workout_id}
+                        for workout_id in workout_ids if workout_id in workout_docs]
+
+        exercise_docs = get_docs_by_ids('Exercise', [
+            exercise_id for workout_data in workout_list for exercise_id in workout_data.get("exercises", [])
+            if isinstance(exercise_id, str)
+        ])
+        for workout_data in workout_list:
+            workout_data["exercises"] = [
+                exercise_docs[exercise_id].to_dict()
+                for exercise_id in workout_data.get("exercises", []) if exercise_id in exercise_docs
+            ]
 
         return jsonify(workout_list), 200
 
@@ -961,8 +1515,12 @@ def get_favorite_meals():
         return jsonify({"error": "Email parameter is required"}), 400
 
     try:
-        user_query = db.collection('users').where('email', '==', email).limit(1)
-        user_docs = user_query.get()
+        fields = parse_fields(request.args.get('fields'))
+    except ValueError as ve:
+        return jsonify({"error": str(ve)}), 400
+
+    try:
+        user_docs = find_users_by_email(email, ['favorited_meals'])
 
         if not user_docs:
             return jsonify({"error": "User not found"}), 404
@@ -973,13 +1531,13 @@ def get_favorite_meals():
         if not meal_ids:
             return jsonify({"message": "No meals found for this user"}), 404
 
+        meal_docs = get_docs_by_ids('Meal', meal_ids, field_paths=projection_for(fields))
         meal_list = []
         for meal_id in meal_ids:
-            meal_ref = db.collection('Meal').document(meal_id)
-            meal_doc = meal_ref.get()
+            meal_doc = meal_docs.get(meal_id)
 
-            if meal_doc.exists:
-                meal_data = meal_doc.to_dict()
+            if meal_doc:
+                meal_data = prune_fields(meal_doc.to_dict(), fields)
                 meal_data['id'] = meal_id
                 meal_list.append(meal_data)
             else:
@@ -1003,8 +1561,7 @@ def unfavorite_meal():
         return jsonify({"error": "Email and Meal ID are required"}), 400
 
     try:
-        user_query = db.collection('users').where('email', '==', email).limit(1)
-        user_docs = user_query.get()
+        user_docs = find_users_by_email(email)
 
         if not user_docs:
             return jsonify({"error": "User not found"}), 404
@@ -1014,6 +1571,7 @@ def unfavorite_meal():
         user_ref.update({
             'favorited_meals': firestore.ArrayRemove([meal_id])
         })
+        doc_cache.invalidate(user_ref)
 
         current_date, _ = get_current_date()
 
@@ -1021,10 +1579,8 @@ def unfavorite_meal():
         day_docs = day_query.get()
 
         if day_docs:
-            day_ref = day_docs[0].reference
-            day_ref.update({
-                'meals': firestore.ArrayRemove([meal_id])
-            })
+            remove_meal_from_days(db, firestore.transactional, [day_docs[0].reference], meal_id)
+            record_streak(user_docs[0], current_date, day_docs[0].reference, logged=False)
 
         return jsonify({
             "message": "Meal unfavorited and removed from today's entry successfully",
@@ -1044,8 +1600,7 @@ def unfavorite_workout():
         return jsonify({"error": "Email and Workout ID are required"}), 400
 
     try:
-        user_query = db.collection('users').where('email', '==', email).limit(1)
-        user_docs = user_query.get()
+        user_docs = find_users_by_email(email)
 
         if not user_docs:
             return jsonify({"error": "User not found"}), 404
@@ -1055,6 +1610,7 @@ def unfavorite_workout():
         user_ref.update({
             'favorited_workouts': firestore.ArrayRemove([workout_id])
         })
+        doc_cache.invalidate(user_ref)
 
         current_date, _ = get_current_date()
 
@@ -1087,21 +1643,29 @@ def edit_meal():
 
     try:
         # Find the user by email
-        user_query = db.collection('users').where('email', '==', email).limit(1)
-        user_docs = user_query.get()
+        user_docs = find_users_by_email(email)
 
         if not user_docs:
             return jsonify({"error": "User not found"}), 404
 
         # Reference to the meal document
         meal_ref = db.collection('Meal').document(meal_id)
-        meal_doc = meal_ref.get()
+        meal_doc = doc_cache.get(meal_ref)
 
         if not meal_doc.exists:
             return jsonify({"error": "Meal not found"}), 404
 
-        # Update the meal document with the new data
-        meal_ref.update(updated_meal_data)
+        # Edited numbers or ingredients are checked against each other before they are stored
+        if any(field in updated_meal_data for field in ('ingredients', 'calories', 'carbs', 'fats', 'proteins')):
+            corrected, report = reconcile_meal({**meal_doc.to_dict(), **updated_meal_data})
+            updated_meal_data = {**updated_meal_data, **{field: corrected[field] for field in report['changed']}}
+
+        # Update the meal and the totals of every day it is on together
+        day_refs = days_with_meal(meal_id)
+        edit_meal_on_days(db, firestore.transactional, meal_id, updated_meal_data, day_refs)
+        refresh_open_day(user_docs[0], day_refs)
+        doc_cache.invalidate(meal_ref)
+        index_meal(meal_id, {**meal_doc.to_dict(), **updated_meal_data})
 
         return jsonify({
             "message": "Meal updated successfully",
@@ -1120,13 +1684,15 @@ def create_workout():
         body_part_focus = data.get('body_part_focus', '')
         total_minutes = data.get('total_minutes')
 
-        workout_ref = db.collection('Workout').add({
+        workout_data = {
             'exercises': exercises,
             'body_part_focus': body_part_focus,
             'total_minutes': total_minutes,
-        })
+        }
+        workout_ref = db.collection('Workout').add(workout_data)
 
         workout_id = workout_ref[1].id
+        recommender.upsert_workout(workout_id, workout_data, workout_calories(exercises))
         return jsonify({"message": "Workout created successfully", "workout_id": workout_id}), 201
     except Exception as e:
         return jsonify({"error": str(e)}), 500 
@@ -1138,38 +1704,46 @@ def get_favorite_workouts():
         return jsonify({"error": "Email is required"}), 400
 
     try:
-        user_query = db.collection('users').where('email', '==', email).limit(1)
-        user_docs = user_query.get()
+        fields = parse_fields(request.args.get('fields'))
+    except ValueError as ve:
+        return jsonify({"error": str(ve)}), 400
+
+    try:
+        user_docs = find_users_by_email(email, ['favorited_workouts'])
         if not user_docs:
             return jsonify({"error": "User not found"}), 404
 
         user_data = user_docs[0].to_dict()
         workout_ids = user_data.get('favorited_workouts', [])
 
-        workouts = []
-        for workout_id in workout_ids:
-            workout_ref = db.collection('Workout').document(workout_id)
-            workout_doc = workout_ref.get()
-            if workout_doc.exists:
-                workout_data = workout_doc.to_dict()
-                workout_data['id'] = workout_doc.id
-
-                exercise_details = []
-                for exercise_id in workout_data.get("exercises", []):
-                    exercise_ref = db.collection('Exercise').document(exercise_id)
-                    exercise_doc = exercise_ref.get()
-                    if exercise_doc.exists:
-                        exercise_details.append(exercise_doc.to_dict())
-
-                workout_data["exercises"] = exercise_details
-                workouts.append(workout_data)
+        workout_docs = get_docs_by_ids('Workout', workout_ids, field_paths=projection_for(fields))
+        workouts = [
+            {**workout_docs[workout_id].to_dict(), 'id': workout_id}
+            for workout_id in workout_ids if workout_id in workout_docs
+        ]
 
+        # Only hydrate exercises when the caller asked for them
+        exercise_fields = nested_fields(fields, 'exercises')
+        if exercise_fields is None or exercise_fields:
+            exercise_docs = get_docs_by_ids(
+                'Exercise',
+                [exercise_id for workout in workouts for exercise_id in workout.get('exercises', [])],
+                field_paths=projection_for(exercise_fields)
+            )
+            for workout_data in workouts:
+                workout_data["exercises"] = [
+                    prune_fields(exercise_docs[exercise_id].to_dict(), exercise_fields)
+                    for exercise_id in workout_data.get("exercises", []) if exercise_id in exercise_docs
+                ]
+
+        workouts = [{**prune_fields(workout, fields), 'id': workout['id']} for workout in workouts]
         return jsonify(workouts), 200
 
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
 @app.route('/create_user_workout', methods=['POST'])
+@idempotent
 def create_user_workout():
     data = request.json
     email = data.get('email')
@@ -1178,8 +1752,7 @@ def create_user_workout():
         return jsonify({"error": "Email is required"}), 400
 
     try:
-        user_query = db.collection('users').where('email', '==', email).limit(1)
-        user_docs = user_query.get()
+        user_docs = find_users_by_email(email)
 
         if not user_docs:
             return jsonify({"error": "User not found"}), 404
@@ -1193,11 +1766,13 @@ def create_user_workout():
         }
         workout_ref = db.collection('Workout').add(workout_data)
         workout_id = workout_ref[1].id
+        recommender.upsert_workout(workout_id, workout_data, workout_calories(workout_data['exercises']))
 
         user_ref = db.collection('users').document(user_id)
         user_ref.update({
             'workouts': firestore.ArrayUnion([workout_id])
         })
+        doc_cache.invalidate(user_ref)
 
         return jsonify({"message": "Workout created successfully", "workout_id": workout_id}), 201
 
@@ -1210,7 +1785,7 @@ def edit_user_workout(workout_id):
 
     try:
         workout_ref = db.collection('Workout').document(workout_id)
-        workout_doc = workout_ref.get()
+        workout_doc = doc_cache.get(workout_ref)
 
         if not workout_doc.exists:
             return jsonify({"error": "Workout not found"}), 404
@@ -1218,17 +1793,27 @@ def edit_user_workout(workout_id):
         workout_data = workout_doc.to_dict()
         exercise_ids = workout_data.get('exercises', [])
 
-        workout_ref.update({
+        # Recompute calories rather than storing the client's value
+        user_doc = get_user_doc_by_email(data['email']) if data.get('email') else find_workout_owner(workout_id)
+        estimated_exercises = estimate_workout(
+            data.get('exercises', []), body_weight_kg(user_doc.to_dict() if user_doc else None), data.get('total_minutes')
+        )
+
+        workout_update = {
             'name': data.get('name'),
             'total_minutes': data.get('total_minutes'),
             'body_part_focus': data.get('body_part_focus'),
-        })
+        }
+        workout_ref.update(workout_update)
+        doc_cache.invalidate(workout_ref)
+        recommender.upsert_workout(workout_id, {**workout_data, **workout_update},
+                                   workout_calories(estimated_exercises[:len(exercise_ids)]))
 
         for index, exercise_id in enumerate(exercise_ids):
             if index >= len(data.get('exercises', [])):
                 continue
 
-            exercise_data = data['exercises'][index]
+            exercise_data = estimated_exercises[index]
             exercise_ref = db.collection('Exercise').document(exercise_id)
 
             exercise_ref.update({
@@ -1240,6 +1825,7 @@ def edit_user_workout(workout_id):
                 'body_parts': exercise_data.get('body_parts'),
                 'description': exercise_data.get('description'),
             })
+            doc_cache.invalidate(exercise_ref)
 
         return jsonify({"message": "Workout and exercises updated successfully"}), 200
 
@@ -1250,7 +1836,7 @@ def edit_user_workout(workout_id):
 def get_exercise(exercise_id):
     try:
         exercise_ref = db.collection('Exercise').document(exercise_id)
-        exercise_doc = exercise_ref.get()
+        exercise_doc = doc_cache.get(exercise_ref)
 
         if not exercise_doc.exists:
             return jsonify({"error": "Exercise not found"}), 404
@@ -1259,94 +1845,230 @@ def get_exercise(exercise_id):
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
-@app.route('/get_calendar', methods=['GET'])
-def get_calendar():
+@app.route('/get_exercises', methods=['POST'])
+def get_exercises():
+    data = request.json
+    exercise_ids = data.get('exercise_ids')
+    if not isinstance(exercise_ids, list):
+        return jsonify({"error": "exercise_ids list is required"}), 400
+
+    try:
+        exercise_docs = get_docs_by_ids('Exercise', exercise_ids)
+
+        # Preserve the requested order, skipping IDs that no longer exist
+        exercises = [
+            {**exercise_docs[exercise_id].to_dict(), 'id': exercise_id}
+            for exercise_id in exercise_ids
+            if isinstance(exercise_id, str) and exercise_id in exercise_docs
+        ]
+
+        return jsonify(exercises), 200
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/sync', methods=['GET'])
+def sync():
     email = request.args.get('email')
     if not email:
         return jsonify({"error": "Email parameter is required"}), 400
 
+    since = None
+    if request.args.get('since'):
+        try:
+            since = decode_sync_token(request.args.get('since'))
+        except (ValueError, OverflowError, OSError):
+            return jsonify({"error": "Invalid sync token"}), 400
+
     try:
-        # Get the user document ID by email
-        user_id = get_user_doc_id_by_email(email)
-        if not user_id:
+        user_doc = get_user_doc_by_email(email)
+        if not user_doc:
             return jsonify({"error": "User not found"}), 404
-        calendar_query = db.collection('Calendar').where('belongs_to', '==', user_id)
-        calendar_docs = calendar_query.get()
 
-        if not calendar_docs:
-            return jsonify({"message": "No calendar entries found for this user"}), 404
+        # Tombstones older than the retention window may be gone, so fall back to a full sync
+        full_sync = since is None or since < datetime.now(pytz.UTC) - timedelta(days=TOMBSTONE_RETENTION_DAYS)
+        # Everything committed up to this first read is visible to the reads below,
+        # so the next delta can safely start here (later commits may be sent twice)
+        token = encode_sync_token(user_doc.read_time)
+
+        def changed(snapshot):
+            return full_sync or snapshot.update_time > since
+
+        def fetch(collection, doc_ids):
+            # Read straight from Firestore: a cached update_time could make a delta skip a change
+            unique_ids = [doc_id for doc_id in dict.fromkeys(doc_ids) if isinstance(doc_id, str) and doc_id]
+            doc_refs = [db.collection(collection).document(doc_id) for doc_id in unique_ids]
+            return [doc for doc in db.get_all(doc_refs) if doc.exists] if doc_refs else []
+
+        # When a document that holds ID lists changes, its children are resent as
+        # well so that newly referenced but unchanged documents reach the client
+        user_data = user_doc.to_dict()
+        profile_changed = changed(user_doc)
+        profile_meal_ids = (user_data.get('favorited_meals') or []) + (user_data.get('meals') or [])
+        profile_workout_ids = (user_data.get('favorited_workouts') or []) + (user_data.get('workouts') or [])
+
+        calendar_docs = find_calendars(user_doc.id)
+        changed_calendars = [doc for doc in calendar_docs if changed(doc)]
+        day_docs = fetch('Day', [day_id for calendar in calendar_docs for day_id in calendar.to_dict().get('days', [])])
+        changed_days = [doc for doc in day_docs if changed(doc) or changed_calendars]
+
+        forced_meals = set(profile_meal_ids if profile_changed else [])
+        forced_workouts = set(profile_workout_ids if profile_changed else [])
+        for day in changed_days:
+            forced_meals.update(day.to_dict().get('meals', []))
+            forced_workouts.update(day.to_dict().get('workouts', []))
+
+        day_values = [doc.to_dict() for doc in day_docs]
+        meal_docs = fetch('Meal', profile_meal_ids + [meal_id for day in day_values for meal_id in day.get('meals', [])])
+        workout_docs = fetch('Workout', profile_workout_ids + [workout_id for day in day_values for workout_id in day.get('workouts', [])])
+        changed_meals = [doc for doc in meal_docs if changed(doc) or doc.id in forced_meals]
+        changed_workouts = [doc for doc in workout_docs if changed(doc) or doc.id in forced_workouts]
+
+        forced_exercises = {exercise_id for doc in changed_workouts for exercise_id in doc.to_dict().get('exercises', [])}
+        exercise_docs = fetch('Exercise', [exercise_id for doc in workout_docs for exercise_id in doc.to_dict().get('exercises', [])])
+        changed_exercises = [doc for doc in exercise_docs if changed(doc) or doc.id in forced_exercises]
+
+        deleted = []
+        if not full_sync:
+            # Served by the (belongs_to, deleted_at) composite index in firestore.indexes.json
+            tombstone_docs = (db.collection('Tombstone').where('belongs_to', '==', user_doc.id)
+                              .where('deleted_at', '>', since).order_by('deleted_at').get())
+            for tombstone in tombstone_docs:
+                tombstone_data = tombstone.to_dict()
+                deleted.append({"collection": tombstone_data['collection'], "id": tombstone_data['doc_id']})
 
-        calendar_data = [
-            {**doc.to_dict(), 'id': doc.id} for doc in calendar_docs
-        ]
+        return jsonify({
+            "full": full_sync,
+            "token": token,
+            "profile": {**user_data, 'id': user_doc.id} if profile_changed else None,
+            "calendar": [{**doc.to_dict(), 'id': doc.id} for doc in changed_calendars],
+            "days": [{**doc.to_dict(), 'id': doc.id} for doc in changed_days],
+            "meals": [{**doc.to_dict(), 'id': doc.id} for doc in changed_meals],
+            "workouts": [{**doc.to_dict(), 'id': doc.id} for doc in changed_workouts],
+            "exercises": [{**doc.to_dict(), 'id': doc.id} for doc in changed_exercises],
+            "deleted": deleted,
+        }), 200
 
-        return jsonify(calendar_data), 200
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/export', methods=['GET'])
+def export_data():
+    email = request.args.get('email')
+    if not email:
+        return jsonify({"error": "Email parameter is required"}), 400
+
+    try:
+        user_doc = get_user_doc_by_email(email)
+        if not user_doc:
+            return jsonify({"error": "User not found"}), 404
+
+        return Response(
+            stream_with_context(export_account(db, user_doc)),
+            mimetype='application/gzip',
+            headers={'Content-Disposition': 'attachment; filename=account_export.jsonl.gz'}
+        )
 
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
-@app.route('/get_workouts_on_day', methods=['POST'])
-def get_workouts_on_day():
+# Limits on what an uploaded archive may inflate to
+ARCHIVE_MAX_BYTES = int(os.getenv('ARCHIVE_MAX_BYTES', 256 * 1024 * 1024))
+ARCHIVE_MAX_RECORDS = int(os.getenv('ARCHIVE_MAX_RECORDS', 1000000))
+
+@app.route('/import', methods=['POST'])
+def import_data():
+    email = request.args.get('email')
+    if not email:
+        return jsonify({"error": "Email parameter is required"}), 400
+
     try:
-        data = request.get_json()
-        email = data.get('email')  # Email sent by the client
-        date = data.get('date')  # Date in YYYY-MM-DD format
+        user_doc = get_user_doc_by_email(email)
+        if not user_doc:
+            return jsonify({"error": "User not found"}), 404
 
-        if not email or not date:
-            return jsonify({"error": "Email and Date are required"}), 400
+        chunks = iter(lambda: request.stream.read(64 * 1024), b'')
+        records = iter_archive_records(chunks, max_bytes=ARCHIVE_MAX_BYTES, max_records=ARCHIVE_MAX_RECORDS)
+        result = import_account(db, user_doc, records, firestore.ArrayUnion)
+        doc_cache.invalidate(user_doc.reference)
+        for day_id in result.pop('merged_days'):
+            doc_cache.invalidate(db.collection('Day').document(day_id))
+        add_weights(db, firestore.transactional, user_doc.id, result.pop('weights'))
+        reads.forget('users')
+        reads.forget('Calendar')
+
+        return jsonify({"message": "Import completed successfully", **result}), 201
+
+    except ValueError as ve:
+        return jsonify({"error": f"Invalid archive: {ve}"}), 400
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/analytics', methods=['GET'])
+def get_analytics():
+    email = request.args.get('email')
+    if not email:
+        return jsonify({"error": "Email parameter is required"}), 400
 
-        # Get the user document ID by email
-        user_id = get_user_doc_id_by_email(email)
-        if not user_id:
+    try:
+        window = int(request.args.get('window', 7))
+        alpha = float(request.args.get('alpha', 0.1))
+        if window < 1 or not 0 < alpha <= 1:
+            raise ValueError("window must be at least 1 and alpha in (0, 1]")
+    except ValueError as ve:
+        return jsonify({"error": f"Invalid analytics parameter: {ve}"}), 400
+
+    try:
+        user_doc = get_user_doc_by_email(email)
+        if not user_doc:
             return jsonify({"error": "User not found"}), 404
 
-        # Fetch the Day entry by the given date
-        day_docs = db.collection('Day').where('date', '==', date).get()
-        if not day_docs:
-            return jsonify([]), 200
+        try:
+            history = load_history(db, user_doc.id).between(request.args.get('start'), request.args.get('end'))
+        except ValueError:
+            return jsonify({"error": "start and end must be YYYY-MM-DD dates"}), 400
 
-        day_doc = day_docs[0]
-        day_data = day_doc.to_dict()
-        day_id = day_doc.id
+        return jsonify(summarize(history, user_doc.to_dict().get('avg_cal_intake'), window=window, alpha=alpha)), 200
 
-        # Validate Calendar contains the Day ID
-        calendar_docs = db.collection('Calendar').where('belongs_to', '==', user_id).get()
-        # Assume the user has only one calendar
-        calendar_doc = calendar_docs[0]
-        
-        if day_id not in calendar_doc.to_dict()["days"]:
-            return jsonify({"error": "No Calendar entry contains the specified Day"}), 404
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
 
-        calendar_doc = calendar_docs[0]
-        calendar_data = calendar_doc.to_dict()
+@app.route('/get_calendar', methods=['GET'])
+def get_calendar():
+    email = request.args.get('email')
+    if not email:
+        return jsonify({"error": "Email parameter is required"}), 400
 
-        # Validate Calendar belongs to the user
-        if calendar_data.get('belongs_to') != user_id:
-            return jsonify({"error": "The specified Calendar does not belong to the user"}), 403
+    try:
+        user = storage.find_user(email, ['email'])
+        if user is None:
+            return jsonify({"error": "User not found"}), 404
+        calendar_data = storage.get_calendars(user['id'])
 
-        # Fetch workouts for the Day
-        workout_ids = day_data.get('workouts', [])
+        if not calendar_data:
+            return jsonify({"message": "No calendar entries found for this user"}), 404
 
-        workouts_with_exercises = []
-        for workout_id in workout_ids:
-            workout_ref = db.collection('Workout').document(workout_id)
-            workout_doc = workout_ref.get()
+        return jsonify(calendar_data), 200
 
-            if not workout_doc.exists:
-                continue
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/get_workouts_on_day', methods=['POST'])
+def get_workouts_on_day():
+    try:
+        data = request.get_json()
+        email = data.get('email')  # Email sent by the client
+        date = data.get('date')  # Date in YYYY-MM-DD format
 
-            workout_data = workout_doc.to_dict()
-            exercise_details = []
-            for exercise_id in workout_data.get("exercises", []):
-                exercise_ref = db.collection('Exercise').document(exercise_id)
-                exercise_doc = exercise_ref.get()
-                if exercise_doc.exists:
-                    exercise_details.append({**exercise_doc.to_dict(), 'id': exercise_id})
+        if not email or not date:
+            return jsonify({"error": "Email and Date are required"}), 400
 
-            workout_data["exercises"] = exercise_details
-            workouts_with_exercises.append({**workout_data, 'id': workout_id})
+        user = storage.find_user(email, ['email'])
+        if user is None:
+            return jsonify({"error": "User not found"}), 404
 
-        return jsonify(workouts_with_exercises), 200
+        # Only the user's own day for the date, with workouts and exercises hydrated
+        workouts = storage.workouts_on_day(user['id'], date)
+        return jsonify(workouts or []), 200
 
     except Exception as e:
         return jsonify({"error": str(e)}), 500
@@ -1359,6 +2081,21 @@ def get_weight_on_day():
         if not date:
             return jsonify({"error": "Date parameter is required"}), 400
 
+        # With the user's email the weight comes from their time series in one read,
+        # or also from their Days until migrate_weights() has run for them
+        if data.get('email'):
+            try:
+                day_offset(date)
+            except (TypeError, ValueError):
+                return jsonify({"error": "Date must be YYYY-MM-DD"}), 400
+            user_docs = find_users_by_email(data['email'], ['email', 'weights_migrated'])
+            if not user_docs:
+                return jsonify({"error": "User not found"}), 404
+            weight = weight_on(db, user_docs[0].id, date, user_docs[0].to_dict().get('weights_migrated', False))
+            if weight is None:
+                return jsonify({"message": "Weight not found for the specified date", "weight": None}), 200
+            return jsonify({"date": date, "weight": weight}), 200
+
         day_docs = db.collection('Day').where('date', '==', date).get()
         if not day_docs:
             return jsonify({"message": "No data found for the specified date", "weight": []}), 200
@@ -1384,17 +2121,41 @@ def update_weight_on_day():
         if not date or weight is None:
             return jsonify({"error": "Date and weight are required"}), 400
 
-        day_query = db.collection('Day').where('date', '==', date).limit(1)
-        day_docs = day_query.get()
         try:
             weight = int(weight) 
         except ValueError:
             return jsonify({"error": "Weight must be a valid number"}), 400
 
+        # With the user's email the weigh-in goes into their weight time series and logging streak,
+        # and onto the Day on their own calendar; the Day field is still written for the views that
+        # read weight from Day documents
+        user_docs = []
+        calendar_docs = []
+        if data.get('email'):
+            try:
+                day_offset(date)
+            except (TypeError, ValueError):
+                return jsonify({"error": "Date must be YYYY-MM-DD"}), 400
+            user_docs = find_users_by_email(data['email'], ['avg_cal_intake'])
+            if not user_docs:
+                return jsonify({"error": "User not found"}), 404
+            calendar_docs = find_calendars(user_docs[0].id, ['days'])
+            if not calendar_docs:
+                return jsonify({"error": "No calendars exist for user"}), 400
+            record_weight(db, firestore.transactional, user_docs[0].id, date, weight)
+
+            # Day documents carry no owner, so keep the one on the user's calendar
+            own_days = {day_id for calendar in calendar_docs for day_id in calendar.to_dict().get('days', [])}
+            day_docs = [day_doc for day_doc in db.collection('Day').where('date', '==', date).get()
+                        if day_doc.id in own_days][:1]
+        else:
+            day_docs = db.collection('Day').where('date', '==', date).limit(1).get()
+
         if day_docs:
             day_ref = day_docs[0].reference
             day_ref.update({"weight": weight})
-            return jsonify({"message": "Weight updated successfully"}), 200
+            doc_cache.invalidate(day_ref)
+            message, status = "Weight updated successfully", 200
         else:
             new_day = {
                 "date": date,
@@ -1402,8 +2163,39 @@ def update_weight_on_day():
                 "meals": [],  
                 "workouts": [],
             }
-            db.collection('Day').add(new_day)
-            return jsonify({"message": "Weight added for new day"}), 201
+            if calendar_docs:
+                new_day["day"] = datetime.fromisoformat(date).strftime('%A')
+            new_day_ref = db.collection('Day').add(new_day)[1]
+            if calendar_docs:
+                calendar_docs[0].reference.update({'days': firestore.ArrayUnion([new_day_ref.id])})
+                reads.forget('Calendar')
+            message, status = "Weight added for new day", 201
+
+        if user_docs:
+            record_streak(user_docs[0], date)
+        return jsonify({"message": message}), status
+
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/get_weight_history', methods=['POST'])
+def get_weight_history():
+    data = request.json
+    email, start, end = data.get('email'), data.get('start'), data.get('end')
+    if not email or not start or not end:
+        return jsonify({"error": "Email, start and end are required"}), 400
+    try:
+        day_offset(start), day_offset(end)
+    except (TypeError, ValueError):
+        return jsonify({"error": "start and end must be YYYY-MM-DD"}), 400
+
+    try:
+        user_docs = find_users_by_email(email, ['email', 'weights_migrated'])
+        if not user_docs:
+            return jsonify({"error": "User not found"}), 404
+
+        points = weight_history(db, user_docs[0].id, start, end, user_docs[0].to_dict().get('weights_migrated', False))
+        return jsonify([{"date": date, "weight": weight} for date, weight in points]), 200
 
     except Exception as e:
         return jsonify({"error": str(e)}), 500
@@ -1418,44 +2210,84 @@ def get_meals_on_day():
         if not email or not date:
             return jsonify({"error": "Email and Date are required"}), 400
 
-        # Get the user document ID by email
-        user_id = get_user_doc_id_by_email(email)
-        if not user_id:
+        user = storage.find_user(email, ['email'])
+        if user is None:
             return jsonify({"error": "User not found"}), 404
 
-        # Fetch the Day entry by the given date
-        day_docs = db.collection('Day').where('date', '==', date).get()
-        if not day_docs:
-            return jsonify([]), 200
+        # Only the user's own day for the date, with meals hydrated
+        meals = storage.meals_on_day(user['id'], date)
+        return jsonify(meals or []), 200
 
-        day_doc = day_docs[0]
-        day_data = day_doc.to_dict()
-        day_id = day_doc.id
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
 
-        # Validate Calendar contains the Day ID
-        calendar_docs = db.collection('Calendar').where('belongs_to', '==', user_id).get()
-        # Assume the user has only one calendar
-        calendar_doc = calendar_docs[0]
-        
-        if day_id not in calendar_doc.to_dict()["days"]:
-            return jsonify({"error": "No Calendar entry contains the specified Day"}), 404
-
-        calendar_doc = calendar_docs[0]
-        calendar_data = calendar_doc.to_dict()
-
-        # Validate Calendar belongs to the user
-        if calendar_data.get('belongs_to') != user_id:
-            return jsonify({"error": "The specified Calendar does not belong to the user"}), 403
-        # Fetch meals for the Day
-        meal_ids = day_data.get('meals', [])
-        meals_with_details = []
-        for meal_id in meal_ids:
-            meal_ref = db.collection('Meal').document(meal_id)
-            meal_doc = meal_ref.get()
-            if meal_doc.exists:
-                meals_with_details.append({**meal_doc.to_dict(), 'id': meal_id})
+@app.route('/get_day_totals', methods=['POST'])
+def get_day_totals():
+    data = request.json
+    email = data.get('email')
+    if not email:
+        return jsonify({"error": "Email is required"}), 400
+    start, end = data.get('start'), data.get('end')
+
+    try:
+        user_docs = find_users_by_email(email, ['email'])
+        if not user_docs:
+            return jsonify({"error": "User not found"}), 404
+
+        day_ids = [day_id for calendar in find_calendars(user_docs[0].id, ['days'])
+                   for day_id in calendar.to_dict().get('days', [])]
+        day_docs = get_docs_by_ids('Day', day_ids, field_paths=['date', 'meals', 'totals'])
+        days = [day.to_dict() for day in day_docs.values()]
+        days = [day for day in days if day.get('date') and (not start or day['date'] >= start) and (not end or day['date'] <= end)]
+
+        # Days written before totals existed are summed from their meals until the reconciliation job backfills them
+        legacy_meal_ids = [meal_id for day in days if not isinstance(day.get('totals'), dict) for meal_id in day.get('meals', [])]
+        meal_docs = get_docs_by_ids('Meal', legacy_meal_ids, field_paths=list(NUTRIENTS))
+        res = []
+        for day in sorted(days, key=lambda day: day['date']):
+            totals = day.get('totals')
+            if not isinstance(totals, dict):
+                totals = sum_totals([meal_docs[meal_id].to_dict() if meal_id in meal_docs else {} for meal_id in day.get('meals', [])])
+            res.append({"date": day['date'], "totals": totals})
+
+        return jsonify(res), 200
+
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/get_streaks', methods=['GET'])
+def get_streaks():
+    email = request.args.get('email')
+    if not email:
+        return jsonify({"error": "email parameter is required"}), 400
+
+    try:
+        user_docs = find_users_by_email(email, ['email'])
+        if not user_docs:
+            return jsonify({"error": "User not found"}), 404
 
-        return jsonify(meals_with_details), 200
+        counters = db.collection('Streak').document(user_docs[0].id).get()
+        return jsonify(streak_summary(counters.to_dict() if counters.exists else None)), 200
+
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+# Written by the weekly-summary job (python -m scripts.jobs weekly-summary)
+@app.route('/get_weekly_summary_data', methods=['GET'])
+def get_weekly_summary_data():
+    email = request.args.get('email')
+    if not email:
+        return jsonify({"error": "email parameter is required"}), 400
+
+    try:
+        user_docs = find_users_by_email(email, ['email'])
+        if not user_docs:
+            return jsonify({"error": "User not found"}), 404
+
+        summary = db.collection('WeeklySummary').document(user_docs[0].id).get()
+        if not summary.exists:
+            return jsonify({"error": "No weekly summary yet"}), 404
+        return jsonify(summary.to_dict()), 200
 
     except Exception as e:
         return jsonify({"error": str(e)}), 500
@@ -1467,13 +2299,12 @@ def get_meal_details():
         return jsonify({"error": "mealId parameter is required"}), 400
 
     try:
-        meal_ref = db.collection('Meal').document(meal_id)
-        meal_doc = meal_ref.get()
-
-        if not meal_doc.exists:
+        meal = storage.get_meal(meal_id)
+        if meal is None:
             return jsonify({"error": "Meal not found"}), 404
 
-        return jsonify(meal_doc.to_dict()), 200
+        del meal['id']
+        return jsonify(meal), 200
 
     except Exception as e:
         return jsonify({"error": str(e)}), 500
@@ -1485,23 +2316,34 @@ def get_workout_details():
         return jsonify({"error": "workoutId parameter is required"}), 400
 
     try:
-        workout_ref = db.collection('Workout').document(workout_id)
-        workout_doc = workout_ref.get()
-
-        if not workout_doc.exists:
+        workout = storage.get_workout(workout_id)
+        if workout is None:
             return jsonify({"error": "Workout not found"}), 404
 
-        workout_data = workout_doc.to_dict()
+        del workout['id']
+        return jsonify(workout), 200
 
-        exercise_details = []
-        for exercise_id in workout_data.get("exercises", []):
-            exercise_ref = db.collection('Exercise').document(exercise_id)
-            exercise_doc = exercise_ref.get()
-            if exercise_doc.exists:
-                exercise_details.append(exercise_doc.to_dict())
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
 
-        workout_data["exercises"] = exercise_details
-        return jsonify(workout_data), 200
+# /batch runs sub-requests through the app in process; independent ones share this pool
+BATCH_MAX_REQUESTS = int(os.getenv('BATCH_MAX_REQUESTS', 20))
+batch_executor = ThreadPoolExecutor(max_workers=int(os.getenv('BATCH_WORKERS', 8)), thread_name_prefix='batch')
+
+@app.route('/batch', methods=['POST'])
+def batch():
+    data = request.json
+    try:
+        calls = parse_batch(data, BATCH_MAX_REQUESTS)
+    except BatchError as be:
+        return jsonify({"error": str(be)}), 400
+
+    try:
+        # User and calendar lookups are read once for the whole batch
+        with reads.scope(('users', 'Calendar')):
+            responses = run_batch(batch_executor, app.wsgi_app, calls,
+                                  base_environ={'REMOTE_ADDR': request.remote_addr})
+        return jsonify({"responses": responses}), 200
 
     except Exception as e:
         return jsonify({"error": str(e)}), 500
@@ -0,0 +1,119 @@
+"""
+Several API calls in one HTTP round-trip.
+
+A batch is a list of sub-requests ({"method", "path", "body", "headers",
+"depends_on"}) that run in process through the app's own WSGI stack, so each
+one sees the same routing, decorators and error handling as a direct call.
+Sub-requests without depends_on run concurrently; one that lists earlier
+indexes starts after they finish and is skipped with 424 if any of them failed.
+Responses come back in request order. A binary response body, such as a
+gzip export, comes back base64-encoded with "encoding": "base64".
+"""
+import base64
+import contextvars
+
+from werkzeug.test import EnvironBuilder
+from werkzeug.wrappers import Response
+
+METHODS = {'GET', 'POST', 'PUT', 'PATCH', 'DELETE'}
+
+
+class BatchError(ValueError):
+    pass
+
+
+def parse_batch(payload, max_requests, batch_path='/batch'):
+    calls = payload.get('requests') if isinstance(payload, dict) else payload
+    if not isinstance(calls, list) or not calls:
+        raise BatchError("Batch must be a non-empty list of requests")
+    if len(calls) > max_requests:
+        raise BatchError(f"Batch is limited to {max_requests} requests")
+
+    parsed = []
+    for index, call in enumerate(calls):
+        if not isinstance(call, dict):
+            raise BatchError(f"Request {index} must be an object")
+        method = str(call.get('method', 'GET')).upper()
+        path = call.get('path')
+        if method not in METHODS:
+            raise BatchError(f"Request {index} has unsupported method {method}")
+        if not isinstance(path, str) or not path.startswith('/'):
+            raise BatchError(f"Request {index} needs a path starting with /")
+        if path.split('?', 1)[0].rstrip('/') == batch_path:
+            raise BatchError("Batches cannot be nested")
+        headers = call.get('headers') or {}
+        if not isinstance(headers, dict):
+            raise BatchError(f"Request {index} headers must be an object")
+        depends_on = call.get('depends_on') or []
+        if not isinstance(depends_on, list) or not all(
+                isinstance(dep, int) and not isinstance(dep, bool) and 0 <= dep < index for dep in depends_on):
+            raise BatchError(f"Request {index} may only depend on earlier requests")
+        parsed.append({
+            'method': method,
+            'path': path,
+            'body': call.get('body'),
+            'headers': {str(name): str(value) for name, value in headers.items()},
+            'depends_on': depends_on,
+        })
+    return parsed
+
+
+def stages(calls):
+    """Group request indexes so each group only depends on earlier groups."""
+    levels = []
+    for call in calls:
+        levels.append(1 + max((levels[dep] for dep in call['depends_on']), default=-1))
+    grouped = [[] for _ in range(max(levels) + 1)]
+    for index, level in enumerate(levels):
+        grouped[level].append(index)
+    return grouped
+
+
+def dispatch(wsgi_app, call, base_environ=None):
+    path, _, query_string = call['path'].partition('?')
+    builder = EnvironBuilder(
+        path=path,
+        query_string=query_string,
+        method=call['method'],
+        headers=call['headers'],
+        json=call['body'] if call['body'] is not None and call['method'] != 'GET' else None,
+        environ_base=base_environ,
+    )
+    try:
+        response = Response.from_app(wsgi_app, builder.get_environ(), buffered=True)
+    finally:
+        builder.close()
+    result = {'status': response.status_code}
+    if response.is_json:
+        result['body'] = response.get_json(silent=True)
+        return result
+    data = response.get_data()
+    if not response.content_encoding:
+        try:
+            result['body'] = data.decode('utf-8')
+            return result
+        except UnicodeDecodeError:
+            pass
+    result['body'] = base64.b64encode(data).decode('ascii')
+    result['encoding'] = 'base64'
+    return result
+
+
+def run_batch(executor, wsgi_app, calls, base_environ=None):
+    results = [None] * len(calls)
+    for stage in stages(calls):
+        pending = {}
+        for index in stage:
+            failed = [dep for dep in calls[index]['depends_on'] if results[dep]['status'] >= 400]
+            if failed:
+                results[index] = {'status': 424, 'body': {"error": f"Skipped because request {failed[0]} failed"}}
+                continue
+            # Each sub-request runs in its own copy of this context so batch-scoped state is shared
+            context = contextvars.copy_context()
+            pending[index] = executor.submit(context.run, dispatch, wsgi_app, calls[index], base_environ)
+        for index, future in pending.items():
+            try:
+                results[index] = future.result()
+            except Exception as e:
+                results[index] = {'status': 500, 'body': {"error": str(e)}}
+    return results
@@ -0,0 +1,64 @@
+"""
+Throughput of the analytics engine over synthetic multi-year histories.
+
+    python benchmarks/analytics_benchmark.py
+"""
+import os
+import sys
+import time
+from datetime import date, timedelta
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from analytics import History, summarize  # noqa: E402
+
+
+def synthetic_rows(years, meals_per_day=3, seed=0):
+    rng = np.random.default_rng(seed)
+    start = date(2015, 1, 1)
+    days = [(start + timedelta(days=offset)).isoformat() for offset in range(365 * years)]
+    meal_rows = [
+        (day, *rng.uniform([200, 10, 5, 5], [900, 120, 50, 60]))
+        for day in days for _ in range(meals_per_day)
+    ]
+    burned_rows = [(day, rng.uniform(100, 600)) for day in days if rng.random() < 0.5]
+    weight_rows = [(day, 80 + rng.normal(0, 0.5)) for day in days if rng.random() < 0.7]
+    return meal_rows, burned_rows, weight_rows
+
+
+def python_rolling_mean(values, window):
+    # The per-row loop a caller would otherwise write over historical_data
+    result = []
+    for index in range(len(values)):
+        recent = values[max(0, index - window + 1):index + 1]
+        result.append(sum(recent) / len(recent))
+    return result
+
+
+def main(repeats=5):
+    print(f"{'years':>5} {'days':>6} {'build ms':>9} {'summary ms':>11} {'days/s':>10} {'py rolling ms':>14}")
+    for years in (1, 3, 5, 10):
+        meal_rows, burned_rows, weight_rows = synthetic_rows(years)
+
+        started = time.perf_counter()
+        for _ in range(repeats):
+            history = History.from_rows(meal_rows, burned_rows, weight_rows)
+        build = (time.perf_counter() - started) / repeats
+
+        started = time.perf_counter()
+        for _ in range(repeats):
+            summarize(history, 2000, window=30)
+        summary = (time.perf_counter() - started) / repeats
+
+        started = time.perf_counter()
+        python_rolling_mean(list(history.calories), 30)
+        python_rolling = time.perf_counter() - started
+
+        print(f"{years:>5} {len(history):>6} {build * 1000:>9.2f} {summary * 1000:>11.2f} "
+              f"{len(history) / (build + summary):>10.0f} {python_rolling * 1000:>14.2f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,148 @@
+"""
+Helpers shared by the Firestore jobs and feature modules.
+
+No module here imports firebase_admin at import time: clients are passed in,
+and so are firestore.transactional and firestore.ArrayUnion wherever a module
+needs them, which keeps everything importable and testable against
+tests/fake_firestore.py. firestore_client() is the one place that connects to a
+real project, for the batch jobs in scripts/jobs.py.
+"""
+import math
+import os
+import re
+from concurrent.futures import ThreadPoolExecutor
+
+# Firestore rejects batches with more than 500 writes
+BATCH_SIZE = 500
+READ_CHUNK_SIZE = 300
+MAX_PARALLEL_COMMITS = 4
+# Firestore caps 'in' filters at 30 values
+IN_FILTER_LIMIT = 30
+USERS_PER_BATCH = 100
+
+_IRREGULAR = {'presses': 'press', 'lunges': 'lunge', 'raises': 'raise', 'crunches': 'crunch', 'burpees': 'burpee'}
+
+
+def number(value, default=0.0):
+    """value as a finite float, or default for booleans, None, text and NaN/inf."""
+    if isinstance(value, bool) or value is None:
+        return default
+    try:
+        result = float(value)
+    except (TypeError, ValueError):
+        return default
+    return result if math.isfinite(result) else default
+
+
+def stem(token):
+    if token in _IRREGULAR:
+        return _IRREGULAR[token]
+    if len(token) > 4 and token.endswith('ies'):
+        return token[:-3] + 'y'
+    if len(token) > 4 and token.endswith('es') and token[:-2].endswith(('ch', 'sh', 'ss', 'x', 'o')):
+        return token[:-2]
+    if len(token) > 2 and token.endswith('s') and not token.endswith(('ss', 'us', 'is')):
+        return token[:-1]
+    return token
+
+
+def normalize_name(name):
+    """Lowercase, punctuation-free, singular form of a food or exercise name."""
+    tokens = re.sub(r'[^a-z0-9]+', ' ', str(name or '').lower()).split()
+    return ' '.join(stem(token) for token in tokens)
+
+
+def firestore_client():
+    """The local emulator when FIRESTORE_EMULATOR_HOST is set, else the service account."""
+    if os.getenv('FIRESTORE_EMULATOR_HOST'):
+        from google.cloud import firestore
+        return firestore.Client(project=os.getenv('GOOGLE_CLOUD_PROJECT', 'demo-fitness'))
+    import firebase_admin
+    from firebase_admin import credentials, firestore
+    if not firebase_admin._apps:
+        firebase_admin.initialize_app(credentials.Certificate("serviceAccountKey.json"))
+    return firestore.client()
+
+
+def chunks(items, size):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def iter_documents(db, collection, doc_ids, field_paths=None):
+    # Batched reads with at most READ_CHUNK_SIZE documents in memory at once
+    for chunk in chunks(doc_ids, READ_CHUNK_SIZE):
+        doc_refs = [db.collection(collection).document(doc_id) for doc_id in chunk]
+        snapshots = {doc.id: doc for doc in db.get_all(doc_refs, field_paths=field_paths) if doc.exists}
+        for doc_id in chunk:
+            if doc_id in snapshots:
+                yield doc_id, snapshots[doc_id].to_dict()
+
+
+def days_by_user(db, user_ids, field_paths=('date', 'meals', 'workouts', 'weight', 'totals')):
+    """
+    {user_id: [day data]} for the dated Day documents on the users' calendars, read
+    with one 'in' query per 30 users and batched get_all calls.
+    """
+    day_owner = {}
+    for start in range(0, len(user_ids), IN_FILTER_LIMIT):
+        query = db.collection('Calendar').where('belongs_to', 'in', user_ids[start:start + IN_FILTER_LIMIT])
+        for calendar in query.select(['belongs_to', 'days']).stream():
+            calendar_data = calendar.to_dict()
+            for day_id in calendar_data.get('days', []):
+                if isinstance(day_id, str):
+                    day_owner.setdefault(day_id, calendar_data.get('belongs_to'))
+
+    days = {user_id: [] for user_id in user_ids}
+    for day_id, day in iter_documents(db, 'Day', list(day_owner), field_paths=list(field_paths)):
+        if isinstance(day.get('date'), str) and day_owner[day_id] in days:
+            days[day_owner[day_id]].append(day)
+    return days
+
+
+class BatchWriter:
+    """Groups writes into BATCH_SIZE-op batches and commits them on a small thread pool."""
+
+    def __init__(self, db, max_parallel=MAX_PARALLEL_COMMITS):
+        self._db = db
+        self._executor = ThreadPoolExecutor(max_workers=max_parallel)
+        self._max_in_flight = max_parallel * 2
+        self._in_flight = []
+        self._batch = db.batch()
+        self._ops = 0
+        self.committed_ops = 0
+
+    def _submit(self):
+        if not self._ops:
+            return
+        batch, ops = self._batch, self._ops
+        self._batch, self._ops = self._db.batch(), 0
+        self._in_flight.append((self._executor.submit(batch.commit), ops))
+        # Bound memory held by queued batches
+        while len(self._in_flight) >= self._max_in_flight:
+            self._wait_oldest()
+
+    def _wait_oldest(self):
+        future, ops = self._in_flight.pop(0)
+        future.result()
+        self.committed_ops += ops
+
+    def set(self, doc_ref, data):
+        self._batch.set(doc_ref, data)
+        self._ops += 1
+        if self._ops >= BATCH_SIZE:
+            self._submit()
+
+    def update(self, doc_ref, data):
+        self._batch.update(doc_ref, data)
+        self._ops += 1
+        if self._ops >= BATCH_SIZE:
+            self._submit()
+
+    def close(self):
+        try:
+            self._submit()
+            while self._in_flight:
+                self._wait_oldest()
+        finally:
+            self._executor.shutdown(wait=True)
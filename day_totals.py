@@ -0,0 +1,189 @@
+"""
+Denormalized nutrition totals on Day documents.
+
+Each Day carries totals = {calories, carbs, fats, proteins, meals} for the meals
+in Day.meals, so a day's numbers can be read without fetching every Meal. The
+functions here change a day's meals and its totals in one Firestore transaction
+(`transactional` is firestore.transactional, see common). Days written before
+totals existed are summed from their meals the first time a transaction touches
+them, and reconcile_day_totals() repairs any day whose totals drifted from its
+meals.
+"""
+from common import number
+
+NUTRIENTS = ('calories', 'carbs', 'fats', 'proteins')
+
+
+def sum_totals(meals):
+    totals = {nutrient: round(sum(number(meal.get(nutrient)) for meal in meals), 2) for nutrient in NUTRIENTS}
+    totals['meals'] = len(meals)
+    return totals
+
+
+def shift_totals(totals, meal, sign):
+    shifted = {nutrient: round(number(totals.get(nutrient)) + sign * number(meal.get(nutrient)), 2)
+               for nutrient in NUTRIENTS}
+    shifted['meals'] = int(totals.get('meals', 0)) + sign
+    return shifted
+
+
+def totals_match(stored, expected, tolerance=0.01):
+    if not isinstance(stored, dict) or stored.get('meals') != expected['meals']:
+        return False
+    return all(abs(number(stored.get(nutrient)) - expected[nutrient]) <= tolerance for nutrient in NUTRIENTS)
+
+
+def _read_meals(db, transaction, meal_ids):
+    # Missing meals count as zero, like a dangling ID in Day.meals
+    refs = [db.collection('Meal').document(meal_id) for meal_id in dict.fromkeys(meal_ids)]
+    found = {doc.id: doc.to_dict() for doc in db.get_all(refs, transaction=transaction) if doc.exists} if refs else {}
+    return {meal_id: found.get(meal_id, {}) for meal_id in meal_ids}
+
+
+def _current_totals(db, transaction, day_data):
+    if isinstance(day_data.get('totals'), dict):
+        return day_data['totals']
+    meals = _read_meals(db, transaction, day_data.get('meals', []))
+    return sum_totals([meals[meal_id] for meal_id in day_data.get('meals', [])])
+
+
+def add_meal_to_day(db, transactional, day_ref, meal_id, new_day=None):
+    """
+    Append a meal to a day and add it to the day's totals. When the day does not
+    exist it is created from new_day; returns whether anything was written.
+    """
+    meal_ref = db.collection('Meal').document(meal_id)
+
+    @transactional
+    def add(transaction):
+        day = day_ref.get(transaction=transaction)
+        meal = meal_ref.get(transaction=transaction)
+        meal_data = meal.to_dict() if meal.exists else {}
+        if not day.exists:
+            if new_day is None:
+                return False
+            transaction.set(day_ref, {'workouts': [], **new_day, 'meals': [meal_id], 'totals': sum_totals([meal_data])})
+            return True
+        day_data = day.to_dict()
+        if meal_id in day_data.get('meals', []):
+            return False
+        totals = _current_totals(db, transaction, day_data)
+        transaction.update(day_ref, {
+            'meals': day_data.get('meals', []) + [meal_id],
+            'totals': shift_totals(totals, meal_data, 1),
+        })
+        return True
+
+    return add(db.transaction())
+
+
+def remove_meal_from_days(db, transactional, day_refs, meal_id, delete_meal=False):
+    """
+    Take a meal out of the given days and their totals, deleting the Meal document
+    too when delete_meal is set. Returns the number of days changed.
+    """
+    meal_ref = db.collection('Meal').document(meal_id)
+
+    @transactional
+    def remove(transaction):
+        meal = meal_ref.get(transaction=transaction)
+        meal_data = meal.to_dict() if meal.exists else {}
+        changes = []
+        for day_ref in day_refs:
+            day = day_ref.get(transaction=transaction)
+            day_data = day.to_dict() if day.exists else {}
+            if meal_id not in day_data.get('meals', []):
+                continue
+            totals = _current_totals(db, transaction, day_data)
+            # ArrayRemove semantics: every copy of the ID goes, and each one was counted
+            copies = day_data['meals'].count(meal_id)
+            for _ in range(copies):
+                totals = shift_totals(totals, meal_data, -1)
+            changes.append((day_ref, [other for other in day_data['meals'] if other != meal_id], totals))
+        for day_ref, meals, totals in changes:
+            transaction.update(day_ref, {'meals': meals, 'totals': totals})
+        if delete_meal and meal.exists:
+            transaction.delete(meal_ref)
+        return len(changes)
+
+    return remove(db.transaction())
+
+
+def edit_meal_on_days(db, transactional, meal_id, updates, day_refs):
+    """
+    Update a Meal document and move the totals of the given days that list it by
+    the difference. Returns the meal as it was before the edit, or None if missing.
+    """
+    meal_ref = db.collection('Meal').document(meal_id)
+
+    @transactional
+    def edit(transaction):
+        meal = meal_ref.get(transaction=transaction)
+        if not meal.exists:
+            return None
+        old = meal.to_dict()
+        new = {**old, **updates}
+        changes = []
+        for day_ref in day_refs:
+            day = day_ref.get(transaction=transaction)
+            day_data = day.to_dict() if day.exists else {}
+            if meal_id not in day_data.get('meals', []):
+                continue
+            if isinstance(day_data.get('totals'), dict):
+                totals = day_data['totals']
+                for _ in range(day_data['meals'].count(meal_id)):
+                    totals = shift_totals(shift_totals(totals, old, -1), new, 1)
+            else:
+                meals = _read_meals(db, transaction, day_data['meals'])
+                meals[meal_id] = new
+                totals = sum_totals([meals[other] for other in day_data['meals']])
+            changes.append((day_ref, totals))
+        transaction.update(meal_ref, updates)
+        for day_ref, totals in changes:
+            transaction.update(day_ref, {'totals': totals})
+        return old
+
+    return edit(db.transaction())
+
+
+def reconcile_day_totals(db, transactional, days_per_batch=200):
+    """
+    Compare every Day's totals with its meals and rewrite the ones that drifted
+    (or were never set). Drifted days are fixed in a transaction that re-reads
+    the day and its meals, so a concurrent meal write is never overwritten.
+    Returns {'checked', 'drifted', 'fixed'}.
+    """
+    report = {'checked': 0, 'drifted': 0, 'fixed': 0}
+
+    @transactional
+    def fix(transaction, day_ref):
+        day = day_ref.get(transaction=transaction)
+        if not day.exists:
+            return False
+        day_data = day.to_dict()
+        meals = _read_meals(db, transaction, day_data.get('meals', []))
+        expected = sum_totals([meals[meal_id] for meal_id in day_data.get('meals', [])])
+        if totals_match(day_data.get('totals'), expected):
+            return False
+        transaction.update(day_ref, {'totals': expected})
+        return True
+
+    def check(days):
+        meals = _read_meals(db, None, [meal_id for _, day in days for meal_id in day.get('meals', [])])
+        for day_ref, day in days:
+            report['checked'] += 1
+            expected = sum_totals([meals[meal_id] for meal_id in day.get('meals', [])])
+            if not totals_match(day.get('totals'), expected):
+                report['drifted'] += 1
+                if fix(db.transaction(), day_ref):
+                    report['fixed'] += 1
+
+    pending = []
+    for day_doc in db.collection('Day').select(['meals', 'totals']).stream():
+        pending.append((day_doc.reference, day_doc.to_dict()))
+        if len(pending) >= days_per_batch:
+            check(pending)
+            pending = []
+    if pending:
+        check(pending)
+    return report
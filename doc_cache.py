@@ -0,0 +1,327 @@
+import copy
+import threading
+import time
+from collections import OrderedDict
+
+
+class CachedSnapshot:
+    # Minimal stand-in for a Firestore DocumentSnapshot served from the cache
+    def __init__(self, reference, data, update_time):
+        self.reference = reference
+        self.id = reference.id
+        self.update_time = update_time
+        self._data = data
+
+    @property
+    def exists(self):
+        return self._data is not None
+
+    def get(self, field_path):
+        value = self._data
+        for part in field_path.split('.'):
+            value = value[part]
+        return copy.deepcopy(value)
+
+    def to_dict(self):
+        return copy.deepcopy(self._data)
+
+
+def project(data, field_paths):
+    # Apply a Firestore-style field mask to a cached document
+    projected = {}
+    for field_path in field_paths:
+        source, target = data, projected
+        parts = field_path.split('.')
+        for part in parts[:-1]:
+            if not isinstance(source, dict) or part not in source:
+                break
+            source = source[part]
+            target = target.setdefault(part, {})
+        else:
+            if isinstance(source, dict) and parts[-1] in source:
+                target[parts[-1]] = copy.deepcopy(source[parts[-1]])
+    return projected
+
+
+class DocumentCache:
+    """
+    Process-local read-through cache of Firestore documents keyed by document path.
+
+    Entries are bounded by max_entries with LRU eviction. Writes made through
+    this process call invalidate(); writes from elsewhere are picked up either by
+    collection on_snapshot listeners (see watch()) or, at the latest, when an
+    entry older than max_age is revalidated against Firestore's update_time.
+
+    With a SharedCache, misses here are looked up in the tier shared by all
+    worker processes before going to Firestore, and invalidations made by any
+    worker are replayed here at most sync_interval seconds later. Listener
+    updates only refresh this process's entries.
+
+    Every invalidation bumps a generation counter; a read that started before
+    the latest invalidation of its document is returned but not cached, so a
+    snapshot fetched before a write cannot outlive the write's invalidate().
+    """
+
+    def __init__(self, client, max_entries=5000, max_age=300, collections=None, flights=None,
+                 shared=None, sync_interval=0.0):
+        self._client = client
+        # Optional SingleFlight that concurrent misses for the same document share
+        self._flights = flights
+        self._shared = shared
+        self._sync_interval = sync_interval
+        self._synced_at = None
+        self._max_entries = max_entries
+        self._max_age = max_age
+        self._collections = set(collections) if collections else None
+        self._entries = OrderedDict()  # path -> (data, update_time, cached_at)
+        # path -> generation of its latest invalidation, for the most recent max_entries paths;
+        # older paths count as invalidated at _invalidated_floor
+        self._generation = 0
+        self._invalidated = OrderedDict()
+        self._invalidated_floor = 0
+        self._lock = threading.Lock()
+        self._stats = {}
+        self._watches = {}
+
+    def _collection_stats(self, collection):
+        if collection not in self._stats:
+            self._stats[collection] = {
+                'hits': 0,
+                'misses': 0,
+                'evictions': 0,
+                'invalidations': 0,
+                'remote_invalidations': 0,
+                'shared_hits': 0,
+                'pushed_updates': 0,
+                'revalidations': 0,
+                'stale': 0,
+                'max_staleness_seconds': 0.0,
+            }
+        return self._stats[collection]
+
+    def is_cacheable(self, doc_ref):
+        return self._collections is None or doc_ref.parent.id in self._collections
+
+    def _lookup(self, doc_ref):
+        # Returns (snapshot, expired_entry); the caller holds no lock
+        path = doc_ref.path
+        with self._lock:
+            entry = self._entries.get(path)
+            if entry is None:
+                self._collection_stats(doc_ref.parent.id)['misses'] += 1
+                return None, None
+            data, update_time, cached_at = entry
+            if time.monotonic() - cached_at > self._max_age:
+                self._collection_stats(doc_ref.parent.id)['revalidations'] += 1
+                return None, entry
+            self._entries.move_to_end(path)
+            self._collection_stats(doc_ref.parent.id)['hits'] += 1
+            return CachedSnapshot(doc_ref, data, update_time), None
+
+    def _sync(self):
+        # Drop entries another worker invalidated since the last sync
+        if self._shared is None:
+            return
+        now = time.monotonic()
+        if self._synced_at is not None and now - self._synced_at < self._sync_interval:
+            return
+        self._synced_at = now
+        paths = self._shared.changes()
+        with self._lock:
+            if paths is None:
+                self._entries.clear()
+                return
+            for path in paths:
+                if self._entries.pop(path, None) is not None:
+                    self._collection_stats(path.split('/')[-2])['remote_invalidations'] += 1
+
+    def _from_shared(self, doc_ref, entry):
+        # Returns (snapshot, expired_entry) for an entry found in the shared tier
+        if entry is None:
+            return None, None
+        data, update_time, cached_at = entry
+        age = max(time.time() - cached_at, 0.0)
+        local_entry = (data, update_time, time.monotonic() - age)
+        if age > self._max_age:
+            return None, local_entry
+        with self._lock:
+            self._collection_stats(doc_ref.parent.id)['shared_hits'] += 1
+            self._entries[doc_ref.path] = local_entry
+            self._entries.move_to_end(doc_ref.path)
+            self._evict_excess()
+        return CachedSnapshot(doc_ref, data, update_time), None
+
+    def _evict_excess(self):
+        while len(self._entries) > self._max_entries:
+            evicted_path, _ = self._entries.popitem(last=False)
+            self._collection_stats(evicted_path.split('/')[-2])['evictions'] += 1
+
+    def _store(self, snapshot, expired_entry=None, version=None, generation=None):
+        collection = snapshot.reference.parent.id
+        path = snapshot.reference.path
+        with self._lock:
+            if generation is not None and self._invalidated.get(path, self._invalidated_floor) > generation:
+                # Invalidated while this read was in flight: the snapshot may predate the write
+                return
+            stats = self._collection_stats(collection)
+            if expired_entry is not None and expired_entry[1] != snapshot.update_time:
+                # The copy we were holding had changed underneath us
+                stats['stale'] += 1
+                staleness = time.monotonic() - expired_entry[2]
+                stats['max_staleness_seconds'] = max(stats['max_staleness_seconds'], staleness)
+            if not snapshot.exists:
+                self._entries.pop(path, None)
+                return
+            data = snapshot.to_dict()
+            self._entries[path] = (data, snapshot.update_time, time.monotonic())
+            self._entries.move_to_end(path)
+            self._evict_excess()
+        if self._shared is not None and version is not None:
+            self._shared.put(path, version, data, snapshot.update_time)
+
+    def get(self, doc_ref):
+        if not self.is_cacheable(doc_ref):
+            return doc_ref.get()
+
+        self._sync()
+        generation = self._generation
+        snapshot, expired_entry = self._lookup(doc_ref)
+        if snapshot is not None:
+            return snapshot
+
+        version = None
+        if self._shared is not None:
+            version, entry = self._shared.get(doc_ref.path)
+            snapshot, shared_expired = self._from_shared(doc_ref, entry)
+            if snapshot is not None:
+                return snapshot
+            expired_entry = expired_entry or shared_expired
+
+        def fetch():
+            snapshot = doc_ref.get()
+            self._store(snapshot, expired_entry, version, generation)
+            return snapshot
+
+        if self._flights is not None:
+            return self._flights.do((doc_ref.parent.id, 'document', doc_ref.path), fetch)
+        return fetch()
+
+    def get_all(self, doc_refs, field_paths=None):
+        # Same contract as Client.get_all: yields snapshots in no particular order
+        results = []
+        misses = []
+        expired_entries = {}
+        self._sync()
+        generation = self._generation
+        for doc_ref in doc_refs:
+            if not self.is_cacheable(doc_ref):
+                misses.append(doc_ref)
+                continue
+            snapshot, expired_entry = self._lookup(doc_ref)
+            if snapshot is None:
+                misses.append(doc_ref)
+                if expired_entry is not None:
+                    expired_entries[doc_ref.path] = expired_entry
+            elif field_paths is None:
+                results.append(snapshot)
+            else:
+                results.append(CachedSnapshot(doc_ref, project(snapshot._data, field_paths), snapshot.update_time))
+
+        versions = {}
+        if misses and self._shared is not None:
+            shared = self._shared.get_many([doc_ref.path for doc_ref in misses if self.is_cacheable(doc_ref)])
+            remaining = []
+            for doc_ref in misses:
+                if doc_ref.path not in shared:
+                    remaining.append(doc_ref)
+                    continue
+                version, entry = shared[doc_ref.path]
+                snapshot, shared_expired = self._from_shared(doc_ref, entry)
+                if snapshot is None:
+                    versions[doc_ref.path] = version
+                    if shared_expired is not None:
+                        expired_entries.setdefault(doc_ref.path, shared_expired)
+                    remaining.append(doc_ref)
+                elif field_paths is None:
+                    results.append(snapshot)
+                else:
+                    results.append(CachedSnapshot(doc_ref, project(snapshot._data, field_paths), snapshot.update_time))
+            misses = remaining
+
+        if misses:
+            for snapshot in self._client.get_all(misses, field_paths=field_paths):
+                # Projected reads are served as-is but never cached as whole documents
+                if field_paths is None and self.is_cacheable(snapshot.reference):
+                    path = snapshot.reference.path
+                    self._store(snapshot, expired_entries.get(path), versions.get(path), generation)
+                results.append(snapshot)
+        return results
+
+    def invalidate(self, doc_ref):
+        with self._lock:
+            self._generation += 1
+            self._invalidated[doc_ref.path] = self._generation
+            self._invalidated.move_to_end(doc_ref.path)
+            while len(self._invalidated) > self._max_entries:
+                _, forgotten = self._invalidated.popitem(last=False)
+                self._invalidated_floor = max(self._invalidated_floor, forgotten)
+            if self._entries.pop(doc_ref.path, None) is not None:
+                self._collection_stats(doc_ref.parent.id)['invalidations'] += 1
+        if self._shared is not None and self.is_cacheable(doc_ref):
+            self._shared.invalidate(doc_ref.path)
+        if self._flights is not None:
+            # A read that started before this write must not be shared with later callers
+            self._flights.forget(doc_ref.parent.id)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def watch(self, collection):
+        # Keep cached documents of a collection coherent with a Firestore listener
+        if collection in self._watches:
+            return
+
+        def on_snapshot(docs, changes, read_time):
+            for change in changes:
+                path = change.document.reference.path
+                with self._lock:
+                    if path not in self._entries:
+                        continue
+                    stats = self._collection_stats(collection)
+                    if change.type.name == 'REMOVED':
+                        del self._entries[path]
+                        stats['invalidations'] += 1
+                    else:
+                        self._entries[path] = (change.document.to_dict(), change.document.update_time, time.monotonic())
+                        stats['pushed_updates'] += 1
+
+        self._watches[collection] = self._client.collection(collection).on_snapshot(on_snapshot)
+
+    def unwatch_all(self):
+        for watch in self._watches.values():
+            watch.unsubscribe()
+        self._watches.clear()
+
+    def stats(self):
+        with self._lock:
+            collections = {}
+            entry_counts = {}
+            for path in self._entries:
+                collection = path.split('/')[-2]
+                entry_counts[collection] = entry_counts.get(collection, 0) + 1
+            for collection, stats in self._stats.items():
+                lookups = stats['hits'] + stats['misses'] + stats['revalidations']
+                collections[collection] = {
+                    **stats,
+                    'entries': entry_counts.get(collection, 0),
+                    'hit_rate': stats['hits'] / lookups if lookups else 0.0,
+                }
+            return {
+                'entries': len(self._entries),
+                'max_entries': self._max_entries,
+                'max_age_seconds': self._max_age,
+                'watched_collections': sorted(self._watches),
+                'collections': collections,
+                'shared': self._shared.stats() if self._shared is not None else None,
+            }
@@ -0,0 +1,284 @@
+"""
+Local exercise energy estimates from MET values (Compendium of Physical Activities).
+
+kcal = MET * 3.5 * body weight (kg) / 200 * minutes
+"""
+import difflib
+import re
+from functools import lru_cache
+
+import numpy as np
+
+from common import USERS_PER_BATCH, BatchWriter, days_by_user, iter_documents, normalize_name
+
+DEFAULT_BODY_WEIGHT_KG = 70.0
+LB_PER_KG = 2.20462
+SECONDS_PER_REP = 3
+REST_SECONDS_PER_SET = 60
+DEFAULT_SETS = 3
+DEFAULT_REPS = 10
+
+MET_TABLE = {
+    # Resistance training
+    'squat': 5.0,
+    'back squat': 6.0,
+    'front squat': 6.0,
+    'goblet squat': 5.0,
+    'jump squat': 8.0,
+    'lunge': 4.0,
+    'walking lunge': 4.0,
+    'split squat': 4.0,
+    'deadlift': 6.0,
+    'romanian deadlift': 6.0,
+    'bench press': 5.0,
+    'incline bench press': 5.0,
+    'chest press': 5.0,
+    'chest fly': 3.5,
+    'overhead press': 5.0,
+    'shoulder press': 5.0,
+    'lateral raise': 3.5,
+    'front raise': 3.5,
+    'bicep curl': 3.5,
+    'hammer curl': 3.5,
+    'tricep extension': 3.5,
+    'tricep dip': 5.0,
+    'dip': 5.0,
+    'row': 5.0,
+    'bent over row': 5.0,
+    'lat pulldown': 5.0,
+    'leg press': 5.0,
+    'leg curl': 3.5,
+    'leg extension': 3.5,
+    'calf raise': 3.5,
+    'hip thrust': 5.0,
+    'glute bridge': 3.5,
+    'kettlebell swing': 9.8,
+    'clean and press': 6.0,
+    'thruster': 8.0,
+    'farmer walk': 6.0,
+    # Calisthenics and core
+    'push up': 8.0,
+    'pull up': 8.0,
+    'chin up': 8.0,
+    'sit up': 8.0,
+    'crunch': 3.8,
+    'bicycle crunch': 3.8,
+    'russian twist': 3.8,
+    'leg raise': 3.8,
+    'plank': 3.8,
+    'side plank': 3.8,
+    'wall sit': 3.8,
+    'superman': 3.5,
+    'burpee': 8.0,
+    'jumping jack': 8.0,
+    'mountain climber': 8.0,
+    'high knee': 8.0,
+    'box jump': 8.0,
+    'bear crawl': 8.0,
+    'battle rope': 8.0,
+    # Cardio
+    'walking': 3.5,
+    'brisk walking': 4.3,
+    'jogging': 7.0,
+    'running': 9.8,
+    'sprint': 11.0,
+    'cycling': 7.5,
+    'stationary bike': 7.0,
+    'spinning': 8.5,
+    'rowing machine': 7.0,
+    'elliptical': 5.0,
+    'stair climber': 9.0,
+    'jump rope': 11.8,
+    'swimming': 7.0,
+    'boxing': 7.8,
+    'shadow boxing': 5.5,
+    'kickboxing': 7.3,
+    'hiit': 8.0,
+    'circuit training': 8.0,
+    'dancing': 5.0,
+    # Mobility
+    'yoga': 2.5,
+    'pilates': 3.0,
+    'stretching': 2.3,
+    'foam rolling': 2.0,
+}
+
+# Used when nothing in the table matches the exercise name
+FALLBACK_METS = (
+    (('cardio', 'full body', 'endurance'), 6.0),
+    (('core', 'abs', 'flexibility', 'mobility'), 3.8),
+)
+DEFAULT_MET = 5.0
+
+def _build_index():
+    # Exact names, names without spaces ("pushup") and order-free token signatures ("squat jump")
+    index = {}
+    for name, met in MET_TABLE.items():
+        key = normalize_name(name)
+        index[key] = met
+        index.setdefault(key.replace(' ', ''), met)
+        index.setdefault(' '.join(sorted(key.split())), met)
+    return index
+
+
+_INDEX = _build_index()
+_SINGLE_WORD_KEYS = [key for key in _INDEX if ' ' not in key]
+
+
+@lru_cache(maxsize=4096)
+def _match_name(normalized):
+    if not normalized:
+        return None
+    if normalized in _INDEX:
+        return _INDEX[normalized]
+
+    tokens = normalized.split()
+    # Longest run of words that is a known exercise, e.g. "thunder jump squat"
+    for size in range(min(len(tokens), 3), 0, -1):
+        for start in range(len(tokens) - size + 1):
+            phrase = tokens[start:start + size]
+            for key in (' '.join(phrase), ''.join(phrase), ' '.join(sorted(phrase))):
+                if key in _INDEX:
+                    return _INDEX[key]
+
+    close = difflib.get_close_matches(normalized, _INDEX.keys(), n=1, cutoff=0.8)
+    if close:
+        return _INDEX[close[0]]
+    # Misspelled single words, e.g. "sqauts"
+    for token in tokens:
+        close = difflib.get_close_matches(token, _SINGLE_WORD_KEYS, n=1, cutoff=0.85)
+        if close:
+            return _INDEX[close[0]]
+    return None
+
+
+def lookup_met(name, body_parts=''):
+    met = _match_name(normalize_name(name))
+    if met is not None:
+        return met
+    body_parts = str(body_parts or '').lower()
+    for keywords, fallback in FALLBACK_METS:
+        if any(keyword in body_parts for keyword in keywords):
+            return fallback
+    return DEFAULT_MET
+
+
+def _first_number(value):
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return float(value)
+    match = re.search(r'\d+(\.\d+)?', str(value or ''))
+    return float(match.group()) if match else None
+
+
+def body_weight_kg(user_data):
+    """The profile weight in kilograms; profiles may set weight_unit to 'lb'."""
+    weight = _first_number((user_data or {}).get('weight'))
+    if not weight or weight <= 0:
+        return DEFAULT_BODY_WEIGHT_KG
+    if str((user_data or {}).get('weight_unit', 'kg')).lower() in ('lb', 'lbs', 'pound', 'pounds'):
+        return weight / LB_PER_KG
+    return weight
+
+
+def exercise_minutes(exercises, total_minutes=None):
+    """
+    Minutes spent on each exercise. Explicit durations win; otherwise the workout's
+    total_minutes is split by training volume, or volume is timed per rep and set.
+    """
+    explicit = [_first_number(exercise.get('duration') or exercise.get('minutes')) for exercise in exercises]
+    sets = np.array([_first_number(exercise.get('sets')) or DEFAULT_SETS for exercise in exercises], dtype=float)
+    reps = np.array([_first_number(exercise.get('reps')) or DEFAULT_REPS for exercise in exercises], dtype=float)
+    timed = sets * (reps * SECONDS_PER_REP + REST_SECONDS_PER_SET) / 60.0
+
+    minutes = np.array([value if value else np.nan for value in explicit], dtype=float)
+    missing = np.isnan(minutes)
+    total_minutes = _first_number(total_minutes)
+    if missing.any() and total_minutes:
+        remaining = max(total_minutes - np.nansum(minutes), 0.0)
+        minutes[missing] = remaining * timed[missing] / timed[missing].sum()
+    else:
+        minutes[missing] = timed[missing]
+    return minutes
+
+
+def calories_burned(mets, minutes, weight_kg):
+    return np.rint(np.asarray(mets, dtype=float) * 3.5 * weight_kg / 200.0 * np.asarray(minutes, dtype=float)).astype(int)
+
+
+def estimate_workout(exercises, weight_kg=DEFAULT_BODY_WEIGHT_KG, total_minutes=None):
+    """Return a copy of each exercise with avg_calories_burned computed locally."""
+    if not exercises:
+        return []
+    mets = [lookup_met(exercise.get('name'), exercise.get('body_parts')) for exercise in exercises]
+    calories = calories_burned(mets, exercise_minutes(exercises, total_minutes), weight_kg)
+    return [{**exercise, 'avg_calories_burned': int(kcal)} for exercise, kcal in zip(exercises, calories)]
+
+
+def owner_body_weights(db, users_per_batch=USERS_PER_BATCH):
+    """
+    {workout_id: body weight in kg} of the user who owns each workout: the user
+    who created or favorited it, else the user whose calendar schedules it.
+    """
+    weights = {}
+    scheduled = {}
+
+    def collect(users):
+        for user_id, days in days_by_user(db, list(users), field_paths=('date', 'workouts')).items():
+            for day in days:
+                for workout_id in day.get('workouts', []):
+                    if isinstance(workout_id, str):
+                        scheduled.setdefault(workout_id, users[user_id])
+
+    pending = {}
+    for user_doc in db.collection('users').select(['weight', 'weight_unit', 'workouts', 'favorited_workouts']).stream():
+        user_data = user_doc.to_dict()
+        weight_kg = body_weight_kg(user_data)
+        for workout_id in (user_data.get('workouts') or []) + (user_data.get('favorited_workouts') or []):
+            if isinstance(workout_id, str):
+                weights.setdefault(workout_id, weight_kg)
+        pending[user_doc.id] = weight_kg
+        if len(pending) >= users_per_batch:
+            collect(pending)
+            pending = {}
+    if pending:
+        collect(pending)
+    return {**scheduled, **weights}
+
+
+def recalculate_workout_library(db, weight_kg=DEFAULT_BODY_WEIGHT_KG, workouts_per_batch=100):
+    """
+    Recompute avg_calories_burned for every Exercise referenced by a Workout at its
+    owner's body weight (weight_kg for workouts no user owns), with batched reads
+    and 500-op batched writes. Returns the number of exercises updated.
+    """
+    writer = BatchWriter(db)
+    updated = 0
+    weights = owner_body_weights(db)
+
+    def recalculate(workouts):
+        nonlocal updated
+        exercise_ids = [exercise_id for _, workout in workouts for exercise_id in workout.get('exercises', [])
+                        if isinstance(exercise_id, str)]
+        exercises = dict(iter_documents(db, 'Exercise', list(dict.fromkeys(exercise_ids))))
+        for workout_id, workout in workouts:
+            ids = [exercise_id for exercise_id in workout.get('exercises', []) if exercise_id in exercises]
+            estimated = estimate_workout([exercises[exercise_id] for exercise_id in ids],
+                                         weights.get(workout_id, weight_kg), workout.get('total_minutes'))
+            for exercise_id, new_data in zip(ids, estimated):
+                if exercises[exercise_id].get('avg_calories_burned') != new_data['avg_calories_burned']:
+                    writer.update(db.collection('Exercise').document(exercise_id),
+                                  {'avg_calories_burned': new_data['avg_calories_burned']})
+                    updated += 1
+
+    try:
+        pending = []
+        for workout_doc in db.collection('Workout').select(['exercises', 'total_minutes']).stream():
+            pending.append((workout_doc.id, workout_doc.to_dict()))
+            if len(pending) >= workouts_per_batch:
+                recalculate(pending)
+                pending = []
+        if pending:
+            recalculate(pending)
+    finally:
+        writer.close()
+    return updated
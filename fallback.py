@@ -0,0 +1,262 @@
+"""
+Local meals and workouts for when the model is slow or unavailable.
+
+Meals come from the most favorited stored meal that fits the request, with its
+portions scaled to the requested calories, or else from a meal template filled in
+for the requested type, diet, ingredients and calories. Workouts are assembled
+from the most favorited stored exercises for the requested body parts, topped up
+from exercise templates, choosing exercises whose intensity suits the requested
+calories over the requested minutes. Everything is in memory and returns in a few
+milliseconds; results carry fallback=True.
+"""
+import threading
+import time
+
+from exercise_energy import DEFAULT_BODY_WEIGHT_KG, estimate_workout, lookup_met
+from meal_reuse import calorie_range, ingredient_keys, normalize_label
+from nutrition import MACROS, canonical_food, estimate_meal, scale_ingredient
+
+MEAL_TEMPLATES = {
+    'breakfast': [
+        ('Berry Oat Bowl', ['1/2 cup rolled oats', '1 cup milk', '100 g blueberries', '1 tbsp honey']),
+        ('Veggie Egg Scramble', ['2 large eggs', '60 g spinach', '1 tomato', '2 slices whole wheat bread']),
+        ('Banana Yogurt Bowl', ['200 g greek yogurt', '1 banana', '30 g almonds']),
+        ('Peanut Butter Banana Oats', ['1/2 cup rolled oats', '1 banana', '2 tbsp peanut butter']),
+    ],
+    'lunch': [
+        ('Chicken Rice Bowl', ['150 g chicken breast', '1 cup cooked brown rice', '150 g broccoli', '1 tbsp olive oil']),
+        ('Chickpea Quinoa Salad', ['1 cup cooked quinoa', '1 cup chickpeas', '100 g mixed greens', '1 tomato', '1 tbsp olive oil']),
+        ('Chicken Wrap', ['1 tortilla', '120 g chicken breast', '100 g mixed greens', '30 g cheddar cheese']),
+    ],
+    'dinner': [
+        ('Salmon Sweet Potato Plate', ['150 g salmon', '200 g sweet potato', '150 g broccoli']),
+        ('Beef Pasta', ['150 g lean beef', '1 cup cooked pasta', '1 tomato', '100 g bell pepper']),
+        ('Tofu Lentil Stir-Fry', ['150 g firm tofu', '1 cup cooked lentils', '100 g bell pepper', '1 tbsp olive oil']),
+    ],
+    'snack': [
+        ('Apple Almond Snack', ['1 apple', '30 g almonds']),
+        ('Peanut Butter Toast', ['2 slices whole wheat bread', '2 tbsp peanut butter']),
+        ('Yogurt Berry Cup', ['200 g greek yogurt', '100 g blueberries']),
+    ],
+}
+DEFAULT_CALORIES = {'breakfast': 450, 'lunch': 600, 'dinner': 700, 'snack': 250, None: 550}
+# Foods a diet leaves out, by the nutrient table's names
+MEATS = {'chicken breast', 'chicken thigh', 'ground beef', 'steak', 'pork chop', 'bacon', 'ham', 'sausage', 'turkey breast'}
+SEAFOOD = {'salmon', 'tuna', 'shrimp', 'cod', 'tilapia'}
+DAIRY = {'milk', 'skim milk', 'greek yogurt', 'yogurt', 'heavy cream', 'sour cream', 'cheddar cheese', 'mozzarella',
+         'parmesan', 'feta', 'cottage cheese', 'cream cheese', 'butter'}
+DIET_EXCLUDES = {
+    'vegan': MEATS | SEAFOOD | DAIRY | {'egg', 'egg white', 'egg noodles', 'honey', 'protein powder', 'mayonnaise'},
+    'vegetarian': MEATS | SEAFOOD,
+    'pescatarian': MEATS,
+    'dairy-free': DAIRY,
+    'gluten-free': {'whole wheat bread', 'white bread', 'bagel', 'english muffin', 'pita', 'flour tortilla', 'croissant',
+                    'pancake', 'waffle', 'pasta', 'couscous', 'egg noodles', 'soy sauce'},
+}
+# Stored meals are scaled at most this far from their recorded portions
+MIN_SCALE, MAX_SCALE = 0.5, 2.0
+
+EXERCISE_TEMPLATES = [
+    {'name': 'Squats', 'body_parts': 'legs, glutes', 'description': 'Sit back and down with your chest up, then drive through your heels to stand.', 'reps': 12, 'sets': 3, 'weight': 'bodyweight'},
+    {'name': 'Walking Lunges', 'body_parts': 'legs, glutes', 'description': 'Step forward into a lunge, lower the back knee, then step through with the other leg.', 'reps': 10, 'sets': 3, 'weight': 'bodyweight'},
+    {'name': 'Glute Bridges', 'body_parts': 'glutes, legs', 'description': 'Lie on your back and lift your hips until your body forms a straight line.', 'reps': 15, 'sets': 3, 'weight': 'bodyweight'},
+    {'name': 'Push-Ups', 'body_parts': 'chest, arms, shoulders', 'description': 'Lower your chest to the floor with a straight body, then press back up.', 'reps': 10, 'sets': 3, 'weight': 'bodyweight'},
+    {'name': 'Dumbbell Bench Press', 'body_parts': 'chest, arms', 'description': 'Press the dumbbells up from chest height and lower them under control.', 'reps': 10, 'sets': 3, 'weight': 'moderate dumbbells'},
+    {'name': 'Bicep Curls', 'body_parts': 'arms', 'description': 'Curl the dumbbells to your shoulders without swinging your elbows.', 'reps': 12, 'sets': 3, 'weight': 'light dumbbells'},
+    {'name': 'Tricep Dips', 'body_parts': 'arms', 'description': 'Lower your body from a bench by bending your elbows, then press back up.', 'reps': 12, 'sets': 3, 'weight': 'bodyweight'},
+    {'name': 'Bent-Over Rows', 'body_parts': 'back, arms', 'description': 'Hinge at the hips and pull the dumbbells to your ribs.', 'reps': 10, 'sets': 3, 'weight': 'moderate dumbbells'},
+    {'name': 'Superman Holds', 'body_parts': 'back, core', 'description': 'Lie face down and lift your arms and legs, holding briefly at the top.', 'reps': 12, 'sets': 3, 'weight': 'bodyweight'},
+    {'name': 'Overhead Press', 'body_parts': 'shoulders, arms', 'description': 'Press the dumbbells overhead from shoulder height and lower slowly.', 'reps': 10, 'sets': 3, 'weight': 'moderate dumbbells'},
+    {'name': 'Lateral Raises', 'body_parts': 'shoulders', 'description': 'Raise the dumbbells out to shoulder height with soft elbows.', 'reps': 12, 'sets': 3, 'weight': 'light dumbbells'},
+    {'name': 'Plank', 'body_parts': 'core', 'description': 'Hold a straight line from head to heels on your forearms.', 'reps': 1, 'sets': 3, 'weight': 'bodyweight'},
+    {'name': 'Bicycle Crunches', 'body_parts': 'core', 'description': 'Bring each elbow toward the opposite knee in a steady pedalling motion.', 'reps': 20, 'sets': 3, 'weight': 'bodyweight'},
+    {'name': 'Mountain Climbers', 'body_parts': 'core, cardio, full body', 'description': 'From a high plank, drive your knees toward your chest one after the other.', 'reps': 30, 'sets': 3, 'weight': 'bodyweight'},
+    {'name': 'Jumping Jacks', 'body_parts': 'cardio, full body', 'description': 'Jump your feet out while raising your arms, then jump back together.', 'reps': 40, 'sets': 3, 'weight': 'bodyweight'},
+    {'name': 'Burpees', 'body_parts': 'cardio, full body', 'description': 'Drop to a push-up, jump your feet in and explode upward.', 'reps': 10, 'sets': 3, 'weight': 'bodyweight'},
+    {'name': 'Kettlebell Swings', 'body_parts': 'full body, glutes, legs', 'description': 'Hinge and snap your hips to swing the kettlebell to chest height.', 'reps': 15, 'sets': 3, 'weight': 'moderate kettlebell'},
+    {'name': 'Jump Rope', 'body_parts': 'cardio, legs', 'description': 'Skip at a steady pace, staying light on the balls of your feet.', 'reps': 60, 'sets': 3, 'weight': 'bodyweight'},
+]
+DEFAULT_MINUTES = 30
+MIN_EXERCISES, MAX_EXERCISES = 3, 5
+MINUTES_PER_EXERCISE = 10
+
+
+def _parts(value):
+    return frozenset(part.strip().lower() for part in str(value or '').split(',') if part.strip())
+
+
+def _allowed(ingredients, diet):
+    excluded = DIET_EXCLUDES.get(diet or '', set())
+    return not any(canonical_food(ingredient) in excluded for ingredient in ingredients)
+
+
+def _with_macros(name, meal_type, ingredients):
+    estimate = estimate_meal(ingredients)
+    return {'name': name, 'type': meal_type, 'ingredients': ingredients, **{field: estimate[field] for field in MACROS}}
+
+
+class FallbackLibrary:
+    """Stored meals and exercises with how many users favorited them."""
+
+    def __init__(self):
+        self.meals = []
+        self.exercises = []
+
+    def load(self, db):
+        meal_favorites, workout_favorites = {}, {}
+        for user_doc in db.collection('users').select(['favorited_meals', 'favorited_workouts']).stream():
+            user = user_doc.to_dict()
+            for meal_id in user.get('favorited_meals') or []:
+                meal_favorites[meal_id] = meal_favorites.get(meal_id, 0) + 1
+            for workout_id in user.get('favorited_workouts') or []:
+                workout_favorites[workout_id] = workout_favorites.get(workout_id, 0) + 1
+
+        for meal_doc in db.collection('Meal').stream():
+            if meal_favorites.get(meal_doc.id):
+                self.add_meal(meal_doc.to_dict(), meal_favorites[meal_doc.id])
+
+        exercise_favorites = {}
+        for workout_doc in db.collection('Workout').select(['exercises']).stream():
+            if workout_favorites.get(workout_doc.id):
+                for exercise_id in workout_doc.to_dict().get('exercises') or []:
+                    if isinstance(exercise_id, str):
+                        exercise_favorites[exercise_id] = exercise_favorites.get(exercise_id, 0) + workout_favorites[workout_doc.id]
+        for exercise_doc in db.collection('Exercise').stream():
+            if exercise_favorites.get(exercise_doc.id):
+                self.add_exercise(exercise_doc.to_dict(), exercise_favorites[exercise_doc.id])
+        # Most favorited first; sorted once here rather than on every add
+        self.meals.sort(key=lambda entry: -entry[0])
+        self.exercises.sort(key=lambda entry: -entry[0])
+        return self
+
+    def add_meal(self, meal, favorites):
+        if isinstance(meal.get('ingredients'), list) and isinstance(meal.get('calories'), (int, float)) and meal['calories'] > 0:
+            self.meals.append((favorites, ingredient_keys(meal['ingredients']), meal))
+
+    def add_exercise(self, exercise, favorites):
+        if exercise.get('name'):
+            fields = ('name', 'body_parts', 'description', 'reps', 'sets', 'weight')
+            self.exercises.append((favorites, {field: exercise[field] for field in fields if field in exercise}))
+
+    def meal(self, request):
+        meal_type, diet = normalize_label(request.get('type')), normalize_label(request.get('diet'))
+        wanted = ingredient_keys(request.get('ingredients') or [])
+        calories = calorie_range(request.get('calories'))
+        target = (calories[0] + calories[1]) / 2 if calories else DEFAULT_CALORIES.get(meal_type, DEFAULT_CALORIES[None])
+
+        for _, keys, meal in self.meals:
+            if meal_type is not None and normalize_label(meal.get('type')) != meal_type:
+                continue
+            if diet is not None and normalize_label(meal.get('diet')) != diet and not _allowed(meal['ingredients'], diet):
+                continue
+            if not wanted <= keys:
+                continue
+            factor = min(max(target / meal['calories'], MIN_SCALE), MAX_SCALE)
+            ingredients = [scale_ingredient(ingredient, factor) for ingredient in meal['ingredients']]
+            result = _with_macros(meal.get('name'), meal.get('type'), ingredients)
+            break
+        else:
+            result = self._template_meal(meal_type, diet, request.get('ingredients') or [], target)
+
+        if diet is not None:
+            result['diet'] = request['diet']
+        result['fallback'] = True
+        return result
+
+    @staticmethod
+    def _template_meal(meal_type, diet, requested, target):
+        templates = [template for key, group in MEAL_TEMPLATES.items() if meal_type in (None, key) for template in group]
+        if not templates:
+            templates = [template for group in MEAL_TEMPLATES.values() for template in group]
+        allowed = [template for template in templates if _allowed(template[1], diet)] or templates
+        wanted = ingredient_keys(requested)
+        # Templates that already hold more of the requested ingredients first, then in listed order
+        name, ingredients = max(allowed, key=lambda template: len(wanted & ingredient_keys(template[1])))
+        present = ingredient_keys(ingredients)
+        ingredients = ingredients + [ingredient for ingredient in requested if canonical_food(ingredient) not in present]
+
+        base = estimate_meal(ingredients)['calories']
+        factor = min(max(target / base, MIN_SCALE), MAX_SCALE) if base else 1.0
+        scaled = [scale_ingredient(ingredient, factor) for ingredient in ingredients]
+        return _with_macros(name, (meal_type or 'meal').title(), scaled)
+
+    def workout(self, request, weight_kg=DEFAULT_BODY_WEIGHT_KG):
+        wanted = _parts(request.get('body_parts'))
+        minutes = calorie_range(request.get('total_minutes'), 0)
+        minutes = int(minutes[0]) if minutes else DEFAULT_MINUTES
+        count = min(max(round(minutes / MINUTES_PER_EXERCISE), MIN_EXERCISES), MAX_EXERCISES)
+
+        # MET that would burn the requested calories over the requested minutes
+        calories = calorie_range(request.get('avg_calories_burned'), 0)
+        target_met = calories[0] / (3.5 * weight_kg / 200 * minutes) if calories else None
+
+        stored = [exercise for _, exercise in self.exercises]
+        candidates = []
+        for exercise in stored + EXERCISE_TEMPLATES:
+            parts = _parts(exercise.get('body_parts'))
+            if wanted and not wanted & parts:
+                continue
+            candidates.append(exercise)
+        if not candidates:
+            candidates = list(EXERCISE_TEMPLATES)
+        if target_met is not None:
+            # Stable sort keeps favorites ahead of templates among equally suitable exercises
+            candidates.sort(key=lambda exercise: abs(lookup_met(exercise['name'], exercise.get('body_parts')) - target_met))
+
+        chosen, names = [], set()
+        # First cover each requested body part, then fill up in order
+        for part in sorted(wanted):
+            for exercise in candidates:
+                if part in _parts(exercise.get('body_parts')) and exercise['name'].lower() not in names:
+                    chosen.append(exercise)
+                    names.add(exercise['name'].lower())
+                    break
+            if len(chosen) >= count:
+                break
+        for exercise in candidates:
+            if len(chosen) >= count:
+                break
+            if exercise['name'].lower() not in names:
+                chosen.append(exercise)
+                names.add(exercise['name'].lower())
+
+        focus = ', '.join(sorted(wanted)) if wanted else 'full body'
+        return {
+            'name': f"{focus.title()} Circuit",
+            'total_minutes': minutes,
+            'exercises': estimate_workout([dict(exercise) for exercise in chosen], weight_kg, minutes),
+            'fallback': True,
+        }
+
+
+class FallbackStats:
+    """How often each kind fell back, and how long assembling the fallback took."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counts = {}
+        self.seconds = {}
+        self.slowest = {}
+
+    def record(self, kind, seconds):
+        with self._lock:
+            self.counts[kind] = self.counts.get(kind, 0) + 1
+            self.seconds[kind] = self.seconds.get(kind, 0.0) + seconds
+            self.slowest[kind] = max(self.slowest.get(kind, 0.0), seconds)
+
+    def timed(self, kind, build):
+        started = time.perf_counter()
+        result = build()
+        self.record(kind, time.perf_counter() - started)
+        return result
+
+    def stats(self):
+        with self._lock:
+            return {
+                kind: {
+                    'count': count,
+                    'average_ms': round(self.seconds[kind] / count * 1000, 2),
+                    'slowest_ms': round(self.slowest[kind] * 1000, 2),
+                }
+                for kind, count in self.counts.items()
+            }
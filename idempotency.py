@@ -0,0 +1,111 @@
+"""
+Idempotency-Key handling for routes that create documents.
+
+The first request with a key runs; its response is kept for ttl seconds and
+replayed to later requests with the same key. Requests that arrive while the
+first is still running wait for its result instead of running again. A key
+reused with a different request body is refused. Only successful responses
+are kept (replayable()), so a retry after an error, a timeout or a 429 runs the
+route again.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+
+class KeyConflict(Exception):
+    pass
+
+
+class StillRunning(Exception):
+    pass
+
+
+def replayable(status_code, streamed=False):
+    """Whether a response may be stored and replayed: 2xx and not streamed."""
+    return not streamed and 200 <= status_code < 300
+
+
+class _Entry:
+    def __init__(self, fingerprint):
+        self.fingerprint = fingerprint
+        self.done = threading.Event()
+        self.response = None
+        self.expires = None
+
+
+class IdempotencyStore:
+    def __init__(self, ttl=24 * 3600, max_entries=10000, max_wait=60.0, clock=time.monotonic):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_wait = max_wait
+        self._clock = clock
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._counts = {'executed': 0, 'replayed': 0, 'waited': 0, 'conflicts': 0, 'not_stored': 0}
+
+    def _evict(self, now):
+        for key in [key for key, entry in self._entries.items() if entry.expires is not None and entry.expires <= now]:
+            del self._entries[key]
+        # Oldest finished entries go first; running ones are never evicted
+        while len(self._entries) > self.max_entries:
+            key = next((key for key, entry in self._entries.items() if entry.done.is_set()), None)
+            if key is None:
+                break
+            del self._entries[key]
+
+    def run(self, key, fingerprint, execute):
+        """
+        execute() -> (response, keep) runs once per key; keep says whether the response
+        may be replayed. Returns (response, replayed).
+        """
+        deadline = self._clock() + self.max_wait
+        while True:
+            with self._lock:
+                now = self._clock()
+                self._evict(now)
+                entry = self._entries.get(key)
+                if entry is not None and entry.fingerprint != fingerprint:
+                    self._counts['conflicts'] += 1
+                    raise KeyConflict("Idempotency-Key was already used with a different request")
+                if entry is None:
+                    entry = self._entries[key] = _Entry(fingerprint)
+                    owner = True
+                else:
+                    owner = False
+                    if entry.done.is_set():
+                        self._counts['replayed'] += 1
+                        return entry.response, True
+                    self._counts['waited'] += 1
+
+            if owner:
+                return self._execute(key, entry, execute), False
+            remaining = deadline - self._clock()
+            if remaining <= 0 or not entry.done.wait(remaining):
+                raise StillRunning("A request with this Idempotency-Key is still in progress")
+            # The first request's response was not kept: loop to replay it or take over
+
+    def _execute(self, key, entry, execute):
+        response, keep = None, False
+        try:
+            response, keep = execute()
+            return response
+        finally:
+            with self._lock:
+                if keep:
+                    entry.response = response
+                    entry.expires = self._clock() + self.ttl
+                    self._entries.move_to_end(key)
+                    self._counts['executed'] += 1
+                else:
+                    self._entries.pop(key, None)
+                    self._counts['not_stored'] += 1
+                entry.done.set()
+
+    def stats(self):
+        with self._lock:
+            return {
+                **self._counts,
+                'entries': len(self._entries),
+                'in_flight': sum(1 for entry in self._entries.values() if not entry.done.is_set()),
+            }
@@ -0,0 +1,133 @@
+"""
+Incremental parsing of a streamed JSON object.
+
+The model streams its answer in chunks of arbitrary size. ObjectStreamParser is fed
+those chunks and reports each top-level member of the object as soon as its value is
+complete, and each element of a top-level array (an exercise, an ingredient) as soon
+as that element is complete, so a client can render them before the model finishes.
+Text before the opening brace, such as a code fence, is skipped.
+"""
+import json
+
+WHITESPACE = ' \t\r\n'
+
+
+class ObjectStreamParser:
+    """
+    feed(chunk) returns a list of events:
+      ('item', key, index, value)  an element of the top-level array under key
+      ('field', key, value)        a complete top-level member
+    Every character is scanned once, and text before the value being parsed is dropped
+    after each chunk, so feeding a response costs O(length) however it is chunked.
+    Positions are offsets into the whole stream; self._text starts at self._offset.
+    """
+
+    def __init__(self):
+        self._text = ''
+        self._offset = 0
+        self.result = {}
+        self.done = False
+        self._pos = 0
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._key = None
+        self._key_start = None
+        self._value_start = None
+        self._is_array = None
+        self._item_start = None
+        self._item_index = 0
+        self._items = []
+
+    def feed(self, chunk):
+        self._text += chunk
+        events = []
+        text, offset = self._text, self._offset
+        end = offset + len(text)
+        while self._pos < end and not self.done:
+            i, ch = self._pos, text[self._pos - offset]
+            self._pos += 1
+
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif ch == '\\':
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+                    if self._depth == 1 and self._value_start is None:
+                        self._key = json.loads(self._slice(self._key_start, i + 1))
+                continue
+
+            if self._depth == 0:
+                if ch == '{':
+                    self._depth = 1
+                continue
+
+            # The first character of a top-level value tells whether its elements are reported
+            if self._depth == 1 and self._value_start is not None and self._is_array is None and ch not in WHITESPACE:
+                self._is_array = ch == '['
+                if self._is_array:
+                    self._item_start, self._item_index, self._items = i + 1, 0, []
+
+            if ch == '"':
+                self._in_string = True
+                if self._depth == 1 and self._value_start is None:
+                    self._key_start = i
+            elif ch == ':' and self._depth == 1 and self._value_start is None:
+                self._value_start = i + 1
+            elif ch in '{[':
+                self._depth += 1
+            elif ch in '}]':
+                if self._depth == 2 and self._is_array:
+                    self._emit_item(events, i)
+                self._depth -= 1
+                if self._depth == 0:
+                    self._emit_field(events, i)
+                    self.done = True
+            elif ch == ',':
+                if self._depth == 2 and self._is_array:
+                    self._emit_item(events, i)
+                    self._item_start = i + 1
+                elif self._depth == 1:
+                    self._emit_field(events, i)
+        self._trim()
+        return events
+
+    def _slice(self, start, end):
+        return self._text[start - self._offset:end - self._offset]
+
+    def _trim(self):
+        # Keep only the key, array element or other value still being read
+        if self._value_start is None:
+            keep = self._key_start
+        elif self._is_array:
+            keep = self._item_start
+        else:
+            keep = self._value_start
+        keep = self._pos if keep is None or self.done else min(keep, self._pos)
+        if keep > self._offset:
+            self._text = self._text[keep - self._offset:]
+            self._offset = keep
+
+    def _emit_item(self, events, end):
+        raw = self._slice(self._item_start, end).strip()
+        if raw:
+            value = json.loads(raw)
+            self._items.append(value)
+            events.append(('item', self._key, self._item_index, value))
+            self._item_index += 1
+
+    def _emit_field(self, events, end):
+        if self._value_start is not None:
+            # An array's elements were parsed as they completed
+            value = self._items if self._is_array else json.loads(self._slice(self._value_start, end))
+            self.result[self._key] = value
+            events.append(('field', self._key, value))
+        self._key = self._key_start = self._value_start = self._is_array = None
+
+    def close(self):
+        """The parsed object; raises ValueError if the stream ended before the object did."""
+        if not self.done:
+            raise ValueError("Model response ended before the JSON object was complete")
+        return self.result
@@ -0,0 +1,253 @@
+"""
+Reuse of existing meals for generate_meal requests.
+
+Each meal's ingredient set is MinHashed and banded into an LSH table, so finding
+meals that contain a request's ingredients, or that duplicate a freshly generated
+meal, touches a few buckets instead of the whole collection. Candidates are then
+checked exactly against the set, the requested type, diet and calories, and macros.
+Meals served this way are stored again for each requester with 'copied_from' set;
+copies are left out of the index so one meal is only ever matched once.
+"""
+import random
+import re
+import threading
+import zlib
+
+import numpy as np
+
+from nutrition import MACROS, canonical_food
+
+NUM_PERMUTATIONS = 64
+ROWS_PER_BAND = 2
+# Two rows per band keeps recall high for small requested sets inside larger meals
+BANDS = NUM_PERMUTATIONS // ROWS_PER_BAND
+# h(x) = (a * x + b) mod p with a, b, x below p = 2^31 - 1, so a * x + b fits in 64 bits
+_PRIME = (1 << 31) - 1
+_rng = np.random.default_rng(7919)
+_A = _rng.integers(1, _PRIME, NUM_PERMUTATIONS, dtype=np.uint64)
+_B = _rng.integers(0, _PRIME, NUM_PERMUTATIONS, dtype=np.uint64)
+
+# A requested calorie number matches meals within this share of it
+CALORIE_TOLERANCE = 0.15
+# Generated meals this similar to a stored one are served as that meal
+DUPLICATE_JACCARD = 0.8
+MAX_MACRO_DISTANCE = 0.15
+# Diet-only requests pick at random among this many best matches, for variety
+CHOICES = 5
+ANY = ('', 'any', 'none', 'meal')
+
+
+def minhash(keys):
+    """MinHash signature of a set of strings, or None for an empty set."""
+    if not keys:
+        return None
+    values = np.array([zlib.crc32(key.encode('utf-8')) % _PRIME for key in keys], dtype=np.uint64)
+    return ((_A[:, None] * values[None, :] + _B[:, None]) % _PRIME).min(axis=1)
+
+
+def _bands(signature):
+    for band in range(BANDS):
+        yield band, signature[band * ROWS_PER_BAND:(band + 1) * ROWS_PER_BAND].tobytes()
+
+
+def ingredient_keys(ingredients):
+    if not isinstance(ingredients, list):
+        return frozenset()
+    return frozenset(filter(None, (canonical_food(ingredient) for ingredient in ingredients if ingredient)))
+
+
+def normalize_label(value):
+    """Lower-cased type or diet, or None when it means any."""
+    value = str(value or '').strip().lower()
+    return None if value in ANY else value
+
+
+def calorie_range(value, tolerance=CALORIE_TOLERANCE):
+    """(low, high) for a requested value such as 500, "500" or "400-600"; None for any."""
+    numbers = [float(number) for number in re.findall(r'\d+(?:\.\d+)?', str(value if value is not None else ''))]
+    if not numbers:
+        return None
+    if len(numbers) >= 2:
+        return min(numbers[:2]), max(numbers[:2])
+    return numbers[0] * (1 - tolerance), numbers[0] * (1 + tolerance)
+
+
+def macro_distance(first, second):
+    """Mean relative difference over calories and macros; missing values count as far apart."""
+    distances = []
+    for field in MACROS:
+        a, b = first.get(field), second.get(field)
+        if not isinstance(a, (int, float)) or not isinstance(b, (int, float)):
+            distances.append(1.0)
+        else:
+            distances.append(abs(a - b) / max(abs(a), abs(b), 1.0))
+    return sum(distances) / len(distances)
+
+
+class MealReuseIndex:
+    """Ingredient sets, labels and macros of stored meals, with an LSH table over the sets."""
+
+    FIELDS = ['ingredients', 'type', 'diet', 'copied_from', *MACROS]
+
+    def __init__(self, rng=None):
+        self.meals = {}
+        self.buckets = {}
+        self.by_type = {}
+        self.lock = threading.RLock()
+        self._rng = rng or random.Random()
+
+    def __len__(self):
+        return len(self.meals)
+
+    def upsert(self, meal_id, meal):
+        if meal.get('copied_from'):
+            self.remove(meal_id)
+            return
+        keys = ingredient_keys(meal.get('ingredients'))
+        signature = minhash(keys)
+        entry = {
+            'keys': keys,
+            'signature': signature,
+            'type': normalize_label(meal.get('type')),
+            'diet': normalize_label(meal.get('diet')),
+            **{field: meal.get(field) for field in MACROS},
+        }
+        with self.lock:
+            self.remove(meal_id)
+            self.meals[meal_id] = entry
+            self.by_type.setdefault(entry['type'], set()).add(meal_id)
+            if signature is not None:
+                for bucket in _bands(signature):
+                    self.buckets.setdefault(bucket, set()).add(meal_id)
+
+    def remove(self, meal_id):
+        with self.lock:
+            entry = self.meals.pop(meal_id, None)
+            if entry is None:
+                return
+            self.by_type.get(entry['type'], set()).discard(meal_id)
+            if entry['signature'] is not None:
+                for bucket in _bands(entry['signature']):
+                    members = self.buckets.get(bucket)
+                    if members is not None:
+                        members.discard(meal_id)
+                        if not members:
+                            del self.buckets[bucket]
+
+    def load(self, db):
+        for meal_doc in db.collection('Meal').select(self.FIELDS).stream():
+            self.upsert(meal_doc.id, meal_doc.to_dict())
+        return self
+
+    def _candidates(self, signature):
+        found = set()
+        for bucket in _bands(signature):
+            found.update(self.buckets.get(bucket, ()))
+        return found
+
+    def find_reusable(self, request, exclude=()):
+        """
+        ID of a stored meal that satisfies a generate_meal request: same type and diet,
+        calories in the requested range and every requested ingredient present. A request
+        that names neither ingredients nor a diet would match almost any meal, so it is
+        always generated.
+        """
+        keys = ingredient_keys(request.get('ingredients') or [])
+        meal_type, diet = normalize_label(request.get('type')), normalize_label(request.get('diet'))
+        if not keys and diet is None:
+            return None
+        calories = calorie_range(request.get('calories'))
+        exclude = set(exclude)
+
+        with self.lock:
+            if keys:
+                candidates = self._candidates(minhash(keys))
+            elif meal_type is not None:
+                candidates = set(self.by_type.get(meal_type, ()))
+            else:
+                candidates = set(self.meals)
+
+            scored = []
+            for meal_id in candidates - exclude:
+                entry = self.meals[meal_id]
+                if meal_type is not None and entry['type'] != meal_type:
+                    continue
+                if diet is not None and entry['diet'] != diet:
+                    continue
+                if not keys <= entry['keys']:
+                    continue
+                meal_calories = entry['calories']
+                if calories is not None and not (
+                        isinstance(meal_calories, (int, float)) and calories[0] <= meal_calories <= calories[1]):
+                    continue
+                # Fewer extra ingredients and calories nearer the middle of the range rank first
+                overlap = len(keys) / len(entry['keys']) if entry['keys'] else 0.0
+                centre = 0.0
+                if calories is not None:
+                    middle = (calories[0] + calories[1]) / 2
+                    centre = abs(meal_calories - middle) / max(middle, 1.0)
+                scored.append((overlap - centre, meal_id))
+
+        if not scored:
+            return None
+        scored.sort(key=lambda item: (-item[0], item[1]))
+        if keys:
+            return scored[0][1]
+        return self._rng.choice(scored[:CHOICES])[1]
+
+    def find_duplicate(self, meal):
+        """ID of a stored meal with nearly the same ingredients, type and macros, or None."""
+        keys = ingredient_keys(meal.get('ingredients'))
+        if not keys:
+            return None
+        meal_type = normalize_label(meal.get('type'))
+        best = None
+        with self.lock:
+            for meal_id in self._candidates(minhash(keys)):
+                entry = self.meals[meal_id]
+                if meal_type is not None and entry['type'] != meal_type:
+                    continue
+                jaccard = len(keys & entry['keys']) / len(keys | entry['keys'])
+                if jaccard >= DUPLICATE_JACCARD and macro_distance(meal, entry) <= MAX_MACRO_DISTANCE:
+                    if best is None or jaccard > best[0]:
+                        best = (jaccard, meal_id)
+        return best[1] if best else None
+
+
+class ReuseStats:
+    """How often generate_meal was answered without the model, and the model time that saved."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reused = 0
+        self.duplicates = 0
+        self.generated = 0
+        self.llm_seconds = 0.0
+
+    def record_reuse(self):
+        with self._lock:
+            self.reused += 1
+
+    def record_generation(self, seconds, duplicate=False):
+        with self._lock:
+            self.generated += 1
+            self.llm_seconds += seconds
+            self.duplicates += duplicate
+
+    def record_duplicate(self):
+        with self._lock:
+            self.duplicates += 1
+
+    def stats(self):
+        with self._lock:
+            requests = self.reused + self.generated
+            average = self.llm_seconds / self.generated if self.generated else None
+            return {
+                'requests': requests,
+                'reused': self.reused,
+                'generated': self.generated,
+                'duplicates_merged': self.duplicates,
+                'reuse_rate': round(self.reused / requests, 4) if requests else None,
+                'average_llm_seconds': round(average, 3) if average is not None else None,
+                'llm_seconds_saved': round(self.reused * average, 3) if average is not None else None,
+            }
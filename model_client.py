@@ -0,0 +1,330 @@
+"""
+Resilient calls to the generative model.
+
+ModelClient sits in front of one or more model tiers, most capable first. Each tier
+keeps a rolling window of call latencies and failures and a circuit breaker that
+opens when too many recent calls failed or were too slow. A request is routed to
+the first tier whose circuit admits it and whose expected latency for the prompt
+fits the latency budget, falling back to the fastest available tier. A call still
+running after the tier's hedge delay gets a duplicate request, and the first
+successful response wins.
+
+model_factory(name) must return an object with generate_content(prompt, stream=False),
+such as google.generativeai.GenerativeModel.
+"""
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+import numpy as np
+
+
+class ModelUnavailable(Exception):
+    pass
+
+
+class RollingWindow:
+    """Latency and outcome of the calls made in the last window seconds."""
+
+    def __init__(self, window=60.0, clock=time.monotonic):
+        self.window = window
+        self._clock = clock
+        self._calls = deque()
+
+    def _trim(self):
+        cutoff = self._clock() - self.window
+        while self._calls and self._calls[0][0] < cutoff:
+            self._calls.popleft()
+
+    def add(self, seconds, ok, prompt_chars):
+        self._calls.append((self._clock(), seconds, ok, prompt_chars))
+        self._trim()
+
+    def clear(self):
+        self._calls.clear()
+
+    def __len__(self):
+        self._trim()
+        return len(self._calls)
+
+    def error_rate(self):
+        self._trim()
+        return sum(not ok for _, _, ok, _ in self._calls) / len(self._calls) if self._calls else 0.0
+
+    def percentile(self, q):
+        self._trim()
+        latencies = [seconds for _, seconds, ok, _ in self._calls if ok]
+        return float(np.percentile(latencies, q)) if latencies else None
+
+    def mean_prompt_chars(self):
+        self._trim()
+        return float(np.mean([chars for _, _, _, chars in self._calls])) if self._calls else None
+
+
+class CircuitBreaker:
+    """
+    closed -> open when, over at least min_calls recent calls, the share of failures
+    and slow calls reaches failure_rate; open -> half_open after cooldown, when one
+    trial call is let through; its outcome closes or reopens the circuit.
+    """
+
+    def __init__(self, failure_rate=0.5, min_calls=5, cooldown=30.0, window=60.0, clock=time.monotonic):
+        self.failure_rate = failure_rate
+        self.min_calls = min_calls
+        self.cooldown = cooldown
+        self.state = 'closed'
+        self._clock = clock
+        self._opened_at = None
+        self._trial_running = False
+        self._outcomes = RollingWindow(window, clock)
+
+    def available(self):
+        if self.state == 'open':
+            return self._clock() - self._opened_at >= self.cooldown
+        return not (self.state == 'half_open' and self._trial_running)
+
+    def before_call(self):
+        """Whether a call may start now; takes the trial slot of a half-open circuit."""
+        if not self.available():
+            return False
+        if self.state == 'open':
+            self.state = 'half_open'
+        if self.state == 'half_open':
+            self._trial_running = True
+        return True
+
+    def release(self):
+        """Give back a half-open circuit's trial slot without an outcome, as for an abandoned call."""
+        if self.state == 'half_open':
+            self._trial_running = False
+
+    def record(self, success):
+        if self.state == 'half_open':
+            self._trial_running = False
+            if success:
+                self.state = 'closed'
+                self._outcomes.clear()
+            else:
+                self._open()
+            return
+        self._outcomes.add(0.0, success, 0)
+        if len(self._outcomes) >= self.min_calls and self._outcomes.error_rate() >= self.failure_rate:
+            self._open()
+
+    def _open(self):
+        self.state = 'open'
+        self._opened_at = self._clock()
+
+
+class ModelTier:
+    def __init__(self, name, model, max_prompt_chars=None, window=60.0, slow_call_seconds=30.0,
+                 breaker=None, clock=time.monotonic):
+        self.name = name
+        self.model = model
+        self.max_prompt_chars = max_prompt_chars
+        self.slow_call_seconds = slow_call_seconds
+        self.latencies = RollingWindow(window, clock)
+        self.breaker = breaker or CircuitBreaker(window=window, clock=clock)
+        self.counts = {'calls': 0, 'errors': 0, 'slow': 0}
+
+    def expected_seconds(self, prompt_chars):
+        """Median recent latency scaled by the prompt's size relative to recent prompts; None before any call."""
+        median = self.latencies.percentile(50)
+        if median is None:
+            return None
+        typical = self.latencies.mean_prompt_chars() or prompt_chars or 1
+        return median * max(1.0, prompt_chars / typical)
+
+
+class ModelClient:
+    def __init__(self, model_factory, tiers=('gemini-pro',), timeout=30.0, hedge_after=None,
+                 hedge_percentile=95, min_hedge_after=1.0, slow_call_seconds=None, chunk_timeout=10.0,
+                 max_workers=16, clock=time.monotonic, **breaker_options):
+        slow_call_seconds = slow_call_seconds or timeout
+        self.tiers = [ModelTier(name, model_factory(name), slow_call_seconds=slow_call_seconds, clock=clock,
+                                breaker=CircuitBreaker(clock=clock, **breaker_options))
+                      for name in tiers]
+        self.timeout = timeout
+        self.chunk_timeout = chunk_timeout
+        self.hedge_after = hedge_after
+        self.hedge_percentile = hedge_percentile
+        self.min_hedge_after = min_hedge_after
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='model')
+        self._counts = {'requests': 0, 'hedges': 0, 'hedges_won': 0, 'failovers': 0, 'timeouts': 0, 'rejected': 0}
+
+    def _count(self, name):
+        with self._lock:
+            self._counts[name] += 1
+
+    def route(self, prompt_chars, budget):
+        """Candidate tiers for a prompt, the preferred one first."""
+        with self._lock:
+            available = [tier for tier in self.tiers if tier.breaker.available()
+                         and (tier.max_prompt_chars is None or prompt_chars <= tier.max_prompt_chars)]
+            expected = {tier.name: tier.expected_seconds(prompt_chars) for tier in available}
+        fitting = [tier for tier in available if expected[tier.name] is None or expected[tier.name] <= budget]
+        if fitting:
+            return fitting + [tier for tier in available if tier not in fitting]
+        # Nothing is expected to make the budget: fastest first
+        return sorted(available, key=lambda tier: expected[tier.name])
+
+    def _hedge_delay(self, tier):
+        if self.hedge_after is not None:
+            return self.hedge_after
+        with self._lock:
+            percentile = tier.latencies.percentile(self.hedge_percentile)
+        return max(percentile or self.timeout, self.min_hedge_after)
+
+    def _start(self, tier):
+        with self._lock:
+            return tier.breaker.before_call()
+
+    def _call(self, tier, prompt, **kwargs):
+        started = time.monotonic()
+        try:
+            response = tier.model.generate_content(prompt, **kwargs)
+            # Reading the text surfaces blocked or empty responses as failures here
+            response.text
+        except Exception:
+            self._record(tier, time.monotonic() - started, False, len(prompt))
+            raise
+        self._record(tier, time.monotonic() - started, True, len(prompt))
+        return response
+
+    def _record(self, tier, seconds, ok, prompt_chars):
+        with self._lock:
+            slow = ok and seconds > tier.slow_call_seconds
+            tier.counts['calls'] += 1
+            tier.counts['errors'] += not ok
+            tier.counts['slow'] += slow
+            tier.latencies.add(seconds, ok, prompt_chars)
+            tier.breaker.record(ok and not slow)
+
+    def generate(self, prompt, budget=None, hedge=True):
+        """
+        The first successful response within budget seconds (default: timeout).
+        Raises ModelUnavailable when every circuit is open, every call failed, or time ran out.
+        """
+        budget = budget or self.timeout
+        self._count('requests')
+        candidates = self.route(len(prompt), budget)
+        started = time.monotonic()
+        deadline = started + budget
+        running = {}
+        hedges = set()
+        errors = []
+
+        def launch(tier=None):
+            # The given tier if its circuit admits a call, otherwise the next candidate that does
+            tiers = ([tier] if tier else []) + [other for other in candidates if other is not tier]
+            for other in tiers:
+                if self._start(other):
+                    if other in candidates:
+                        candidates.remove(other)
+                    future = self._executor.submit(self._call, other, prompt)
+                    running[future] = other
+                    return future
+            return None
+
+        if launch() is None:
+            self._count('rejected')
+            raise ModelUnavailable("All model tiers are unavailable")
+        primary = next(iter(running.values()))
+        hedge_at = started + self._hedge_delay(primary) if hedge else None
+
+        while running:
+            until = deadline if hedge_at is None else min(hedge_at, deadline)
+            done, _ = wait(running, timeout=max(until - time.monotonic(), 0), return_when=FIRST_COMPLETED)
+            for future in done:
+                running.pop(future)
+                try:
+                    response = future.result()
+                except Exception as e:
+                    errors.append(e)
+                    continue
+                if future in hedges:
+                    self._count('hedges_won')
+                return response
+
+            now = time.monotonic()
+            if now >= deadline:
+                break
+            if not running:
+                # Every call so far failed: fail over to the next tier
+                if launch() is not None:
+                    self._count('failovers')
+            elif hedge_at is not None and now >= hedge_at:
+                # A duplicate of the slow call, on the same tier when its circuit allows
+                hedge_at = None
+                future = launch(primary)
+                if future is not None:
+                    hedges.add(future)
+                    self._count('hedges')
+
+        if not running and errors:
+            raise ModelUnavailable(f"Model call failed: {errors[-1]}")
+        self._count('timeouts')
+        raise ModelUnavailable(f"No model response within {budget:g} seconds")
+
+    def stream(self, prompt, budget=None, chunk_timeout=None):
+        """
+        A streaming response from the routed tier. Iterating it raises ModelUnavailable
+        when the stream runs past budget seconds (default: timeout) or a chunk takes
+        longer than chunk_timeout. The outcome is recorded once the stream is consumed;
+        a stream closed early, as on a client disconnect, is neither a success nor a failure.
+        """
+        budget = budget or self.timeout
+        for tier in self.route(len(prompt), budget):
+            if self._start(tier):
+                return self._consume(tier, prompt, budget, chunk_timeout or self.chunk_timeout)
+        self._count('rejected')
+        raise ModelUnavailable("All model tiers are unavailable")
+
+    def _consume(self, tier, prompt, budget, chunk_timeout):
+        self._count('requests')
+        started = time.monotonic()
+        deadline = started + budget
+        ok = None
+
+        def wait_for(call, *args):
+            # The model's iterator blocks, so each step runs on the executor and is waited for
+            future = self._executor.submit(call, *args)
+            done, _ = wait([future], timeout=max(min(deadline - time.monotonic(), chunk_timeout), 0))
+            if not done:
+                self._count('timeouts')
+                raise ModelUnavailable(f"No model stream chunk within {min(budget, chunk_timeout):g} seconds")
+            return future.result()
+
+        try:
+            chunks = wait_for(lambda: iter(tier.model.generate_content(prompt, stream=True)))
+            while True:
+                chunk = wait_for(next, chunks, None)
+                if chunk is None:
+                    break
+                yield chunk
+            ok = True
+        except Exception:
+            ok = False
+            raise
+        finally:
+            if ok is None:
+                with self._lock:
+                    tier.breaker.release()
+            else:
+                self._record(tier, time.monotonic() - started, ok, len(prompt))
+
+    def stats(self):
+        with self._lock:
+            tiers = {}
+            for tier in self.tiers:
+                p50, p95 = tier.latencies.percentile(50), tier.latencies.percentile(95)
+                tiers[tier.name] = {
+                    **tier.counts,
+                    'circuit': tier.breaker.state,
+                    'error_rate': round(tier.latencies.error_rate(), 4),
+                    'p50_seconds': round(p50, 3) if p50 is not None else None,
+                    'p95_seconds': round(p95, 3) if p95 is not None else None,
+                }
+            return {**self._counts, 'tiers': tiers}
@@ -0,0 +1,253 @@
+"""
+Turning model text into meal and workout documents without regenerating.
+
+Text goes through three stages, each only when the previous one is not enough:
+  1. tolerant extraction: the first JSON object, ignoring code fences and trailing
+     text, with trailing commas dropped and a truncated object cut back to its last
+     complete member;
+  2. validation against the meal or workout schema: values are coerced to their
+     types and missing or unusable fields get defaults;
+  3. one repair call with a short prompt, only when no usable object remains.
+"""
+import json
+import re
+import threading
+
+from exercise_energy import DEFAULT_REPS, DEFAULT_SETS, exercise_minutes
+
+WHITESPACE = ' \t\r\n'
+# Output sent back for repair is cut to this many characters
+REPAIR_INPUT_LIMIT = 4000
+
+MEAL_SCHEMA = {
+    'name': (str, 'Generated meal'),
+    'type': (str, 'meal'),
+    'calories': (int, None),
+    'carbs': (int, None),
+    'fats': (int, None),
+    'proteins': (int, None),
+    'ingredients': (list, None),
+}
+EXERCISE_SCHEMA = {
+    'name': (str, None),
+    'body_parts': (str, ''),
+    'description': (str, ''),
+    'reps': (int, DEFAULT_REPS),
+    'sets': (int, DEFAULT_SETS),
+    'weight': (str, 'bodyweight'),
+}
+WORKOUT_SCHEMA = {
+    'name': (str, 'Generated workout'),
+    'total_minutes': (int, None),
+    'exercises': (list, None),
+}
+# Shown to the model in repair prompts
+SCHEMA_TEXT = {
+    'meal': '{"name": str, "calories": int, "carbs": int, "fats": int, "proteins": int, '
+            '"ingredients": [str], "type": str}',
+    'workout': '{"name": str, "total_minutes": int, "exercises": [{"name": str, "body_parts": str, '
+               '"description": str, "reps": int, "sets": int, "weight": str}]}',
+}
+
+
+def _close_object(text):
+    """
+    The object starting at text[0] with trailing commas removed. If the text ends
+    before the object does, it is cut at the last comma and the open brackets closed.
+    Returns (text, truncated).
+    """
+    out = []
+    stack = []
+    in_string = escape = False
+    cut = None
+    for ch in text:
+        if in_string:
+            out.append(ch)
+            if escape:
+                escape = False
+            elif ch == '\\':
+                escape = True
+            elif ch == '"':
+                in_string = False
+            continue
+        if ch == '"':
+            in_string = True
+        elif ch in '{[':
+            stack.append('}' if ch == '{' else ']')
+        elif ch in '}]':
+            end = len(out)
+            while end and out[end - 1] in WHITESPACE:
+                end -= 1
+            if end and out[end - 1] == ',':
+                del out[end - 1]
+            if stack:
+                stack.pop()
+            if not stack:
+                out.append(ch)
+                return ''.join(out), False
+        elif ch == ',':
+            cut = (len(out), list(stack))
+        out.append(ch)
+    if cut is None:
+        raise ValueError("Model response ended before any complete JSON member")
+    length, still_open = cut
+    return ''.join(out[:length]) + ''.join(reversed(still_open)), True
+
+
+def extract_json(text):
+    """
+    (object, how) for the first JSON object in text, where how is 'clean',
+    'tolerated' (trailing commas) or 'truncated'. Raises ValueError if there is none.
+    """
+    start = text.find('{')
+    if start < 0:
+        raise ValueError("No JSON object in model response")
+    try:
+        data, _ = json.JSONDecoder().raw_decode(text, start)
+        how = 'clean'
+    except json.JSONDecodeError:
+        closed, truncated = _close_object(text[start:])
+        data = json.loads(closed)
+        how = 'truncated' if truncated else 'tolerated'
+    if not isinstance(data, dict):
+        raise ValueError("Model response is not a JSON object")
+    return data, how
+
+
+def _coerce(value, kind):
+    if kind is int:
+        if isinstance(value, bool):
+            return None
+        if isinstance(value, (int, float)):
+            return int(round(value)) if value >= 0 else None
+        match = re.search(r'\d+(?:\.\d+)?', str(value)) if isinstance(value, str) else None
+        return int(round(float(match.group()))) if match else None
+    if kind is str:
+        if isinstance(value, str):
+            return value.strip() or None
+        return str(value) if isinstance(value, (int, float)) and not isinstance(value, bool) else None
+    if kind is list:
+        if isinstance(value, str):
+            value = value.split(',')
+        return value if isinstance(value, list) else None
+    return value
+
+
+def _apply_schema(data, schema, filled, prefix=''):
+    result = dict(data)
+    for field, (kind, default) in schema.items():
+        value = _coerce(data[field], kind) if field in data else None
+        if value is None:
+            if default is not None:
+                filled.append(prefix + field)
+                result[field] = default
+            else:
+                result.pop(field, None)
+        else:
+            result[field] = value
+    return result
+
+
+def validate(kind, data):
+    """
+    (document, filled fields, problem). Fields the pipeline can estimate later (meal
+    macros, which reconcile_meal derives from the ingredients) are left out rather
+    than guessed. problem is None unless the output is unusable.
+    """
+    filled = []
+    if kind == 'meal':
+        meal = _apply_schema(data, MEAL_SCHEMA, filled)
+        ingredients = [str(item).strip() for item in meal.get('ingredients') or []
+                       if isinstance(item, (str, int, float)) and str(item).strip()]
+        if not ingredients:
+            return meal, filled, "meal has no ingredients"
+        meal['ingredients'] = ingredients
+        return meal, filled, None
+
+    workout = _apply_schema(data, WORKOUT_SCHEMA, filled)
+    exercises = []
+    for index, exercise in enumerate(workout.get('exercises') or []):
+        if isinstance(exercise, dict):
+            exercise = _apply_schema(exercise, EXERCISE_SCHEMA, filled, f'exercises.{index}.')
+            if exercise.get('name'):
+                exercises.append(exercise)
+    if not exercises:
+        return workout, filled, "workout has no usable exercises"
+    workout['exercises'] = exercises
+    if 'total_minutes' not in workout:
+        filled.append('total_minutes')
+        workout['total_minutes'] = int(round(exercise_minutes(exercises).sum()))
+    return workout, filled, None
+
+
+def repair_prompt(kind, text, problem):
+    return f"""
+        The text below was meant to be a single JSON object for a {kind}, but it could not be used: {problem}.
+        Respond with ONLY the corrected JSON object, keeping its content, in this schema:
+        {SCHEMA_TEXT[kind]}
+
+        {text[:REPAIR_INPUT_LIMIT]}
+        """
+
+
+class OutputStats:
+    """How model output was turned into documents, and how often it was wasted."""
+
+    OUTCOMES = ('clean', 'tolerated', 'truncated', 'defaulted', 'repaired', 'failed')
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counts = dict.fromkeys(self.OUTCOMES, 0)
+        self.repair_calls = 0
+
+    def record(self, outcome, repair_call=False):
+        with self._lock:
+            self.counts[outcome] += 1
+            self.repair_calls += repair_call
+
+    def stats(self):
+        with self._lock:
+            total = sum(self.counts.values())
+            return {
+                **self.counts,
+                'responses': total,
+                'repair_calls': self.repair_calls,
+                # Responses that would have failed a strict json.loads but were still used
+                'salvaged': total - self.counts['clean'] - self.counts['failed'],
+                'wasted_generation_rate': round(self.counts['failed'] / total, 4) if total else None,
+            }
+
+
+def _usable(kind, text):
+    try:
+        data, how = extract_json(text)
+    except ValueError as e:
+        return None, None, None, str(e)
+    document, filled, problem = validate(kind, data)
+    return document, how, filled, problem
+
+
+def parse_output(kind, text, repair=None, stats=None):
+    """
+    A validated meal or workout document from model text. repair(prompt) -> text is
+    called at most once, when the text holds no usable object. Raises ValueError if
+    the output is still unusable.
+    """
+    document, how, filled, problem = _usable(kind, text)
+    if problem is None:
+        if stats:
+            stats.record('defaulted' if filled else how)
+        return document
+
+    if repair is not None:
+        try:
+            document, _, _, repair_problem = _usable(kind, repair(repair_prompt(kind, text, problem)))
+        except Exception as e:
+            repair_problem = str(e)
+        if repair_problem is None:
+            if stats:
+                stats.record('repaired', repair_call=True)
+            return document
+    if stats:
+        stats.record('failed', repair_call=repair is not None)
+    raise ValueError(f"Unusable model response: {problem}")
@@ -0,0 +1,347 @@
+"""
+Local ingredient nutrition from the bundled table in data/nutrients.csv.
+
+Values are per 100 g. The CSV is compiled once into a .npy file next to it that
+every worker memory-maps, so the numbers live in the shared page cache; names,
+aliases and the lookup index stay in memory.
+"""
+import bisect
+import csv
+import difflib
+import math
+import os
+import re
+import tempfile
+import threading
+from functools import lru_cache
+
+import numpy as np
+
+from common import BatchWriter, normalize_name, number, stem
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data')
+CSV_PATH = os.path.join(DATA_DIR, 'nutrients.csv')
+TABLE_PATH = os.getenv('NUTRIENT_TABLE_PATH', os.path.join(DATA_DIR, 'nutrients.npy'))
+
+COLUMNS = ('kcal', 'carbs', 'fats', 'proteins', 'portion_g', 'cup_g')
+MACROS = ('calories', 'carbs', 'fats', 'proteins')
+MACRO_CALORIES = {'carbs': 4.0, 'proteins': 4.0, 'fats': 9.0}
+
+ML_PER_CUP = 240.0
+# Reported calories may differ this much from 4/4/9 kcal per gram of macros
+CALORIE_TOLERANCE = 0.25
+# Share of ingredients that must be recognised before a rough estimate can overrule reported values
+MIN_COVERAGE = 0.5
+# Rough estimates only overrule reported calories that are off by more than this factor
+MAX_DEVIATION = 2.0
+
+MASS_UNITS = {'g': 1.0, 'gram': 1.0, 'gr': 1.0, 'kg': 1000.0, 'kilogram': 1000.0, 'mg': 0.001,
+              'oz': 28.35, 'ounce': 28.35, 'lb': 453.6, 'pound': 453.6}
+VOLUME_UNITS = {'cup': 1.0, 'c': 1.0, 'tbsp': 1 / 16, 'tablespoon': 1 / 16, 'tbs': 1 / 16, 'tsp': 1 / 48,
+                'teaspoon': 1 / 48, 'ml': 1 / ML_PER_CUP, 'l': 1000 / ML_PER_CUP, 'liter': 1000 / ML_PER_CUP,
+                'litre': 1000 / ML_PER_CUP}
+COUNT_UNITS = {'slice', 'piece', 'clove', 'fillet', 'serving', 'scoop', 'whole', 'can'}
+SIZES = {'small': 0.75, 'medium': 1.0, 'large': 1.25}
+
+# Preparation words that do not change which food it is
+DESCRIPTORS = {
+    'a', 'an', 'of', 'fresh', 'chopped', 'diced', 'sliced', 'minced', 'grated', 'cubed', 'cooked', 'uncooked',
+    'raw', 'grilled', 'baked', 'roasted', 'steamed', 'boiled', 'fried', 'sauteed', 'boneless', 'skinless',
+    'organic', 'lean', 'frozen', 'canned', 'low', 'fat', 'free', 'reduced', 'light', 'plain', 'unsweetened',
+    'extra', 'virgin', 'finely', 'roughly', 'thinly', 'to', 'taste', 'optional', 'for', 'garnish', 'about',
+    'small', 'medium', 'large', 'whole', 'serving', 'portion', 'handful', 'pinch', 'dash',
+}
+
+_FRACTIONS = {'½': '1/2', '⅓': '1/3', '⅔': '2/3', '¼': '1/4', '¾': '3/4', '⅛': '1/8'}
+_AMOUNT = re.compile(
+    r'(?P<low>\d+(?:\.\d+)?)\s*(?:-|to)\s*(?P<high>\d+(?:\.\d+)?)'
+    r'|(?P<mixed>\d+)\s+(?P<numerator>\d+)/(?P<denominator>\d+)'
+    r'|(?P<fraction>\d+/\d+)'
+    r'|(?P<number>\d+(?:\.\d+)?)'
+)
+_WORD = re.compile(r'\s*([a-z]+)\.?')
+
+
+def _read_rows(csv_path):
+    with open(csv_path, newline='', encoding='utf-8') as f:
+        return list(csv.DictReader(f))
+
+
+def compile_table(rows, table_path):
+    """Write the numeric columns as a float32 .npy file, atomically so readers never see half a file."""
+    values = np.array([[float(row[column]) if row.get(column) else np.nan for column in COLUMNS] for row in rows],
+                      dtype=np.float32).reshape(-1, len(COLUMNS))
+    fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(table_path) or '.', suffix='.npy')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            np.save(f, values)
+        os.replace(temp_path, table_path)
+    except BaseException:
+        os.unlink(temp_path)
+        raise
+    return values
+
+
+class NutrientTable:
+    """The nutrient table plus an exact, prefix and fuzzy index over food names and aliases."""
+
+    def __init__(self, csv_path=CSV_PATH, table_path=TABLE_PATH):
+        rows = _read_rows(csv_path)
+        self.names = [row['name'] for row in rows]
+        self.values = self._load_values(rows, csv_path, table_path)
+
+        self._index = {}
+        for row_number, row in enumerate(rows):
+            for name in [row['name'], *filter(None, (row.get('aliases') or '').split('|'))]:
+                self._index.setdefault(normalize_name(name), row_number)
+        self._keys = sorted(self._index)
+        self._single_word_keys = [key for key in self._keys if ' ' not in key]
+        self.lookup = lru_cache(maxsize=4096)(self._lookup)
+
+    @staticmethod
+    def _load_values(rows, csv_path, table_path):
+        try:
+            if not os.path.exists(table_path) or os.path.getmtime(table_path) < os.path.getmtime(csv_path):
+                compile_table(rows, table_path)
+            values = np.load(table_path, mmap_mode='r')
+            if values.shape != (len(rows), len(COLUMNS)):
+                compile_table(rows, table_path)
+                values = np.load(table_path, mmap_mode='r')
+            return values
+        except OSError:
+            # Read-only deployment without a compiled table: keep the values in process memory
+            return np.array([[float(row[column]) if row.get(column) else np.nan for column in COLUMNS]
+                             for row in rows], dtype=np.float32).reshape(-1, len(COLUMNS))
+
+    def __len__(self):
+        return len(self.names)
+
+    def _prefixed(self, prefix):
+        start = bisect.bisect_left(self._keys, prefix)
+        end = bisect.bisect_left(self._keys, prefix + '￿')
+        return self._keys[start:end]
+
+    def search(self, prefix, limit=10):
+        """Food names whose name or alias starts with prefix, e.g. for autocomplete."""
+        rows = dict.fromkeys(self._index[key] for key in self._prefixed(normalize_name(prefix)))
+        return [self.names[row] for row in list(rows)[:limit]]
+
+    def _lookup(self, normalized):
+        """Row number of the food named `normalized`, or None."""
+        if not normalized:
+            return None
+        if normalized in self._index:
+            return self._index[normalized]
+
+        tokens = normalized.split()
+        kept = [token for token in tokens if token not in DESCRIPTORS] or tokens
+        if ' '.join(kept) in self._index:
+            return self._index[' '.join(kept)]
+        # Longest run of words that is a known food, e.g. "spicy chicken breast strip"
+        for size in range(min(len(kept), 3), 0, -1):
+            for start in range(len(kept) - size + 1):
+                phrase = ' '.join(kept[start:start + size])
+                if phrase in self._index:
+                    return self._index[phrase]
+
+        # Truncated names, e.g. "parm"
+        prefixed = self._prefixed(' '.join(kept))
+        if prefixed and len(' '.join(kept)) >= 3:
+            return self._index[min(prefixed, key=len)]
+
+        close = difflib.get_close_matches(' '.join(kept), self._keys, n=1, cutoff=0.8)
+        if close:
+            return self._index[close[0]]
+        # Misspelled single words, e.g. "brocoli"
+        for token in kept:
+            close = difflib.get_close_matches(token, self._single_word_keys, n=1, cutoff=0.85)
+            if close:
+                return self._index[close[0]]
+        return None
+
+    def grams(self, row, amount, unit, size):
+        portion_g, cup_g = float(self.values[row, 4]), float(self.values[row, 5])
+        if unit in MASS_UNITS:
+            return amount * MASS_UNITS[unit]
+        if unit in VOLUME_UNITS:
+            return amount * VOLUME_UNITS[unit] * (cup_g if math.isfinite(cup_g) else ML_PER_CUP)
+        return (amount or 1.0) * size * portion_g
+
+    def estimate(self, ingredients):
+        """
+        Macros for a list of ingredient strings. Unquantified ingredients count as one
+        typical portion; unrecognised ones are listed and left out of the totals.
+        """
+        rows, grams, unmatched = [], [], []
+        quantified = 0
+        for ingredient in ingredients or []:
+            name, amount, unit, size = parse_ingredient(ingredient)
+            row = self.lookup(normalize_name(name))
+            if row is None:
+                unmatched.append(ingredient)
+                continue
+            rows.append(row)
+            grams.append(self.grams(row, amount, unit, size))
+            quantified += amount is not None
+
+        totals = np.asarray(grams, dtype=float) @ np.asarray(self.values[rows, :4], dtype=float).reshape(-1, 4) / 100.0
+        return {
+            **{field: int(round(value)) for field, value in zip(MACROS, totals)},
+            'ingredients': len(ingredients or []),
+            'matched': len(rows),
+            'quantified': quantified,
+            'unmatched': unmatched,
+        }
+
+
+def _amount(match):
+    if match.group('low'):
+        return (float(match.group('low')) + float(match.group('high'))) / 2
+    if match.group('mixed'):
+        return int(match.group('mixed')) + int(match.group('numerator')) / max(int(match.group('denominator')), 1)
+    if match.group('fraction'):
+        numerator, denominator = match.group('fraction').split('/')
+        return int(numerator) / max(int(denominator), 1)
+    return float(match.group('number'))
+
+
+def scale_ingredient(text, factor):
+    """The ingredient string with its quantity multiplied by factor, e.g. ("150 g rice", 1.5) -> "225 g rice"."""
+    text = str(text or '')
+    for symbol, fraction in _FRACTIONS.items():
+        text = text.replace(symbol, ' ' + fraction).strip()
+    match = _AMOUNT.search(text)
+    if not match:
+        return text
+    amount = _amount(match) * factor
+    unit = parse_ingredient(text)[2]
+    # Whole numbers for counted items and large quantities such as grams, quarters for cups and spoons
+    if unit not in MASS_UNITS and unit not in VOLUME_UNITS:
+        amount = max(round(amount), 1)
+    else:
+        amount = round(amount) if amount >= 10 else max(round(amount * 4) / 4, 0.25)
+    return f"{text[:match.start()]}{amount:g}{text[match.end():]}"
+
+
+def parse_ingredient(text):
+    """
+    Split an ingredient string into (name, amount, unit, size factor), e.g.
+    "1 1/2 cups cooked brown rice" -> ("cooked brown rice", 1.5, "cup", 1.0).
+    Amount is None when the string has no quantity.
+    """
+    text = str(text or '').lower()
+    for symbol, fraction in _FRACTIONS.items():
+        text = text.replace(symbol, ' ' + fraction)
+
+    amount, unit, size = None, None, 1.0
+    match = _AMOUNT.search(text)
+    if match:
+        amount = _amount(match)
+        end = match.end()
+        word = _WORD.match(text, end)
+        if word and word.group(1) in SIZES:
+            size = SIZES[word.group(1)]
+            end = word.end()
+            word = _WORD.match(text, end)
+        if word and stem(word.group(1)) in (*MASS_UNITS, *VOLUME_UNITS, *COUNT_UNITS):
+            unit = stem(word.group(1))
+            end = word.end()
+        text = text[:match.start()] + ' ' + text[end:]
+    elif (word := _WORD.match(text)) and word.group(1) in SIZES:
+        size = SIZES[word.group(1)]
+
+    # "onion, finely chopped" and "chicken breast (skinless)" name the food before the comma or bracket
+    name = re.split(r'[,(]', text, maxsplit=1)[0]
+    if not name.strip():
+        name = re.sub(r'[(),]', ' ', text)
+    name = re.sub(r'^\s*of\s+', '', name).strip()
+    return name, amount, unit, size
+
+
+_table = None
+_table_lock = threading.Lock()
+
+
+def get_table():
+    global _table
+    if _table is None:
+        with _table_lock:
+            if _table is None:
+                _table = NutrientTable()
+    return _table
+
+
+def estimate_meal(ingredients):
+    return get_table().estimate(ingredients)
+
+
+def canonical_food(ingredient):
+    """The table's name for an ingredient string, or its normalized name when the table has no match."""
+    name = normalize_name(parse_ingredient(ingredient)[0])
+    row = get_table().lookup(name)
+    if row is not None:
+        return get_table().names[row]
+    return ' '.join(token for token in name.split() if token not in DESCRIPTORS) or name
+
+
+def _macro_calories(values):
+    return sum(values[field] * factor for field, factor in MACRO_CALORIES.items())
+
+
+def reconcile_meal(meal):
+    """
+    Check a meal's calories and macros against its ingredients and return
+    (corrected copy, report). Reported values are replaced when:
+      - every ingredient is recognised and quantified (the local numbers are exact),
+      - a value is missing (filled from whatever could be estimated),
+      - calories disagree with 4/4/9 kcal per gram of the reported macros (calories are recomputed),
+      - most ingredients are recognised and calories are still off by more than MAX_DEVIATION.
+    """
+    estimate = estimate_meal(meal.get('ingredients') if isinstance(meal.get('ingredients'), list) else [])
+    reported = {field: number(meal.get(field), None) for field in MACROS}
+    computed = {field: estimate[field] for field in MACROS}
+    count = estimate['ingredients']
+    exact = count and estimate['matched'] == count and estimate['quantified'] == count
+    coverage = estimate['matched'] / count if count else 0.0
+
+    corrected = dict(meal)
+    source = 'reported'
+    if exact:
+        corrected.update(computed)
+        source = 'ingredients'
+    elif any(value is None for value in reported.values()):
+        if estimate['matched']:
+            corrected.update({field: computed[field] for field, value in reported.items() if value is None})
+            source = 'ingredients'
+    else:
+        calories = reported['calories']
+        macro_calories = _macro_calories(reported)
+        if macro_calories > 0 and abs(calories - macro_calories) > CALORIE_TOLERANCE * macro_calories:
+            calories = corrected['calories'] = int(round(macro_calories))
+            source = 'macros'
+        if coverage >= MIN_COVERAGE and computed['calories'] > 0 and not (
+                computed['calories'] / MAX_DEVIATION <= calories <= computed['calories'] * MAX_DEVIATION):
+            corrected.update(computed)
+            source = 'ingredients'
+
+    changed = [field for field in MACROS if corrected.get(field) != meal.get(field)]
+    return corrected, {'source': source, 'changed': changed, 'estimate': estimate}
+
+
+def recalculate_meal_library(db):
+    """
+    Reconcile every Meal document with its ingredients, writing only meals whose
+    numbers change in 500-op batches. Returns the number of meals updated.
+    """
+    writer = BatchWriter(db)
+    updated = 0
+    try:
+        for meal_doc in db.collection('Meal').select(['ingredients', *MACROS]).stream():
+            meal = meal_doc.to_dict()
+            corrected, report = reconcile_meal(meal)
+            if report['changed']:
+                writer.update(meal_doc.reference, {field: corrected[field] for field in report['changed']})
+                updated += 1
+    finally:
+        writer.close()
+    return updated
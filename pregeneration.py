@@ -0,0 +1,200 @@
+"""
+Background pre-generation of meals and workouts.
+
+Every generation request is remembered as demand for the user's current profile.
+A worker thread keeps a few ready-made candidates per remembered request shape,
+within a global hourly budget of model calls, and requests that fit a pooled
+candidate are answered from the pool without waiting for the model.
+"""
+import hashlib
+import json
+import threading
+import time
+from collections import deque
+
+from meal_reuse import calorie_range, ingredient_keys, normalize_label
+
+MEAL_CRITERIA = ('type', 'diet', 'calories', 'ingredients', 'time')
+WORKOUT_CRITERIA = ('total_minutes', 'body_parts', 'avg_calories_burned')
+PROFILE_FIELDS = ('goal', 'avg_cal_intake', 'weight', 'weight_unit')
+MINUTES_TOLERANCE = 0.2
+CALORIES_TOLERANCE = 0.25
+
+
+def profile_key(user_data):
+    """Changes whenever a profile field that shapes generation changes, which retires the old pool."""
+    profile = {field: (user_data or {}).get(field) for field in PROFILE_FIELDS}
+    return hashlib.sha1(json.dumps(profile, sort_keys=True, default=str).encode('utf-8')).hexdigest()[:16]
+
+
+def criteria_for(kind, request):
+    fields = MEAL_CRITERIA if kind == 'meal' else WORKOUT_CRITERIA
+    return {field: request[field] for field in fields if request.get(field) not in (None, '', [])}
+
+
+def _body_parts(value):
+    return frozenset(part.strip().lower() for part in str(value or '').split(',') if part.strip())
+
+
+def meal_fits(request, meal):
+    if normalize_label(request.get('type')) not in (None, normalize_label(meal.get('type'))):
+        return False
+    if normalize_label(request.get('diet')) not in (None, normalize_label(meal.get('diet'))):
+        return False
+    calories = calorie_range(request.get('calories'))
+    if calories is not None and not (
+            isinstance(meal.get('calories'), (int, float)) and calories[0] <= meal['calories'] <= calories[1]):
+        return False
+    return ingredient_keys(request.get('ingredients') or []) <= ingredient_keys(meal.get('ingredients'))
+
+
+def workout_fits(request, workout):
+    wanted = _body_parts(request.get('body_parts'))
+    have = _body_parts(', '.join(str(exercise.get('body_parts', '')) for exercise in workout.get('exercises', [])
+                                 if isinstance(exercise, dict)))
+    if wanted and not wanted <= have:
+        return False
+    minutes = calorie_range(request.get('total_minutes'), MINUTES_TOLERANCE)
+    if minutes is not None and not (
+            isinstance(workout.get('total_minutes'), (int, float)) and minutes[0] <= workout['total_minutes'] <= minutes[1]):
+        return False
+    calories = calorie_range(request.get('avg_calories_burned'), CALORIES_TOLERANCE)
+    burned = [exercise.get('avg_calories_burned') for exercise in workout.get('exercises', []) if isinstance(exercise, dict)]
+    if calories is not None and burned and all(isinstance(value, (int, float)) for value in burned):
+        return calories[0] <= sum(burned) <= calories[1]
+    return True
+
+
+FITS = {'meal': meal_fits, 'workout': workout_fits}
+
+
+class PregenerationPool:
+    """
+    Pools keyed by (user ID, kind, profile key). Each remembers the last few request
+    shapes it was asked for and holds up to per_shape unexpired candidates for each.
+
+    generate(kind, criteria, user_data) must return the parsed model output, or raise.
+    """
+
+    def __init__(self, generate, per_shape=1, shapes_per_pool=3, ttl=6 * 3600, idle_ttl=24 * 3600,
+                 budget_per_hour=30, max_pools=1000, interval=5.0):
+        self._generate = generate
+        self.per_shape = per_shape
+        self.shapes_per_pool = shapes_per_pool
+        self.ttl = ttl
+        self.idle_ttl = idle_ttl
+        self.budget_per_hour = budget_per_hour
+        self.max_pools = max_pools
+        self.interval = interval
+        self._pools = {}
+        self._calls = deque()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self._counts = {'hits': 0, 'misses': 0, 'generated': 0, 'failed': 0, 'expired': 0, 'budget_exhausted': 0}
+
+    def _pool(self, key, user_data):
+        pool = self._pools.get(key)
+        if pool is None:
+            if len(self._pools) >= self.max_pools:
+                # Forget the pool that has gone unused the longest
+                del self._pools[min(self._pools, key=lambda other: self._pools[other]['last_used'])]
+            pool = self._pools[key] = {'shapes': deque(maxlen=self.shapes_per_pool), 'items': [], 'user': user_data}
+        pool['last_used'] = time.monotonic()
+        pool['user'] = user_data
+        return pool
+
+    def take(self, user_id, kind, user_data, request):
+        """A pooled candidate that fits request, or None. Either way the request shape is remembered."""
+        criteria = criteria_for(kind, request)
+        key = (user_id, kind, profile_key(user_data))
+        now = time.monotonic()
+        with self._lock:
+            pool = self._pool(key, user_data)
+            if criteria in pool['shapes']:
+                pool['shapes'].remove(criteria)
+            pool['shapes'].append(criteria)
+            for index, item in enumerate(pool['items']):
+                if now - item['created'] <= self.ttl and FITS[kind](request, item['data']):
+                    del pool['items'][index]
+                    self._counts['hits'] += 1
+                    return item['data']
+            self._counts['misses'] += 1
+            return None
+
+    def _expire(self, now):
+        for key, pool in list(self._pools.items()):
+            if now - pool['last_used'] > self.idle_ttl:
+                self._counts['expired'] += len(pool['items'])
+                del self._pools[key]
+                continue
+            fresh = [item for item in pool['items'] if now - item['created'] <= self.ttl]
+            self._counts['expired'] += len(pool['items']) - len(fresh)
+            pool['items'] = fresh
+
+    def _next_job(self, now):
+        # Most recently used pools first; the first request shape short of candidates
+        for key, pool in sorted(self._pools.items(), key=lambda entry: -entry[1]['last_used']):
+            for criteria in reversed(pool['shapes']):
+                ready = sum(1 for item in pool['items'] if item['criteria'] == criteria)
+                if ready < self.per_shape:
+                    return key, criteria, pool['user']
+        return None
+
+    def refill_once(self):
+        """Generate at most one candidate. Returns True if a model call was made."""
+        now = time.monotonic()
+        with self._lock:
+            self._expire(now)
+            job = self._next_job(now)
+            if job is None:
+                return False
+            while self._calls and now - self._calls[0] > 3600:
+                self._calls.popleft()
+            if len(self._calls) >= self.budget_per_hour:
+                self._counts['budget_exhausted'] += 1
+                return False
+            self._calls.append(now)
+
+        key, criteria, user_data = job
+        try:
+            data = self._generate(key[1], criteria, user_data)
+        except Exception as e:
+            print(f"Error pre-generating {key[1]}: {e}")
+            with self._lock:
+                self._counts['failed'] += 1
+            return True
+        with self._lock:
+            self._counts['generated'] += 1
+            if key in self._pools:
+                self._pools[key]['items'].append({'criteria': criteria, 'data': data, 'created': time.monotonic()})
+        return True
+
+    def _run(self):
+        while not self._stop.is_set():
+            if not self.refill_once():
+                self._stop.wait(self.interval)
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, daemon=True, name='pregeneration')
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def stats(self):
+        with self._lock:
+            lookups = self._counts['hits'] + self._counts['misses']
+            now = time.monotonic()
+            return {
+                **self._counts,
+                'hit_rate': round(self._counts['hits'] / lookups, 4) if lookups else None,
+                'pools': len(self._pools),
+                'pooled_items': sum(len(pool['items']) for pool in self._pools.values()),
+                'calls_last_hour': sum(1 for started in self._calls if now - started <= 3600),
+                'budget_per_hour': self.budget_per_hour,
+            }
@@ -0,0 +1,382 @@
+"""
+Ranked meal and workout recommendations.
+
+Each index keeps one row per document in preallocated NumPy arrays that grow by
+doubling. Writes update a single row in place, deletes clear the row's `alive`
+flag and free it for reuse, and ranking is a handful of vectorized passes plus
+an argpartition top-K.
+"""
+import math
+import threading
+import time
+import zlib
+
+import numpy as np
+
+from common import iter_documents, normalize_name, number
+
+TERM_DIMENSIONS = 512
+PART_DIMENSIONS = 64
+MEALS_PER_DAY = 3
+STOP_WORDS = {'and', 'with', 'the', 'of', 'in', 'on', 'for', 'to', 'a', 'an', 'or', 'g', 'cup', 'tbsp', 'tsp', 'oz'}
+
+# Goal keywords -> preferred share of calories from proteins, carbs and fats, and a per-meal calorie factor
+MEAL_GOALS = (
+    (('lose', 'loss', 'cut', 'lean', 'shred', 'slim'), (0.35, 0.35, 0.30), 0.85),
+    (('gain', 'bulk', 'build', 'muscle', 'mass', 'strength'), (0.30, 0.45, 0.25), 1.1),
+    (('endurance', 'run', 'marathon', 'cardio', 'stamina'), (0.20, 0.55, 0.25), 1.0),
+)
+DEFAULT_MACRO_SHARES = (0.25, 0.50, 0.25)
+
+# Goal keywords -> weights for calories per minute, cardio focus and session minutes
+WORKOUT_GOALS = (
+    (('lose', 'loss', 'cut', 'lean', 'shred', 'slim'), (0.7, 0.3, 0.0), 45),
+    (('gain', 'bulk', 'build', 'muscle', 'mass', 'strength'), (0.3, -0.5, 0.0), 60),
+    (('endurance', 'run', 'marathon', 'cardio', 'stamina'), (0.2, 0.5, 0.3), 60),
+)
+DEFAULT_WORKOUT_WEIGHTS = ((0.4, 0.0, 0.0), 45)
+CARDIO_PARTS = ('cardio', 'full body', 'endurance')
+
+
+def _goal_settings(goal, table, default):
+    goal = str(goal or '').lower()
+    for keywords, *settings in table:
+        if any(keyword in goal for keyword in keywords):
+            return settings
+    return default
+
+
+def hashed_terms(text, dimensions=TERM_DIMENSIONS):
+    """Sublinear term frequencies of text, hashed into a fixed number of columns."""
+    vector = np.zeros(dimensions, dtype=np.float32)
+    for token in normalize_name(text).split():
+        if len(token) > 1 and token not in STOP_WORDS and not token.isdigit():
+            vector[zlib.crc32(token.encode('utf-8')) % dimensions] += 1
+    return np.log1p(vector)
+
+
+def _cosine(matrix, vector):
+    norms = np.linalg.norm(matrix, axis=1) * np.linalg.norm(vector)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return np.where(norms > 0, matrix @ vector / norms, 0.0)
+
+
+def _top_k(scores, candidates, k):
+    """Rows of the k best scores, best first; ties keep row order."""
+    if k <= 0 or not len(candidates):
+        return []
+    candidate_scores = scores[candidates]
+    if k < len(candidates):
+        keep = np.argpartition(-candidate_scores, k - 1)[:k]
+        candidates, candidate_scores = candidates[keep], candidate_scores[keep]
+    order = np.lexsort((candidates, -candidate_scores))
+    return candidates[order].tolist()
+
+
+class ArrayIndex:
+    """Rows of named NumPy columns keyed by document ID."""
+
+    def __init__(self, columns, capacity=256):
+        self.ids = []
+        self.rows = {}
+        self._free = []
+        self.alive = np.zeros(capacity, dtype=bool)
+        self.columns = {name: np.zeros((capacity, *shape), dtype=np.float32) for name, shape in columns.items()}
+        self.lock = threading.RLock()
+
+    def __len__(self):
+        return len(self.rows)
+
+    def _grow(self):
+        capacity = len(self.alive) * 2
+        self.alive = np.concatenate([self.alive, np.zeros(capacity - len(self.alive), dtype=bool)])
+        for name, column in self.columns.items():
+            self.columns[name] = np.concatenate([column, np.zeros_like(column)])
+
+    def _row_for(self, doc_id):
+        if doc_id in self.rows:
+            return self.rows[doc_id]
+        if self._free:
+            row = self._free.pop()
+            self.ids[row] = doc_id
+        else:
+            row = len(self.ids)
+            if row >= len(self.alive):
+                self._grow()
+            self.ids.append(doc_id)
+        self.rows[doc_id] = row
+        self.alive[row] = True
+        return row
+
+    def set_row(self, doc_id, values):
+        with self.lock:
+            row = self._row_for(doc_id)
+            for name, value in values.items():
+                self.columns[name][row] = value
+            return row
+
+    def remove(self, doc_id):
+        with self.lock:
+            row = self.rows.pop(doc_id, None)
+            if row is None:
+                return None
+            self.alive[row] = False
+            self.ids[row] = None
+            for column in self.columns.values():
+                column[row] = 0
+            self._free.append(row)
+            return row
+
+    def candidates(self, exclude=()):
+        """Live rows not in exclude, plus the number of rows in use."""
+        size = len(self.ids)
+        alive = self.alive[:size].copy()
+        for doc_id in exclude:
+            row = self.rows.get(doc_id)
+            if row is not None:
+                alive[row] = False
+        return np.flatnonzero(alive), size
+
+    def favorite_rows(self, favorite_ids):
+        return [self.rows[doc_id] for doc_id in favorite_ids if doc_id in self.rows]
+
+
+class MealIndex(ArrayIndex):
+    """Hashed TF-IDF over name and ingredients, plus calories and macros."""
+
+    FIELDS = ['name', 'ingredients', 'calories', 'carbs', 'fats', 'proteins']
+
+    def __init__(self, capacity=256):
+        super().__init__({'terms': (TERM_DIMENSIONS,), 'nutrition': (4,)}, capacity)
+        # Number of live meals using each term column, for IDF
+        self.document_frequency = np.zeros(TERM_DIMENSIONS, dtype=np.int64)
+        # TF-IDF row norms; IDF moves with every write, so writes reset this
+        self._norms = None
+
+    def upsert(self, meal_id, meal):
+        ingredients = meal.get('ingredients') if isinstance(meal.get('ingredients'), list) else []
+        terms = hashed_terms(' '.join([str(meal.get('name') or ''), *map(str, ingredients)]))
+        with self.lock:
+            if meal_id in self.rows:
+                self.document_frequency -= self.columns['terms'][self.rows[meal_id]] > 0
+            self.set_row(meal_id, {
+                'terms': terms,
+                'nutrition': [number(meal.get(field), math.nan) for field in ('calories', 'proteins', 'carbs', 'fats')],
+            })
+            self.document_frequency += terms > 0
+            self._norms = None
+
+    def remove(self, meal_id):
+        with self.lock:
+            if meal_id in self.rows:
+                self.document_frequency -= self.columns['terms'][self.rows[meal_id]] > 0
+                self._norms = None
+            return super().remove(meal_id)
+
+    def load(self, db):
+        for meal_doc in db.collection('Meal').select(self.FIELDS).stream():
+            self.upsert(meal_doc.id, meal_doc.to_dict())
+        return self
+
+    def recommend(self, user_data, k, exclude=()):
+        """IDs of the k meals that best fit the user's favorites, goal and calorie intake."""
+        user_data = user_data or {}
+        with self.lock:
+            candidates, size = self.candidates(exclude)
+            if not len(candidates):
+                return []
+            idf = (np.log((1.0 + len(self)) / (1.0 + self.document_frequency)) + 1.0).astype(np.float32)
+            terms = self.columns['terms'][:size]
+            nutrition = self.columns['nutrition'][:size].astype(float)
+            if self._norms is None or len(self._norms) != size:
+                self._norms = np.sqrt(np.einsum('ij,ij,j->i', terms, terms, idf * idf))
+
+            # Cosine between TF-IDF rows and the query without materialising terms * idf
+            query = hashed_terms(user_data.get('goal'))
+            favorite_rows = self.favorite_rows(user_data.get('favorited_meals') or [])
+            if favorite_rows:
+                query = query + terms[favorite_rows].mean(axis=0)
+            query = query * idf
+            norms = self._norms * np.linalg.norm(query)
+            with np.errstate(invalid='ignore', divide='ignore'):
+                similarity = np.where(norms > 0, terms @ (query * idf) / norms, 0.0)
+
+            macro_shares, calorie_factor = _goal_settings(user_data.get('goal'), MEAL_GOALS,
+                                                          (DEFAULT_MACRO_SHARES, 1.0))
+            calories = nutrition[:, 0]
+            target = number(user_data.get('avg_cal_intake'), math.nan) / MEALS_PER_DAY * calorie_factor
+            if target > 0:
+                calorie_fit = np.where(np.isnan(calories), 0.5, np.exp(-np.abs(calories - target) / target))
+            else:
+                calorie_fit = np.full(size, 0.5)
+
+            energy = np.nan_to_num(nutrition[:, 1:]) * np.array([4.0, 4.0, 9.0])
+            total = energy.sum(axis=1, keepdims=True)
+            with np.errstate(invalid='ignore', divide='ignore'):
+                shares = np.where(total > 0, energy / total, np.nan)
+            macro_fit = np.nan_to_num(1.0 - 0.5 * np.abs(shares - np.array(macro_shares)).sum(axis=1), nan=0.5)
+
+            scores = 0.5 * similarity + 0.3 * calorie_fit + 0.2 * macro_fit
+            return [self.ids[row] for row in _top_k(scores, candidates, k)]
+
+
+class WorkoutIndex(ArrayIndex):
+    """Hashed body-part focus, minutes and calories burned."""
+
+    FIELDS = ['body_part_focus', 'total_minutes', 'exercises']
+
+    def __init__(self, capacity=256):
+        super().__init__({'parts': (PART_DIMENSIONS,), 'effort': (3,)}, capacity)
+
+    def upsert(self, workout_id, workout, calories=None):
+        focus = str(workout.get('body_part_focus') or '').lower()
+        parts = np.zeros(PART_DIMENSIONS, dtype=np.float32)
+        for part in filter(None, (part.strip() for part in focus.split(','))):
+            parts[zlib.crc32(normalize_name(part).encode('utf-8')) % PART_DIMENSIONS] = 1.0
+        self.set_row(workout_id, {
+            'parts': parts,
+            'effort': [
+                number(workout.get('total_minutes'), math.nan),
+                number(calories, math.nan),
+                1.0 if any(part in focus for part in CARDIO_PARTS) else 0.0,
+            ],
+        })
+
+    def load(self, db):
+        workouts = [(doc.id, doc.to_dict()) for doc in db.collection('Workout').select(self.FIELDS).stream()]
+        exercise_ids = list(dict.fromkeys(
+            exercise_id for _, workout in workouts for exercise_id in workout.get('exercises') or []
+            if isinstance(exercise_id, str)
+        ))
+        burned = {
+            exercise_id: number(exercise.get('avg_calories_burned'), math.nan)
+            for exercise_id, exercise in iter_documents(db, 'Exercise', exercise_ids, field_paths=['avg_calories_burned'])
+        }
+        for workout_id, workout in workouts:
+            calories = [burned[exercise_id] for exercise_id in workout.get('exercises') or []
+                        if isinstance(exercise_id, str) and exercise_id in burned]
+            self.upsert(workout_id, workout, np.nansum(calories) if calories else None)
+        return self
+
+    def recommend(self, user_data, k, exclude=()):
+        """IDs of the k workouts that best fit the user's favorites and goal."""
+        user_data = user_data or {}
+        with self.lock:
+            candidates, size = self.candidates(exclude)
+            if not len(candidates):
+                return []
+            parts = self.columns['parts'][:size]
+            minutes, calories, cardio = self.columns['effort'][:size].astype(float).T
+
+            favorite_rows = self.favorite_rows(user_data.get('favorited_workouts') or [])
+            similarity = _cosine(parts, parts[favorite_rows].mean(axis=0)) if favorite_rows else np.zeros(size)
+
+            (intensity_weight, cardio_weight, duration_weight), target_minutes = _goal_settings(
+                user_data.get('goal'), WORKOUT_GOALS, DEFAULT_WORKOUT_WEIGHTS)
+            if favorite_rows and not np.isnan(minutes[favorite_rows]).all():
+                target_minutes = float(np.nanmedian(minutes[favorite_rows]))
+            with np.errstate(invalid='ignore', divide='ignore'):
+                per_minute = calories / minutes
+            per_minute[~np.isfinite(per_minute)] = np.nan
+            live_rates = per_minute[candidates]
+            top_rate = np.nanmax(live_rates) if not np.isnan(live_rates).all() else 0.0
+            intensity = np.nan_to_num(per_minute / top_rate, nan=0.5) if top_rate > 0 else np.full(size, 0.5)
+            duration_fit = np.nan_to_num(np.exp(-np.abs(minutes - target_minutes) / max(target_minutes, 1.0)), nan=0.5)
+
+            goal_fit = intensity_weight * intensity + cardio_weight * cardio + duration_weight * duration_fit
+            scores = 0.5 * similarity + 0.3 * goal_fit + 0.2 * duration_fit
+            return [self.ids[row] for row in _top_k(scores, candidates, k)]
+
+
+class LiveIndex:
+    """
+    An index built lazily with build(db). Once older than max_age seconds it is
+    rebuilt in the background to pick up writes from other processes; writes seen
+    while a build runs are replayed onto the new index before it is swapped in.
+    """
+
+    def __init__(self, db, build, max_age=600, name='index'):
+        self._db = db
+        self._build_index = build
+        self._max_age = max_age
+        self._name = name
+        self._lock = threading.Lock()
+        self._first_build = threading.Lock()
+        self._index = None
+        self._loaded_at = None
+        self._pending = None
+
+    def _build(self):
+        index = self._build_index(self._db)
+        with self._lock:
+            for method, args in self._pending or []:
+                getattr(index, method)(*args)
+            self._index, self._loaded_at, self._pending = index, time.monotonic(), None
+        return index
+
+    def _refresh(self):
+        try:
+            self._build()
+        except Exception as e:
+            print(f"Error rebuilding {self._name}: {e}")
+            with self._lock:
+                self._pending = None
+
+    def get(self, wait=True):
+        """The index, building it first if needed; with wait=False, None until a background build finishes."""
+        with self._lock:
+            index = self._index
+            stale = index is not None and time.monotonic() - self._loaded_at > self._max_age
+            if self._pending is None and (stale or (index is None and not wait)):
+                self._pending = []
+                threading.Thread(target=self._refresh, daemon=True).start()
+        if index is not None or not wait:
+            return index
+
+        with self._first_build:
+            with self._lock:
+                if self._index is not None:
+                    return self._index
+                self._pending = []
+            try:
+                return self._build()
+            except Exception:
+                with self._lock:
+                    self._pending = None
+                raise
+
+    def apply(self, method, *args):
+        """Call index.method(*args) on the live index, if built, and on any index being built."""
+        with self._lock:
+            index = self._index
+            if self._pending is not None:
+                self._pending.append((method, args))
+        if index is not None:
+            getattr(index, method)(*args)
+
+
+class Recommender:
+    """Lazily built meal and workout indexes behind the not-favorited endpoints."""
+
+    def __init__(self, db, max_age=600):
+        self.meals = LiveIndex(db, lambda client: MealIndex().load(client), max_age, 'meal recommendation index')
+        self.workouts = LiveIndex(db, lambda client: WorkoutIndex().load(client), max_age,
+                                  'workout recommendation index')
+
+    def recommend_meals(self, user_data, k, exclude=()):
+        return self.meals.get().recommend(user_data, k, exclude)
+
+    def recommend_workouts(self, user_data, k, exclude=()):
+        return self.workouts.get().recommend(user_data, k, exclude)
+
+    def upsert_meal(self, meal_id, meal):
+        self.meals.apply('upsert', meal_id, meal)
+
+    def remove_meal(self, meal_id):
+        self.meals.apply('remove', meal_id)
+
+    def upsert_workout(self, workout_id, workout, calories=None):
+        self.workouts.apply('upsert', workout_id, workout, calories)
+
+    def remove_workout(self, workout_id):
+        self.workouts.apply('remove', workout_id)
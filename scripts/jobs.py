@@ -0,0 +1,69 @@
+"""
+Command-line entry point for the maintenance and batch jobs.
+
+    python -m scripts.jobs reconcile-totals
+    python -m scripts.jobs recalculate-meals
+    python -m scripts.jobs recalculate-workouts
+    python -m scripts.jobs backfill-streaks
+    python -m scripts.jobs migrate-weights
+    python -m scripts.jobs weekly-summary [--week 2024-03-04] [--workers 4] [--schedule]
+
+Run from the repository root. Jobs connect through common.firestore_client(), so
+with FIRESTORE_EMULATOR_HOST set they talk to the local Firestore emulator.
+"""
+import argparse
+import os
+import time
+from datetime import datetime, timezone
+
+from google.cloud.firestore import transactional
+
+from common import USERS_PER_BATCH, firestore_client
+from day_totals import reconcile_day_totals
+from exercise_energy import recalculate_workout_library
+from nutrition import recalculate_meal_library
+from streaks import backfill_streaks
+from weekly_summary import run_weekly_summaries, seconds_until_next_run
+from weight_series import migrate_weights
+
+
+def weekly_summary(client, args):
+    while True:
+        if args.schedule:
+            time.sleep(seconds_until_next_run(datetime.now(timezone.utc), 0, args.hour))
+        print(run_weekly_summaries(client, args.week, workers=args.workers, users_per_batch=args.batch_size,
+                                   checkpoint_path=args.checkpoint, restart=args.restart))
+        if not args.schedule:
+            break
+
+
+JOBS = {
+    'reconcile-totals': lambda client, args: print(reconcile_day_totals(client, transactional)),
+    'recalculate-meals': lambda client, args: print(f"Updated {recalculate_meal_library(client)} meals"),
+    'recalculate-workouts': lambda client, args: print(f"Updated {recalculate_workout_library(client)} exercises"),
+    'backfill-streaks': lambda client, args: print(backfill_streaks(client)),
+    'migrate-weights': lambda client, args: print(migrate_weights(client, transactional)),
+    'weekly-summary': weekly_summary,
+}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Run a maintenance or batch job against Firestore.')
+    jobs = parser.add_subparsers(dest='job', required=True)
+    for name in JOBS:
+        jobs.add_parser(name)
+    weekly = jobs.choices['weekly-summary']
+    weekly.description = 'Compute weekly summaries for every user.'
+    weekly.add_argument('--week', help='any date in the week to summarize (default: last complete week)')
+    weekly.add_argument('--workers', type=int, default=os.cpu_count(), help='worker processes; 0 runs in process')
+    weekly.add_argument('--batch-size', type=int, default=USERS_PER_BATCH)
+    weekly.add_argument('--checkpoint', default='weekly_summary.checkpoint')
+    weekly.add_argument('--restart', action='store_true', help='ignore an existing checkpoint')
+    weekly.add_argument('--schedule', action='store_true', help='run every Monday at --hour UTC')
+    weekly.add_argument('--hour', type=int, default=6)
+    args = parser.parse_args(argv)
+    JOBS[args.job](firestore_client(), args)
+
+
+if __name__ == '__main__':
+    main()
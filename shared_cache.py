@@ -0,0 +1,193 @@
+"""
+Document cache tier shared by every worker process on a host.
+
+Entries live in a SQLite file (WAL mode, so readers in one worker never block
+on another's writes). Every document path carries a version that moves forward
+on each store and invalidation; versions come from one counter and are never
+reused, even for a path that was evicted and cached again. A worker stores a document it fetched only if
+the version it saw before the fetch is still current, so a read that raced a
+write elsewhere cannot put stale data back. Invalidations are also appended to
+a log that each worker replays into its in-process tier (changes()). Entries
+beyond max_entries are evicted least recently used first.
+
+Connections are opened lazily per process, so the cache can be created before
+a pre-fork server forks its workers.
+"""
+import os
+import pickle
+import sqlite3
+import threading
+import time
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS documents (
+    path TEXT PRIMARY KEY,
+    version INTEGER NOT NULL,
+    data BLOB,
+    cached_at REAL,
+    last_used REAL
+);
+CREATE INDEX IF NOT EXISTS documents_last_used ON documents (last_used);
+
+CREATE TABLE IF NOT EXISTS counters (
+    name TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+);
+INSERT OR IGNORE INTO counters (name, value) VALUES ('version', 0);
+
+CREATE TABLE IF NOT EXISTS invalidations (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    path TEXT NOT NULL,
+    at REAL NOT NULL
+);
+"""
+
+
+class SharedCache:
+    def __init__(self, path, max_entries=50000, log_retention=600, evict_every=100, clock=time.time):
+        self.path = path
+        self.max_entries = max_entries
+        self.log_retention = log_retention
+        self._evict_every = evict_every
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._connection = None
+        self._pid = None
+        self._last_seq = None
+        self._puts = 0
+        self._counts = {'hits': 0, 'misses': 0, 'stores': 0, 'conflicts': 0, 'invalidations': 0,
+                        'evictions': 0, 'replayed_invalidations': 0, 'resets': 0}
+
+    def _db(self):
+        # Called with self._lock held; a forked worker gets its own connection
+        if self._connection is None or self._pid != os.getpid():
+            self._connection = sqlite3.connect(self.path, timeout=10, check_same_thread=False, isolation_level=None)
+            self._connection.execute('PRAGMA journal_mode=WAL')
+            self._connection.execute('PRAGMA synchronous=NORMAL')
+            self._connection.executescript(SCHEMA)
+            self._pid = os.getpid()
+            self._last_seq = self._latest_seq(self._connection)
+        return self._connection
+
+    @staticmethod
+    def _next_version(db):
+        db.execute("UPDATE counters SET value = value + 1 WHERE name = 'version'")
+        return db.execute("SELECT value FROM counters WHERE name = 'version'").fetchone()[0]
+
+    @staticmethod
+    def _latest_seq(db):
+        # The last sequence number ever handed out, even if the log has since been pruned
+        row = db.execute("SELECT seq FROM sqlite_sequence WHERE name = 'invalidations'").fetchone()
+        return row[0] if row else 0
+
+    def get_many(self, paths):
+        """path -> (version, entry) where entry is (data, update_time, cached_at) or None."""
+        if not paths:
+            return {}
+        with self._lock:
+            db = self._db()
+            placeholders = ','.join('?' * len(paths))
+            rows = db.execute(f'SELECT path, version, data, cached_at FROM documents WHERE path IN ({placeholders})',
+                              list(paths)).fetchall()
+            found = {path: (version, data, cached_at) for path, version, data, cached_at in rows}
+            results = {}
+            hits = []
+            for path in paths:
+                version, data, cached_at = found.get(path, (0, None, None))
+                if data is None:
+                    self._counts['misses'] += 1
+                    results[path] = (version, None)
+                else:
+                    self._counts['hits'] += 1
+                    hits.append(path)
+                    document, update_time = pickle.loads(data)
+                    results[path] = (version, (document, update_time, cached_at))
+            if hits:
+                now = self._clock()
+                db.executemany('UPDATE documents SET last_used = ? WHERE path = ?', [(now, path) for path in hits])
+            return results
+
+    def get(self, path):
+        return self.get_many([path])[path]
+
+    def put(self, path, expected_version, data, update_time):
+        """Store a fetched document unless its version moved since expected_version was read."""
+        payload = pickle.dumps((data, update_time), protocol=pickle.HIGHEST_PROTOCOL)
+        with self._lock:
+            db = self._db()
+            now = self._clock()
+            db.execute('BEGIN IMMEDIATE')
+            try:
+                row = db.execute('SELECT version FROM documents WHERE path = ?', (path,)).fetchone()
+                if (row[0] if row else 0) != expected_version:
+                    self._counts['conflicts'] += 1
+                    db.execute('COMMIT')
+                    return False
+                db.execute(
+                    'INSERT INTO documents (path, version, data, cached_at, last_used) VALUES (?, ?, ?, ?, ?) '
+                    'ON CONFLICT (path) DO UPDATE SET version = excluded.version, data = excluded.data, '
+                    'cached_at = excluded.cached_at, last_used = excluded.last_used',
+                    (path, self._next_version(db), payload, now, now),
+                )
+                self._counts['stores'] += 1
+                self._puts += 1
+                if self._puts % self._evict_every == 0:
+                    self._evict(db, now)
+                db.execute('COMMIT')
+            except BaseException:
+                db.execute('ROLLBACK')
+                raise
+            return True
+
+    def _evict(self, db, now):
+        # Whole rows go; a put that read the evicted row's version now sees 0 and is refused
+        excess = db.execute('SELECT COUNT(*) FROM documents').fetchone()[0] - self.max_entries
+        if excess > 0:
+            db.execute('DELETE FROM documents WHERE path IN (SELECT path FROM documents ORDER BY last_used LIMIT ?)',
+                       (excess,))
+            self._counts['evictions'] += excess
+        db.execute('DELETE FROM invalidations WHERE at < ?', (now - self.log_retention,))
+
+    def invalidate(self, path):
+        with self._lock:
+            db = self._db()
+            now = self._clock()
+            db.execute('BEGIN IMMEDIATE')
+            try:
+                db.execute(
+                    'INSERT INTO documents (path, version, data, cached_at, last_used) VALUES (?, ?, NULL, NULL, ?) '
+                    'ON CONFLICT (path) DO UPDATE SET version = excluded.version, data = NULL, cached_at = NULL',
+                    (path, self._next_version(db), now),
+                )
+                db.execute('INSERT INTO invalidations (path, at) VALUES (?, ?)', (path, now))
+                db.execute('COMMIT')
+            except BaseException:
+                db.execute('ROLLBACK')
+                raise
+            self._counts['invalidations'] += 1
+
+    def changes(self):
+        """
+        Paths invalidated by any worker since the last call, or None when this
+        worker fell further behind than the log keeps and must drop everything.
+        """
+        with self._lock:
+            db = self._db()
+            latest = self._latest_seq(db)
+            if latest == self._last_seq:
+                return []
+            oldest = db.execute('SELECT MIN(seq) FROM invalidations').fetchone()[0]
+            rows = db.execute('SELECT seq, path FROM invalidations WHERE seq > ? ORDER BY seq',
+                              (self._last_seq,)).fetchall()
+            behind = oldest is None or oldest > self._last_seq + 1
+            self._last_seq = max([latest] + [seq for seq, _ in rows])
+            if behind:
+                self._counts['resets'] += 1
+                return None
+            self._counts['replayed_invalidations'] += len(rows)
+            return [path for _, path in rows]
+
+    def stats(self):
+        with self._lock:
+            entries = self._db().execute('SELECT COUNT(*) FROM documents WHERE data IS NOT NULL').fetchone()[0]
+            return {**self._counts, 'entries': entries, 'max_entries': self.max_entries, 'path': self.path}
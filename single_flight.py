@@ -0,0 +1,125 @@
+"""
+Coalescing of identical concurrent reads.
+
+SingleFlight.do(key, fetch) runs fetch once for all callers that ask for the same
+key while it is running; everyone gets the same result or the same exception.
+Nothing is kept after the call finishes, so this never serves data older than a
+read that was already in progress. Keys are tuples whose first element names the
+collection, so a write to a collection can forget() its in-flight reads and make
+later callers start a fresh one.
+
+Inside a scope() -- one /batch request, say -- results for the named collections
+are also kept until the scope ends, so sub-requests looking up the same user or
+calendar read it once. Threads working for the scope must run in a copy of its
+context (contextvars.copy_context()).
+"""
+import contextvars
+import threading
+from contextlib import contextmanager
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class _Scope:
+    def __init__(self, collections):
+        self.collections = set(collections)
+        self.results = {}
+        self.generations = {}
+        self.lock = threading.Lock()
+
+
+class SingleFlight:
+    def __init__(self):
+        self._calls = {}
+        self._lock = threading.Lock()
+        self._stats = {}
+        self._scope = contextvars.ContextVar('single_flight_scope', default=None)
+
+    def _collection_stats(self, collection):
+        if collection not in self._stats:
+            self._stats[collection] = {'reads': 0, 'round_trips': 0, 'coalesced': 0, 'scope_hits': 0}
+        return self._stats[collection]
+
+    @contextmanager
+    def scope(self, collections):
+        token = self._scope.set(_Scope(collections))
+        try:
+            yield
+        finally:
+            self._scope.reset(token)
+
+    def do(self, key, fetch):
+        scope = self._scope.get()
+        if scope is None or key[0] not in scope.collections:
+            return self._do(key, fetch)
+        with scope.lock:
+            if key in scope.results:
+                with self._lock:
+                    stats = self._collection_stats(key[0])
+                    stats['reads'] += 1
+                    stats['scope_hits'] += 1
+                return scope.results[key]
+            generation = scope.generations.get(key[0], 0)
+        result = self._do(key, fetch)
+        with scope.lock:
+            # A write inside the scope while this read ran makes its result unsafe to keep
+            if scope.generations.get(key[0], 0) == generation:
+                scope.results[key] = result
+        return result
+
+    def _do(self, key, fetch):
+        with self._lock:
+            stats = self._collection_stats(key[0])
+            stats['reads'] += 1
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+                stats['round_trips'] += 1
+            else:
+                stats['coalesced'] += 1
+
+        if not leader:
+            call.done.wait()
+        else:
+            try:
+                call.result = fetch()
+            except Exception as e:
+                call.error = e
+            finally:
+                with self._lock:
+                    if self._calls.get(key) is call:
+                        del self._calls[key]
+                call.done.set()
+        if call.error is not None:
+            raise call.error
+        return call.result
+
+    def forget(self, collection):
+        """Detach in-flight reads of a collection; they finish for their callers but nobody new joins them."""
+        with self._lock:
+            for key in [key for key in self._calls if key[0] == collection]:
+                del self._calls[key]
+        scope = self._scope.get()
+        if scope is not None:
+            with scope.lock:
+                scope.generations[collection] = scope.generations.get(collection, 0) + 1
+                for key in [key for key in scope.results if key[0] == collection]:
+                    del scope.results[key]
+
+    def stats(self):
+        with self._lock:
+            totals = {'reads': 0, 'round_trips': 0, 'coalesced': 0, 'scope_hits': 0}
+            for stats in self._stats.values():
+                for name, value in stats.items():
+                    totals[name] += value
+            return {
+                **totals,
+                'in_flight': len(self._calls),
+                'collections': {collection: dict(stats) for collection, stats in self._stats.items()},
+            }
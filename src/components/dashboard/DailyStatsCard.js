@@ -53,6 +53,7 @@ const DailyStatsCard = ({
   userWeight,
   expectedDailyCalories,
   date,
+  email,
 }) => {
   const [weight, setWeight] = useState(null); // Initialize as null (no data)
   const [isEditingWeight, setIsEditingWeight] = useState(false); // Edit mode toggle
@@ -112,7 +113,7 @@ const DailyStatsCard = ({
         headers: {
           "Content-Type": "application/json",
         },
-        body: JSON.stringify({ weight: weight, date: parsedDate }),
+        body: JSON.stringify({ weight: weight, date: parsedDate, email: email }),
       });
 
       if (response.ok) {
@@ -2,7 +2,7 @@ import React, { useState } from "react";
 import { Paper, Typography, Box, Dialog, DialogContent, DialogTitle } from "@mui/material";
 import MealCard from "./MealCard";
 
-const CompactMealCard = ({ meal }) => {
+const CompactMealCard = ({ meal, isFavorite, onFavoriteToggle }) => {
   const [isDialogOpen, setDialogOpen] = useState(false);
 
   const handleDialogOpen = () => setDialogOpen(true);
@@ -75,7 +75,11 @@ const CompactMealCard = ({ meal }) => {
       >
         <DialogTitle>Meal Details</DialogTitle>
         <DialogContent>
-          <MealCard meal={meal} />
+          <MealCard
+            meal={meal}
+            isFavoriteInitial={isFavorite}
+            handleFavoriteToggleCallback={onFavoriteToggle}
+          />
         </DialogContent>
       </Dialog>
     </Paper>
@@ -16,8 +16,8 @@ import { useAuth } from "../../context/AuthContext";
 import MealDetailsDialog from "./MealDetailsDialog";
 import MacronutrientChart from "./MacronutrientChart";
 
-const MealCard = ({ meal, handleDelete, handleFavoriteToggleCallback }) => {
-  const [isFavorite, setIsFavorite] = useState(false);
+const MealCard = ({ meal, handleDelete, handleFavoriteToggleCallback, isFavoriteInitial }) => {
+  const [isFavorite, setIsFavorite] = useState(isFavoriteInitial ?? false);
   const { user } = useAuth();
   const [isDialogOpen, setDialogOpen] = useState(false);
 
@@ -62,7 +62,10 @@ const MealCard = ({ meal, handleDelete, handleFavoriteToggleCallback }) => {
   };
 
   useEffect(() => {
-    checkIfFavorite();
+    // Parent pages that already know the favorite status skip the per-card request
+    if (isFavoriteInitial === undefined) {
+      checkIfFavorite();
+    }
   }, [meal.id]);
 
   const checkIfFavorite = async () => {
@@ -12,8 +12,10 @@ import { useNavigate } from "react-router-dom";
  *
  * @param {Object} props - The component props.
  * @param {Array} props.meals - An array of meal objects to display in the card.
+ * @param {Object} [props.favorites] - Favorite status by meal ID, fetched once for the whole list.
+ * @param {function} [props.onFavoriteToggle] - Called with the meal and its new status when a card toggles it.
  */
-const MealListCard = ({ meals }) => {
+const MealListCard = ({ meals, favorites = {}, onFavoriteToggle }) => {
   const navigate = useNavigate();
 
   /**
@@ -81,7 +83,14 @@ const MealListCard = ({ meals }) => {
         }}
       >
         {meals.length > 0 ? (
-          meals.map((meal) => <CompactMealCard key={meal.id} meal={meal} />)
+          meals.map((meal) => (
+            <CompactMealCard
+              key={meal.id}
+              meal={meal}
+              isFavorite={favorites[meal.id]}
+              onFavoriteToggle={onFavoriteToggle}
+            />
+          ))
         ) : (
           <Typography
             variant="body2"
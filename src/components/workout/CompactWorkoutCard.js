@@ -8,8 +8,10 @@ import WorkoutCard from "./WorkoutCard";
  *
  * @param {Object} props - The component props.
  * @param {Object} props.workout - The workout object containing details such as name, exercises, and calories.
+ * @param {boolean} [props.isFavorite] - Favorite status fetched by the list; the full card checks it itself when absent.
+ * @param {function} [props.onFavoriteToggle] - Called with the workout and its new status when it is toggled.
  */
-const CompactWorkoutCard = ({ workout }) => {
+const CompactWorkoutCard = ({ workout, isFavorite, onFavoriteToggle }) => {
   const [isDialogOpen, setDialogOpen] = useState(false);
 
   /**
@@ -74,7 +76,11 @@ const CompactWorkoutCard = ({ workout }) => {
 
       {/* Dialog for full workout details */}
       <Dialog open={isDialogOpen} onClose={handleDialogClose}>
-        <WorkoutCard workout={workout} />
+        <WorkoutCard
+          workout={workout}
+          isFavoriteInitial={isFavorite}
+          onFavoriteToggle={onFavoriteToggle}
+        />
       </Dialog>
     </Paper>
   );
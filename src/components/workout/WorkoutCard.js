@@ -17,14 +17,16 @@ import { useAuth } from "../../context/AuthContext";
  * @param {function} props.handleUpdate - Function to handle the update of the workout after editing.
  * @param {function} props.handleDelete - Function to handle the removal of the workout.
  * @param {function} props.onFavoriteToggle - Function to handle toggling the favorite status of the workout.
+ * @param {boolean} [props.isFavoriteInitial] - Favorite status already known by the parent; skips the status request when provided.
  */
 const WorkoutCard = ({
   workout,
   handleUpdate,
   handleDelete,
   onFavoriteToggle,
+  isFavoriteInitial,
 }) => {
-  const [isFavorite, setIsFavorite] = useState(false);
+  const [isFavorite, setIsFavorite] = useState(isFavoriteInitial ?? false);
   const { user } = useAuth();
   const [isDialogOpen, setDialogOpen] = useState(false);
   const [editedWorkout, setEditedWorkout] = useState(workout);
@@ -83,6 +85,7 @@ const WorkoutCard = ({
         headers: { "Content-Type": "application/json" },
         body: JSON.stringify({
           ...editedWorkout,
+          email: user.email,
           exercises: editedWorkout.exercises.map((exercise) => ({
             id: exercise.id,
             name: exercise.name,
@@ -111,7 +114,9 @@ const WorkoutCard = ({
    * Checks if the workout is marked as a favorite by the current user.
    */
   useEffect(() => {
-    checkIfFavorite();
+    if (isFavoriteInitial === undefined) {
+      checkIfFavorite();
+    }
   }, [workout.id]);
 
   /**
@@ -11,8 +11,10 @@ import { useNavigate } from "react-router-dom";
  *
  * @param {Object} props - The component props.
  * @param {Array} props.workouts - List of workout objects to display.
+ * @param {Object} [props.favorites] - Favorite status by workout ID, fetched once for the whole list.
+ * @param {function} [props.onFavoriteToggle] - Called with the workout and its new status when a card toggles it.
  */
-const WorkoutListCard = ({ workouts }) => {
+const WorkoutListCard = ({ workouts, favorites = {}, onFavoriteToggle }) => {
   const navigate = useNavigate();
 
   /**
@@ -83,7 +85,12 @@ const WorkoutListCard = ({ workouts }) => {
         {workouts.length > 0 ? (
           // Display workouts in CompactWorkoutCard components
           workouts.map((workout) => (
-            <CompactWorkoutCard key={workout.id} workout={workout} />
+            <CompactWorkoutCard
+              key={workout.id}
+              workout={workout}
+              isFavorite={favorites[workout.id]}
+              onFavoriteToggle={onFavoriteToggle}
+            />
           ))
         ) : (
           // Message shown when no workouts are available
@@ -30,6 +30,7 @@ const Dashboard = () => {
   const [meals, setMeals] = useState([]);
   const [weight, setWeight] = useState(undefined);
   const [avgCalIntake, setCalIntake] = useState(2000);
+  const [favorites, setFavorites] = useState({ meals: {}, workouts: {} });
 
   /**
    * Fetches the user's workouts for a specific date.
@@ -78,6 +79,46 @@ const Dashboard = () => {
     }
   };
 
+  /**
+   * Fetches the favorite status of every meal and workout shown, in one request
+   * instead of one per card.
+   *
+   * @param {Array} mealList - The meals shown for the selected date.
+   * @param {Array} workoutList - The workouts shown for the selected date.
+   */
+  const fetchFavorites = async (mealList, workoutList) => {
+    if (mealList.length === 0 && workoutList.length === 0) return;
+    try {
+      const response = await fetch("/check_favorites", {
+        method: "POST",
+        headers: { "Content-Type": "application/json" },
+        body: JSON.stringify({
+          email: user.email,
+          meal_ids: mealList.map((meal) => meal.id),
+          workout_ids: workoutList.map((workout) => workout.id),
+        }),
+      });
+      if (response.ok) {
+        const data = await response.json();
+        setFavorites({ meals: data.meals || {}, workouts: data.workouts || {} });
+      }
+    } catch (error) {
+      console.error("Error checking favorite status:", error);
+    }
+  };
+
+  /**
+   * Keeps the known favorite status in step when a card toggles it.
+   *
+   * @param {string} kind - "meals" or "workouts".
+   */
+  const handleFavoriteToggle = (kind) => (item, isFavorite) => {
+    setFavorites((previous) => ({
+      ...previous,
+      [kind]: { ...previous[kind], [item.id]: isFavorite },
+    }));
+  };
+
   /**
    * Fetches the user's weight for a specific date.
    * 
@@ -91,6 +132,7 @@ const Dashboard = () => {
         body: JSON.stringify({
           date: date.toISOString().split("T")[0],
           user_id: user.uid,
+          email: user.email,
         }),
       });
       const data = await response.json();
@@ -134,6 +176,10 @@ const Dashboard = () => {
     fetchWeightForDate(selectedDate);
   }, [selectedDate]);
 
+  useEffect(() => {
+    fetchFavorites(meals, workouts);
+  }, [meals, workouts]);
+
   return (
     <Box sx={{ padding: 0 }}>
       <Box
@@ -181,6 +227,7 @@ const Dashboard = () => {
           userWeight={weight}
           expectedDailyCalories={avgCalIntake}
           date={selectedDate}
+          email={user.email}
         />
       </Box>
       {/* Group Workout and Meals together */}
@@ -193,9 +240,17 @@ const Dashboard = () => {
         }}
       >
         {/* Workouts Section */}
-        <WorkoutListCard workouts={workouts} />
+        <WorkoutListCard
+          workouts={workouts}
+          favorites={favorites.workouts}
+          onFavoriteToggle={handleFavoriteToggle("workouts")}
+        />
 
-        <MealListCard meals={meals} />
+        <MealListCard
+          meals={meals}
+          favorites={favorites.meals}
+          onFavoriteToggle={handleFavoriteToggle("meals")}
+        />
       </Box>
     </Box>
   );
@@ -243,6 +243,7 @@ function Meal() {
                 handleDelete={(mealId) => {
                   setFavoriteMeals((prevMeal) => prevMeal.filter((w) => w.id !== mealId));
                 }}
+                isFavoriteInitial={true}
                 handleFavoriteToggleCallback={(meal, isFavorite) => {
                   if (!isFavorite) {
                     setFavoriteMeals((prevMeals) => prevMeals.filter((m) => m.id !== meal.id));
@@ -272,6 +273,7 @@ function Meal() {
                   key={meal.id}
                   meal={meal}
                   handleDelete={() => console.log("Delete function for individual meals, " + meal.id)}
+                  isFavoriteInitial={false}
                   handleFavoriteToggleCallback={(meal, isFavorite) => {
                     if (isFavorite) {
                       setOtherUserMeals((prevMeals) => prevMeals.filter((m) => m.id !== meal.id));
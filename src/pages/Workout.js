@@ -27,7 +27,7 @@ function Workout() {
 
   /**
    * Handles the generation of a workout, calling the backend API to fetch workout data,
-   * and fetching exercises in parallel for the generated workout.
+   * and fetching the exercises of the generated workout in a single bulk request.
    * @param {Object} workoutData - The data containing user's input for generating workout.
    */
   const handleGenerateWorkout = async (workoutData) => {
@@ -44,24 +44,25 @@ function Workout() {
       if (response.ok) {
         const data = await response.json();
 
-        // Refactor: Fetch exercises in parallel with workout data
-        const exercises = await Promise.all(
-          data.workout_data.exercises.map(async (exerciseId) => {
-            const exerciseResponse = await fetch(`/get_exercise/${exerciseId}`);
-            if (exerciseResponse.ok) {
-              return await exerciseResponse.json();
-            } else {
-              return {
-                id: exerciseId,
-                name: "Unknown Exercise",
-                reps: 0,
-                sets: 0,
-                weight: "",
-                avg_calories_burned: 0,
-                body_parts: "",
-              };
+        // Fetch all exercises for the generated workout in one request
+        const exerciseIds = data.workout_data.exercises;
+        const exerciseResponse = await fetch("/get_exercises", {
+          method: "POST",
+          headers: { "Content-Type": "application/json" },
+          body: JSON.stringify({ exercise_ids: exerciseIds }),
+        });
+        const foundExercises = exerciseResponse.ok ? await exerciseResponse.json() : [];
+        const exercises = exerciseIds.map(
+          (exerciseId) =>
+            foundExercises.find((exercise) => exercise.id === exerciseId) || {
+              id: exerciseId,
+              name: "Unknown Exercise",
+              reps: 0,
+              sets: 0,
+              weight: "",
+              avg_calories_burned: 0,
+              body_parts: "",
             }
-          })
         );
 
         setGeneratedWorkout({
@@ -242,6 +243,7 @@ function Workout() {
                 }}
                 handleDelete={handleDelete}
                 onFavoriteToggle={handleFavoriteToggle}
+                isFavoriteInitial={true}
               />
             ))}
           </Box>
@@ -270,6 +272,7 @@ function Workout() {
                     console.log("No delete function for individual workouts, " + workout.id)
                   }
                   onFavoriteToggle={handleFavoriteToggle}
+                  isFavoriteInitial={false}
                 />
               ))
             ) : (
@@ -0,0 +1,221 @@
+"""
+Storage for users, calendars, days, meals, workouts and exercises.
+
+Storage is the interface the read views use for these records, and
+FirestoreStorage its implementation. Records are plain dicts carrying their
+document fields plus 'id'. A day's meals and workouts, and a workout's exercises, are
+ID lists on write and hydrated records on the read views.
+"""
+import abc
+
+
+class Storage(abc.ABC):
+    @abc.abstractmethod
+    def find_user(self, email, fields=None):
+        """The user with this email, or None."""
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def add_user(self, data):
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def get_calendars(self, user_id):
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def add_calendar(self, user_id):
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def add_day(self, user_id, date, meals=(), workouts=(), weight=None):
+        """Create the user's day for a date and append it to their calendar."""
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def add_meal(self, data):
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def add_exercise(self, data):
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def add_workout(self, data):
+        """data['exercises'] lists exercise IDs."""
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def get_meal(self, meal_id):
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def get_workout(self, workout_id):
+        """The workout with its exercises hydrated, or None."""
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def historical_data(self, user_id, fields=None):
+        """
+        (date, event_type, record) for every meal and workout in the user's calendar, in
+        calendar order. fields may narrow the records; callers still prune them.
+        """
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def meals_on_day(self, user_id, date):
+        """Hydrated meals of the user's day, or None when they have no day for that date."""
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def workouts_on_day(self, user_id, date):
+        """Hydrated workouts (with exercises) of the user's day, or None when they have no such day."""
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+class FirestoreStorage(Storage):
+    """
+    Storage over a Firestore client. array_union is firestore.ArrayUnion (see
+    common). Documents are read through
+    doc_cache when one is given and user/calendar lookups through a SingleFlight
+    when given.
+    """
+
+    def __init__(self, client, array_union, doc_cache=None, flights=None):
+        self._client = client
+        self._array_union = array_union
+        self._cache = doc_cache
+        self._flights = flights
+
+    def _read(self, key, fetch):
+        if self._flights is None:
+            return list(fetch())
+        return list(self._flights.do(key, fetch))
+
+    def _get(self, collection, doc_id):
+        doc_ref = self._client.collection(collection).document(doc_id)
+        return self._cache.get(doc_ref) if self._cache is not None else doc_ref.get()
+
+    def _get_all(self, collection, doc_ids, field_paths=None):
+        unique_ids = [doc_id for doc_id in dict.fromkeys(doc_ids) if isinstance(doc_id, str) and doc_id]
+        if not unique_ids:
+            return {}
+        doc_refs = [self._client.collection(collection).document(doc_id) for doc_id in unique_ids]
+        source = self._cache if self._cache is not None else self._client
+        return {doc.id: doc.to_dict() for doc in source.get_all(doc_refs, field_paths=field_paths) if doc.exists}
+
+    def find_user(self, email, fields=None):
+        query = self._client.collection('users').where('email', '==', email).limit(1)
+        if fields:
+            query = query.select(fields)
+        docs = self._read(('users', 'email', email, tuple(fields or ())), query.get)
+        return {**docs[0].to_dict(), 'id': docs[0].id} if docs else None
+
+    def add_user(self, data):
+        _, doc_ref = self._client.collection('users').add(dict(data))
+        if self._flights is not None:
+            self._flights.forget('users')
+        return doc_ref.id
+
+    def _calendar_docs(self, user_id, fields=None):
+        query = self._client.collection('Calendar').where('belongs_to', '==', user_id)
+        if fields:
+            query = query.select(fields)
+        return self._read(('Calendar', 'belongs_to', user_id, tuple(fields or ())), query.get)
+
+    def get_calendars(self, user_id):
+        return [{**doc.to_dict(), 'id': doc.id} for doc in self._calendar_docs(user_id)]
+
+    def add_calendar(self, user_id):
+        _, doc_ref = self._client.collection('Calendar').add({'belongs_to': user_id, 'days': []})
+        if self._flights is not None:
+            self._flights.forget('Calendar')
+        return doc_ref.id
+
+    def add_day(self, user_id, date, meals=(), workouts=(), weight=None):
+        calendars = self._calendar_docs(user_id)
+        if not calendars:
+            raise ValueError("No calendars exist for user")
+        day = {'date': date, 'meals': list(meals), 'workouts': list(workouts)}
+        if weight is not None:
+            day['weight'] = weight
+        _, day_ref = self._client.collection('Day').add(day)
+        calendar_ref = self._client.collection('Calendar').document(calendars[0].id)
+        calendar_ref.update({'days': self._array_union([day_ref.id])})
+        if self._flights is not None:
+            self._flights.forget('Calendar')
+        return day_ref.id
+
+    def _add(self, collection, data):
+        _, doc_ref = self._client.collection(collection).add(dict(data))
+        return doc_ref.id
+
+    def add_meal(self, data):
+        return self._add('Meal', data)
+
+    def add_exercise(self, data):
+        return self._add('Exercise', data)
+
+    def add_workout(self, data):
+        return self._add('Workout', {**data, 'exercises': list(data.get('exercises', []))})
+
+    def get_meal(self, meal_id):
+        doc = self._get('Meal', meal_id)
+        return {**doc.to_dict(), 'id': meal_id} if doc.exists else None
+
+    def _hydrate_workouts(self, workout_ids):
+        workouts = self._get_all('Workout', workout_ids)
+        exercises = self._get_all('Exercise', [
+            exercise_id for workout in workouts.values() for exercise_id in workout.get('exercises', [])
+        ])
+        return [
+            {**workouts[workout_id], 'id': workout_id, 'exercises': [
+                {**exercises[exercise_id], 'id': exercise_id}
+                for exercise_id in workouts[workout_id].get('exercises', []) if exercise_id in exercises
+            ]}
+            for workout_id in workout_ids if workout_id in workouts
+        ]
+
+    def get_workout(self, workout_id):
+        workouts = self._hydrate_workouts([workout_id])
+        return workouts[0] if workouts else None
+
+    def historical_data(self, user_id, fields=None):
+        rows = []
+        for calendar in self._calendar_docs(user_id, ['days']):
+            day_ids = calendar.to_dict().get('days', [])
+            day_docs = self._get_all('Day', day_ids, field_paths=['date', 'meals', 'workouts'])
+            days = [day_docs[day_id] for day_id in day_ids if day_id in day_docs]
+            meals = self._get_all('Meal', [meal_id for day in days for meal_id in day.get('meals', [])], field_paths=fields)
+            workouts = self._get_all('Workout', [workout_id for day in days for workout_id in day.get('workouts', [])],
+                                     field_paths=fields)
+            for day in days:
+                rows.extend((day['date'], 'Meal', meals[meal_id]) for meal_id in day.get('meals', []) if meal_id in meals)
+                rows.extend((day['date'], 'Workout', workouts[workout_id])
+                            for workout_id in day.get('workouts', []) if workout_id in workouts)
+        return rows
+
+    def _day(self, user_id, date):
+        # Day documents carry no owner, so keep the one on the user's calendar
+        day_ids = {day_id for calendar in self._calendar_docs(user_id) for day_id in calendar.to_dict().get('days', [])}
+        for day_doc in self._client.collection('Day').where('date', '==', date).get():
+            if day_doc.id in day_ids:
+                return day_doc.to_dict()
+        return None
+
+    def meals_on_day(self, user_id, date):
+        day = self._day(user_id, date)
+        if day is None:
+            return None
+        meal_ids = day.get('meals', [])
+        meals = self._get_all('Meal', meal_ids)
+        return [{**meals[meal_id], 'id': meal_id} for meal_id in meal_ids if meal_id in meals]
+
+    def workouts_on_day(self, user_id, date):
+        day = self._day(user_id, date)
+        if day is None:
+            return None
+        return self._hydrate_workouts(day.get('workouts', []))
@@ -0,0 +1,158 @@
+"""
+Logging streaks and calorie-target adherence.
+
+Streak/{user_id} keeps running counters so a streak is one document get instead
+of a scan over the user's days: current and longest streak, the last logged
+date, days logged, and days whose calories landed within TARGET_TOLERANCE of the
+user's avg_cal_intake. The most recent day stays open in 'open_day' because
+more meals can still be logged on it; earlier days are final. Write routes call
+record_activity(), which reads and writes only the counters document in one
+transaction. Activity dated before last_logged is ignored there and picked up by
+backfill_streaks(), which rebuilds every user's counters from their Day documents.
+"""
+from datetime import date, datetime, timedelta, timezone
+
+from common import BATCH_SIZE, USERS_PER_BATCH, days_by_user, iter_documents, number
+from day_totals import sum_totals
+
+TARGET_TOLERANCE = 0.1
+
+
+def empty_counters():
+    return {'current_streak': 0, 'longest_streak': 0, 'last_logged': None, 'days_logged': 0,
+            'days_within_target': 0, 'open_day': None}
+
+
+def within_target(calories, target):
+    """
+    Whether a day's calories landed within TARGET_TOLERANCE of a positive target;
+    calories may be a number or a NumPy array of daily totals. /analytics counts
+    days_within_target with this too.
+    """
+    target = number(target)
+    if target <= 0:
+        return False
+    return (calories > 0) & (abs(calories - target) <= TARGET_TOLERANCE * target)
+
+
+def apply_activity(counters, day, calories=None, target=None, logged=True):
+    """
+    Counters after activity on day (YYYY-MM-DD). calories is the day's total so
+    far, or None when the activity did not change it; logged=False only updates
+    the calories of the open day, as when a meal is taken off it.
+    """
+    counters = {**empty_counters(), **(counters or {})}
+    last = counters['last_logged']
+    if last and day < last:
+        return counters
+    if day == last:
+        open_day = counters['open_day'] or {'date': day, 'calories': 0.0, 'within': False}
+        if calories is not None:
+            within = within_target(number(calories), target)
+            counters['days_within_target'] += int(within) - int(open_day['within'])
+            counters['open_day'] = {'date': day, 'calories': number(calories), 'within': within}
+        return counters
+    if not logged:
+        return counters
+
+    follows = last is not None and date.fromisoformat(day) - date.fromisoformat(last) == timedelta(days=1)
+    counters['current_streak'] = counters['current_streak'] + 1 if follows else 1
+    counters['longest_streak'] = max(counters['longest_streak'], counters['current_streak'])
+    counters['last_logged'] = day
+    counters['days_logged'] += 1
+    calories = number(calories) if calories is not None else 0.0
+    within = within_target(calories, target)
+    counters['days_within_target'] += int(within)
+    counters['open_day'] = {'date': day, 'calories': calories, 'within': within}
+    return counters
+
+
+def streak_summary(counters, today=None):
+    """What clients read: a streak whose last logged day is before yesterday has lapsed."""
+    counters = {**empty_counters(), **(counters or {})}
+    today = today or datetime.now(timezone.utc).date()
+    last = counters['last_logged']
+    active = last is not None and date.fromisoformat(last) >= today - timedelta(days=1)
+    return {
+        'current_streak': counters['current_streak'] if active else 0,
+        'longest_streak': counters['longest_streak'],
+        'last_logged': last,
+        'days_logged': counters['days_logged'],
+        'days_within_target': counters['days_within_target'],
+        'adherence': round(counters['days_within_target'] / counters['days_logged'], 3) if counters['days_logged'] else None,
+    }
+
+
+def record_activity(db, transactional, user_id, day, calories=None, target=None, logged=True):
+    """Apply one write route's activity to Streak/{user_id} in a transaction; returns the new counters."""
+    counters_ref = db.collection('Streak').document(user_id)
+
+    @transactional
+    def record(transaction):
+        snapshot = counters_ref.get(transaction=transaction)
+        counters = apply_activity(snapshot.to_dict() if snapshot.exists else None, day, calories, target, logged)
+        transaction.set(counters_ref, counters)
+        return counters
+
+    return record(db.transaction())
+
+
+def _is_date(value):
+    try:
+        date.fromisoformat(value)
+    except (TypeError, ValueError):
+        return False
+    return True
+
+
+def counters_from_days(days, target=None):
+    """Counters for a user's Day documents, folded through apply_activity in date order."""
+    calories_by_date = {}
+    for day in days:
+        if not _is_date(day.get('date')) or not (day.get('meals') or day.get('workouts') or day.get('weight') is not None):
+            continue
+        calories_by_date[day['date']] = calories_by_date.get(day['date'], 0.0) + number((day.get('totals') or {}).get('calories'))
+    counters = empty_counters()
+    for day in sorted(calories_by_date):
+        counters = apply_activity(counters, day, calories_by_date[day], target)
+    return counters
+
+
+def backfill_streaks(db, users_per_batch=USERS_PER_BATCH):
+    """
+    Rebuild Streak/{user_id} for every user from their Day documents. Days without
+    totals are summed from their meals. Returns {'users', 'days'}.
+    """
+    report = {'users': 0, 'days': 0}
+
+    def backfill(users):
+        days = days_by_user(db, [user_id for user_id, _ in users])
+        legacy = [day for user_days in days.values() for day in user_days if not isinstance(day.get('totals'), dict)]
+        meals = dict(iter_documents(db, 'Meal', list(dict.fromkeys(
+            meal_id for day in legacy for meal_id in day.get('meals', [])
+        )), field_paths=['calories']))
+        for day in legacy:
+            day['totals'] = sum_totals([meals.get(meal_id, {}) for meal_id in day.get('meals', [])])
+
+        batch, ops = db.batch(), 0
+        for user_id, user_data in users:
+            counters = counters_from_days(days[user_id], user_data.get('avg_cal_intake'))
+            batch.set(db.collection('Streak').document(user_id), counters)
+            ops += 1
+            if ops >= BATCH_SIZE:
+                batch.commit()
+                batch, ops = db.batch(), 0
+            report['users'] += 1
+            report['days'] += counters['days_logged']
+        if ops:
+            batch.commit()
+
+    pending = []
+    for user_doc in db.collection('users').select(['avg_cal_intake']).stream():
+        pending.append((user_doc.id, user_doc.to_dict()))
+        if len(pending) >= users_per_batch:
+            backfill(pending)
+            pending = []
+    if pending:
+        backfill(pending)
+    return report
@@ -0,0 +1,265 @@
+"""In-memory stand-in for the parts of the Firestore client the backend uses."""
+import copy
+import itertools
+from datetime import datetime, timedelta
+
+import pytz
+from google.cloud.firestore_v1.transforms import (
+    ArrayRemove,
+    ArrayUnion,
+    DELETE_FIELD,
+    Increment,
+    SERVER_TIMESTAMP,
+)
+
+_ids = itertools.count(1)
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = datetime(2024, 1, 1, tzinfo=pytz.UTC)
+
+    def tick(self):
+        self.now += timedelta(microseconds=1)
+        return self.now
+
+
+class FakeSnapshot:
+    def __init__(self, reference, data, update_time, read_time):
+        self.reference = reference
+        self.id = reference.id
+        self._data = data
+        self.update_time = update_time
+        self.read_time = read_time
+
+    @property
+    def exists(self):
+        return self._data is not None
+
+    def get(self, field_path):
+        value = self._data
+        for part in field_path.split('.'):
+            value = value[part]
+        return copy.deepcopy(value)
+
+    def to_dict(self):
+        return copy.deepcopy(self._data)
+
+
+def _apply_field_paths(data, field_paths):
+    if data is None or field_paths is None:
+        return data
+    return {key: value for key, value in data.items() if key in {path.split('.')[0] for path in field_paths}}
+
+
+def _resolve(value, current, now):
+    if value is SERVER_TIMESTAMP:
+        return now
+    if isinstance(value, ArrayUnion):
+        current = list(current or [])
+        return current + [item for item in value.values if item not in current]
+    if isinstance(value, ArrayRemove):
+        return [item for item in (current or []) if item not in value.values]
+    if isinstance(value, Increment):
+        return (current or 0) + value.value
+    return copy.deepcopy(value)
+
+
+class FakeDocumentReference:
+    def __init__(self, client, collection_id, doc_id):
+        self._client = client
+        self.id = doc_id
+        self.parent = client.collection(collection_id)
+        self.path = f"{collection_id}/{doc_id}"
+
+    def __eq__(self, other):
+        return isinstance(other, FakeDocumentReference) and self.path == other.path
+
+    def __hash__(self):
+        return hash(self.path)
+
+    def get(self, field_paths=None, transaction=None):
+        self._client.reads += 1
+        data, update_time = self._client.store.get(self.path, (None, None))
+        return FakeSnapshot(self, _apply_field_paths(copy.deepcopy(data), field_paths), update_time, self._client.clock.tick())
+
+    def set(self, data, merge=False):
+        now = self._client.clock.tick()
+        current = self._client.store.get(self.path, (None, None))[0] if merge else None
+        new_data = dict(current or {})
+        for key, value in data.items():
+            new_data[key] = _resolve(value, new_data.get(key), now)
+        self._client.store[self.path] = (new_data, now)
+        self._client.writes += 1
+
+    def create(self, data):
+        if self.path in self._client.store:
+            raise ValueError(f"Document already exists: {self.path}")
+        self.set(data)
+
+    def update(self, data):
+        if self.path not in self._client.store:
+            raise ValueError(f"No document to update: {self.path}")
+        now = self._client.clock.tick()
+        new_data = copy.deepcopy(self._client.store[self.path][0])
+        for key, value in data.items():
+            if value is DELETE_FIELD:
+                new_data.pop(key, None)
+                continue
+            target = new_data
+            parts = key.split('.')
+            for part in parts[:-1]:
+                target = target.setdefault(part, {})
+            target[parts[-1]] = _resolve(value, target.get(parts[-1]), now)
+        self._client.store[self.path] = (new_data, now)
+        self._client.writes += 1
+
+    def delete(self):
+        self._client.store.pop(self.path, None)
+        self._client.writes += 1
+
+
+class FakeQuery:
+    def __init__(self, client, collection_id, filters=(), limit=None, order=None, projection=None):
+        self._client = client
+        self._collection_id = collection_id
+        self._filters = list(filters)
+        self._limit = limit
+        self._order = order
+        self._projection = projection
+
+    def _copy(self, **changes):
+        kwargs = dict(filters=self._filters, limit=self._limit, order=self._order, projection=self._projection)
+        kwargs.update(changes)
+        return FakeQuery(self._client, self._collection_id, **kwargs)
+
+    def where(self, field, op, value):
+        return self._copy(filters=self._filters + [(field, op, value)])
+
+    def limit(self, count):
+        return self._copy(limit=count)
+
+    def order_by(self, field, direction='ASCENDING'):
+        return self._copy(order=(field, direction))
+
+    def select(self, field_paths):
+        return self._copy(projection=list(field_paths))
+
+    @staticmethod
+    def _matches(data, field, op, value):
+        if field not in data:
+            return False
+        actual = data[field]
+        if op == '==':
+            return actual == value
+        if op == '>':
+            return actual > value
+        if op == '>=':
+            return actual >= value
+        if op == '<':
+            return actual < value
+        if op == '<=':
+            return actual <= value
+        if op == 'in':
+            return actual in value
+        if op == 'array_contains':
+            return isinstance(actual, list) and value in actual
+        raise NotImplementedError(op)
+
+    def stream(self):
+        prefix = self._collection_id + '/'
+        read_time = self._client.clock.tick()
+        results = []
+        for path, (data, update_time) in list(self._client.store.items()):
+            if not path.startswith(prefix) or '/' in path[len(prefix):]:
+                continue
+            if all(self._matches(data, *condition) for condition in self._filters):
+                ref = FakeDocumentReference(self._client, self._collection_id, path[len(prefix):])
+                results.append(FakeSnapshot(ref, _apply_field_paths(copy.deepcopy(data), self._projection), update_time, read_time))
+        if self._order:
+            field, direction = self._order
+            results.sort(key=lambda snapshot: snapshot._data.get(field), reverse=direction == 'DESCENDING')
+        if self._limit is not None:
+            results = results[:self._limit]
+        self._client.reads += max(len(results), 1)
+        return iter(results)
+
+    def get(self):
+        return list(self.stream())
+
+
+class FakeCollectionReference(FakeQuery):
+    def __init__(self, client, collection_id):
+        super().__init__(client, collection_id)
+        self.id = collection_id
+
+    def document(self, doc_id=None):
+        return FakeDocumentReference(self._client, self.id, doc_id or f"fake{next(_ids):08d}")
+
+    def add(self, data):
+        doc_ref = self.document()
+        doc_ref.set(data)
+        return self._client.clock.now, doc_ref
+
+
+class FakeWriteBatch:
+    def __init__(self, client):
+        self._client = client
+        self._ops = []
+
+    def set(self, doc_ref, data, merge=False):
+        self._ops.append(lambda: doc_ref.set(data, merge=merge))
+
+    def update(self, doc_ref, data):
+        self._ops.append(lambda: doc_ref.update(data))
+
+    def delete(self, doc_ref):
+        self._ops.append(doc_ref.delete)
+
+    def commit(self):
+        if len(self._ops) > 500:
+            raise ValueError("A batch can contain at most 500 writes")
+        with self._client.lock:
+            for op in self._ops:
+                op()
+        self._client.commits += 1
+        return []
+
+
+class FakeClient:
+    def __init__(self):
+        import threading
+        self.store = {}
+        self.clock = FakeClock()
+        self.lock = threading.RLock()
+        self.reads = 0
+        self.writes = 0
+        self.commits = 0
+
+    def collection(self, collection_id):
+        return FakeCollectionReference(self, collection_id)
+
+    def get_all(self, references, field_paths=None, transaction=None):
+        for reference in references:
+            yield reference.get(field_paths=field_paths)
+
+    def batch(self):
+        return FakeWriteBatch(self)
+
+    def transaction(self):
+        return FakeTransaction(self)
+
+
+class FakeTransaction(FakeWriteBatch):
+    def create(self, doc_ref, data):
+        self._ops.append(lambda: doc_ref.create(data))
+
+
+def transactional(function):
+    # Stand-in for firestore.transactional: transactions run one at a time, so reads stay consistent
+    def run(transaction, *args, **kwargs):
+        with transaction._client.lock:
+            result = function(transaction, *args, **kwargs)
+            transaction.commit()
+        return result
+    return run
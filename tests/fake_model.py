@@ -0,0 +1,60 @@
+"""Local stand-in for google.generativeai.GenerativeModel with injected latency and failures."""
+import json
+import threading
+import time
+
+import numpy as np
+
+
+class FakeResponse:
+    def __init__(self, text):
+        self.text = text
+
+
+class FakeModel:
+    """
+    latency(rng) -> seconds and fails(rng) -> bool are drawn per call, so tests can
+    inject fixed delays, sequences or distributions such as rng.lognormal.
+    """
+
+    def __init__(self, name, latency=lambda rng: 0.0, fails=lambda rng: False, text=None, chunk_latency=0.0, seed=0):
+        self.name = name
+        self.latency = latency
+        self.chunk_latency = chunk_latency
+        self.fails = fails
+        self.text = text or json.dumps({'name': f'{name} meal', 'ingredients': ['1 cup rice']})
+        self.calls = 0
+        self._rng = np.random.default_rng(seed)
+        self._lock = threading.Lock()
+
+    def generate_content(self, prompt, stream=False):
+        with self._lock:
+            self.calls += 1
+            delay, fail = self.latency(self._rng), self.fails(self._rng)
+        time.sleep(delay)
+        if fail:
+            raise RuntimeError(f'{self.name} unavailable')
+        if stream:
+            return self._chunks()
+        return FakeResponse(self.text)
+
+    def _chunks(self):
+        for i in range(0, len(self.text), 16):
+            time.sleep(self.chunk_latency)
+            yield FakeResponse(self.text[i:i + 16])
+
+
+def sequence(*values):
+    """A latency or failure function returning values in turn, then repeating the last."""
+    values = list(values)
+    return lambda rng: values.pop(0) if len(values) > 1 else values[0]
+
+
+class FakeModels:
+    """model_factory for ModelClient that hands out preconfigured FakeModels by name."""
+
+    def __init__(self, **models):
+        self.models = {name: FakeModel(name, **options) for name, options in models.items()}
+
+    def __call__(self, name):
+        return self.models[name]
@@ -0,0 +1,135 @@
+import gzip
+import json
+
+import pytest
+
+from google.cloud.firestore_v1.transforms import ArrayUnion
+
+from account_archive import export_account, import_account, iter_archive_records
+from tests.fake_firestore import FakeClient
+
+
+def seed_account(db):
+    db.collection('users').document('u1').set({
+        'email': 'old@example.com',
+        'name': 'Joe',
+        'favorited_meals': ['m1'],
+        'favorited_workouts': [],
+    })
+    db.collection('Calendar').document('c1').set({'belongs_to': 'u1', 'days': ['d1', 'd2']})
+    db.collection('Day').document('d1').set({'date': '2024-01-01', 'meals': ['m1', 'm2'], 'workouts': ['w1']})
+    db.collection('Day').document('d2').set({'date': '2024-01-02', 'meals': ['m1'], 'workouts': []})
+    db.collection('Meal').document('m1').set({'name': 'Pasta', 'calories': 600})
+    db.collection('Meal').document('m2').set({'name': 'Salad', 'calories': 300})
+    db.collection('Workout').document('w1').set({'name': 'Legs', 'exercises': ['e1']})
+    db.collection('Exercise').document('e1').set({'name': 'Squat', 'sets': 3})
+
+
+def test_export_contains_every_document_once():
+    db = FakeClient()
+    seed_account(db)
+    user_doc = db.collection('users').document('u1').get()
+
+    archive = b''.join(export_account(db, user_doc))
+    records = [json.loads(line) for line in gzip.decompress(archive).splitlines()]
+
+    assert [record['collection'] for record in records] == [
+        'users', 'Calendar', 'Day', 'Day', 'Meal', 'Meal', 'Workout', 'Exercise'
+    ]
+
+
+def test_import_preserves_relationships_under_new_ids():
+    source = FakeClient()
+    seed_account(source)
+    archive = b''.join(export_account(source, source.collection('users').document('u1').get()))
+
+    target = FakeClient()
+    target.collection('users').document('u2').set({'email': 'new@example.com', 'favorited_meals': []})
+    user_doc = target.collection('users').document('u2').get()
+
+    chunks = [archive[i:i + 7] for i in range(0, len(archive), 7)]
+    result = import_account(target, user_doc, iter_archive_records(chunks), ArrayUnion)
+    assert result['documents']['Day'] == 2
+
+    user = target.collection('users').document('u2').get().to_dict()
+    assert user['email'] == 'new@example.com'
+    calendar = target.collection('Calendar').where('belongs_to', '==', 'u2').get()[0].to_dict()
+    first_day = target.collection('Day').document(calendar['days'][0]).get().to_dict()
+    assert first_day['date'] == '2024-01-01'
+    assert target.collection('Meal').document(user['favorited_meals'][0]).get().to_dict()['name'] == 'Pasta'
+    workout = target.collection('Workout').document(first_day['workouts'][0]).get().to_dict()
+    assert target.collection('Exercise').document(workout['exercises'][0]).get().to_dict()['name'] == 'Squat'
+
+
+def test_invalid_archive_is_rejected():
+    with pytest.raises(ValueError):
+        list(iter_archive_records([b'not gzip at all']))
+
+
+def test_days_are_merged_by_date():
+    source = FakeClient()
+    seed_account(source)
+    archive = b''.join(export_account(source, source.collection('users').document('u1').get()))
+
+    target = FakeClient()
+    target.collection('users').document('u2').set({'email': 'new@example.com'})
+    target.collection('Calendar').document('c2').set({'belongs_to': 'u2', 'days': ['mine']})
+    target.collection('Day').document('mine').set({'date': '2024-01-02', 'meals': ['toast'], 'workouts': [],
+                                                   'weight': 70, 'totals': {'calories': 200, 'meals': 1}})
+    user_doc = target.collection('users').document('u2').get()
+
+    for _ in range(2):
+        import_account(target, user_doc, iter_archive_records([archive]), ArrayUnion)
+
+    days = target.collection('Calendar').document('c2').get().to_dict()['days']
+    dates = [target.collection('Day').document(day_id).get().to_dict()['date'] for day_id in days]
+    assert sorted(dates) == ['2024-01-01', '2024-01-02']
+    mine = target.collection('Day').document('mine').get().to_dict()
+    assert mine['meals'][0] == 'toast' and len(mine['meals']) == 3
+    assert mine['weight'] == 70 and mine['totals'] is None
+
+
+def test_imported_weights_are_returned_for_the_series():
+    source = FakeClient()
+    seed_account(source)
+    source.collection('Day').document('d1').update({'weight': 81})
+    source.collection('Day').document('d2').update({'weight': 80})
+    archive = b''.join(export_account(source, source.collection('users').document('u1').get()))
+
+    target = FakeClient()
+    target.collection('users').document('u2').set({'email': 'new@example.com'})
+    target.collection('Calendar').document('c2').set({'belongs_to': 'u2', 'days': ['mine']})
+    target.collection('Day').document('mine').set({'date': '2024-01-02', 'meals': [], 'workouts': [], 'weight': 70})
+    user_doc = target.collection('users').document('u2').get()
+
+    result = import_account(target, user_doc, iter_archive_records([archive]), ArrayUnion)
+    assert result['weights'] == {'2024-01-01': 81}
+
+
+def test_archive_size_and_record_count_are_bounded():
+    records = b''.join(json.dumps({'collection': 'Meal', 'id': str(i), 'data': {}}).encode() + b'\n' for i in range(100))
+    archive = gzip.compress(records + b' ' * 1000000)
+    with pytest.raises(ValueError):
+        list(iter_archive_records([archive], max_bytes=100000))
+    with pytest.raises(ValueError):
+        list(iter_archive_records([archive], max_records=50))
+    assert len(list(iter_archive_records([archive]))) == 100
+
+
+def test_invalid_archive_writes_nothing():
+    source = FakeClient()
+    seed_account(source)
+    archive = gzip.decompress(b''.join(export_account(source, source.collection('users').document('u1').get())))
+
+    target = FakeClient()
+    target.collection('users').document('u2').set({'email': 'new@example.com', 'name': 'Ann'})
+    user_doc = target.collection('users').document('u2').get()
+    writes = target.writes
+    for bad in (archive + b'{"collection": "Secrets", "id": "x", "data": {}}\n', archive + b'{"collection": '):
+        with pytest.raises(ValueError):
+            import_account(target, user_doc, iter_archive_records([gzip.compress(bad)]), ArrayUnion)
+    with pytest.raises(ValueError):
+        import_account(target, user_doc, iter_archive_records([gzip.compress(archive)], max_records=5), ArrayUnion)
+
+    assert target.writes == writes
+    assert target.collection('users').document('u2').get().to_dict()['name'] == 'Ann'
@@ -0,0 +1,90 @@
+import threading
+import time
+
+import pytest
+
+from admission import AdmissionController, RateLimited, TokenBucket
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_token_bucket_refills_at_rate():
+    clock = FakeClock()
+    bucket = TokenBucket(rate=0.5, capacity=2, clock=clock)
+    assert bucket.take() and bucket.take() and not bucket.take()
+    assert bucket.wait_time() == 2.0
+    clock.now = 2.0
+    assert bucket.take()
+
+
+def test_rates_must_be_positive():
+    with pytest.raises(ValueError):
+        AdmissionController(global_rate=0)
+    with pytest.raises(ValueError):
+        AdmissionController(user_rate=0)
+
+
+def test_user_limit_rejects_with_retry_after():
+    clock = FakeClock()
+    admission = AdmissionController(user_rate=0.1, user_burst=2, global_rate=100, global_burst=100, clock=clock)
+    admission.acquire('a')
+    admission.acquire('a')
+    with pytest.raises(RateLimited) as raised:
+        admission.acquire('a')
+    assert raised.value.retry_after_header == '10'
+    admission.acquire('b')  # other users are unaffected
+
+    stats = admission.stats()
+    assert stats['admitted'] == 3 and stats['rejected_user'] == 1
+
+
+def test_full_queue_and_timeout_are_refused():
+    clock = FakeClock()
+    admission = AdmissionController(user_rate=10, user_burst=10, global_rate=1, global_burst=1,
+                                    max_queue=0, clock=clock)
+    admission.acquire('a')
+    with pytest.raises(RateLimited):
+        admission.acquire('b')
+    assert admission.stats()['rejected_queue_full'] == 1
+
+    admission = AdmissionController(global_rate=0.001, global_burst=1, max_wait=0.05)
+    admission.acquire('a')
+    with pytest.raises(RateLimited) as raised:
+        admission.acquire('b')
+    assert raised.value.reason == 'server busy'
+    assert admission.stats()['timed_out'] == 1 and admission.stats()['queue_depth'] == 0
+
+
+def test_queue_is_served_round_robin_across_users():
+    clock = FakeClock()
+    admission = AdmissionController(user_rate=100, user_burst=100, global_rate=64, global_burst=1,
+                                    max_wait=100, clock=clock)
+    admission.acquire('warmup')
+    order = []
+
+    def request(user):
+        admission.acquire(user)
+        order.append(user)
+
+    threads = []
+    for user in ['busy', 'busy', 'busy', 'quiet']:
+        thread = threading.Thread(target=request, args=(user,))
+        thread.start()
+        threads.append(thread)
+        while admission.stats()['queue_depth'] < len(threads):
+            time.sleep(0.001)
+
+    # Release one global token at a time
+    for served in range(1, 5):
+        clock.now += 1 / 64
+        while len(order) < served:
+            time.sleep(0.001)
+    for thread in threads:
+        thread.join()
+    assert order == ['busy', 'quiet', 'busy', 'busy']
@@ -0,0 +1,93 @@
+import numpy as np
+
+from analytics import (History, calorie_balance, ewma, load_history, macro_ratios, rolling_mean, summarize,
+                       weight_trend)
+from streaks import counters_from_days
+from tests.fake_firestore import FakeClient
+
+
+def make_history():
+    return History.from_rows(
+        meal_rows=[
+            ("2024-01-01", 500, 50, 10, 30),
+            ("2024-01-01", 700, 80, 20, 40),
+            ("2024-01-03", 400, 40, 10, 20),
+        ],
+        burned_rows=[("2024-01-02", 300)],
+        weight_rows=[("2024-01-01", 80), ("2024-01-03", 79)],
+    )
+
+
+def test_rows_are_aggregated_per_date():
+    history = make_history()
+    assert [str(date) for date in history.dates] == ["2024-01-01", "2024-01-02", "2024-01-03"]
+    assert history.calories.tolist() == [1200, 0, 400]
+    assert history.burned.tolist() == [0, 300, 0]
+    assert np.isnan(history.weight[1])
+
+
+def test_rolling_mean_uses_calendar_days():
+    history = make_history()
+    intake = np.where(history.calories > 0, history.calories, np.nan)
+    assert rolling_mean(history.dates, intake, 2).tolist() == [1200, 1200, 400]
+
+
+def test_ewma_matches_recurrence():
+    values = np.random.default_rng(1).uniform(60, 90, 2000)
+    expected = [values[0]]
+    for value in values[1:]:
+        expected.append(0.7 * expected[-1] + 0.3 * value)
+    assert np.allclose(ewma(values, 0.3), expected)
+
+
+def test_weight_trend_skips_unweighed_days():
+    trend = weight_trend(make_history(), alpha=0.5)
+    assert trend[0] == 80
+    assert np.isnan(trend[1])
+    assert trend[2] == 79.5
+
+
+def test_macro_ratios_and_balance():
+    history = make_history()
+    ratios = macro_ratios(history)
+    assert np.isclose(ratios["carbs"][0] + ratios["proteins"][0] + ratios["fats"][0], 1.0)
+    assert calorie_balance(history, 1000)["net_vs_target"].tolist() == [200, -1300, -600]
+
+
+def test_days_within_target_match_the_streak_counters():
+    history = make_history()
+    # 1200 kcal is within 10% of 1100; 400 kcal is under the target but far from it
+    assert summarize(history, 1100)["summary"]["days_within_target"] == 1
+    days = [{"date": "2024-01-01", "meals": ["m"], "totals": {"calories": 1200}},
+            {"date": "2024-01-03", "meals": ["m"], "totals": {"calories": 400}}]
+    assert counters_from_days(days, 1100)["days_within_target"] == 1
+
+
+def test_load_history_reads_user_documents():
+    db = FakeClient()
+    db.collection("Calendar").document("c1").set({"belongs_to": "u1", "days": ["d1"]})
+    db.collection("Day").document("d1").set({"date": "2024-01-01", "meals": ["m1"], "workouts": ["w1"], "weight": 75})
+    db.collection("Meal").document("m1").set({"calories": 600, "carbs": 50, "fats": 10, "proteins": 30})
+    db.collection("Workout").document("w1").set({"exercises": ["e1", "e2"]})
+    db.collection("Exercise").document("e1").set({"avg_calories_burned": 100})
+    db.collection("Exercise").document("e2").set({"avg_calories_burned": 50})
+
+    history = load_history(db, "u1")
+    assert history.calories.tolist() == [600]
+    assert history.burned.tolist() == [150]
+    assert history.weight.tolist() == [75]
+
+
+def test_load_history_uses_day_totals_without_reading_meals():
+    db = FakeClient()
+    db.collection("Calendar").document("c1").set({"belongs_to": "u1", "days": ["d1", "d2"]})
+    db.collection("Day").document("d1").set({
+        "date": "2024-01-01", "meals": ["m1", "m2"], "workouts": [],
+        "totals": {"calories": 900, "carbs": 90, "fats": 20, "proteins": 50, "meals": 2},
+    })
+    db.collection("Day").document("d2").set({"date": "2024-01-02", "meals": ["m3"], "workouts": []})
+    db.collection("Meal").document("m3").set({"calories": 400, "carbs": 40, "fats": 10, "proteins": 20})
+
+    history = load_history(db, "u1")
+    assert history.calories.tolist() == [900, 400]
+    assert history.proteins.tolist() == [50, 20]
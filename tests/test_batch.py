@@ -0,0 +1,128 @@
+import base64
+import gzip
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from flask import Flask, Response, jsonify, request
+
+from batch import BatchError, parse_batch, run_batch, stages
+from single_flight import SingleFlight
+
+
+@pytest.fixture
+def service():
+    app = Flask(__name__)
+    reads = SingleFlight()
+    users = {'a@b.c': {'name': 'Ada', 'favorites': []}}
+    lookups = []
+    both_running = threading.Barrier(2, timeout=5)
+
+    def find_user(email):
+        def fetch():
+            lookups.append(email)
+            return dict(users[email])
+        return reads.do(('users', 'email', email), fetch)
+
+    @app.route('/profile')
+    def profile():
+        return jsonify(find_user(request.args['email'])), 200
+
+    @app.route('/favorite', methods=['POST'])
+    def favorite():
+        data = request.json
+        users[data['email']]['favorites'].append(data['meal'])
+        reads.forget('users')
+        return jsonify({"message": "added"}), 201
+
+    @app.route('/slow')
+    def slow():
+        both_running.wait()
+        return jsonify({"ok": True}), 200
+
+    @app.route('/export')
+    def export():
+        return Response(gzip.compress(b'{"collection": "users"}\n'), mimetype='application/gzip')
+
+    @app.route('/broken', methods=['POST'])
+    def broken():
+        return jsonify({"error": "nope"}), 400
+
+    return app, reads, lookups
+
+
+def call(service, payload):
+    app, reads, _ = service
+    with ThreadPoolExecutor(max_workers=4) as executor, reads.scope(('users',)):
+        return run_batch(executor, app.wsgi_app, parse_batch(payload, 10))
+
+
+def test_responses_come_back_in_request_order(service):
+    responses = call(service, [
+        {'path': '/profile?email=a@b.c'},
+        {'method': 'POST', 'path': '/broken', 'body': {}},
+        {'path': '/missing'},
+    ])
+    assert [response['status'] for response in responses] == [200, 400, 404]
+    assert responses[0]['body']['name'] == 'Ada'
+
+
+def test_independent_requests_run_concurrently(service):
+    # Each /slow waits for the other, so running them one after another would time out
+    responses = call(service, [{'path': '/slow'}, {'path': '/slow'}])
+    assert [response['status'] for response in responses] == [200, 200]
+
+
+def test_user_lookups_are_shared_across_the_batch(service):
+    _, reads, lookups = service
+    responses = call(service, [{'path': '/profile?email=a@b.c'} for _ in range(4)])
+    assert all(response['status'] == 200 for response in responses)
+    assert lookups == ['a@b.c']
+    assert reads.stats()['scope_hits'] + reads.stats()['coalesced'] == 3
+
+
+def test_dependent_request_sees_earlier_write(service):
+    _, _, lookups = service
+    responses = call(service, [
+        {'path': '/profile?email=a@b.c'},
+        {'method': 'POST', 'path': '/favorite', 'body': {'email': 'a@b.c', 'meal': 'm1'}, 'depends_on': [0]},
+        {'path': '/profile?email=a@b.c', 'depends_on': [1]},
+    ])
+    assert responses[0]['body']['favorites'] == []
+    assert responses[2]['body']['favorites'] == ['m1']
+    assert len(lookups) == 2
+
+
+def test_requests_after_a_failure_are_skipped(service):
+    responses = call(service, [
+        {'method': 'POST', 'path': '/broken', 'body': {}},
+        {'path': '/profile?email=a@b.c', 'depends_on': [0]},
+        {'path': '/profile?email=a@b.c'},
+    ])
+    assert [response['status'] for response in responses] == [400, 424, 200]
+
+
+def test_stages_follow_dependencies():
+    calls = parse_batch([{'path': '/a'}, {'path': '/b'}, {'path': '/c', 'depends_on': [0]},
+                         {'path': '/d', 'depends_on': [2, 1]}], 10)
+    assert stages(calls) == [[0, 1], [2], [3]]
+
+
+@pytest.mark.parametrize('payload', [
+    [],
+    [{'path': 'no-slash'}],
+    [{'path': '/batch'}],
+    [{'path': '/a', 'method': 'TRACE'}],
+    [{'path': '/a', 'depends_on': [0]}],
+    [{'path': '/a'}] * 11,
+])
+def test_invalid_batches_are_refused(payload):
+    with pytest.raises(BatchError):
+        parse_batch(payload, 10)
+
+
+def test_binary_responses_are_base64_encoded(service):
+    responses = call(service, [{'path': '/export'}, {'path': '/profile?email=a@b.c'}])
+    assert responses[0]['status'] == 200 and responses[0]['encoding'] == 'base64'
+    assert gzip.decompress(base64.b64decode(responses[0]['body'])) == b'{"collection": "users"}\n'
+    assert responses[1]['body']['name'] == 'Ada' and 'encoding' not in responses[1]
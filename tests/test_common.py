@@ -0,0 +1,33 @@
+import math
+
+from common import days_by_user, normalize_name, number
+from tests.fake_firestore import FakeClient
+
+
+def test_number_falls_back_to_the_default():
+    assert number('2.5') == 2.5
+    assert number(None) == 0.0
+    assert number(True) == 0.0
+    assert number('lots', None) is None
+    assert math.isnan(number(float('inf'), math.nan))
+
+
+def test_normalize_name_shares_one_singular_form_for_foods_and_exercises():
+    assert normalize_name('Cherry Tomatoes') == 'cherry tomato'
+    assert normalize_name('Blueberries, fresh') == 'blueberry fresh'
+    assert normalize_name('Bench Presses') == 'bench press'
+    assert normalize_name('Walking Lunges') == 'walking lunge'
+    assert normalize_name('Hummus') == 'hummus'
+
+
+def test_days_by_user_skips_undated_days_and_other_users():
+    db = FakeClient()
+    db.collection('Calendar').document('c1').set({'belongs_to': 'u1', 'days': ['d1', 'd2']})
+    db.collection('Calendar').document('c2').set({'belongs_to': 'u2', 'days': ['d3']})
+    db.collection('Day').document('d1').set({'date': '2024-03-04', 'weight': 80})
+    db.collection('Day').document('d2').set({'weight': 81})
+    db.collection('Day').document('d3').set({'date': '2024-03-04', 'weight': 70})
+
+    days = days_by_user(db, ['u1'], field_paths=('date', 'weight'))
+
+    assert days == {'u1': [{'date': '2024-03-04', 'weight': 80}]}
@@ -0,0 +1,95 @@
+import threading
+
+from day_totals import (add_meal_to_day, edit_meal_on_days, reconcile_day_totals, remove_meal_from_days,
+                        sum_totals)
+from tests.fake_firestore import FakeClient, transactional
+
+
+def seeded_db():
+    db = FakeClient()
+    db.collection('Meal').document('oats').set({'name': 'Oats', 'calories': 300, 'carbs': 50, 'fats': 6, 'proteins': 10})
+    db.collection('Meal').document('salad').set({'name': 'Salad', 'calories': 450.5, 'carbs': 20, 'fats': 30, 'proteins': 25})
+    db.collection('Day').document('d1').set({'date': '2024-03-01', 'meals': [], 'workouts': [],
+                                             'totals': sum_totals([])})
+    return db
+
+
+def totals(db, day_id):
+    return db.collection('Day').document(day_id).get().to_dict()['totals']
+
+
+def test_adding_and_removing_meals_keeps_totals():
+    db = seeded_db()
+    day_ref = db.collection('Day').document('d1')
+    assert add_meal_to_day(db, transactional, day_ref, 'oats')
+    assert add_meal_to_day(db, transactional, day_ref, 'salad')
+    assert not add_meal_to_day(db, transactional, day_ref, 'salad')  # already on the day
+    assert totals(db, 'd1') == {'calories': 750.5, 'carbs': 70, 'fats': 36, 'proteins': 35, 'meals': 2}
+
+    assert remove_meal_from_days(db, transactional, [day_ref], 'oats') == 1
+    day = day_ref.get().to_dict()
+    assert day['meals'] == ['salad']
+    assert day['totals'] == {'calories': 450.5, 'carbs': 20, 'fats': 30, 'proteins': 25, 'meals': 1}
+
+
+def test_new_day_is_created_with_totals():
+    db = seeded_db()
+    day_ref = db.collection('Day').document('d2')
+    add_meal_to_day(db, transactional, day_ref, 'oats', new_day={'date': '2024-03-02', 'day': 'Saturday'})
+    day = day_ref.get().to_dict()
+    assert day['date'] == '2024-03-02' and day['meals'] == ['oats'] and day['workouts'] == []
+    assert day['totals']['calories'] == 300
+
+
+def test_deleting_a_meal_updates_every_day_it_was_on():
+    db = seeded_db()
+    db.collection('Day').document('d2').set({'date': '2024-03-02', 'meals': ['oats', 'salad']})  # written before totals
+    add_meal_to_day(db, transactional, db.collection('Day').document('d1'), 'salad')
+    day_refs = [db.collection('Day').document(day_id) for day_id in ('d1', 'd2')]
+
+    assert remove_meal_from_days(db, transactional, day_refs, 'salad', delete_meal=True) == 2
+    assert not db.collection('Meal').document('salad').get().exists
+    assert totals(db, 'd1')['meals'] == 0 and totals(db, 'd1')['calories'] == 0
+    assert totals(db, 'd2') == {'calories': 300, 'carbs': 50, 'fats': 6, 'proteins': 10, 'meals': 1}
+
+
+def test_editing_a_meal_moves_day_totals_by_the_difference():
+    db = seeded_db()
+    day_ref = db.collection('Day').document('d1')
+    add_meal_to_day(db, transactional, day_ref, 'oats')
+    add_meal_to_day(db, transactional, day_ref, 'salad')
+
+    old = edit_meal_on_days(db, transactional, 'oats', {'calories': 350, 'proteins': 12}, [day_ref])
+    assert old['calories'] == 300
+    assert db.collection('Meal').document('oats').get().to_dict()['calories'] == 350
+    assert totals(db, 'd1') == {'calories': 800.5, 'carbs': 70, 'fats': 36, 'proteins': 37, 'meals': 2}
+    assert edit_meal_on_days(db, transactional, 'missing', {'calories': 1}, [day_ref]) is None
+
+
+def test_concurrent_adds_do_not_lose_updates():
+    db = seeded_db()
+    for index in range(20):
+        db.collection('Meal').document(f'm{index}').set({'calories': 100})
+    day_ref = db.collection('Day').document('d1')
+    threads = [threading.Thread(target=add_meal_to_day, args=(db, transactional, day_ref, f'm{index}')) for index in range(20)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(5)
+    assert totals(db, 'd1') == {'calories': 2000, 'carbs': 0, 'fats': 0, 'proteins': 0, 'meals': 20}
+
+
+def test_reconciliation_fixes_drift_and_backfills():
+    db = seeded_db()
+    day_ref = db.collection('Day').document('d1')
+    add_meal_to_day(db, transactional, day_ref, 'oats')
+    db.collection('Meal').document('oats').update({'calories': 320})  # changed outside the write paths
+    db.collection('Day').document('d2').set({'date': '2024-03-02', 'meals': ['salad', 'gone']})
+    db.collection('Day').document('d3').set({'date': '2024-03-03', 'meals': ['salad'],
+                                             'totals': sum_totals([{'calories': 450.5, 'carbs': 20, 'fats': 30, 'proteins': 25}])})
+
+    report = reconcile_day_totals(db, transactional, days_per_batch=2)
+    assert report == {'checked': 3, 'drifted': 2, 'fixed': 2}
+    assert totals(db, 'd1')['calories'] == 320
+    assert totals(db, 'd2') == {'calories': 450.5, 'carbs': 20, 'fats': 30, 'proteins': 25, 'meals': 2}
+    assert reconcile_day_totals(db, transactional)['drifted'] == 0
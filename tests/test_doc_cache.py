@@ -0,0 +1,102 @@
+import pytest
+import time
+
+from doc_cache import CachedSnapshot, DocumentCache
+
+
+class FakeCollection:
+    def __init__(self, collection_id):
+        self.id = collection_id
+
+
+class FakeRef:
+    def __init__(self, store, collection, doc_id):
+        self.store = store
+        self.id = doc_id
+        self.path = f"{collection}/{doc_id}"
+        self.parent = FakeCollection(collection)
+
+    def get(self):
+        self.store["reads"] += 1
+        data, update_time = self.store.get(self.path, (None, None))
+        return CachedSnapshot(self, data, update_time)
+
+
+class FakeClient:
+    def __init__(self, store):
+        self.store = store
+
+    def get_all(self, refs, field_paths=None):
+        for ref in refs:
+            yield ref.get()
+
+
+@pytest.fixture
+def store():
+    return {"reads": 0, "Meal/a": ({"name": "Pasta", "calories": 600}, 1)}
+
+
+def test_repeated_get_is_served_from_cache(store):
+    cache = DocumentCache(FakeClient(store))
+    ref = FakeRef(store, "Meal", "a")
+    assert cache.get(ref).to_dict()["name"] == "Pasta"
+    assert cache.get(ref).to_dict()["name"] == "Pasta"
+    assert store["reads"] == 1
+    assert cache.stats()["collections"]["Meal"]["hits"] == 1
+
+
+def test_invalidate_forces_a_fresh_read(store):
+    cache = DocumentCache(FakeClient(store))
+    ref = FakeRef(store, "Meal", "a")
+    cache.get(ref)
+    store["Meal/a"] = ({"name": "Salad"}, 2)
+    cache.invalidate(ref)
+    assert cache.get(ref).to_dict()["name"] == "Salad"
+
+
+def test_read_racing_an_invalidation_is_not_cached(store):
+    cache = DocumentCache(FakeClient(store))
+    ref = FakeRef(store, "Meal", "a")
+    read = ref.get
+
+    def get_then_write():
+        # The read returns the old document, then a write lands and invalidates it
+        snapshot = read()
+        store["Meal/a"] = ({"name": "Salad"}, 2)
+        cache.invalidate(ref)
+        return snapshot
+
+    ref.get = get_then_write
+    assert cache.get(ref).to_dict()["name"] == "Pasta"
+    ref.get = read
+    assert cache.get(ref).to_dict()["name"] == "Salad"
+    assert store["reads"] == 2
+
+
+def test_lru_eviction_is_bounded(store):
+    store["Meal/b"] = ({"name": "Soup"}, 1)
+    cache = DocumentCache(FakeClient(store), max_entries=1)
+    cache.get(FakeRef(store, "Meal", "a"))
+    cache.get(FakeRef(store, "Meal", "b"))
+    stats = cache.stats()
+    assert stats["entries"] == 1
+    assert stats["collections"]["Meal"]["evictions"] == 1
+
+
+def test_expired_entry_revalidates_and_counts_staleness(store):
+    cache = DocumentCache(FakeClient(store), max_age=0.01)
+    ref = FakeRef(store, "Meal", "a")
+    cache.get(ref)
+    store["Meal/a"] = ({"name": "Salad"}, 2)
+    time.sleep(0.02)
+    assert cache.get(ref).to_dict()["name"] == "Salad"
+    assert cache.stats()["collections"]["Meal"]["stale"] == 1
+
+
+def test_projected_get_all_uses_cached_documents(store):
+    cache = DocumentCache(FakeClient(store))
+    ref = FakeRef(store, "Meal", "a")
+    cache.get(ref)
+    snapshots = list(cache.get_all([ref], field_paths=["name"]))
+    assert snapshots[0].to_dict() == {"name": "Pasta"}
+    assert store["reads"] == 1
@@ -297,3 +297,14 @@ def test_get_exercise(client):
     elif response.status_code == 404:
         assert response.json["error"] == "Exercise not found"
 
+
+def test_sync(client):
+    response = client.get("/sync", query_string={"email": "test_user@example.com"})
+    assert response.status_code == 200
+    assert response.json["full"] is True
+    token = response.json["token"]
+
+    response = client.get("/sync", query_string={"email": "test_user@example.com", "since": token})
+    assert response.status_code == 200
+    assert response.json["full"] is False
+    assert isinstance(response.json["deleted"], list)
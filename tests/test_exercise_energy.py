@@ -0,0 +1,79 @@
+import pytest
+
+from exercise_energy import (
+    DEFAULT_MET,
+    body_weight_kg,
+    estimate_workout,
+    lookup_met,
+    owner_body_weights,
+    recalculate_workout_library,
+)
+from tests.fake_firestore import FakeClient
+
+
+@pytest.mark.parametrize("name, met", [
+    ("Push-Ups", 8.0),
+    ("pushups", 8.0),
+    ("Thunder Squats", 5.0),
+    ("Squat Jumps", 8.0),
+    ("Bench Presses", 5.0),
+    ("Jumping Jacks", 8.0),
+    ("Runing", 9.8),
+])
+def test_lookup_met_matches_variants(name, met):
+    assert lookup_met(name) == met
+
+
+def test_unknown_exercise_falls_back_on_body_parts():
+    assert lookup_met("Dragon Flow") == DEFAULT_MET
+    assert lookup_met("Dragon Flow", "cardio") == 6.0
+
+
+def test_body_weight_units():
+    assert body_weight_kg({"weight": 70}) == 70
+    assert round(body_weight_kg({"weight": 180, "weight_unit": "lb"}), 1) == 81.6
+    assert body_weight_kg({}) == 70
+
+
+def test_estimate_workout_splits_total_minutes():
+    exercises = estimate_workout(
+        [{"name": "Squats", "sets": 3, "reps": 10}, {"name": "Running", "duration": 20}],
+        weight_kg=80,
+        total_minutes=40,
+    )
+    # Running: 9.8 MET * 3.5 * 80 / 200 * 20 min; squats get the remaining 20 min at 5 MET
+    assert exercises[1]["avg_calories_burned"] == 274
+    assert exercises[0]["avg_calories_burned"] == 140
+
+
+def test_recalculate_workout_library_updates_changed_exercises():
+    db = FakeClient()
+    db.collection("Workout").document("w1").set({"exercises": ["e1", "e2"], "total_minutes": 30})
+    db.collection("Exercise").document("e1").set({"name": "Burpees", "sets": 3, "reps": 10, "avg_calories_burned": 999})
+    db.collection("Exercise").document("e2").set({"name": "Plank", "sets": 3, "reps": 1, "avg_calories_burned": 1})
+
+    assert recalculate_workout_library(db) == 2
+    assert db.collection("Exercise").document("e1").get().to_dict()["avg_calories_burned"] != 999
+    assert recalculate_workout_library(db) == 0
+
+
+def test_recalculate_workout_library_uses_each_owners_weight():
+    db = FakeClient()
+    db.collection("users").document("u1").set({"weight": 100, "workouts": ["w1"]})
+    db.collection("users").document("u2").set({"weight": 110, "weight_unit": "lb", "favorited_workouts": ["w2"]})
+    db.collection("Calendar").document("c1").set({"belongs_to": "u1", "days": ["d1"]})
+    db.collection("Day").document("d1").set({"date": "2024-03-01", "workouts": ["w2", "w3"]})
+    for workout_id in ("w1", "w2", "w3", "w4"):
+        db.collection("Workout").document(workout_id).set({"exercises": [f"e{workout_id}"], "total_minutes": 30})
+        db.collection("Exercise").document(f"e{workout_id}").set({"name": "Running", "duration": 30})
+
+    weights = owner_body_weights(db, users_per_batch=1)
+    assert weights["w1"] == 100 and weights["w3"] == 100 and "w4" not in weights
+    assert round(weights["w2"], 1) == 49.9
+
+    assert recalculate_workout_library(db) == 4
+    burned = {workout_id: db.collection("Exercise").document(f"e{workout_id}").get().to_dict()["avg_calories_burned"]
+              for workout_id in ("w1", "w2", "w3", "w4")}
+    assert burned["w1"] == burned["w3"] == estimate_workout([{"name": "Running", "duration": 30}], 100)[0]["avg_calories_burned"]
+    assert burned["w4"] == estimate_workout([{"name": "Running", "duration": 30}])[0]["avg_calories_burned"]
+    assert burned["w2"] < burned["w4"]
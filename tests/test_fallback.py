@@ -0,0 +1,81 @@
+from fallback import FallbackLibrary, FallbackStats
+from meal_reuse import ingredient_keys
+from tests.fake_firestore import FakeClient
+
+
+def seeded_db():
+    db = FakeClient()
+    db.collection('Meal').document('bowl').set({
+        'name': 'Chicken Rice Bowl', 'type': 'Lunch',
+        'ingredients': ['150 g chicken breast', '1 cup white rice', '100 g broccoli'],
+        'calories': 500, 'carbs': 55, 'fats': 5, 'proteins': 50,
+    })
+    db.collection('Meal').document('cake').set({
+        'name': 'Chocolate Cake', 'type': 'Lunch', 'ingredients': ['100 g dark chocolate'], 'calories': 600,
+    })
+    db.collection('Exercise').document('e1').set({'name': 'Box Jumps', 'body_parts': 'legs', 'reps': 10, 'sets': 4})
+    db.collection('Workout').document('w1').set({'exercises': ['e1']})
+    db.collection('users').document('u1').set({'favorited_meals': ['bowl'], 'favorited_workouts': ['w1']})
+    db.collection('users').document('u2').set({'favorited_meals': ['bowl']})
+    return db
+
+
+def test_favorited_meal_is_scaled_to_requested_calories():
+    library = FallbackLibrary().load(seeded_db())
+    assert [meal['name'] for _, _, meal in library.meals] == ['Chicken Rice Bowl']  # the cake has no favorites
+
+    meal = library.meal({'type': 'lunch', 'ingredients': ['chicken'], 'calories': 750})
+    assert meal['name'] == 'Chicken Rice Bowl' and meal['fallback']
+    assert meal['ingredients'][0] == '225 g chicken breast'
+    assert 650 <= meal['calories'] <= 850
+
+
+def test_template_meal_respects_diet_type_and_ingredients():
+    meal = FallbackLibrary().meal({'type': 'Dinner', 'diet': 'vegan', 'calories': '500-600', 'ingredients': ['spinach']})
+    assert meal['type'] == 'Dinner' and meal['diet'] == 'vegan'
+    assert 'spinach' in ingredient_keys(meal['ingredients'])
+    assert not ingredient_keys(meal['ingredients']) & {'chicken breast', 'salmon', 'steak'}
+    assert 400 <= meal['calories'] <= 700
+
+
+def test_workout_covers_requested_body_parts_and_minutes():
+    library = FallbackLibrary().load(seeded_db())
+    workout = library.workout({'body_parts': 'legs, arms', 'total_minutes': 45})
+    names = [exercise['name'] for exercise in workout['exercises']]
+
+    assert workout['fallback'] and workout['total_minutes'] == 45
+    assert 'Box Jumps' in names  # favorites come before templates
+    assert len(names) == len(set(names)) and 3 <= len(names) <= 5
+    parts = ', '.join(exercise['body_parts'] for exercise in workout['exercises'])
+    assert 'legs' in parts and 'arms' in parts
+    assert all(exercise['avg_calories_burned'] > 0 for exercise in workout['exercises'])
+
+
+def test_calorie_target_prefers_intense_exercises():
+    library = FallbackLibrary()
+    easy = library.workout({'total_minutes': 30, 'avg_calories_burned': 120})
+    hard = library.workout({'total_minutes': 30, 'avg_calories_burned': 450})
+    burned = lambda workout: sum(exercise['avg_calories_burned'] for exercise in workout['exercises'])
+    assert burned(easy) < burned(hard)
+
+
+def test_fallback_is_fast():
+    library = FallbackLibrary().load(seeded_db())
+    stats = FallbackStats()
+    for _ in range(20):
+        stats.timed('meal', lambda: library.meal({'type': 'breakfast', 'calories': 400}))
+        stats.timed('workout', lambda: library.workout({'body_parts': 'core', 'total_minutes': 20}))
+    result = stats.stats()
+    assert result['meal']['count'] == 20
+    assert result['meal']['slowest_ms'] < 50 and result['workout']['slowest_ms'] < 50
+
+
+def test_load_orders_meals_by_favorites():
+    db = seeded_db()
+    db.collection('Meal').document('oats').set({
+        'name': 'Overnight Oats', 'type': 'Breakfast', 'ingredients': ['80 g oats', '200 ml milk'], 'calories': 350,
+    })
+    for user_id in ('u3', 'u4', 'u5'):
+        db.collection('users').document(user_id).set({'favorited_meals': ['oats']})
+    library = FallbackLibrary().load(db)
+    assert [favorites for favorites, _, _ in library.meals] == [3, 2]
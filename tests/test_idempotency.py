@@ -0,0 +1,105 @@
+import threading
+
+import pytest
+
+from idempotency import IdempotencyStore, KeyConflict, StillRunning, replayable
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_response_is_replayed_until_it_expires():
+    clock = FakeClock()
+    store = IdempotencyStore(ttl=60, clock=clock)
+    calls = []
+
+    def execute():
+        calls.append(1)
+        return {'meal_id': len(calls)}, True
+
+    assert store.run('k', 'body', execute) == ({'meal_id': 1}, False)
+    assert store.run('k', 'body', execute) == ({'meal_id': 1}, True)
+    clock.now = 61
+    assert store.run('k', 'body', execute) == ({'meal_id': 2}, False)
+    assert store.stats()['replayed'] == 1
+
+
+def test_concurrent_duplicates_wait_for_the_first_request():
+    store = IdempotencyStore()
+    started, release = threading.Event(), threading.Event()
+    calls = []
+
+    def execute():
+        calls.append(1)
+        started.set()
+        release.wait(5)
+        return 'generated', True
+
+    results = []
+    first = threading.Thread(target=lambda: results.append(store.run('k', 'body', execute)))
+    first.start()
+    started.wait(5)
+    duplicates = [threading.Thread(target=lambda: results.append(store.run('k', 'body', execute))) for _ in range(3)]
+    for thread in duplicates:
+        thread.start()
+    while store.stats()['waited'] < 3:
+        pass
+    release.set()
+    for thread in [first, *duplicates]:
+        thread.join(5)
+
+    assert len(calls) == 1
+    assert sorted(results) == [('generated', False)] + [('generated', True)] * 3
+
+
+def test_key_reused_with_another_body_is_refused():
+    store = IdempotencyStore()
+    store.run('k', 'body', lambda: ('ok', True))
+    with pytest.raises(KeyConflict):
+        store.run('k', 'other body', lambda: ('ok', True))
+
+
+def test_unkept_responses_and_errors_let_retries_run():
+    store = IdempotencyStore()
+    assert store.run('k', 'body', lambda: ('server error', False)) == ('server error', False)
+    assert store.run('k', 'body', lambda: ('ok', True)) == ('ok', False)
+
+    def fail():
+        raise RuntimeError('boom')
+
+    with pytest.raises(RuntimeError):
+        store.run('j', 'body', fail)
+    assert store.run('j', 'body', lambda: ('ok', True)) == ('ok', False)
+
+
+def test_waiting_is_bounded():
+    store = IdempotencyStore(max_wait=0.05)
+    release = threading.Event()
+    owner = threading.Thread(target=store.run, args=('k', 'body', lambda: (release.wait(5), True)))
+    owner.start()
+    while store.stats()['in_flight'] == 0:
+        pass
+    with pytest.raises(StillRunning):
+        store.run('k', 'body', lambda: ('ok', True))
+    release.set()
+    owner.join(5)
+
+
+def test_rate_limited_attempt_is_not_replayed_to_its_retry():
+    store = IdempotencyStore()
+    statuses = [429, 200]
+
+    def execute():
+        status = statuses.pop(0)
+        return {'status': status}, replayable(status)
+
+    assert store.run('k', 'body', execute) == ({'status': 429}, False)
+    assert store.run('k', 'body', execute) == ({'status': 200}, False)
+    assert store.run('k', 'body', execute) == ({'status': 200}, True)
+    assert [replayable(status) for status in (201, 204, 400, 408, 409, 500)] == [True, True, False, False, False, False]
+    assert not replayable(200, streamed=True)
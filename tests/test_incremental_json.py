@@ -0,0 +1,64 @@
+import json
+
+import pytest
+
+from incremental_json import ObjectStreamParser
+
+WORKOUT = {
+    'name': 'Leg Day, "Heavy"',
+    'total_minutes': 45,
+    'exercises': [
+        {'name': 'Squats', 'body_parts': 'legs, glutes', 'reps': 10, 'sets': 3, 'weight': '60 kg'},
+        {'name': 'Lunges {walking}', 'body_parts': 'legs', 'reps': 12, 'sets': 3, 'weight': 'bodyweight'},
+    ],
+}
+
+
+def feed_all(text, size):
+    parser = ObjectStreamParser()
+    events = []
+    for start in range(0, len(text), size):
+        events.extend(parser.feed(text[start:start + size]))
+    return parser, events
+
+
+@pytest.mark.parametrize('size', [1, 3, 7, 1000])
+def test_events_do_not_depend_on_chunking(size):
+    text = '```json\n' + json.dumps(WORKOUT, indent=2) + '\n```'
+    parser, events = feed_all(text, size)
+
+    assert events == [
+        ('field', 'name', WORKOUT['name']),
+        ('field', 'total_minutes', 45),
+        ('item', 'exercises', 0, WORKOUT['exercises'][0]),
+        ('item', 'exercises', 1, WORKOUT['exercises'][1]),
+        ('field', 'exercises', WORKOUT['exercises']),
+    ]
+    assert parser.close() == WORKOUT
+
+
+def test_each_exercise_is_reported_before_the_object_ends():
+    parser = ObjectStreamParser()
+    assert parser.feed('{"exercises": [{"name": "Squats"}, {"name": "Lun') == [('item', 'exercises', 0, {'name': 'Squats'})]
+    assert parser.feed('ges"}') == []
+    assert parser.feed(']') == [('item', 'exercises', 1, {'name': 'Lunges'})]
+    with pytest.raises(ValueError):
+        parser.close()
+
+
+def test_escaped_quotes_and_empty_arrays():
+    parser, events = feed_all(r'{"name": "Say \"hi\", then go", "ingredients": []}', 2)
+    assert events == [('field', 'name', 'Say "hi", then go'), ('field', 'ingredients', [])]
+
+
+def test_only_the_value_being_read_is_kept():
+    exercises = [{'name': f'Exercise {index}', 'reps': 10, 'sets': 3} for index in range(200)]
+    text = json.dumps({'name': 'Long Day', 'exercises': exercises})
+    parser = ObjectStreamParser()
+    events, longest = [], 0
+    for start in range(0, len(text), 5):
+        events.extend(parser.feed(text[start:start + 5]))
+        longest = max(longest, len(parser._text))
+    assert longest < 60
+    assert [event[3] for event in events if event[0] == 'item'] == exercises
+    assert parser.close() == {'name': 'Long Day', 'exercises': exercises}
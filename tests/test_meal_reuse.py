@@ -0,0 +1,92 @@
+import random
+
+from meal_reuse import MealReuseIndex, ReuseStats, calorie_range, minhash
+from tests.fake_firestore import FakeClient
+
+
+def seeded_db():
+    db = FakeClient()
+    db.collection('Meal').document('bowl').set({
+        'name': 'Chicken Rice Bowl', 'type': 'Lunch',
+        'ingredients': ['150 g chicken breast', '1 cup white rice', 'broccoli', '1 tbsp soy sauce'],
+        'calories': 520, 'carbs': 55, 'fats': 8, 'proteins': 50,
+    })
+    db.collection('Meal').document('oats').set({
+        'name': 'Berry Oats', 'type': 'Breakfast', 'diet': 'vegetarian',
+        'ingredients': ['1/2 cup rolled oats', '1 cup milk', 'blueberries'],
+        'calories': 400, 'carbs': 60, 'fats': 9, 'proteins': 17,
+    })
+    return db
+
+
+def test_minhash_similarity_tracks_jaccard():
+    first = minhash({'a', 'b', 'c', 'd'})
+    assert (first == minhash({'d', 'c', 'b', 'a'})).all()
+    assert 0.3 < (first == minhash({'a', 'b', 'c', 'e'})).mean() < 0.9
+    assert minhash(set()) is None
+
+
+def test_calorie_range():
+    assert calorie_range('400-600') == (400, 600)
+    assert calorie_range(500) == (425, 575)
+    assert calorie_range('any') is None
+
+
+def test_find_reusable_checks_ingredients_type_and_calories():
+    index = MealReuseIndex().load(seeded_db())
+    assert index.find_reusable({'type': 'lunch', 'ingredients': ['chicken', 'rice'], 'calories': '500'}) == 'bowl'
+    assert index.find_reusable({'type': 'dinner', 'ingredients': ['chicken']}) is None
+    assert index.find_reusable({'type': 'lunch', 'ingredients': ['salmon']}) is None
+    assert index.find_reusable({'type': 'lunch', 'calories': 900}) is None
+    assert index.find_reusable({'type': 'lunch', 'ingredients': ['chicken']}, exclude=['bowl']) is None
+
+
+def test_find_reusable_matches_diet_and_any_type():
+    index = MealReuseIndex(rng=random.Random(0)).load(seeded_db())
+    assert index.find_reusable({'diet': 'vegetarian'}) == 'oats'
+    assert index.find_reusable({'type': 'any', 'ingredients': ['blueberries']}) == 'oats'
+    assert index.find_reusable({'diet': 'vegan'}) is None
+
+
+def test_find_reusable_needs_ingredients_or_a_diet():
+    index = MealReuseIndex(rng=random.Random(0)).load(seeded_db())
+    assert index.find_reusable({}) is None
+    assert index.find_reusable({'type': 'lunch', 'ingredients': [], 'calories': 500}) is None
+    assert index.find_reusable({'type': 'lunch', 'diet': 'any', 'ingredients': ['any']}) is None
+
+
+def test_copies_are_not_indexed():
+    db = seeded_db()
+    db.collection('Meal').document('bowl2').set({**db.collection('Meal').document('bowl').get().to_dict(),
+                                                 'copied_from': 'bowl'})
+    index = MealReuseIndex().load(db)
+    assert 'bowl2' not in index.meals
+    index.upsert('bowl2', {'ingredients': ['broccoli'], 'copied_from': 'bowl'})
+    assert 'bowl2' not in index.meals
+    assert index.find_reusable({'type': 'lunch', 'ingredients': ['chicken']}, exclude=['bowl']) is None
+
+
+def test_find_duplicate_needs_similar_ingredients_and_macros():
+    index = MealReuseIndex().load(seeded_db())
+    generated = {
+        'type': 'Lunch', 'ingredients': ['200 g grilled chicken breast', '1 cup rice', 'steamed broccoli', 'soy sauce'],
+        'calories': 540, 'carbs': 57, 'fats': 9, 'proteins': 52,
+    }
+    assert index.find_duplicate(generated) == 'bowl'
+    assert index.find_duplicate({**generated, 'calories': 1500, 'fats': 80}) is None
+
+    index.remove('bowl')
+    assert index.find_duplicate(generated) is None
+    assert not any('bowl' in members for members in index.buckets.values())
+
+
+def test_reuse_stats():
+    stats = ReuseStats()
+    stats.record_generation(2.0)
+    stats.record_generation(4.0, duplicate=True)
+    stats.record_reuse()
+    result = stats.stats()
+    assert result['reuse_rate'] == round(1 / 3, 4)
+    assert result['llm_seconds_saved'] == 3.0
+    assert result['duplicates_merged'] == 1
+
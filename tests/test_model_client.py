@@ -0,0 +1,129 @@
+import time
+
+import pytest
+
+from model_client import CircuitBreaker, ModelClient, ModelUnavailable
+from tests.fake_model import FakeModels, sequence
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_slow_call_is_hedged():
+    models = FakeModels(pro={'latency': sequence(0.5, 0.01)})
+    client = ModelClient(models, tiers=['pro'], hedge_after=0.05)
+
+    started = time.monotonic()
+    assert client.generate('prompt').text
+    assert time.monotonic() - started < 0.3
+    assert client.stats()['hedges'] == 1 and client.stats()['hedges_won'] == 1
+    assert models.models['pro'].calls == 2
+
+
+def test_hedge_delay_follows_tail_latency():
+    models = FakeModels(pro={'latency': lambda rng: rng.lognormal(-4.5, 0.3)})
+    client = ModelClient(models, tiers=['pro'], min_hedge_after=0.0)
+    for _ in range(30):
+        client.generate('prompt')
+    assert 0.005 < client._hedge_delay(client.tiers[0]) < 0.05
+
+
+def test_failed_tier_fails_over_and_circuit_opens():
+    clock = FakeClock()
+    models = FakeModels(pro={'fails': lambda rng: True}, flash={})
+    client = ModelClient(models, tiers=['pro', 'flash'], clock=clock, min_calls=3, cooldown=10)
+
+    for _ in range(3):
+        assert client.generate('prompt').text == models.models['flash'].text
+    assert client.stats()['failovers'] == 3
+    assert client.stats()['tiers']['pro']['circuit'] == 'open'
+
+    client.generate('prompt')
+    assert models.models['pro'].calls == 3  # no calls while open
+
+    clock.now = 10
+    models.models['pro'].fails = lambda rng: False
+    assert client.generate('prompt').text == models.models['pro'].text
+    assert client.stats()['tiers']['pro']['circuit'] == 'closed'
+
+
+def test_all_circuits_open_is_unavailable():
+    breaker = CircuitBreaker(min_calls=2, cooldown=60, clock=FakeClock())
+    breaker.record(False)
+    breaker.record(False)
+    assert breaker.state == 'open' and not breaker.before_call()
+
+    models = FakeModels(pro={'fails': lambda rng: True})
+    client = ModelClient(models, tiers=['pro'], min_calls=1)
+    with pytest.raises(ModelUnavailable):
+        client.generate('prompt')
+    with pytest.raises(ModelUnavailable, match='unavailable'):
+        client.generate('prompt')
+    assert client.stats()['rejected'] == 1
+
+
+def test_routing_respects_latency_budget_and_prompt_size():
+    models = FakeModels(pro={'latency': lambda rng: 0.05}, flash={'latency': lambda rng: 0.005})
+    client = ModelClient(models, tiers=['pro', 'flash'], hedge_after=10)
+    client.generate('x' * 100)
+    client.tiers[1].latencies.add(0.005, True, 100)
+
+    assert client.route(100, budget=1)[0].name == 'pro'
+    assert client.route(100, budget=0.01)[0].name == 'flash'
+    # A prompt 30x the usual size is expected to take 30x as long
+    assert client.route(3000, budget=1)[0].name == 'flash'
+
+
+def test_budget_is_enforced():
+    models = FakeModels(pro={'latency': lambda rng: 0.3})
+    client = ModelClient(models, tiers=['pro'])
+    with pytest.raises(ModelUnavailable, match='within'):
+        client.generate('prompt', budget=0.05, hedge=False)
+    assert client.stats()['timeouts'] == 1
+
+
+def test_stream_records_outcome():
+    models = FakeModels(pro={})
+    client = ModelClient(models, tiers=['pro'])
+    text = ''.join(chunk.text for chunk in client.stream('prompt'))
+    assert text == models.models['pro'].text
+    assert client.stats()['tiers']['pro']['calls'] == 1
+
+
+def test_stalled_stream_times_out_as_a_failure():
+    models = FakeModels(pro={'chunk_latency': 0.2})
+    client = ModelClient(models, tiers=['pro'], chunk_timeout=0.05)
+    started = time.monotonic()
+    with pytest.raises(ModelUnavailable, match='chunk'):
+        list(client.stream('prompt'))
+    assert time.monotonic() - started < 0.15
+    assert client.stats()['timeouts'] == 1 and client.stats()['tiers']['pro']['errors'] == 1
+
+    with pytest.raises(ModelUnavailable):
+        list(client.stream('prompt', budget=0.1, chunk_timeout=1.0))
+
+
+def test_closed_stream_gives_back_the_half_open_trial():
+    clock = FakeClock()
+    models = FakeModels(pro={'fails': sequence(True, False)})
+    client = ModelClient(models, tiers=['pro'], clock=clock, min_calls=1, cooldown=10.0)
+    with pytest.raises(RuntimeError):
+        list(client.stream('prompt'))
+    breaker = client.tiers[0].breaker
+    assert breaker.state == 'open'
+
+    clock.now = 10.0
+    stream = client.stream('prompt')
+    next(stream)
+    assert not breaker.available()
+    stream.close()  # the client disconnected
+    assert breaker.state == 'half_open' and breaker.available()
+    assert client.stats()['tiers']['pro']['calls'] == 1
+
+    assert ''.join(chunk.text for chunk in client.stream('prompt')) == models.models['pro'].text
+    assert breaker.state == 'closed'
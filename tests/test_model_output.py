@@ -0,0 +1,62 @@
+import json
+
+import pytest
+
+from model_output import OutputStats, extract_json, parse_output, validate
+
+MEAL = {'name': 'Chicken Bowl', 'type': 'Lunch', 'calories': 520, 'carbs': 55, 'fats': 8, 'proteins': 50,
+        'ingredients': ['150 g chicken breast', '1 cup rice']}
+
+
+@pytest.mark.parametrize('text, how', [
+    ('```json\n' + json.dumps(MEAL) + '\n```', 'clean'),
+    ('Here you go: ' + json.dumps(MEAL) + '\nEnjoy your meal!', 'clean'),
+    (json.dumps(MEAL).replace(']', ',]').replace('}', ', }'), 'tolerated'),
+])
+def test_extract_json_tolerates_wrapping_and_trailing_commas(text, how):
+    assert extract_json(text) == (MEAL, how)
+
+
+def test_truncated_output_keeps_complete_members():
+    text = '{"name": "Leg Day", "exercises": [{"name": "Squats", "reps": 10}, {"name": "Lunges", "re'
+    data, how = extract_json(text)
+    assert how == 'truncated'
+    assert data == {'name': 'Leg Day', 'exercises': [{'name': 'Squats', 'reps': 10}, {'name': 'Lunges'}]}
+
+
+def test_validate_coerces_and_fills_defaults():
+    workout, filled, problem = validate('workout', {
+        'exercises': [{'name': 'Squats', 'reps': '12 reps', 'sets': 3}, {'description': 'no name'}, 'junk'],
+    })
+    assert problem is None
+    assert workout['name'] == 'Generated workout'
+    assert workout['exercises'] == [{'name': 'Squats', 'body_parts': '', 'description': '', 'reps': 12,
+                                     'sets': 3, 'weight': 'bodyweight'}]
+    assert workout['total_minutes'] > 0
+    assert {'name', 'total_minutes', 'exercises.0.weight'} <= set(filled)
+
+    meal, filled, problem = validate('meal', {'name': 'Toast', 'calories': 'about 300 kcal', 'ingredients': 'bread, butter'})
+    assert problem is None and filled == ['type']
+    assert meal['calories'] == 300 and meal['ingredients'] == ['bread', 'butter']
+    assert 'proteins' not in meal  # left for the nutrient table to estimate
+
+
+def test_repair_is_called_once_and_only_for_unusable_output():
+    stats = OutputStats()
+    prompts = []
+
+    def repair(prompt):
+        prompts.append(prompt)
+        return json.dumps(MEAL)
+
+    assert parse_output('meal', json.dumps(MEAL), repair, stats) == MEAL
+    assert parse_output('meal', 'Sorry, I cannot help with that.', repair, stats) == MEAL
+    assert len(prompts) == 1 and 'Sorry, I cannot help' in prompts[0]
+
+    with pytest.raises(ValueError):
+        parse_output('workout', '{"name": "Rest", "exercises": []}', lambda prompt: 'still not JSON', stats)
+
+    result = stats.stats()
+    assert (result['clean'], result['repaired'], result['failed']) == (1, 1, 1)
+    assert result['repair_calls'] == 2
+    assert result['wasted_generation_rate'] == round(1 / 3, 4)
@@ -0,0 +1,87 @@
+import numpy as np
+import pytest
+
+from common import normalize_name
+from nutrition import (
+    CSV_PATH, NutrientTable, estimate_meal, parse_ingredient, recalculate_meal_library, reconcile_meal, scale_ingredient,
+)
+from tests.fake_firestore import FakeClient
+
+
+def test_table_is_compiled_and_memory_mapped(tmp_path):
+    table = NutrientTable(CSV_PATH, str(tmp_path / 'nutrients.npy'))
+    assert isinstance(table.values, np.memmap)
+    assert table.values.shape == (len(table), 6)
+    assert (tmp_path / 'nutrients.npy').exists()
+
+
+@pytest.mark.parametrize('text, expected', [
+    ('200g chicken breast', ('chicken breast', 200.0, 'g', 1.0)),
+    ('1 1/2 cups cooked brown rice', ('cooked brown rice', 1.5, 'cup', 1.0)),
+    ('2 large eggs', ('eggs', 2.0, None, 1.25)),
+    ('Salmon fillet (150 g)', ('salmon fillet', 150.0, 'g', 1.0)),
+    ('½ avocado', ('avocado', 0.5, None, 1.0)),
+    ('onion, finely chopped', ('onion', None, None, 1.0)),
+])
+def test_parse_ingredient(text, expected):
+    assert parse_ingredient(text) == expected
+
+
+@pytest.mark.parametrize('name, food', [
+    ('Spaghetti', 'pasta'),
+    ('grilled chicken breast strips', 'chicken breast'),
+    ('parm', 'parmesan'),
+    ('brocoli', 'broccoli'),
+    ('tomatoes', 'tomato'),
+])
+def test_lookup(name, food):
+    table = NutrientTable()
+    assert table.names[table.lookup(normalize_name(name))] == food
+
+
+@pytest.mark.parametrize('text, factor, expected', [
+    ('150 g chicken breast', 1.5, '225 g chicken breast'),
+    ('1 1/2 cups cooked rice', 2, '3 cups cooked rice'),
+    ('½ cup oats', 1.5, '0.75 cup oats'),
+    ('2 large eggs', 1.4, '3 large eggs'),
+    ('salt to taste', 2, 'salt to taste'),
+])
+def test_scale_ingredient(text, factor, expected):
+    assert scale_ingredient(text, factor) == expected
+
+
+def test_estimate_meal_sums_quantified_ingredients():
+    estimate = estimate_meal(['200 g chicken breast', '100 g white rice', 'moon rocks'])
+    assert estimate['calories'] == 330 + 130
+    assert estimate['proteins'] == 65
+    assert estimate['unmatched'] == ['moon rocks']
+
+
+def test_reconcile_prefers_exact_ingredient_totals():
+    meal, report = reconcile_meal({'ingredients': ['100 g white rice'], 'calories': 900, 'carbs': 1, 'fats': 1, 'proteins': 1})
+    assert (meal['calories'], meal['carbs']) == (130, 28)
+    assert report['source'] == 'ingredients'
+
+
+def test_reconcile_fixes_calories_that_disagree_with_macros():
+    meal, report = reconcile_meal({'ingredients': ['chicken breast', 'rice'], 'calories': 900,
+                                   'carbs': 50, 'fats': 10, 'proteins': 40})
+    assert meal['calories'] == 450
+    assert report['changed'] == ['calories']
+
+
+def test_reconcile_keeps_plausible_values():
+    meal = {'ingredients': ['chicken breast', 'rice'], 'calories': 460, 'carbs': 50, 'fats': 10, 'proteins': 40}
+    corrected, report = reconcile_meal(meal)
+    assert corrected == meal
+    assert report['source'] == 'reported'
+
+
+def test_recalculate_meal_library_updates_only_wrong_meals():
+    db = FakeClient()
+    db.collection('Meal').document('m1').set({'name': 'Rice', 'ingredients': ['100 g white rice'],
+                                              'calories': 10, 'carbs': 28, 'fats': 0, 'proteins': 3})
+    db.collection('Meal').document('m2').set({'name': 'Rice', 'ingredients': ['100 g white rice'],
+                                              'calories': 130, 'carbs': 28, 'fats': 0, 'proteins': 3})
+    assert recalculate_meal_library(db) == 1
+    assert db.collection('Meal').document('m1').get().to_dict()['calories'] == 130
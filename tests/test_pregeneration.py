@@ -0,0 +1,73 @@
+from pregeneration import PregenerationPool, meal_fits, profile_key, workout_fits
+
+USER = {'goal': 'lose weight', 'avg_cal_intake': 1800, 'weight': 70, 'weight_unit': 'kg'}
+
+
+def fake_generate(kind, criteria, user_data):
+    if kind == 'meal':
+        return {'name': 'Chicken Bowl', 'type': criteria.get('type', 'Lunch'), 'calories': 500,
+                'ingredients': ['150 g chicken breast', '1 cup rice']}
+    return {'name': 'Leg Day', 'total_minutes': 30,
+            'exercises': [{'name': 'Squats', 'body_parts': 'legs', 'avg_calories_burned': 200}]}
+
+
+def test_pool_serves_remembered_request_shapes():
+    pool = PregenerationPool(fake_generate, per_shape=2)
+    request = {'email': 'a@example.com', 'type': 'Lunch', 'ingredients': ['chicken']}
+
+    assert pool.take('u1', 'meal', USER, request) is None
+    assert pool.refill_once() and pool.refill_once()
+    assert not pool.refill_once()  # the shape is full
+    assert pool.take('u1', 'meal', USER, request)['name'] == 'Chicken Bowl'
+    assert pool.take('u2', 'meal', USER, request) is None  # pools are per user
+
+    stats = pool.stats()
+    assert stats['hits'] == 1 and stats['misses'] == 2
+    assert stats['generated'] == 2 and stats['pooled_items'] == 1
+
+
+def test_profile_change_retires_pool():
+    pool = PregenerationPool(fake_generate)
+    request = {'body_parts': 'legs', 'total_minutes': 30}
+    pool.take('u1', 'workout', USER, request)
+    pool.refill_once()
+
+    assert profile_key(USER) != profile_key({**USER, 'goal': 'build muscle'})
+    assert pool.take('u1', 'workout', {**USER, 'goal': 'build muscle'}, request) is None
+    assert pool.take('u1', 'workout', USER, request) is not None
+
+
+def test_expiry_and_budget():
+    pool = PregenerationPool(fake_generate, ttl=0, budget_per_hour=1)
+    request = {'type': 'Dinner'}
+    pool.take('u1', 'meal', USER, request)
+
+    assert pool.refill_once()
+    assert pool.take('u1', 'meal', USER, request) is None  # expired before it was taken
+    assert not pool.refill_once()
+
+    stats = pool.stats()
+    assert stats['budget_exhausted'] == 1 and stats['expired'] == 1
+    assert stats['calls_last_hour'] == 1
+
+
+def test_failed_generation_is_counted():
+    def failing(kind, criteria, user_data):
+        raise RuntimeError('model unavailable')
+
+    pool = PregenerationPool(failing)
+    pool.take('u1', 'meal', USER, {'type': 'Lunch'})
+    assert pool.refill_once()
+    assert pool.stats()['failed'] == 1 and pool.stats()['pooled_items'] == 0
+
+
+def test_fits():
+    meal = {'type': 'Lunch', 'diet': 'vegan', 'calories': 500, 'ingredients': ['tofu', '1 cup rice']}
+    assert meal_fits({'type': 'lunch', 'diet': 'Vegan', 'calories': '450-550', 'ingredients': ['rice']}, meal)
+    assert not meal_fits({'type': 'dinner'}, meal)
+    assert not meal_fits({'ingredients': ['chicken']}, meal)
+
+    workout = fake_generate('workout', {}, USER)
+    assert workout_fits({'body_parts': 'legs', 'total_minutes': 30, 'avg_calories_burned': 220}, workout)
+    assert not workout_fits({'body_parts': 'legs, arms'}, workout)
+    assert not workout_fits({'total_minutes': 60}, workout)
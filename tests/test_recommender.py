@@ -0,0 +1,81 @@
+import time
+
+from recommender import LiveIndex, MealIndex, Recommender, WorkoutIndex
+from tests.fake_firestore import FakeClient
+
+
+def seed_meals(db):
+    meals = {
+        'salad': {'name': 'Chicken Salad', 'ingredients': ['chicken breast', 'lettuce', 'tomato'],
+                  'calories': 450, 'carbs': 20, 'fats': 15, 'proteins': 55},
+        'wrap': {'name': 'Chicken Wrap', 'ingredients': ['chicken breast', 'tortilla', 'lettuce'],
+                 'calories': 550, 'carbs': 45, 'fats': 18, 'proteins': 45},
+        'cake': {'name': 'Chocolate Cake', 'ingredients': ['flour', 'sugar', 'chocolate'],
+                 'calories': 1200, 'carbs': 160, 'fats': 55, 'proteins': 12},
+        'pasta': {'name': 'Pasta Carbonara', 'ingredients': ['pasta', 'bacon', 'egg'],
+                  'calories': 900, 'carbs': 95, 'fats': 40, 'proteins': 35},
+    }
+    for meal_id, meal in meals.items():
+        db.collection('Meal').document(meal_id).set(meal)
+
+
+def test_meals_rank_by_favorites_and_calorie_target():
+    db = FakeClient()
+    seed_meals(db)
+    index = MealIndex(capacity=2).load(db)
+    user = {'goal': 'lose weight', 'avg_cal_intake': 1500, 'favorited_meals': ['salad']}
+
+    assert index.recommend(user, 2, exclude={'salad'}) == ['wrap', 'pasta']
+    assert index.recommend(user, 10, exclude={'salad'})[-1] == 'cake'
+
+
+def test_meal_index_updates_incrementally():
+    index = MealIndex()
+    index.upsert('a', {'name': 'Oatmeal', 'ingredients': ['oats'], 'calories': 300})
+    index.upsert('b', {'name': 'Steak', 'ingredients': ['steak'], 'calories': 700})
+    index.remove('a')
+    assert index.recommend({}, 5) == ['b']
+
+    index.upsert('c', {'name': 'Oatmeal', 'ingredients': ['oats'], 'calories': 300})
+    assert len(index) == 2
+    assert index.rows['c'] == 0  # the freed row is reused
+    fresh = MealIndex()
+    fresh.upsert('b', {'name': 'Steak', 'ingredients': ['steak'], 'calories': 700})
+    fresh.upsert('c', {'name': 'Oatmeal', 'ingredients': ['oats'], 'calories': 300})
+    assert (index.document_frequency == fresh.document_frequency).all()
+
+
+def test_workouts_follow_favorite_body_parts():
+    index = WorkoutIndex()
+    index.upsert('legs', {'body_part_focus': 'legs, glutes', 'total_minutes': 45}, 300)
+    index.upsert('legs2', {'body_part_focus': 'legs', 'total_minutes': 40}, 250)
+    index.upsert('arms', {'body_part_focus': 'arms, chest', 'total_minutes': 45}, 250)
+    user = {'favorited_workouts': ['legs']}
+
+    assert index.recommend(user, 1, exclude={'legs'}) == ['legs2']
+
+
+def test_recommender_loads_workout_calories_from_exercises():
+    db = FakeClient()
+    db.collection('Exercise').document('e1').set({'name': 'Running', 'avg_calories_burned': 400})
+    db.collection('Exercise').document('e2').set({'name': 'Stretching', 'avg_calories_burned': 60})
+    db.collection('Workout').document('run').set({'body_part_focus': 'cardio', 'total_minutes': 40, 'exercises': ['e1']})
+    db.collection('Workout').document('yoga').set({'body_part_focus': 'core', 'total_minutes': 40, 'exercises': ['e2']})
+    recommender = Recommender(db)
+
+    assert recommender.recommend_workouts({'goal': 'lose weight'}, 2) == ['run', 'yoga']
+    recommender.remove_workout('run')
+    assert recommender.recommend_workouts({'goal': 'lose weight'}, 2) == ['yoga']
+
+
+def test_live_index_can_build_in_the_background():
+    db = FakeClient()
+    seed_meals(db)
+    live = LiveIndex(db, lambda client: MealIndex().load(client))
+    index = live.get(wait=False)
+    for _ in range(500):
+        if index is not None:
+            break
+        time.sleep(0.01)
+        index = live.get(wait=False)
+    assert len(index) == 4
@@ -0,0 +1,298 @@
+import base64
+import gzip
+import itertools
+import json
+
+import firebase_admin
+import pytest
+from firebase_admin import credentials, firestore
+
+from admission import AdmissionController
+from meal_reuse import MealReuseIndex
+from model_client import ModelClient
+from recommender import LiveIndex
+from tests.fake_firestore import FakeClient, transactional
+from tests.fake_model import FakeModels
+
+MEAL = {
+    'name': 'Chicken Rice Bowl', 'type': 'Lunch', 'calories': 500, 'carbs': 55, 'fats': 5, 'proteins': 50,
+    'ingredients': ['150 g chicken breast', '1 cup white rice', '100 g broccoli'],
+}
+MEAL_REQUEST = {'type': 'lunch', 'ingredients': ['chicken'], 'calories': '300-800'}
+
+_emails = itertools.count(1)
+
+
+@pytest.fixture(scope='module')
+def server():
+    # app.py connects at import time, so the fake client is patched in before the first import
+    db = FakeClient()
+    with pytest.MonkeyPatch.context() as patch:
+        patch.setenv('GOOGLE_API_KEY', 'test-key')
+        patch.setattr(firebase_admin, 'initialize_app', lambda *args, **kwargs: None)
+        patch.setattr(credentials, 'Certificate', lambda path: None)
+        patch.setattr(firestore, 'client', lambda: db)
+        patch.setattr(firestore, 'transactional', transactional)
+        import app
+        assert app.db is db
+        app.app.testing = True
+        yield app
+
+
+@pytest.fixture
+def model(server, monkeypatch):
+    models = FakeModels(pro={'text': json.dumps(MEAL)})
+    monkeypatch.setattr(server, 'model_client', ModelClient(models, tiers=['pro']))
+    return models.models['pro']
+
+
+@pytest.fixture
+def client(server, model, monkeypatch):
+    # Each test starts with an empty reuse index and its own rate limits
+    reuse = LiveIndex(server.db, lambda db: MealReuseIndex())
+    reuse.get()
+    monkeypatch.setattr(server, 'meal_reuse', reuse)
+    monkeypatch.setattr(server, 'admission', AdmissionController(global_burst=100))
+    return server.app.test_client()
+
+
+def add_user(server, **fields):
+    email = f'user{next(_emails)}@example.com'
+    user_ref = server.db.collection('users').add({
+        'email': email, 'avg_cal_intake': 2000, 'favorited_meals': [], 'favorited_workouts': [], **fields,
+    })[1]
+    server.db.collection('Calendar').add({'belongs_to': user_ref.id, 'days': []})
+    return email, user_ref.id
+
+
+def calendar_days(server, user_id):
+    calendar = server.db.collection('Calendar').where('belongs_to', '==', user_id).get()[0]
+    days = [server.db.collection('Day').document(day_id).get() for day_id in calendar.to_dict()['days']]
+    return {day.get('date'): day.to_dict() for day in days}
+
+
+def today(server):
+    return dict(zip(('date', 'day'), server.get_current_date()))
+
+
+def test_generate_meal_schedules_the_meal_and_counts_today_toward_the_streak(server, client, model):
+    email, user_id = add_user(server)
+    response = client.post('/generate_meal', json={**MEAL_REQUEST, 'email': email, 'dates': [today(server)]})
+
+    assert response.status_code == 201
+    meal_id = response.json['meal_id']
+    assert server.db.collection('Meal').document(meal_id).get().get('name') == 'Chicken Rice Bowl'
+    day = calendar_days(server, user_id)[today(server)['date']]
+    assert day['meals'] == [meal_id] and day['totals']['meals'] == 1
+    streak = client.get('/get_streaks', query_string={'email': email}).json
+    assert streak['current_streak'] == 1 and streak['last_logged'] == today(server)['date']
+    assert model.calls == 1
+
+
+def test_reused_meal_is_copied_for_the_second_requester(server, client, model):
+    first_email, _ = add_user(server)
+    second_email, second_id = add_user(server)
+    original_id = client.post('/generate_meal', json={**MEAL_REQUEST, 'email': first_email}).json['meal_id']
+
+    response = client.post('/generate_meal', json={
+        **MEAL_REQUEST, 'email': second_email, 'dates': [{'date': '2024-03-04', 'day': 'Monday'}],
+    })
+
+    assert response.status_code == 201 and response.json['reused']
+    copy_id = response.json['meal_id']
+    assert copy_id != original_id
+    assert server.db.collection('Meal').document(copy_id).get().get('copied_from') == original_id
+    assert calendar_days(server, second_id)['2024-03-04']['meals'] == [copy_id]
+    assert model.calls == 1
+
+    fresh = client.post('/generate_meal', json={**MEAL_REQUEST, 'email': second_email, 'fresh': True})
+    assert fresh.status_code == 201 and 'reused' not in fresh.json
+    assert model.calls == 2
+
+
+def test_idempotent_retry_replays_the_first_response(server, client, model):
+    email, _ = add_user(server)
+    body = {**MEAL_REQUEST, 'email': email}
+    first = client.post('/generate_meal', json=body, headers={'Idempotency-Key': 'k1'})
+    retry = client.post('/generate_meal', json=body, headers={'Idempotency-Key': 'k1'})
+
+    assert first.status_code == retry.status_code == 201
+    assert retry.headers['Idempotent-Replayed'] == 'true'
+    assert retry.json['meal_id'] == first.json['meal_id']
+    assert model.calls == 1
+
+    conflict = client.post('/generate_meal', json={**body, 'type': 'dinner'}, headers={'Idempotency-Key': 'k1'})
+    assert conflict.status_code == 422
+
+
+def test_admitted_rejects_requests_over_the_user_burst(server, client, model, monkeypatch):
+    monkeypatch.setattr(server, 'admission', AdmissionController(user_rate=0.01, user_burst=1, max_queue=0))
+    email, _ = add_user(server)
+
+    assert client.post('/generate_meal', json={**MEAL_REQUEST, 'email': email}).status_code == 201
+    response = client.post('/generate_meal', json={**MEAL_REQUEST, 'email': email})
+
+    assert response.status_code == 429
+    assert int(response.headers['Retry-After']) > 0
+    assert model.calls == 1
+
+
+def test_batch_runs_sub_requests_through_the_app(server, client):
+    email, _ = add_user(server, name='Ada')
+    response = client.post('/batch', json={'requests': [
+        {'method': 'GET', 'path': f'/get_profile?email={email}&fields=name'},
+        {'method': 'POST', 'path': '/update_weight_on_day', 'body': {'email': email, 'date': '2024-03-04', 'weight': 70}},
+        {'method': 'POST', 'path': '/get_weight_on_day', 'body': {'email': email, 'date': '2024-03-04'}, 'depends_on': [1]},
+        {'method': 'GET', 'path': f'/export?email={email}'},
+        {'method': 'GET', 'path': '/get_profile?email=nobody@example.com'},
+    ]})
+
+    assert response.status_code == 200
+    responses = response.json['responses']
+    assert [result['status'] for result in responses] == [200, 201, 200, 200, 404]
+    assert responses[0]['body']['name'] == 'Ada'
+    assert responses[2]['body']['weight'] == 70
+    assert responses[3]['encoding'] == 'base64'
+    assert json.loads(gzip.decompress(base64.b64decode(responses[3]['body'])).splitlines()[0])['collection'] == 'users'
+
+
+def test_batch_rejects_nested_batches(client):
+    response = client.post('/batch', json={'requests': [{'method': 'POST', 'path': '/batch'}]})
+    assert response.status_code == 400
+
+
+def test_import_copies_an_export_and_its_weights(server, client):
+    source_email, source_id = add_user(server)
+    client.post('/update_weight_on_day', json={'email': source_email, 'date': '2024-03-04', 'weight': 80})
+    client.post('/create_favorite_meal', json={**MEAL, 'email': source_email})
+    target_email, target_id = add_user(server, weights_migrated=True)
+    archive = client.get('/export', query_string={'email': source_email}).data
+
+    response = client.post('/import', query_string={'email': target_email}, data=archive)
+
+    assert response.status_code == 201
+    assert calendar_days(server, target_id)['2024-03-04']['weight'] == 80
+    assert server.db.collection('WeightSeries').document(f'{target_id}_2024').get().exists
+    history = client.post('/get_weight_history', json={'email': target_email, 'start': '2024-01-01', 'end': '2024-12-31'})
+    assert history.json == [{'date': '2024-03-04', 'weight': 80}]
+    target = server.db.collection('users').document(target_id).get().to_dict()
+    assert len(target['favorited_meals']) == 1
+    assert target['favorited_meals'] != server.db.collection('users').document(source_id).get().get('favorited_meals')
+
+
+def test_import_rejects_an_invalid_archive_without_writing(server, client):
+    email, _ = add_user(server)
+    writes = server.db.writes
+
+    response = client.post('/import', query_string={'email': email}, data=b'not an archive')
+
+    assert response.status_code == 400
+    assert server.db.writes == writes
+
+
+def test_weight_routes_read_the_series_and_unmigrated_days(server, client):
+    email, user_id = add_user(server)
+    assert client.post('/update_weight_on_day', json={'email': email, 'date': '2024-03-04', 'weight': 81}).status_code == 201
+    assert client.post('/update_weight_on_day', json={'email': email, 'date': '2024-03-04', 'weight': 80}).status_code == 200
+    # A weight written to a Day before the series existed is still found until the user is migrated
+    day_ref = server.db.collection('Day').add({'date': '2024-03-01', 'day': 'Friday', 'weight': 82, 'meals': [], 'workouts': []})[1]
+    calendar = server.db.collection('Calendar').where('belongs_to', '==', user_id).get()[0]
+    calendar.reference.update({'days': firestore.ArrayUnion([day_ref.id])})
+    server.reads.forget('Calendar')
+
+    assert client.post('/get_weight_on_day', json={'email': email, 'date': '2024-03-04'}).json['weight'] == 80
+    assert client.post('/get_weight_on_day', json={'email': email, 'date': '2024-03-01'}).json['weight'] == 82
+    history = client.post('/get_weight_history', json={'email': email, 'start': '2024-03-01', 'end': '2024-03-31'})
+    assert history.json == [{'date': '2024-03-01', 'weight': 82}, {'date': '2024-03-04', 'weight': 80}]
+    assert client.post('/get_weight_on_day', json={'email': email, 'date': '03/04/2024'}).status_code == 400
+    assert client.post('/get_weight_history', json={'email': email, 'start': '2024-03-01'}).status_code == 400
+
+
+def test_weigh_in_counts_toward_the_streak_only_up_to_today(server, client):
+    email, _ = add_user(server)
+    client.post('/update_weight_on_day', json={'email': email, 'date': '2999-01-01', 'weight': 70})
+    assert client.get('/get_streaks', query_string={'email': email}).json['days_logged'] == 0
+
+    client.post('/update_weight_on_day', json={'email': email, 'date': today(server)['date'], 'weight': 70})
+    streak = client.get('/get_streaks', query_string={'email': email}).json
+    assert streak['days_logged'] == 1 and streak['current_streak'] == 1
+
+
+def test_saving_a_workout_does_not_count_as_logging(server, client):
+    email, _ = add_user(server)
+    response = client.post('/create_user_workout', json={'email': email, 'exercises': [], 'total_minutes': 30})
+
+    assert response.status_code == 201
+    assert client.get('/get_streaks', query_string={'email': email}).json['days_logged'] == 0
+
+
+def test_favorite_meal_logged_today_counts_its_calories(server, client):
+    email, _ = add_user(server, avg_cal_intake=500)
+    response = client.post('/create_favorite_meal', json={**MEAL, 'email': email})
+
+    assert response.status_code == 200
+    streak = client.get('/get_streaks', query_string={'email': email}).json
+    assert streak['days_logged'] == 1 and streak['last_logged'] == today(server)['date']
+
+
+def test_get_exercises_keeps_the_requested_order(server, client):
+    first = server.db.collection('Exercise').add({'name': 'Squat'})[1].id
+    second = server.db.collection('Exercise').add({'name': 'Plank'})[1].id
+
+    response = client.post('/get_exercises', json={'exercise_ids': [second, 'missing', first]})
+
+    assert response.status_code == 200
+    assert [(exercise['id'], exercise['name']) for exercise in response.json] == [(second, 'Plank'), (first, 'Squat')]
+    assert client.post('/get_exercises', json={}).status_code == 400
+
+
+def test_check_favorites_answers_every_id_from_one_user_read(server, client):
+    email, _ = add_user(server, favorited_meals=['m1'], favorited_workouts=['w2'])
+
+    response = client.post('/check_favorites', json={'email': email, 'meal_ids': ['m1', 'm2'], 'workout_ids': ['w1', 'w2']})
+
+    assert response.status_code == 200
+    assert response.json == {'meals': {'m1': True, 'm2': False}, 'workouts': {'w1': False, 'w2': True}}
+
+
+def test_fields_prune_profiles_and_favorite_workouts(server, client):
+    exercise_id = server.db.collection('Exercise').add({'name': 'Squat', 'reps': 10})[1].id
+    workout_id = server.db.collection('Workout').add({'name': 'Legs', 'total_minutes': 30, 'exercises': [exercise_id]})[1].id
+    email, user_id = add_user(server, name='Ada', goal='Run', favorited_workouts=[workout_id])
+
+    profile = client.get('/get_profile', query_string={'email': email, 'fields': 'name,goal'})
+    assert profile.json == {'name': 'Ada', 'goal': 'Run', 'id': user_id}
+    assert client.get('/get_profile', query_string={'email': email, 'fields': 'name;drop'}).status_code == 400
+
+    workouts = client.get('/get_favorite_workouts', query_string={'email': email, 'fields': 'name,exercises.name'})
+    assert workouts.status_code == 200
+    assert workouts.json == [{'name': 'Legs', 'exercises': [{'name': 'Squat'}], 'id': workout_id}]
+
+
+def test_analytics_returns_aligned_series(server, client):
+    email, _ = add_user(server)
+    client.post('/update_weight_on_day', json={'email': email, 'date': '2024-03-04', 'weight': 80})
+
+    response = client.get('/analytics', query_string={'email': email, 'window': 7})
+
+    assert response.status_code == 200
+    assert len(response.json['dates']) == len(response.json['calories'])
+    assert 'summary' in response.json
+    assert client.get('/analytics', query_string={'email': email, 'window': 0}).status_code == 400
+
+
+def test_cache_stats_stay_within_bounds(server, client):
+    meal_id = server.db.collection('Meal').add(dict(MEAL))[1].id
+    client.get('/get_meal_details', query_string={'mealId': meal_id})
+
+    response = client.get('/cache_stats')
+
+    assert response.status_code == 200
+    assert 'Meal' in response.json['collections']
+    assert response.json['entries'] <= response.json['max_entries']
+
+
+def test_sync_rejects_an_invalid_token(server, client):
+    email, _ = add_user(server)
+    assert client.get('/sync', query_string={'email': email, 'since': 'yesterday'}).status_code == 400
+    assert client.get('/sync', query_string={'email': email}).json['full'] is True
@@ -0,0 +1,121 @@
+import multiprocessing
+
+import pytest
+
+from doc_cache import DocumentCache
+from shared_cache import SharedCache
+from tests.fake_firestore import FakeClient
+
+
+@pytest.fixture
+def db():
+    db = FakeClient()
+    db.collection('Meal').document('a').set({'name': 'Pasta'})
+    db.collection('Meal').document('b').set({'name': 'Soup'})
+    return db
+
+
+def worker(db, path, **options):
+    # Each worker process opens its own connection to the same cache file
+    return DocumentCache(db, shared=SharedCache(path, **options))
+
+
+def test_workers_share_fetched_documents(db, tmp_path):
+    path = str(tmp_path / 'cache.db')
+    first, second = worker(db, path), worker(db, path)
+    ref = db.collection('Meal').document('a')
+
+    assert first.get(ref).to_dict()['name'] == 'Pasta'
+    assert second.get(ref).to_dict()['name'] == 'Pasta'
+    assert second.get(ref).to_dict()['name'] == 'Pasta'
+    assert db.reads == 1
+    assert second.stats()['collections']['Meal']['shared_hits'] == 1
+
+
+def test_invalidation_reaches_every_worker(db, tmp_path):
+    path = str(tmp_path / 'cache.db')
+    first, second = worker(db, path), worker(db, path)
+    ref = db.collection('Meal').document('a')
+    first.get(ref)
+    second.get(ref)
+
+    ref.update({'name': 'Pesto Pasta'})
+    first.invalidate(ref)
+
+    assert second.get(ref).to_dict()['name'] == 'Pesto Pasta'
+    assert second.stats()['collections']['Meal']['remote_invalidations'] == 1
+
+
+def test_get_all_uses_the_shared_tier(db, tmp_path):
+    path = str(tmp_path / 'cache.db')
+    first, second = worker(db, path), worker(db, path)
+    refs = [db.collection('Meal').document(doc_id) for doc_id in ('a', 'b')]
+    first.get_all(refs)
+    reads = db.reads
+
+    names = sorted(snapshot.to_dict()['name'] for snapshot in second.get_all(refs))
+    assert names == ['Pasta', 'Soup'] and db.reads == reads
+
+
+def test_read_that_raced_a_write_is_not_stored(tmp_path):
+    path = str(tmp_path / 'cache.db')
+    reader, writer = SharedCache(path), SharedCache(path)
+    version, entry = reader.get('Meal/a')
+    assert entry is None
+
+    writer.invalidate('Meal/a')
+    assert not reader.put('Meal/a', version, {'name': 'old'}, None)
+    assert reader.get('Meal/a')[1] is None
+
+    version, _ = reader.get('Meal/a')
+    assert reader.put('Meal/a', version, {'name': 'new'}, None)
+    assert writer.get('Meal/a')[1][0] == {'name': 'new'}
+
+
+def test_least_recently_used_entries_are_evicted(tmp_path):
+    now = [0.0]
+    cache = SharedCache(str(tmp_path / 'cache.db'), max_entries=2, evict_every=1, clock=lambda: now[0])
+    for path in ('Meal/a', 'Meal/b'):
+        now[0] += 1
+        cache.put(path, cache.get(path)[0], {'path': path}, None)
+    now[0] += 1
+    cache.get('Meal/a')
+    now[0] += 1
+    cache.put('Meal/c', 0, {'path': 'Meal/c'}, None)
+
+    assert cache.get('Meal/b')[1] is None
+    assert cache.get('Meal/a')[1] is not None and cache.get('Meal/c')[1] is not None
+    assert cache.stats()['evictions'] == 1
+
+
+def test_worker_that_missed_pruned_invalidations_resets(tmp_path):
+    path = str(tmp_path / 'cache.db')
+    now = [0.0]
+    behind, writer = SharedCache(path, clock=lambda: now[0]), SharedCache(path, log_retention=10, evict_every=1,
+                                                                            clock=lambda: now[0])
+    assert behind.changes() == []
+    writer.invalidate('Meal/a')
+    now[0] = 100
+    writer.put('Meal/b', 0, {}, None)  # prunes the log
+
+    assert behind.changes() is None
+    writer.invalidate('Meal/b')
+    assert behind.changes() == ['Meal/b']
+
+
+def _invalidate_in_child(path):
+    SharedCache(path).invalidate('Meal/a')
+
+
+def test_invalidation_from_another_process(db, tmp_path):
+    path = str(tmp_path / 'cache.db')
+    cache = worker(db, path)
+    ref = db.collection('Meal').document('a')
+    cache.get(ref)
+    ref.update({'name': 'Pesto Pasta'})
+
+    child = multiprocessing.get_context('spawn').Process(target=_invalidate_in_child, args=(path,))
+    child.start()
+    child.join(30)
+    assert child.exitcode == 0
+    assert cache.get(ref).to_dict()['name'] == 'Pesto Pasta'
@@ -0,0 +1,116 @@
+import threading
+
+import pytest
+
+from doc_cache import DocumentCache
+from single_flight import SingleFlight
+from tests.fake_firestore import FakeClient
+
+
+def run_concurrently(flights, key, fetch, callers):
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(flights.do(key, fetch))) for _ in range(callers)]
+    for thread in threads:
+        thread.start()
+    return threads, results
+
+
+def test_concurrent_identical_reads_share_one_fetch():
+    flights = SingleFlight()
+    release = threading.Event()
+    calls = []
+
+    def fetch():
+        calls.append(1)
+        release.wait(5)
+        return ['user']
+
+    threads, results = run_concurrently(flights, ('users', 'email', 'a@b.c'), fetch, 5)
+    while flights.stats()['reads'] < 5:
+        pass
+    release.set()
+    for thread in threads:
+        thread.join(5)
+
+    assert len(calls) == 1
+    assert results == [['user']] * 5
+    stats = flights.stats()
+    assert stats['round_trips'] == 1 and stats['coalesced'] == 4 and stats['in_flight'] == 0
+    assert stats['collections']['users']['coalesced'] == 4
+
+
+def test_waiters_share_the_leaders_exception():
+    flights = SingleFlight()
+    release = threading.Event()
+    errors = []
+
+    def fetch():
+        release.wait(5)
+        raise RuntimeError('deadline exceeded')
+
+    def call():
+        try:
+            flights.do(('Calendar', 'belongs_to', 'u1'), fetch)
+        except RuntimeError as e:
+            errors.append(str(e))
+
+    threads = [threading.Thread(target=call) for _ in range(3)]
+    for thread in threads:
+        thread.start()
+    while flights.stats()['reads'] < 3:
+        pass
+    release.set()
+    for thread in threads:
+        thread.join(5)
+
+    assert errors == ['deadline exceeded'] * 3
+    assert flights.stats()['round_trips'] == 1
+
+
+def test_nothing_is_kept_after_a_read_finishes():
+    flights = SingleFlight()
+    assert flights.do(('users', 'email', 'a'), lambda: 1) == 1
+    assert flights.do(('users', 'email', 'a'), lambda: 2) == 2
+    with pytest.raises(KeyError):
+        flights.do(('users', 'email', 'a'), lambda: {}['missing'])
+
+
+def test_forget_starts_a_fresh_read_after_a_write():
+    flights = SingleFlight()
+    release = threading.Event()
+    key = ('users', 'email', 'a')
+    threads, results = run_concurrently(flights, key, lambda: (release.wait(5), 'before write')[1], 1)
+    while flights.stats()['in_flight'] == 0:
+        pass
+
+    flights.forget('Calendar')
+    assert flights.stats()['in_flight'] == 1
+    flights.forget('users')
+    assert flights.do(key, lambda: 'after write') == 'after write'
+    release.set()
+    threads[0].join(5)
+    assert results == ['before write']
+
+
+def test_document_cache_misses_are_coalesced():
+    db = FakeClient()
+    db.collection('Meal').document('a').set({'name': 'Pasta'})
+    flights = SingleFlight()
+    cache = DocumentCache(db, flights=flights)
+    ref = db.collection('Meal').document('a')
+    release = threading.Event()
+    original_get = ref.get
+    ref.get = lambda: (release.wait(5), original_get())[1]
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(cache.get(ref).to_dict()['name'])) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    while flights.stats()['reads'] < 4:
+        pass
+    release.set()
+    for thread in threads:
+        thread.join(5)
+
+    assert results == ['Pasta'] * 4
+    assert flights.stats()['collections']['Meal']['round_trips'] == 1
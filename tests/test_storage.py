@@ -0,0 +1,92 @@
+import pytest
+from google.cloud.firestore_v1.transforms import ArrayUnion
+
+from storage import FirestoreStorage, Storage
+from tests.fake_firestore import FakeClient
+
+
+@pytest.fixture
+def storage():
+    backend = FirestoreStorage(FakeClient(), ArrayUnion)
+    yield backend
+    backend.close()
+
+
+def seed(storage):
+    user_id = storage.add_user({'email': 'a@b.c', 'name': 'Ada', 'avg_cal_intake': 2000})
+    storage.add_calendar(user_id)
+    squat = storage.add_exercise({'name': 'Squat', 'sets': 3})
+    plank = storage.add_exercise({'name': 'Plank', 'sets': 2})
+    workout = storage.add_workout({'name': 'Legs', 'exercises': [squat, plank]})
+    oats = storage.add_meal({'name': 'Oats', 'calories': 300})
+    salad = storage.add_meal({'name': 'Salad', 'calories': 450})
+    first = storage.add_day(user_id, '2024-03-01', meals=[oats, salad], workouts=[workout], weight=70)
+    second = storage.add_day(user_id, '2024-03-02', meals=[salad])
+    return user_id, {'workout': workout, 'oats': oats, 'salad': salad, 'days': [first, second]}
+
+
+def test_users_and_calendars(storage):
+    user_id, ids = seed(storage)
+    user = storage.find_user('a@b.c')
+    assert user['id'] == user_id and user['name'] == 'Ada'
+    assert storage.find_user('a@b.c', ['email']) == {'email': 'a@b.c', 'id': user_id}
+    assert storage.find_user('missing@b.c') is None
+
+    calendars = storage.get_calendars(user_id)
+    assert len(calendars) == 1
+    assert calendars[0]['belongs_to'] == user_id and calendars[0]['days'] == ids['days']
+
+
+def test_historical_data_follows_calendar_order(storage):
+    user_id, _ = seed(storage)
+    rows = [(date, event_type, record['name']) for date, event_type, record in storage.historical_data(user_id)]
+    assert rows == [
+        ('2024-03-01', 'Meal', 'Oats'),
+        ('2024-03-01', 'Meal', 'Salad'),
+        ('2024-03-01', 'Workout', 'Legs'),
+        ('2024-03-02', 'Meal', 'Salad'),
+    ]
+
+
+def test_day_views_hydrate_records(storage):
+    user_id, ids = seed(storage)
+    meals = storage.meals_on_day(user_id, '2024-03-01')
+    assert [(meal['id'], meal['name']) for meal in meals] == [(ids['oats'], 'Oats'), (ids['salad'], 'Salad')]
+
+    workouts = storage.workouts_on_day(user_id, '2024-03-01')
+    assert [workout['id'] for workout in workouts] == [ids['workout']]
+    assert [exercise['name'] for exercise in workouts[0]['exercises']] == ['Squat', 'Plank']
+    assert storage.workouts_on_day(user_id, '2024-03-02') == []
+    assert storage.meals_on_day(user_id, '2024-03-03') is None
+
+
+def test_days_are_scoped_to_their_user(storage):
+    seed(storage)
+    other = storage.add_user({'email': 'o@b.c'})
+    storage.add_calendar(other)
+    storage.add_day(other, '2024-03-01', meals=[storage.add_meal({'name': 'Toast'})])
+    assert [meal['name'] for meal in storage.meals_on_day(other, '2024-03-01')] == ['Toast']
+
+
+def test_details(storage):
+    _, ids = seed(storage)
+    assert storage.get_meal(ids['oats'])['calories'] == 300
+    assert storage.get_meal('missing') is None
+    workout = storage.get_workout(ids['workout'])
+    assert workout['name'] == 'Legs' and [exercise['sets'] for exercise in workout['exercises']] == [3, 2]
+    assert storage.get_workout('missing') is None
+
+
+def test_day_needs_a_calendar(storage):
+    user_id = storage.add_user({'email': 'x@b.c'})
+    with pytest.raises(ValueError):
+        storage.add_day(user_id, '2024-03-01')
+
+
+def test_storage_is_abstract():
+    class ReadOnly(Storage):
+        def find_user(self, email, fields=None):
+            return None
+
+    with pytest.raises(TypeError):
+        ReadOnly()
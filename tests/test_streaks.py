@@ -0,0 +1,79 @@
+from datetime import date
+
+from streaks import apply_activity, backfill_streaks, counters_from_days, record_activity, streak_summary
+from tests.fake_firestore import FakeClient, transactional
+
+
+def test_consecutive_days_extend_the_streak():
+    counters = None
+    for day in ('2024-03-01', '2024-03-02', '2024-03-02', '2024-03-03', '2024-03-05', '2024-03-06'):
+        counters = apply_activity(counters, day)
+    assert (counters['current_streak'], counters['longest_streak']) == (2, 3)
+    assert counters['days_logged'] == 5 and counters['last_logged'] == '2024-03-06'
+
+
+def test_open_day_adherence_follows_its_calorie_total():
+    counters = apply_activity(None, '2024-03-01', calories=900, target=2000)
+    assert counters['days_within_target'] == 0
+    counters = apply_activity(counters, '2024-03-01', calories=1950, target=2000)
+    assert counters['days_within_target'] == 1
+    counters = apply_activity(counters, '2024-03-01', calories=2500, target=2000, logged=False)
+    assert counters['days_within_target'] == 0
+    # A workout does not change the day's calories
+    counters = apply_activity(counters, '2024-03-01', calories=1900, target=2000)
+    counters = apply_activity(counters, '2024-03-01')
+    assert counters['days_within_target'] == 1 and counters['days_logged'] == 1
+
+
+def test_removal_and_backdated_activity_do_not_log_days():
+    counters = apply_activity(None, '2024-03-05')
+    assert apply_activity(counters, '2024-03-06', calories=0, logged=False) == counters
+    assert apply_activity(counters, '2024-03-01') == counters
+
+
+def test_summary_reports_lapsed_streaks():
+    counters = apply_activity(apply_activity(None, '2024-03-01', 2000, 2000), '2024-03-02', 500, 2000)
+    assert streak_summary(counters, today=date(2024, 3, 3))['current_streak'] == 2
+    summary = streak_summary(counters, today=date(2024, 3, 4))
+    assert summary['current_streak'] == 0 and summary['longest_streak'] == 2 and summary['adherence'] == 0.5
+    assert streak_summary(None)['adherence'] is None
+
+
+def test_record_activity_touches_only_the_counters_document():
+    db = FakeClient()
+    record_activity(db, transactional, 'u1', '2024-03-01', calories=2000, target=2000)
+    reads, writes = db.reads, db.writes
+    counters = record_activity(db, transactional, 'u1', '2024-03-02')
+    assert (db.reads - reads, db.writes - writes) == (1, 1)
+    assert db.collection('Streak').document('u1').get().to_dict() == counters
+    assert counters['current_streak'] == 2 and counters['days_within_target'] == 1
+
+
+def test_backfill_matches_incremental_updates():
+    db = FakeClient()
+    db.collection('users').document('u1').set({'email': 'a@b.c', 'avg_cal_intake': 2000})
+    db.collection('users').document('u2').set({'email': 'o@b.c'})
+    db.collection('Calendar').document('c1').set({'belongs_to': 'u1', 'days': ['d1', 'd2', 'd3', 'd4']})
+    db.collection('Meal').document('m1').set({'calories': 1000})
+    db.collection('Day').document('d1').set({'date': '2024-03-02', 'meals': ['m1', 'm1'], 'workouts': []})
+    db.collection('Day').document('d2').set({'date': '2024-03-01', 'meals': [], 'workouts': ['w1'],
+                                             'totals': {'calories': 0, 'meals': 0}})
+    db.collection('Day').document('d3').set({'date': '2024-03-03', 'meals': [], 'workouts': [], 'weight': 70})
+    db.collection('Day').document('d4').set({'date': '2024-03-09', 'meals': [], 'workouts': []})
+
+    assert backfill_streaks(db, users_per_batch=1) == {'users': 2, 'days': 3}
+    counters = db.collection('Streak').document('u1').get().to_dict()
+    expected = None
+    for day, calories in (('2024-03-01', 0), ('2024-03-02', 2000), ('2024-03-03', 0)):
+        expected = apply_activity(expected, day, calories, 2000)
+    assert counters == expected
+    assert counters['current_streak'] == 3 and counters['days_within_target'] == 1
+    assert db.collection('Streak').document('u2').get().to_dict()['days_logged'] == 0
+
+
+def test_days_sharing_a_date_count_once():
+    days = [{'date': '2024-03-01', 'meals': ['a'], 'totals': {'calories': 1000}},
+            {'date': '2024-03-01', 'meals': ['b'], 'totals': {'calories': 900}},
+            {'date': 'someday', 'meals': ['c']}]
+    counters = counters_from_days(days, 2000)
+    assert counters['days_logged'] == 1 and counters['days_within_target'] == 1
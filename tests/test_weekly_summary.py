@@ -0,0 +1,97 @@
+import json
+
+from weekly_summary import run_weekly_summaries, summarize_users, week_bounds
+from tests.fake_firestore import FakeClient
+
+
+def seeded_client(users=3):
+    db = FakeClient()
+    db.collection('Meal').document('m1').set({'calories': 600, 'carbs': 50, 'fats': 10, 'proteins': 30})
+    db.collection('Workout').document('w1').set({'exercises': ['e1', 'e2']})
+    db.collection('Exercise').document('e1').set({'avg_calories_burned': 100})
+    db.collection('Exercise').document('e2').set({'avg_calories_burned': 50})
+    for index in range(users):
+        user_id = f'u{index}'
+        db.collection('users').document(user_id).set({'email': f'{user_id}@b.c', 'name': f'User {index}', 'weight': 80})
+        db.collection('Calendar').document(f'c{index}').set({'belongs_to': user_id, 'days': [f'{user_id}-1', f'{user_id}-2', f'{user_id}-3']})
+        db.collection('Day').document(f'{user_id}-1').set({
+            'date': '2024-03-04', 'meals': ['m1'], 'workouts': ['w1'], 'weight': 78,
+            'totals': {'calories': 600, 'carbs': 50, 'fats': 10, 'proteins': 30, 'meals': 1},
+        })
+        # Written before Day totals existed
+        db.collection('Day').document(f'{user_id}-2').set({'date': '2024-03-10', 'meals': ['m1', 'm1'], 'workouts': []})
+        db.collection('Day').document(f'{user_id}-3').set({'date': '2024-03-11', 'meals': ['m1'], 'weight': 70})
+    return db
+
+
+def test_week_bounds_snap_to_monday():
+    assert week_bounds('2024-03-07') == ('2024-03-04', '2024-03-10')
+
+
+def test_summaries_cover_only_the_week():
+    db = seeded_client(users=1)
+    [(user_id, summary)] = summarize_users(db, [('u0', {'email': 'u0@b.c', 'name': 'Ada', 'weight': 80})], '2024-03-04')
+    assert user_id == 'u0'
+    assert summary['caloriesConsumed'] == 1800 and summary['proteins'] == 90
+    assert summary['caloriesBurned'] == 150
+    assert summary['weight'] == 78
+    assert (summary['days_logged'], summary['meals'], summary['workouts']) == (2, 3, 1)
+
+    [(_, empty)] = summarize_users(db, [('u0', {'weight': 80})], '2024-02-26')
+    assert empty['caloriesConsumed'] == 0 and empty['weight'] == 80
+
+
+def test_run_writes_summary_documents_and_reports_throughput(tmp_path):
+    db = seeded_client()
+    report = run_weekly_summaries(db, '2024-03-06', workers=0, users_per_batch=2,
+                                  checkpoint_path=str(tmp_path / 'checkpoint'))
+    assert (report['users'], report['batches'], report['failed_batches']) == (3, 2, 0)
+    assert report['users_per_second'] > 0
+    summary = db.collection('WeeklySummary').document('u2').get().to_dict()
+    assert summary['email'] == 'u2@b.c' and summary['week_start'] == '2024-03-04'
+
+
+def test_resume_skips_users_already_written(tmp_path):
+    db = seeded_client()
+    checkpoint = tmp_path / 'checkpoint'
+    checkpoint.write_text(json.dumps({'week_start': '2024-03-04'}) + '\n'
+                          + json.dumps({'users': ['u0', 'u1']}) + '\n' + '{"users": ["u2"')
+
+    report = run_weekly_summaries(db, '2024-03-04', workers=0, checkpoint_path=str(checkpoint))
+    assert (report['resumed'], report['users']) == (2, 1)
+    assert not db.collection('WeeklySummary').document('u0').get().exists
+    assert db.collection('WeeklySummary').document('u2').get().exists
+
+    # A checkpoint from another week does not count
+    report = run_weekly_summaries(db, '2024-03-11', workers=0, checkpoint_path=str(checkpoint))
+    assert (report['resumed'], report['users']) == (0, 3)
+
+
+def test_failed_batch_is_retried_on_the_next_run(tmp_path, monkeypatch):
+    import weekly_summary
+
+    db = seeded_client()
+    checkpoint = str(tmp_path / 'checkpoint')
+    real = weekly_summary.summarize_users
+
+    def flaky(db, users, week_start):
+        if users[0][0] == 'u2':
+            raise RuntimeError('deadline exceeded')
+        return real(db, users, week_start)
+
+    monkeypatch.setattr(weekly_summary, 'summarize_users', flaky)
+    report = run_weekly_summaries(db, '2024-03-04', workers=0, users_per_batch=2, checkpoint_path=checkpoint)
+    assert (report['users'], report['failed_batches']) == (2, 1)
+
+    monkeypatch.setattr(weekly_summary, 'summarize_users', real)
+    report = run_weekly_summaries(db, '2024-03-04', workers=0, users_per_batch=2, checkpoint_path=checkpoint)
+    assert (report['resumed'], report['users']) == (2, 1)
+
+
+def test_process_pool_workers_open_their_own_client(tmp_path):
+    # Each spawned worker builds the same seeded stand-in; the parent writes the results
+    db = seeded_client()
+    report = run_weekly_summaries(db, '2024-03-04', client_factory=seeded_client, workers=2, users_per_batch=1,
+                                  checkpoint_path=str(tmp_path / 'checkpoint'))
+    assert (report['users'], report['batches'], report['failed_batches']) == (3, 3, 0)
+    assert db.collection('WeeklySummary').document('u1').get().to_dict()['caloriesConsumed'] == 1800
@@ -0,0 +1,68 @@
+from weight_series import (add_weights, day_offset, merge_points, migrate_weights, offset_date, record_weight,
+                           weight_history, weight_on)
+from tests.fake_firestore import FakeClient, transactional
+
+
+def test_offsets_round_trip_through_leap_years():
+    assert day_offset('2024-12-31') == (2024, 365)
+    assert offset_date(2024, 59) == '2024-02-29'
+    assert merge_points({'offsets': [3, 9], 'values': [70, 71]}, {5: 72, 9: 73}) == ([3, 5, 9], [70, 72, 73])
+
+
+def test_appends_keep_the_arrays_sorted_and_replace_a_day():
+    db = FakeClient()
+    for day, weight in (('2024-03-05', 71), ('2024-03-01', 72), ('2024-03-09', 70), ('2024-03-05', 70.5)):
+        record_weight(db, transactional, 'u1', day, weight)
+    series = db.collection('WeightSeries').document('u1_2024').get().to_dict()
+    assert series['offsets'] == [60, 64, 68] and series['values'] == [72, 70.5, 70]
+    assert db.commits == 4
+
+
+def test_range_reads_one_document_per_year():
+    db = FakeClient()
+    for day, weight in (('2023-12-30', 75), ('2024-01-02', 74), ('2024-02-01', 73), ('2024-06-01', 70)):
+        record_weight(db, transactional, 'u1', day, weight)
+    record_weight(db, transactional, 'u2', '2024-01-02', 90)
+
+    reads = db.reads
+    assert weight_history(db, 'u1', '2023-12-01', '2024-02-01') == [('2023-12-30', 75), ('2024-01-02', 74),
+                                                                      ('2024-02-01', 73)]
+    assert db.reads - reads == 2
+
+    reads = db.reads
+    assert weight_history(db, 'u1', '2024-01-03', '2024-05-31') == [('2024-02-01', 73)]
+    assert db.reads - reads == 1
+    assert weight_history(db, 'u1', '2024-03-01', '2024-02-01') == []
+    assert weight_on(db, 'u1', '2024-06-01') == 70 and weight_on(db, 'u1', '2024-06-02') is None
+
+
+def test_migration_copies_day_weights_without_overwriting_the_series():
+    db = FakeClient()
+    db.collection('users').document('u1').set({'email': 'a@b.c'})
+    db.collection('users').document('u2').set({'email': 'o@b.c'})
+    db.collection('Calendar').document('c1').set({'belongs_to': 'u1', 'days': ['d1', 'd2', 'd3', 'd4', 'd5', 'd6']})
+    db.collection('Day').document('d1').set({'date': '2023-12-31', 'weight': 80})
+    db.collection('Day').document('d5').set({'date': 'someday', 'weight': 60})
+    db.collection('Day').document('d6').set({'weight': 61})
+    db.collection('Day').document('d2').set({'date': '2024-01-01', 'weight': 79})
+    db.collection('Day').document('d3').set({'date': '2024-01-02', 'meals': []})
+    db.collection('Day').document('d4').set({'date': '2024-01-03', 'weight': 78})
+    record_weight(db, transactional, 'u1', '2024-01-03', 77.5)
+
+    assert weight_history(db, 'u1', '2023-01-01', '2024-12-31') == [('2024-01-03', 77.5)]
+    # Before the migration the Day weights are read too; the series wins on a date both have
+    assert weight_history(db, 'u1', '2023-01-01', '2024-12-31', migrated=False) == [
+        ('2023-12-31', 80), ('2024-01-01', 79), ('2024-01-03', 77.5)]
+    assert weight_on(db, 'u1', '2024-01-01', migrated=False) == 79
+
+    assert migrate_weights(db, transactional, users_per_batch=1) == {'users': 2, 'points': 3, 'series': 2}
+    assert weight_history(db, 'u1', '2023-01-01', '2024-12-31') == [('2023-12-31', 80), ('2024-01-01', 79),
+                                                                      ('2024-01-03', 77.5)]
+    assert db.collection('users').document('u1').get().to_dict()['weights_migrated'] is True
+
+
+def test_added_weights_keep_existing_points():
+    db = FakeClient()
+    record_weight(db, transactional, 'u1', '2024-01-03', 77.5)
+    assert add_weights(db, transactional, 'u1', {'2024-01-03': 70, '2023-05-01': 82, 'bad': 1}) == 2
+    assert weight_history(db, 'u1', '2023-01-01', '2024-12-31') == [('2023-05-01', 82), ('2024-01-03', 77.5)]
@@ -0,0 +1,226 @@
+"""
+Weekly summary batch job.
+
+Enumerates every user, computes their numbers for one Monday-to-Sunday week and
+writes them to WeeklySummary/{user_id}, which /get_weekly_summary_data serves
+with a single read. Users are processed in fixed-size batches on a process
+pool; each worker opens its own Firestore client through a picklable
+client_factory and reads a whole batch's calendars, days, meals, workouts and
+exercises with batched reads. The parent commits each batch's summaries and then
+appends the batch's user IDs to a JSONL checkpoint, so a run that crashed picks
+up where it stopped when started again for the same week.
+
+    python -m scripts.jobs weekly-summary [--week 2024-03-04] [--workers 4] [--schedule]
+
+With FIRESTORE_EMULATOR_HOST set the job talks to the local Firestore emulator.
+"""
+import json
+import multiprocessing
+import os
+import time
+from concurrent.futures import ALL_COMPLETED, FIRST_COMPLETED, ProcessPoolExecutor, wait
+from datetime import date, datetime, timedelta, timezone
+
+from common import BATCH_SIZE, USERS_PER_BATCH, days_by_user, firestore_client, iter_documents, number
+from day_totals import NUTRIENTS, sum_totals
+
+USER_FIELDS = ['email', 'name', 'weight']
+
+_worker_db = None
+
+
+def week_bounds(week_start):
+    """(first, last) ISO dates of the Monday-to-Sunday week containing week_start."""
+    start = date.fromisoformat(week_start) if isinstance(week_start, str) else week_start
+    start -= timedelta(days=start.weekday())
+    return start.isoformat(), (start + timedelta(days=6)).isoformat()
+
+
+def last_complete_week(today=None):
+    today = today or datetime.now(timezone.utc).date()
+    return week_bounds(today - timedelta(days=7))[0]
+
+
+def _init_worker(client_factory):
+    global _worker_db
+    _worker_db = client_factory()
+
+
+def _run_in_worker(users, week_start):
+    return summarize_users(_worker_db, users, week_start)
+
+
+def summarize_users(db, users, week_start):
+    """
+    Weekly summaries for a batch of users given as [(user_id, user_data)], read with
+    batched queries and get_all calls for the whole batch. Returns [(user_id, summary)] in input order.
+    """
+    first, last = week_bounds(week_start)
+    days = {
+        user_id: [day for day in user_days if first <= day['date'] <= last]
+        for user_id, user_days in days_by_user(db, [user_id for user_id, _ in users]).items()
+    }
+
+    week_days = [day for user_days in days.values() for day in user_days]
+    # Only days written before Day totals existed need their meals
+    meals = dict(iter_documents(db, 'Meal', list(dict.fromkeys(
+        meal_id for day in week_days if not isinstance(day.get('totals'), dict) for meal_id in day.get('meals', [])
+    )), field_paths=list(NUTRIENTS)))
+    workouts = dict(iter_documents(db, 'Workout', list(dict.fromkeys(
+        workout_id for day in week_days for workout_id in day.get('workouts', [])
+    )), field_paths=['exercises']))
+    exercise_ids = list(dict.fromkeys(
+        exercise_id for workout in workouts.values() for exercise_id in workout.get('exercises', [])
+        if isinstance(exercise_id, str)
+    ))
+    burned_by_exercise = {
+        exercise_id: number(exercise.get('avg_calories_burned'))
+        for exercise_id, exercise in iter_documents(db, 'Exercise', exercise_ids, field_paths=['avg_calories_burned'])
+    }
+
+    summaries = []
+    for user_id, user_data in users:
+        consumed = {nutrient: 0.0 for nutrient in NUTRIENTS}
+        burned, meal_count, workout_count, weight = 0.0, 0, 0, None
+        for day in sorted(days[user_id], key=lambda day: day['date']):
+            totals = day.get('totals')
+            if not isinstance(totals, dict):
+                totals = sum_totals([meals.get(meal_id, {}) for meal_id in day.get('meals', [])])
+            for nutrient in NUTRIENTS:
+                consumed[nutrient] += number(totals.get(nutrient))
+            meal_count += int(totals.get('meals', 0))
+            for workout_id in day.get('workouts', []):
+                if workout_id in workouts:
+                    workout_count += 1
+                    burned += sum(burned_by_exercise.get(exercise_id, 0.0)
+                                  for exercise_id in workouts[workout_id].get('exercises', []))
+            if day.get('weight') is not None:
+                weight = number(day['weight'])
+        summaries.append((user_id, {
+            'email': user_data.get('email'),
+            'name': user_data.get('name'),
+            'week_start': first,
+            'week_end': last,
+            'weight': weight if weight is not None else user_data.get('weight'),
+            'caloriesConsumed': round(consumed['calories'], 2),
+            'caloriesBurned': round(burned, 2),
+            'carbs': round(consumed['carbs'], 2),
+            'fats': round(consumed['fats'], 2),
+            'proteins': round(consumed['proteins'], 2),
+            'days_logged': len(days[user_id]),
+            'meals': meal_count,
+            'workouts': workout_count,
+        }))
+    return summaries
+
+
+def _load_checkpoint(path, week_start):
+    """User IDs already written for week_start; a checkpoint for another week is ignored."""
+    done = set()
+    try:
+        with open(path, encoding='utf-8') as checkpoint:
+            lines = checkpoint.read().splitlines()
+    except FileNotFoundError:
+        return done
+    for line in lines:
+        try:
+            entry = json.loads(line)
+        except ValueError:
+            continue  # torn line from a crash mid-append; that batch is simply redone
+        if 'week_start' in entry and entry['week_start'] != week_start:
+            return set()
+        done.update(entry.get('users', []))
+    return done
+
+
+def _write_summaries(db, summaries, generated_at):
+    for start in range(0, len(summaries), BATCH_SIZE):
+        batch = db.batch()
+        for user_id, summary in summaries[start:start + BATCH_SIZE]:
+            batch.set(db.collection('WeeklySummary').document(user_id), {**summary, 'generated_at': generated_at})
+        batch.commit()
+
+
+def run_weekly_summaries(db, week_start=None, client_factory=firestore_client, workers=None,
+                         users_per_batch=USERS_PER_BATCH, checkpoint_path='weekly_summary.checkpoint', restart=False,
+                         clock=time.monotonic):
+    """
+    Compute and store every user's summary for the week containing week_start
+    (default: the last complete week). workers=0 computes in this process with db.
+    Returns a report with counts and users_per_second.
+    """
+    week_start = week_bounds(week_start)[0] if week_start else last_complete_week()
+    started = clock()
+    done = set() if restart else _load_checkpoint(checkpoint_path, week_start)
+    if restart or not done:
+        with open(checkpoint_path, 'w', encoding='utf-8') as checkpoint:
+            checkpoint.write(json.dumps({'week_start': week_start}) + '\n')
+    report = {'week_start': week_start, 'users': 0, 'resumed': 0, 'batches': 0, 'failed_batches': 0, 'errors': []}
+    generated_at = datetime.now(timezone.utc).isoformat()
+
+    def batches():
+        pending = []
+        for user_doc in db.collection('users').select(USER_FIELDS).stream():
+            if user_doc.id in done:
+                report['resumed'] += 1
+                continue
+            pending.append((user_doc.id, user_doc.to_dict()))
+            if len(pending) >= users_per_batch:
+                yield pending
+                pending = []
+        if pending:
+            yield pending
+
+    def finish(summaries):
+        _write_summaries(db, summaries, generated_at)
+        with open(checkpoint_path, 'a', encoding='utf-8') as checkpoint:
+            checkpoint.write(json.dumps({'users': [user_id for user_id, _ in summaries]}) + '\n')
+            checkpoint.flush()
+            os.fsync(checkpoint.fileno())
+        report['users'] += len(summaries)
+        report['batches'] += 1
+
+    def failed(error):
+        # The batch stays out of the checkpoint, so the next run retries it
+        report['failed_batches'] += 1
+        report['errors'].append(str(error))
+
+    if workers == 0:
+        for users in batches():
+            try:
+                finish(summarize_users(db, users, week_start))
+            except Exception as e:
+                failed(e)
+    else:
+        # spawn: gRPC channels do not survive fork
+        with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'),
+                                 initializer=_init_worker, initargs=(client_factory,)) as executor:
+            max_in_flight = 2 * (workers or os.cpu_count() or 1)
+            in_flight = set()
+
+            def collect(return_when):
+                nonlocal in_flight
+                completed, in_flight = wait(in_flight, return_when=return_when)
+                for future in completed:
+                    try:
+                        finish(future.result())
+                    except Exception as e:
+                        failed(e)
+
+            for users in batches():
+                in_flight.add(executor.submit(_run_in_worker, users, week_start))
+                if len(in_flight) >= max_in_flight:
+                    collect(FIRST_COMPLETED)
+            if in_flight:
+                collect(ALL_COMPLETED)
+
+    report['seconds'] = round(clock() - started, 3)
+    report['users_per_second'] = round(report['users'] / report['seconds'], 1) if report['seconds'] > 0 else None
+    return report
+
+
+def seconds_until_next_run(now, weekday, hour):
+    target = now.replace(hour=hour, minute=0, second=0, microsecond=0) + timedelta(days=(weekday - now.weekday()) % 7)
+    if target <= now:
+        target += timedelta(days=7)
+    return (target - now).total_seconds()
@@ -0,0 +1,160 @@
+"""
+Body weight history as compact per-user, per-year time series.
+
+WeightSeries/{user_id}_{year} holds two parallel arrays: 'offsets', the sorted
+day numbers since January 1st, and 'values', the weight logged on each of those
+days. A year of daily weigh-ins fits in one small document, so a chart over any
+range within a year is one read and a range across New Year is two. Writes go
+through record_weight(), which inserts or replaces a point in a transaction
+(`transactional` is firestore.transactional, see common). migrate_weights()
+builds the series from the weight field of existing Day documents and marks each
+user 'weights_migrated'; until then reads for that user also take weights from
+their Day documents.
+"""
+from bisect import bisect_left, bisect_right
+from datetime import date, timedelta
+
+from common import USERS_PER_BATCH, days_by_user, number
+
+
+def _is_day(value):
+    try:
+        day_offset(value)
+    except (TypeError, ValueError):
+        return False
+    return True
+
+
+def series_ref(db, user_id, year):
+    return db.collection('WeightSeries').document(f'{user_id}_{year}')
+
+
+def day_offset(day):
+    if not isinstance(day, date):
+        day = date.fromisoformat(day)
+    return day.year, (day - date(day.year, 1, 1)).days
+
+
+def offset_date(year, offset):
+    return (date(year, 1, 1) + timedelta(days=offset)).isoformat()
+
+
+def merge_points(series, points):
+    """(offsets, values) of a series document with {offset: value} points added or replaced."""
+    merged = dict(zip((series or {}).get('offsets', []), (series or {}).get('values', [])))
+    merged.update(points)
+    offsets = sorted(merged)
+    return offsets, [merged[offset] for offset in offsets]
+
+
+def record_weight(db, transactional, user_id, day, weight):
+    """Insert or replace the weight logged on day (YYYY-MM-DD) in the user's series for that year."""
+    year, offset = day_offset(day)
+    ref = series_ref(db, user_id, year)
+
+    @transactional
+    def record(transaction):
+        snapshot = ref.get(transaction=transaction)
+        offsets, values = merge_points(snapshot.to_dict() if snapshot.exists else None, {offset: weight})
+        transaction.set(ref, {'user_id': user_id, 'year': year, 'offsets': offsets, 'values': values})
+
+    record(db.transaction())
+
+
+def add_weights(db, transactional, user_id, weights):
+    """
+    Add {date: weight} points to the user's series, one transaction per year;
+    points already in a series are kept. Returns the number of series written.
+    """
+    by_year = {}
+    for day, weight in weights.items():
+        try:
+            year, offset = day_offset(day)
+        except (TypeError, ValueError):
+            continue
+        by_year.setdefault(year, {})[offset] = number(weight)
+
+    @transactional
+    def add(transaction, ref, year, points):
+        snapshot = ref.get(transaction=transaction)
+        existing = snapshot.to_dict() if snapshot.exists else {}
+        offsets, values = merge_points(None, {**points, **dict(zip(existing.get('offsets', []), existing.get('values', [])))})
+        transaction.set(ref, {'user_id': user_id, 'year': year, 'offsets': offsets, 'values': values})
+
+    for year, points in by_year.items():
+        add(db.transaction(), series_ref(db, user_id, year), year, points)
+    return len(by_year)
+
+
+def day_weights(db, user_id, start, end):
+    """[(date, weight)] from the weight field of the user's Day documents between start and end."""
+    weights = {}
+    for day in days_by_user(db, [user_id], field_paths=('date', 'weight'))[user_id]:
+        if start <= day['date'] <= end and day.get('weight') is not None:
+            weights.setdefault(day['date'], number(day['weight']))
+    return sorted(weights.items())
+
+
+def weight_history(db, user_id, start, end, migrated=True):
+    """
+    [(date, weight)] logged between start and end inclusive, one read per calendar
+    year spanned. For a user not yet migrated, weights still only on their Day
+    documents are filled in.
+    """
+    (first_year, first), (last_year, last) = day_offset(start), day_offset(end)
+    if (first_year, first) > (last_year, last):
+        return []
+    refs = [series_ref(db, user_id, year) for year in range(first_year, last_year + 1)]
+    series = {snapshot.get('year'): snapshot.to_dict() for snapshot in db.get_all(refs) if snapshot.exists}
+    points = []
+    for year in range(first_year, last_year + 1):
+        if year not in series:
+            continue
+        offsets, values = series[year].get('offsets', []), series[year].get('values', [])
+        low = bisect_left(offsets, first) if year == first_year else 0
+        high = bisect_right(offsets, last) if year == last_year else len(offsets)
+        points.extend((offset_date(year, offset), value) for offset, value in zip(offsets[low:high], values[low:high]))
+    if not migrated:
+        points = sorted({**dict(day_weights(db, user_id, offset_date(first_year, first), offset_date(last_year, last))),
+                         **dict(points)}.items())
+    return points
+
+
+def weight_on(db, user_id, day, migrated=True):
+    """The weight logged on day, or None."""
+    points = weight_history(db, user_id, day, day, migrated)
+    return points[0][1] if points else None
+
+
+def migrate_weights(db, transactional, users_per_batch=USERS_PER_BATCH):
+    """
+    Copy the weight field of every user's Day documents into their series and
+    mark the user 'weights_migrated'. Points already in a series are newer than
+    the Day field and are kept. Returns {'users', 'points', 'series'}.
+    """
+    report = {'users': 0, 'points': 0, 'series': 0}
+
+    def backfill(user_ids):
+        for user_id, days in days_by_user(db, user_ids, field_paths=('date', 'weight')).items():
+            weights = {}
+            for day in days:
+                if day.get('weight') is not None:
+                    weights[day['date']] = day['weight']
+            series = add_weights(db, transactional, user_id, weights)
+            report['points'] += sum(1 for day in weights if _is_day(day))
+            report['series'] += series
+            report['users'] += 1
+        batch = db.batch()
+        for user_id in user_ids:
+            batch.update(db.collection('users').document(user_id), {'weights_migrated': True})
+        batch.commit()
+
+    pending = []
+    for user_doc in db.collection('users').select([]).stream():
+        pending.append(user_doc.id)
+        if len(pending) >= users_per_batch:
+            backfill(pending)
+            pending = []
+    if pending:
+        backfill(pending)
+    return report